@@ -15,6 +15,8 @@ sys.path.append(str(PROJECT_ROOT))
 
 # 3. 必要なモジュールをインポート
 from src.core.orchestrator import Orchestrator
+import config
+from src.core import metrics, resilience, stream_runs, jobs, prompt_profile, gemini_pool
 
 # --- Flaskアプリケーションのインスタンスを生成 ---
 app = Flask(__name__, 
@@ -24,32 +26,151 @@ app = Flask(__name__,
 # 4. Orchestratorを初期化する際に、決定したPROJECT_ROOTを引数として渡す
 orchestrator = Orchestrator(project_root=PROJECT_ROOT)
 
+# 長い依頼をリクエストから切り離して実行する、ジョブの待ち行列
+job_queue = jobs.create_queue(orchestrator)
+
 @app.route("/")
 def index():
     return render_template("index.html")
 
+# SSEのレスポンスヘッダー（プロキシにバッファ・キャッシュさせない）
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+STREAM_ERROR = {"status": "error", "message": "サーバー内部でエラーが発生しました。"}
+
 @app.route('/api/chat', methods=['POST'])
 def chat_api():
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message', '')
+
+    # 外部APIのユーザー別レート制限の単位（ヘッダーがなければ接続元）。ストリームの再開もこの単位で受け付ける
+    user_id = request.headers.get('X-User-Id') or request.remote_addr
+
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id:
+        # 切断後の再接続。実行中または直近に終わった実行の続きを送る（再実行はしない）
+        try:
+            run, after_seq = stream_runs.registry.resume(user_id, last_event_id)
+        except stream_runs.ResumeError as e:
+            return Response(f"Error: {e}", status=410)
+        print(f"[APP] run {run.run_id} をイベント {after_seq} の続きから再開します。")
+    else:
+        if not user_message:
+            return Response("Error: メッセージがありません", status=400)
+        # 実行は接続から切り離して行い、出力はrunのバッファを経由して送る
+        run, after_seq = stream_runs.registry.create(user_id), 0
+        with resilience.user_scope(user_id):
+            stream_runs.start_in_thread(run, lambda: orchestrator.run_multi_agent_session_stream(user_message, user_id), STREAM_ERROR)
+        print(f"[APP] run {run.run_id} を開始します。")
+
+    stream = stream_runs.iter_sse(stream_runs.registry, run, after_seq, config.SSE_HEARTBEAT_SECONDS)
+    return Response(stream, mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    # すぐにジョブIDを返し、実行はワーカーに任せる（進捗はポーリングかSSEで受け取る）
+    data = request.get_json(silent=True) or {}
     user_message = data.get('message', '')
     if not user_message:
-        return Response("Error: メッセージがありません", status=400)
+        return jsonify({"error": "メッセージがありません"}), 400
+    user_id = request.headers.get('X-User-Id') or request.remote_addr
+    # 優先度の指定がなければ、依頼の内容から見積もる（予定の確認は先に実行する）
+    priority = data.get('priority') or orchestrator.estimate_priority(user_message, user_id)
+    try:
+        job = job_queue.submit(user_id, user_message, priority)
+    except jobs.QueueFull as e:
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = str(int(e.retry_after))
+        return response, 429
+    return jsonify({
+        **job.to_dict(),
+        "position": job_queue.position(job),
+        "poll_url": f"/api/jobs/{job.id}",
+        "events_url": f"/api/jobs/{job.id}/events",
+    }), 202
+
+@app.route('/api/jobs', methods=['GET'])
+def job_stats():
+    return jsonify(job_queue.stats())
 
-    def generate_stream():
-        print("[APP] generate_stream を開始します。")
+def _find_job(job_id: str):
+    # 投入したユーザー以外には見せない
+    job = job_queue.get(job_id)
+    user_id = request.headers.get('X-User-Id') or request.remote_addr
+    return job if job is not None and job.user_id == user_id else None
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def poll_job(job_id):
+    # ?after=<連番> より後の進捗イベントを返す（次回は返したnext_afterを渡す）
+    job = _find_job(job_id)
+    if job is None:
+        return jsonify({"error": "ジョブが見つかりません"}), 404
+    try:
+        after = int(request.args.get('after', '0') or 0)
+    except ValueError:
+        return jsonify({"error": "afterには整数を指定してください"}), 400
+    truncated = False
+    try:
+        events, _ = job.run.events_after(after)
+    except stream_runs.ResumeError:
+        # 古いイベントはバッファから押し出されている。残っている分だけ返す
+        events, _ = job.run.events_after(job.run.events[0][0] - 1)
+        truncated = True
+    return jsonify({
+        **job.to_dict(),
+        "position": job_queue.position(job),
+        "events": [{"seq": seq, **json.loads(data)} for seq, data in events],
+        "next_after": events[-1][0] if events else after,
+        "truncated": truncated,
+    })
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    # 進捗をSSEで購読する。再接続時はLast-Event-IDの続きから送る
+    job = _find_job(job_id)
+    if job is None:
+        return Response("Error: ジョブが見つかりません", status=404)
+    try:
+        after = int(request.args.get('after', '0') or 0)
+    except ValueError:
+        return Response("Error: afterには整数を指定してください", status=400)
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id:
         try:
-            response_generator = orchestrator.run_multi_agent_session_stream(user_message)
-            for response_part in response_generator:
-                formatted_data = f"data: {json.dumps(response_part, ensure_ascii=False)}\n\n"
-                yield formatted_data
-            print("[APP] ストリームが正常に完了しました。")
-        except Exception as e:
-            print(f"[APP] generate_stream でエラーが発生: {e}")
-            error_data = {"status": "error", "message": "サーバー内部でエラーが発生しました。"}
-            yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
-        finally:
-            print("[APP] finallyブロックが実行されました。ストリームを終了します。")
-    return Response(generate_stream(), mimetype='text/event-stream')
+            run_id, after = stream_runs.parse_event_id(last_event_id)
+        except stream_runs.ResumeError as e:
+            return Response(f"Error: {e}", status=400)
+        if run_id != job.run.run_id:
+            return Response("Error: Last-Event-IDがこのジョブのものではありません", status=400)
+    try:
+        # 続きがバッファから押し出されていれば、ストリームを始める前に410で知らせる
+        job.run.events_after(after)
+    except stream_runs.ResumeError as e:
+        return Response(f"Error: {e}", status=410)
+    stream = stream_runs.iter_sse(stream_runs.registry, job.run, after, config.SSE_HEARTBEAT_SECONDS)
+    return Response(stream, mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = _find_job(job_id)
+    if job is None:
+        return jsonify({"error": "ジョブが見つかりません"}), 404
+    cancelled = job_queue.cancel(job_id)
+    return jsonify({**job.to_dict(), "cancelled": cancelled})
+
+@app.route("/api/metrics")
+def metrics_api():
+    # LLM呼び出し回数・tierごとの遅延/コストなどの集計値を返す
+    return jsonify(metrics.snapshot())
+
+@app.route("/api/metrics/prompts")
+def prompt_profile_api():
+    # 呼び出し箇所ごとのプロンプトのトークン数の見積もりと、その内訳（ペルソナ・履歴・ツール結果など）
+    return jsonify(prompt_profile.profiler.report())
+
+@app.route("/api/metrics/gemini")
+def gemini_pool_api():
+    # 共有しているGeminiクライアントごとの状態（健全性・呼び出し中の数）と、モデルごとの同時呼び出し数
+    return jsonify(gemini_pool.pool.stats())
 
 @app.route("/delete_event", methods=["POST"])
 def delete_event():
@@ -0,0 +1,92 @@
+# asgi.py
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from a2wsgi import WSGIMiddleware
+
+# asyncio版のサーバー。/api/chat（SSE）だけをasyncioで処理し、LLMの応答や予定の取得を待つ間も
+# スレッドを占有せずに多くのストリームを同時に扱えるようにする。プロトコル（リクエスト・SSEの形式・再開）はapp.pyと同じ。
+# それ以外のページ・APIは、app.pyのFlaskアプリをそのままマウントして提供する。
+#   uvicorn asgi:app --host 0.0.0.0 --port 5001
+
+# app.pyがsys.pathの設定とOrchestratorの初期化を行う（同じインスタンスを共有する）
+from app import app as flask_app, orchestrator, job_queue, SSE_HEADERS, STREAM_ERROR
+import config
+from src.core import resilience, stream_runs
+from src.calendar_agent import async_calendar
+
+
+async def chat_api(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    user_message = data.get('message', '')
+
+    # 外部APIのユーザー別レート制限の単位（ヘッダーがなければ接続元）。ストリームの再開もこの単位で受け付ける
+    user_id = request.headers.get('X-User-Id') or (request.client.host if request.client else None)
+
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id:
+        # 切断後の再接続。実行中または直近に終わった実行の続きを送る（再実行はしない）
+        try:
+            run, after_seq = stream_runs.registry.resume(user_id, last_event_id)
+        except stream_runs.ResumeError as e:
+            return Response(f"Error: {e}", status_code=410)
+        print(f"[ASGI] run {run.run_id} をイベント {after_seq} の続きから再開します。")
+    else:
+        if not user_message:
+            return Response("Error: メッセージがありません", status_code=400)
+        # 実行は接続から切り離したタスクで行う（切断しても猶予時間内なら再接続して続きを受け取れる）
+        run, after_seq = stream_runs.registry.create(user_id), 0
+        with resilience.user_scope(user_id):
+            stream_runs.start_as_task(run, lambda: orchestrator.arun_multi_agent_session_stream(user_message, user_id), STREAM_ERROR)
+        print(f"[ASGI] run {run.run_id} を開始します。")
+
+    stream = stream_runs.aiter_sse(stream_runs.registry, run, after_seq, config.SSE_HEARTBEAT_SECONDS)
+    return StreamingResponse(stream, media_type='text/event-stream', headers=SSE_HEADERS)
+
+
+async def job_events(request):
+    # ジョブの進捗のSSE購読もasyncioで扱う（購読中にスレッドを占有しない）。投入・ポーリングはFlask側
+    job = job_queue.get(request.path_params['job_id'])
+    user_id = request.headers.get('X-User-Id') or (request.client.host if request.client else None)
+    if job is None or job.user_id != user_id:
+        return Response("Error: ジョブが見つかりません", status_code=404)
+    try:
+        after = int(request.query_params.get('after', '0') or 0)
+    except ValueError:
+        return Response("Error: afterには整数を指定してください", status_code=400)
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id:
+        try:
+            run_id, after = stream_runs.parse_event_id(last_event_id)
+        except stream_runs.ResumeError as e:
+            return Response(f"Error: {e}", status_code=400)
+        if run_id != job.run.run_id:
+            return Response("Error: Last-Event-IDがこのジョブのものではありません", status_code=400)
+    try:
+        # 続きがバッファから押し出されていれば、ストリームを始める前に410で知らせる
+        job.run.events_after(after)
+    except stream_runs.ResumeError as e:
+        return Response(f"Error: {e}", status_code=410)
+    stream = stream_runs.aiter_sse(stream_runs.registry, job.run, after, config.SSE_HEARTBEAT_SECONDS)
+    return StreamingResponse(stream, media_type='text/event-stream', headers=SSE_HEADERS)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # 終了時にCalendar APIの接続プールを閉じる
+    await async_calendar.client.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/chat', chat_api, methods=['POST']),
+        Route('/api/jobs/{job_id}/events', job_events, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,78 @@
+# benchmarks/bench_event_search.py
+"""
+予定の検索索引（event_search）を、10万件の予定で計測する。
+従来の部分一致（全件を `in` で走査）と比べ、表記ゆれでの見つかり方も表示する。
+
+使い方:
+    python benchmarks/bench_event_search.py --events 100000 --repeat 20
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.calendar_agent import free_busy, event_search
+
+TITLES = [
+    "定例会議", "週次ミーティング", "1on1", "歯科検診", "美容院", "ジム", "英会話レッスン", "読書会",
+    "プロジェクト進捗確認", "企画書の締切", "病院の予約", "打ち合わせ（営業部）", "ランチ", "飲み会",
+    "家族の誕生日", "レポート提出", "勉強会", "面談", "出張（大阪）", "Zoom 打ち合わせ",
+]
+QUERIES = ["定例会議", "歯医者", "ミーティング", "締め切り", "zoom", "誕生日会"]
+
+
+def generate_events(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    start = free_busy.JST.localize(datetime(2025, 1, 1))
+    events = []
+    for i in range(count):
+        begin = start + timedelta(minutes=rng.randrange(0, 365 * 24 * 60, 15))
+        events.append({
+            "id": f"evt{i}",
+            "summary": f"{rng.choice(TITLES)} #{rng.randrange(1000)}",
+            "start": begin.isoformat(),
+            "end": (begin + timedelta(minutes=60)).isoformat(),
+            "description": rng.choice(["", "資料を持参", "オンライン", "駅前のクリニック"]),
+        })
+    return events
+
+
+def measure(label: str, func, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"{label:<40}{elapsed * 1000:>10.2f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    events = generate_events(args.events)
+    index = event_search.EventSearchIndex()
+    started = time.perf_counter()
+    for event in events:
+        index.add(event)
+    print(f"予定数: {len(index)}件 / 索引の構築: {(time.perf_counter() - started) * 1000:.0f} ms")
+    month_start = free_busy.to_minute(free_busy.JST.localize(datetime(2025, 6, 1)))
+    month_end = free_busy.to_minute(free_busy.JST.localize(datetime(2025, 7, 1)))
+
+    for query in QUERIES:
+        scan = measure(f"部分一致の走査「{query}」", lambda: [e for e in events if query.lower() in e["summary"].lower()], args.repeat)
+        hits = measure(f"索引の検索「{query}」（上位10件）", lambda: index.search(query, limit=10), args.repeat)
+        measure(f"索引の検索「{query}」（1か月の範囲）", lambda: index.search(query, month_start, month_end, limit=10), args.repeat)
+        top = hits[0][1]["summary"] if hits else "なし"
+        print(f"    部分一致: {len(scan)}件 / 索引: 最上位『{top}』（類似度 {hits[0][0]:.2f}）" if hits else f"    部分一致: {len(scan)}件 / 索引: 該当なし")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/bench_free_slots.py
+"""
+空き時間エンジン（free_busy）の性能を、1年分の密な予定で計測する。
+Google Calendarには接続せず、乱数で生成した予定を使う。
+
+使い方:
+    python benchmarks/bench_free_slots.py --events-per-day 12 --repeat 20
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.calendar_agent import free_busy
+
+
+def generate_events(start: datetime, days: int, events_per_day: int, seed: int = 0) -> list:
+    """7時〜22時の間に、重なりも含むランダムな予定を生成する"""
+    rng = random.Random(seed)
+    events = []
+    for d in range(days):
+        day = start + timedelta(days=d)
+        for i in range(events_per_day):
+            begin = day.replace(hour=7) + timedelta(minutes=rng.randrange(0, 15 * 60, 5))
+            end = begin + timedelta(minutes=rng.choice([15, 30, 45, 60, 90, 120]))
+            events.append({
+                "id": f"evt{d}_{i}",
+                "summary": f"予定{i}",
+                "start": begin.isoformat(),
+                "end": end.isoformat(),
+            })
+    return events
+
+
+def measure(label: str, func, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"{label:<36}{elapsed * 1000:>10.2f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--events-per-day", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    start = free_busy.JST.localize(datetime(2025, 1, 1))
+    end = start + timedelta(days=args.days)
+    events = generate_events(start, args.days, args.events_per_day)
+    print(f"予定数: {len(events)}件（{args.days}日 × {args.events_per_day}件）")
+
+    intervals = measure("予定→区間の変換", lambda: free_busy.events_to_intervals(events), args.repeat)
+    busy = measure("区間の結合（バッファ10分）", lambda: free_busy.merge_intervals(intervals, buffer_minutes=10), args.repeat)
+    windows = measure("空き区間の計算（9:00-18:00）", lambda: free_busy.free_windows(busy, start, end, "09:00", "18:00", min_minutes=30), args.repeat)
+    measure("60分枠の上位5件（早い順）", lambda: free_busy.k_best_slots(windows, 60, k=5), args.repeat)
+    measure("60分枠の上位5件（14時に近い順）", lambda: free_busy.k_best_slots(windows, 60, k=5, preferred_hour=14), args.repeat)
+    print(f"結合後の区間: {len(busy)}件 / 空き区間: {len(windows)}件")
+
+
+if __name__ == "__main__":
+    main()
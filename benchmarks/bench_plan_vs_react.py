@@ -0,0 +1,126 @@
+# benchmarks/bench_plan_vs_react.py
+"""
+ReActモードとPlan-and-Executeモードで、1ターンあたりのLLM呼び出し回数と所要時間を比較する。
+Gemini/Google Calendarには接続せず、台本どおりに応答する擬似クライアントと擬似ツールを使う。
+
+使い方:
+    python benchmarks/bench_plan_vs_react.py --llm-latency 1.5 --tool-latency 0.3
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-dummy-key")
+
+import config
+from src.agents.ak.agent import AKAgent
+from src.calendar_agent import tools
+from src.core import metrics, prompt_templates
+
+# シナリオ: ReActでの行動列と、同じ仕事をするPlanのステップ
+SCENARIOS = {
+    "2日分の確認＋追加": {
+        "message": "明日と明後日の予定を確認して、空いていれば明日の15時に会議を入れて",
+        "react_actions": [
+            ("list_calendar_events", {"start_time": "2025-01-02", "end_time": "2025-01-02"}),
+            ("list_calendar_events", {"start_time": "2025-01-03", "end_time": "2025-01-03"}),
+            ("add_calendar_event", {"summary": "会議", "start_time": "2025-01-02T15:00:00", "end_time": "2025-01-02T16:00:00"}),
+        ],
+        "plan": [
+            {"id": "s1", "tool": "list_calendar_events", "args": {"start_time": "2025-01-02", "end_time": "2025-01-02"}, "depends_on": []},
+            {"id": "s2", "tool": "list_calendar_events", "args": {"start_time": "2025-01-03", "end_time": "2025-01-03"}, "depends_on": []},
+            {"id": "s3", "tool": "add_calendar_event", "args": {"summary": "会議", "start_time": "2025-01-02T15:00:00", "end_time": "2025-01-02T16:00:00"}, "depends_on": ["s1"]},
+        ],
+    },
+    "検索して削除": {
+        "message": "明日の歯医者の予定を消して",
+        "react_actions": [
+            ("list_calendar_events", {"start_time": "2025-01-02", "end_time": "2025-01-02"}),
+            ("delete_calendar_event", {"event_id": "evt0"}),
+        ],
+        "plan": [
+            {"id": "s1", "tool": "list_calendar_events", "args": {"start_time": "2025-01-02", "end_time": "2025-01-02"}, "depends_on": []},
+            {"id": "s2", "tool": "delete_calendar_event", "args": {"event_id": "$s1.events.0.id"}, "depends_on": ["s1"]},
+        ],
+    },
+}
+
+
+class ScriptedClient:
+    """プロンプトの種類に応じて台本どおりの応答を返す、genai.Clientの代用品"""
+
+    def __init__(self, scenario: dict, llm_latency: float):
+        self.scenario = scenario
+        self.llm_latency = llm_latency
+        self.chats = SimpleNamespace(create=lambda model: SimpleNamespace(send_message=self._respond))
+
+    def _respond(self, prompt: str, config=None):
+        time.sleep(self.llm_latency)
+        if "計画のルール" in prompt:
+            text = json.dumps({"steps": self.scenario["plan"]}, ensure_ascii=False)
+        elif "実行したツールとその結果" in prompt:
+            text = "承知しました。すべて完了しています。"
+        else:
+            done = prompt.count("[ツール実行結果]")
+            actions = self.scenario["react_actions"]
+            if done < len(actions):
+                name, args = actions[done]
+                text = f"Thought: 次は{name}を使う。\nAction: {name}\nAction Input: {json.dumps(args, ensure_ascii=False)}"
+            else:
+                text = "Thought: 完了。\nAction: FinalAnswer\nAction Input: 承知しました。すべて完了しています。"
+        return SimpleNamespace(text=text)
+
+
+def _fake_tools(tool_latency: float) -> dict:
+    def delayed(result: dict):
+        def tool(**kwargs):
+            time.sleep(tool_latency)
+            return json.dumps(result, ensure_ascii=False)
+        return tool
+
+    return {
+        "list_calendar_events": delayed({"events": [{"id": "evt0", "summary": "歯医者", "start": "2025-01-02T10:00:00+09:00", "end": "2025-01-02T11:00:00+09:00"}]}),
+        "add_calendar_event": delayed({"status": "success", "message": "追加しました。", "eventId": "evt1"}),
+        "delete_calendar_event": delayed({"status": "success", "message": "削除しました。"}),
+        "get_current_datetime": delayed({"current_datetime": "2025-01-01T09:00:00+09:00"}),
+    }
+
+
+def run_turn(agent: AKAgent, mode: str, message: str) -> tuple:
+    token = metrics.start_turn()
+    started = time.perf_counter()
+    generator = agent.plan_and_execute_generator(message) if mode == "plan_execute" else agent.chat_generator(message)
+    for _ in generator:
+        pass
+    elapsed = time.perf_counter() - started
+    calls = metrics.end_turn(token, mode)
+    return sum(calls.values()), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="擬似LLM呼び出し1回あたりの遅延（秒）")
+    parser.add_argument("--tool-latency", type=float, default=0.3, help="擬似ツール呼び出し1回あたりの遅延（秒）")
+    args = parser.parse_args()
+
+    tools.TOOL_REGISTRY.update(_fake_tools(args.tool_latency))
+    # 呼び出し回数そのものを比較するため、応答キャッシュ・コンテキストキャッシュは無効にする
+    config.LLM_CACHE_ENABLED = False
+    prompt_templates.contexts.enabled = False
+
+    print(f"{'シナリオ':<16}{'モード':<14}{'LLM呼び出し/ターン':>18}{'所要時間(秒)':>14}")
+    for name, scenario in SCENARIOS.items():
+        for mode in ("react", "plan_execute"):
+            agent = AKAgent(project_root=PROJECT_ROOT, user_profile="", client=ScriptedClient(scenario, args.llm_latency))
+            calls, elapsed = run_turn(agent, mode, scenario["message"])
+            print(f"{name:<16}{mode:<14}{calls:>18}{elapsed:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# benchmarks/bench_schedule_optimizer.py
+"""
+週単位のスケジュール最適化（schedule_optimizer）の所要時間と配置結果を計測する。
+Google Calendarには接続せず、乱数で生成した既存予定とタスクを使う。
+
+使い方:
+    python benchmarks/bench_schedule_optimizer.py --tasks 20 --events-per-day 4
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+
+from src.calendar_agent import free_busy, schedule_optimizer
+from benchmarks.bench_free_slots import generate_events
+
+
+def generate_tasks(start: datetime, days: int, count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    tasks = []
+    for i in range(count):
+        deadline = start + timedelta(days=rng.randrange(1, days + 1))
+        tasks.append({
+            "title": f"タスク{i}",
+            "duration_minutes": rng.choice([30, 60, 90, 120]),
+            "deadline": deadline.date().isoformat() if rng.random() < 0.6 else None,
+            "priority": rng.randint(1, 5),
+            "preferred": rng.choice([None, None, "morning", "afternoon", "evening"]),
+        })
+    return tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--events-per-day", type=int, default=4)
+    parser.add_argument("--tasks", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    start = free_busy.JST.localize(datetime(2025, 1, 6))
+    end = start + timedelta(days=args.days)
+    events = generate_events(start, args.days, args.events_per_day)
+    busy = free_busy.merge_intervals(free_busy.events_to_intervals(events), buffer_minutes=10)
+    tasks = generate_tasks(start, args.days, args.tasks)
+    preferences = schedule_optimizer.preferences_from_profile("朝型で、午前中に集中したい。")
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        result = schedule_optimizer.optimize_schedule(tasks, busy, start, end, "09:00", "21:00", preferences)
+    elapsed = (time.perf_counter() - started) / args.repeat
+
+    print(f"既存予定: {len(events)}件 / タスク: {len(tasks)}件 / 期間: {args.days}日")
+    print(f"最適化の所要時間: {elapsed * 1000:.2f} ms")
+    print(f"配置: {len(result['placed'])}件 / 未配置: {len(result['unplaced'])}件 / スコア: {result['score']}")
+    print(schedule_optimizer.format_proposal(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+# benchmarks/bench_sse_load.py
+"""
+/api/chat（SSE）の同時セッション数を段階的に増やし、サーバーがどこで頭打ちになるかを測る負荷試験。
+擬似Gemini・擬似Calendar（fake_upstreams）を差し込んだサーバー（loadtest_server）を別プロセスで起動し、
+3つのワークフローを混ぜた依頼（fake_upstreams.MESSAGE_MIX）を、段階ごとにN本のSSEセッションで同時に送る。
+
+計測する値（段階ごと）:
+    最初のイベントまでの時間・最終応答までの時間（p50/p95/最大、ワークフロー別）、
+    途中で切れた・完了しなかったストリームの数、サーバーのメモリ（RSS）とセッションあたりの増分
+
+結果はJSONのレポートに書き出す（コミットをまたいで比べられるよう、コミットIDを含める）。--baselineで以前のレポートと比べる。
+
+使い方:
+    python benchmarks/bench_sse_load.py --server gunicorn --threads 8 --sessions 4,8,16,32
+    python benchmarks/bench_sse_load.py --server uvicorn --sessions 8,32,128 --baseline load_report_abc1234.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+os.environ.setdefault("GEMINI_API_KEY", "loadtest-dummy-key")
+
+from benchmarks.fake_upstreams import MESSAGE_MIX
+
+# 最終応答までの時間のp95が、最初の段階のこの倍を超えたら「頭打ち」とみなす
+SATURATION_FACTOR = 2.0
+
+
+# ▼▼▼ サーバーの起動とメモリの計測 ▼▼▼
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind: str, threads: int, port: int, args, log_path: str) -> subprocess.Popen:
+    if kind == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--workers", "1",
+                   "--threads", str(threads), "--timeout", "0", "benchmarks.loadtest_server:app"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "benchmarks.loadtest_server:asgi_app", "--host", "127.0.0.1",
+                   "--port", str(port), "--workers", "1", "--timeout-keep-alive", "75", "--log-level", "warning"]
+    env = dict(os.environ, LOADTEST_LLM_LATENCY=str(args.llm_latency), LOADTEST_CALENDAR_LATENCY=str(args.calendar_latency))
+    with open(log_path, "w") as log:
+        return subprocess.Popen(command, cwd=PROJECT_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"サーバーが起動に失敗しました（終了コード {process.returncode}）。")
+        try:
+            if httpx.get(f"{base_url}/api/metrics", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("サーバーの起動を待ちきれませんでした。")
+
+
+def process_tree_rss_kb(pid: int):
+    """pidとその子孫プロセス（gunicornのワーカーなど）のRSSの合計（KB）。/procがない環境ではNone"""
+    if pid is None or not os.path.isdir("/proc"):
+        return None
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        except (OSError, StopIteration):
+            pass
+        stack.extend(children.get(current, []))
+    return total
+
+
+# ▼▼▼ 1本のSSEセッション ▼▼▼
+
+async def run_session(client: httpx.AsyncClient, base_url: str, index: int, item: dict, timeout: float) -> dict:
+    result = {"workflow": item["workflow"], "ttfe": None, "ttfa": None, "completed": False, "error": None}
+    message = f"{item['message']}（負荷試験 #{index}）"
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(timeout):
+            async with client.stream("POST", f"{base_url}/api/chat", json={"message": message},
+                                     headers={"X-User-Id": f"loadtest-{index}"}) as response:
+                if response.status_code != 200:
+                    result["error"] = f"HTTP {response.status_code}"
+                    return result
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event:"):
+                        event = line[6:].strip()
+                    elif line.startswith("data:"):
+                        elapsed = time.perf_counter() - started
+                        if event == "end":
+                            result["completed"] = True
+                            return result
+                        if result["ttfe"] is None:
+                            result["ttfe"] = elapsed
+                        payload = json.loads(line[5:])
+                        if payload.get("status") == "final_answer":
+                            result["ttfa"] = elapsed
+                        elif payload.get("status") == "error":
+                            result["error"] = payload.get("message")
+                    elif not line:
+                        event = None
+        result["error"] = result["error"] or "終了イベントなしでストリームが閉じられました"
+    except TimeoutError:
+        result["error"] = "timeout"
+    except httpx.HTTPError as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def server_turns(base_url: str) -> dict:
+    """サーバーが実際に選んだワークフローごとのターン数（/api/metricsのllm_calls_per_turnの件数）"""
+    try:
+        timings = httpx.get(f"{base_url}/api/metrics", timeout=10).json().get("timings", {})
+    except (httpx.HTTPError, ValueError):
+        return {}
+    prefix = "llm_calls_per_turn{workflow="
+    return {key[len(prefix):-1]: stat["count"] for key, stat in timings.items() if key.startswith(prefix)}
+
+
+async def run_level(base_url: str, sessions: int, timeout: float, rng: random.Random, pid) -> dict:
+    weights = [item["weight"] for item in MESSAGE_MIX]
+    items = rng.choices(MESSAGE_MIX, weights=weights, k=sessions)
+    rss_before = process_tree_rss_kb(pid)
+    turns_before = await asyncio.to_thread(server_turns, base_url)
+    peak = [rss_before or 0]
+
+    async def sample_memory():
+        while True:
+            await asyncio.sleep(0.5)
+            rss = await asyncio.to_thread(process_tree_rss_kb, pid)
+            peak[0] = max(peak[0], rss or 0)
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    sampler = asyncio.create_task(sample_memory())
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=httpx.Timeout(timeout, connect=10), limits=limits) as client:
+        results = await asyncio.gather(*(run_session(client, base_url, i, item, timeout) for i, item in enumerate(items)))
+    duration = time.perf_counter() - started
+    sampler.cancel()
+    rss_after = process_tree_rss_kb(pid)
+    turns_after = await asyncio.to_thread(server_turns, base_url)
+    summary = summarize(sessions, results, duration, rss_before, rss_after, peak[0])
+    # 依頼の組み合わせどおりのワークフローが選ばれたか（オラクルが使えないとすべてReActに落ちる）を確かめられるようにする
+    summary["server_workflows"] = {name: count - turns_before.get(name, 0) for name, count in turns_after.items()
+                                   if count - turns_before.get(name, 0)}
+    return summary
+
+
+# ▼▼▼ 集計とレポート ▼▼▼
+
+def _percentiles(values: list) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    values = sorted(values)
+
+    def at(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+    return {"p50": at(0.5), "p95": at(0.95), "max": round(values[-1], 3)}
+
+
+def summarize(sessions: int, results: list, duration: float, rss_before, rss_after, rss_peak) -> dict:
+    completed = [r for r in results if r["completed"] and r["ttfa"] is not None]
+    errors = {}
+    for r in results:
+        if r["error"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    by_workflow = {}
+    for workflow in sorted({r["workflow"] for r in results}):
+        ttfa = [r["ttfa"] for r in completed if r["workflow"] == workflow]
+        by_workflow[workflow] = {"sessions": sum(1 for r in results if r["workflow"] == workflow), "ttfa": _percentiles(ttfa)}
+    return {
+        "sessions": sessions,
+        "completed": len(completed),
+        "dropped": sessions - len(completed),
+        "errors": errors,
+        "duration_seconds": round(duration, 3),
+        "sessions_per_second": round(len(completed) / duration, 3) if duration else None,
+        "ttfe": _percentiles([r["ttfe"] for r in results if r["ttfe"] is not None]),
+        "ttfa": _percentiles([r["ttfa"] for r in completed]),
+        "by_workflow": by_workflow,
+        "rss_kb": {"before": rss_before, "after": rss_after, "peak": rss_peak or None},
+        "rss_kb_per_session": round((rss_peak - rss_before) / sessions, 1) if rss_before and rss_peak else None,
+    }
+
+
+def mark_saturation(levels: list):
+    """最終応答までの時間のp95が最初の段階のSATURATION_FACTOR倍を超えた、または取りこぼしが出た段階に印を付ける"""
+    base = levels[0]["ttfa"]["p95"] if levels else None
+    for level in levels:
+        p95 = level["ttfa"]["p95"]
+        level["saturated"] = bool(level["dropped"]) or (base is not None and p95 is not None and p95 > base * SATURATION_FACTOR)
+
+
+def git_revision() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"commit": git("rev-parse", "--short", "HEAD") or "unknown", "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def print_table(levels: list, baseline: dict = None):
+    base_levels = {level["sessions"]: level for level in (baseline or {}).get("levels", [])}
+    print(f"{'同時数':>6}{'完了':>6}{'取りこぼし':>10}{'初回p95':>10}{'最終p50':>10}{'最終p95':>10}{'件/秒':>8}{'KB/件':>10}  備考")
+    for level in levels:
+        note = "頭打ち" if level["saturated"] else ""
+        old = base_levels.get(level["sessions"])
+        if old and old["ttfa"]["p95"] and level["ttfa"]["p95"]:
+            note += f"  最終p95 {level['ttfa']['p95'] - old['ttfa']['p95']:+.2f}秒 / 取りこぼし {level['dropped'] - old['dropped']:+d}（基準比）"
+        print(f"{level['sessions']:>6}{level['completed']:>6}{level['dropped']:>10}{_fmt(level['ttfe']['p95']):>10}"
+              f"{_fmt(level['ttfa']['p50']):>10}{_fmt(level['ttfa']['p95']):>10}{_fmt(level['sessions_per_second']):>8}"
+              f"{_fmt(level['rss_kb_per_session']):>10}  {note}")
+        for message, count in level["errors"].items():
+            print(f"{'':>6}  - {message} x{count}")
+        expected = {name: stat["sessions"] for name, stat in level["by_workflow"].items()}
+        if level.get("server_workflows") and level["server_workflows"] != expected:
+            print(f"{'':>6}  ! サーバーが選んだワークフロー {level['server_workflows']} が想定 {expected} と一致しません")
+
+
+def _fmt(value) -> str:
+    return "-" if value is None else f"{value:.2f}" if isinstance(value, float) else str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=["gunicorn", "uvicorn"], default="gunicorn", help="起動するサーバー")
+    parser.add_argument("--threads", type=int, default=8, help="gunicornのスレッド数（本番は8）")
+    parser.add_argument("--url", help="起動済みのサーバーに対して実行する（このときメモリは計測しない）")
+    parser.add_argument("--sessions", default="4,8,16,32", help="同時セッション数の段階（カンマ区切り）")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="擬似LLM呼び出し1回あたりの遅延（秒）")
+    parser.add_argument("--calendar-latency", type=float, default=0.2, help="擬似Calendar API呼び出し1回あたりの遅延（秒）")
+    parser.add_argument("--timeout", type=float, default=180, help="1セッションの打ち切り時間（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="依頼の組み合わせを決める乱数の種")
+    parser.add_argument("--report", help="レポートの出力先（既定: load_report_<コミット>.json）")
+    parser.add_argument("--baseline", help="比較する以前のレポート")
+    args = parser.parse_args()
+
+    levels_to_run = [int(n) for n in args.sessions.split(",") if n.strip()]
+    revision = git_revision()
+    process, pid = None, None
+    base_url = args.url
+    if not base_url:
+        port = _free_port()
+        log_path = os.path.join(tempfile.gettempdir(), f"loadtest_server_{port}.log")
+        process = start_server(args.server, args.threads, port, args, log_path)
+        pid = process.pid
+        base_url = f"http://127.0.0.1:{port}"
+        print(f"[LOAD] {args.server} を起動しました（ログ: {log_path}）")
+    try:
+        wait_until_ready(base_url, process)
+        rng = random.Random(args.seed)
+        levels = []
+        for sessions in levels_to_run:
+            print(f"[LOAD] 同時 {sessions} セッションを実行中...")
+            levels.append(asyncio.run(run_level(base_url, sessions, args.timeout, rng, pid)))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    mark_saturation(levels)
+    report = {
+        **revision,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "server": {"kind": args.server if not args.url else "external", "threads": args.threads if args.server == "gunicorn" else None},
+        "params": {"llm_latency": args.llm_latency, "calendar_latency": args.calendar_latency,
+                   "timeout": args.timeout, "seed": args.seed, "message_mix": MESSAGE_MIX},
+        "levels": levels,
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"[LOAD] 基準: {args.baseline}（コミット {baseline.get('commit')}）")
+    print_table(levels, baseline)
+    knee = next((level["sessions"] for level in levels if level["saturated"]), None)
+    print(f"[LOAD] 頭打ちになった同時数: {knee if knee is not None else '（この範囲では頭打ちなし）'}")
+
+    report_path = args.report or f"load_report_{revision['commit']}.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[LOAD] レポートを書き出しました: {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/bench_tool_format.py
+"""
+ツールの結果をプロンプトに入れるときの量を、従来のJSONとコンパクトな形式（tool_format）で比べる。
+トークン数はprompt_profileのローカルな見積もり。Google Calendar・Geminiには接続しない。
+
+使い方:
+    python benchmarks/bench_tool_format.py --days 1,7,30,90 --events-per-day 4
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-dummy-key")
+
+from src.calendar_agent import free_busy, tool_format
+from src.core import prompt_profile
+
+TITLES = ["定例会議", "1on1", "歯科検診", "ジム", "英会話レッスン", "プロジェクト進捗確認", "企画書の締切", "ランチ", "勉強会", "面談"]
+
+
+def generate_listing(days: int, events_per_day: int, seed: int = 0) -> str:
+    """list_calendar_eventsと同じ形式（ensure_asciiの既定のまま）の結果を作る"""
+    rng = random.Random(seed)
+    start = free_busy.JST.localize(datetime(2025, 6, 2, 8))
+    events = []
+    for d in range(days):
+        for _ in range(events_per_day):
+            begin = start + timedelta(days=d, minutes=rng.randrange(0, 12 * 60, 15))
+            events.append({
+                # GoogleのイベントIDと同じ、base32hexの26文字
+                "id": "".join(rng.choice("0123456789abcdefghijklmnopqrstuv") for _ in range(26)),
+                "summary": rng.choice(TITLES),
+                "start": begin.isoformat(),
+                "end": (begin + timedelta(minutes=rng.choice([30, 60, 90]))).isoformat(),
+            })
+        if d % 7 == 5:
+            day = (start + timedelta(days=d)).date()
+            events.append({"id": f"holiday{d}", "summary": "祝日", "start": day.isoformat(), "end": (day + timedelta(days=1)).isoformat()})
+    events.sort(key=lambda e: e["start"])
+    return json.dumps({"events": events})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", default="1,7,30,90", help="一覧の期間（日数、カンマ区切り）")
+    parser.add_argument("--events-per-day", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'期間':>6}{'予定数':>8}{'JSON(tok)':>12}{'表(tok)':>10}{'削減':>8}{'変換(ms)':>10}")
+    for days in (int(d) for d in args.days.split(",")):
+        raw = generate_listing(days, args.events_per_day)
+        count = len(json.loads(raw)["events"])
+        started = time.perf_counter()
+        compact = tool_format.for_prompt("list_calendar_events", raw)
+        elapsed = (time.perf_counter() - started) * 1000
+        raw_tokens, compact_tokens = prompt_profile.estimate_tokens(raw), prompt_profile.estimate_tokens(compact)
+        print(f"{days:>5}日{count:>8}{raw_tokens:>12}{compact_tokens:>10}{1 - compact_tokens / raw_tokens:>8.0%}{elapsed:>10.2f}")
+    print(f"\n表の例（{args.days.split(',')[0]}日分）:")
+    print(tool_format.for_prompt("list_calendar_events", generate_listing(int(args.days.split(",")[0]), args.events_per_day)))
+
+
+if __name__ == "__main__":
+    main()
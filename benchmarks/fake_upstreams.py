@@ -0,0 +1,208 @@
+# benchmarks/fake_upstreams.py
+"""
+負荷試験用の擬似Gemini・擬似Google Calendar。
+カセット（src/core/cassette.py）の再生の差し込み口を使い、記録の代わりにその場で応答を作って返す。
+HTTPの層で差し替えるので、レート制限・再試行・読み取りの合流・書き込みジャーナルなどは本番と同じ経路を通る。
+"""
+import email
+import json
+import random
+import re
+import threading
+from datetime import datetime, timedelta
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+from src.core import cassette
+
+# 負荷試験で送る依頼と、それぞれが選ばれるべきワークフロー・出現の重み
+MESSAGE_MIX = [
+    {"message": "今日の予定を教えて", "workflow": "simple_listing", "weight": 4},
+    {"message": "明日のスケジュールを確認したい", "workflow": "simple_listing", "weight": 2},
+    {"message": "明日の15時に打ち合わせを入れて", "workflow": "single_agent_react", "weight": 3},
+    {"message": "週末に何か面白いことがしたい", "workflow": "multi_agent_discussion", "weight": 1},
+]
+
+_REQUEST_PATTERN = re.compile(r"# ユーザーからの(?:依頼|指示):?\s*「?([^」\n]+)")
+
+
+def workflow_for(message: str) -> str:
+    for item in MESSAGE_MIX:
+        if message.startswith(item["message"]):
+            return item["workflow"]
+    return "single_agent_react"
+
+
+class FakeUpstreams(cassette.Cassette):
+    """記録を読む代わりに、リクエストの内容から応答を作る再生用カセット"""
+
+    def __init__(self, llm_latency: float = 1.0, calendar_latency: float = 0.2, jitter: float = 0.3, seed: int = 0):
+        # 親の__init__はカセットのファイルを読むので呼ばない
+        self.path = None
+        self.mode = "replay"
+        self.latency_scale = 1.0
+        self.llm_latency = llm_latency
+        self.calendar_latency = calendar_latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._events = {}
+        self._contexts = {}   # コンテキストキャッシュの名前 -> 登録された前置き
+        self._seed_events()
+
+    def _latency_ms(self, base: float) -> int:
+        with self._lock:
+            return round(base * 1000 * self._random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def match(self, method: str, url: str, body: bytes) -> dict:
+        if cassette.api_of(url) == "gemini" and "/cachedContents" in url:
+            entry = self._cached_contents(method.upper(), url, json.loads(body or b"{}"))
+            latency = self.calendar_latency
+        elif cassette.api_of(url) == "gemini":
+            entry = self._gemini(json.loads(body or b"{}"))
+            latency = self.llm_latency
+        elif "/batch/" in url:
+            entry = self._batch(body.decode("utf-8"))
+            latency = self.calendar_latency
+        else:
+            entry = self._calendar(method.upper(), url, json.loads(body) if body else None)
+            latency = self.calendar_latency
+        entry["ms"] = self._latency_ms(latency)
+        return entry
+
+    # ▼▼▼ Gemini ▼▼▼
+
+    def _gemini(self, request: dict) -> dict:
+        contents = request.get("contents") or [{}]
+        prompt = "".join(part.get("text", "") for part in contents[-1].get("parts", []))
+        with self._lock:
+            cached = self._contexts.get(request.get("cachedContent"), "")
+        prompt = cached + prompt
+        text = self._respond(prompt)
+        return {"status": 200, "type": "application/json", "json": {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": len(prompt) // 2, "candidatesTokenCount": len(text) // 2,
+                              "cachedContentTokenCount": len(cached) // 2, "totalTokenCount": (len(prompt) + len(text)) // 2},
+        }}
+
+    def _cached_contents(self, method: str, url: str, request: dict) -> dict:
+        """コンテキストキャッシュの作成・延長（前置きを覚えておき、cachedContentを指定した呼び出しで先頭に付ける）"""
+        expire = (datetime.utcnow() + timedelta(hours=1)).isoformat() + "Z"
+        with self._lock:
+            if method == "POST":
+                name = f"cachedContents/fake{len(self._contexts)}"
+                self._contexts[name] = "".join(part.get("text", "") for content in request.get("contents", []) for part in content.get("parts", []))
+                return _ok({"name": name, "model": request.get("model"), "expireTime": expire})
+            name = "cachedContents/" + urlsplit(url).path.split("/cachedContents/", 1)[-1]
+            if name not in self._contexts:
+                return _error(404, "Not Found")
+            return _ok({"name": name, "expireTime": expire})
+
+    def _respond(self, prompt: str) -> str:
+        found = _REQUEST_PATTERN.search(prompt)
+        message = found.group(1).strip() if found else ""
+        tomorrow = (datetime.now() + timedelta(days=1)).date().isoformat()
+        if "最適なワークフロー" in prompt:
+            return workflow_for(message)
+        if "計画のルール" in prompt:
+            return json.dumps({"steps": [
+                {"id": "s1", "tool": "list_calendar_events", "args": {"start_time": tomorrow, "end_time": tomorrow}, "depends_on": []},
+                {"id": "s2", "tool": "add_calendar_event", "depends_on": ["s1"], "args": {
+                    "summary": "打ち合わせ", "start_time": f"{tomorrow}T15:00:00", "end_time": f"{tomorrow}T16:00:00"}},
+            ]}, ensure_ascii=False)
+        if "実行したツールとその結果" in prompt or "カレンダーを確認したところ" in prompt:
+            return "承知しました。ご確認ください、予定は以上のとおりです。"
+        if "for_oracle" in prompt:
+            return json.dumps({
+                "for_oracle": "週末は午前に体を動かし、午後は新しい場所を訪ねる案を推します。",
+                "for_ui": "午前は散歩、午後は美術館はいかがでしょう。",
+                "tasks": [{"title": "美術館に行く", "duration_minutes": 120}],
+            }, ensure_ascii=False)
+        # ReActモード（SINGLE_AGENT_MODE=react）: 予定を1回確認してから答える
+        if "[ツール実行結果]" in prompt:
+            return "Thought: 完了。\nAction: FinalAnswer\nAction Input: 承知しました。確認が済みました。"
+        if "# ユーザーからの指示" in prompt:
+            return (f"Thought: まず予定を確認する。\nAction: list_calendar_events\n"
+                    f"Action Input: {json.dumps({'start_time': tomorrow, 'end_time': tomorrow})}")
+        return "承知しました。"
+
+    # ▼▼▼ Google Calendar（events.list/get/insert/patch/delete/instancesだけを模す） ▼▼▼
+
+    def _seed_events(self):
+        start = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0)
+        for day in range(14):
+            for hour, summary in ((10, "定例ミーティング"), (14, "作業ブロック")):
+                begin = start + timedelta(days=day, hours=hour - 9)
+                event_id = f"seed{day:02d}{hour}"
+                self._events[event_id] = {
+                    "id": event_id, "status": "confirmed", "summary": summary,
+                    "start": {"dateTime": begin.isoformat() + "+09:00"},
+                    "end": {"dateTime": (begin + timedelta(hours=1)).isoformat() + "+09:00"},
+                }
+
+    def _calendar(self, method: str, url: str, body: dict) -> dict:
+        parts = urlsplit(url)
+        path = parts.path.split("/calendars/", 1)[-1].split("/")   # ["primary", "events", <id>, "instances"]
+        params = dict(parse_qsl(parts.query))
+        event_id = path[2] if len(path) > 2 else None
+        with self._lock:
+            if method == "GET" and event_id is None:
+                return _ok({"items": self._in_range(params.get("timeMin"), params.get("timeMax"))})
+            if method == "GET" and len(path) > 3:
+                return _ok({"items": []})
+            if method == "POST" and event_id is None:
+                new_id = body.get("id") or f"evt{len(self._events)}"
+                if new_id in self._events:
+                    return _error(409, "The requested identifier already exists.")
+                self._events[new_id] = dict(body, id=new_id, status="confirmed")
+                return _ok(self._events[new_id])
+            if event_id not in self._events:
+                return _error(404, "Not Found")
+            if method == "GET":
+                return _ok(self._events[event_id])
+            if method in ("PATCH", "PUT"):
+                self._events[event_id].update(body or {})
+                return _ok(self._events[event_id])
+            if method == "DELETE":
+                del self._events[event_id]
+                return {"status": 204, "type": "", "text": ""}
+        return _error(400, f"擬似Calendarが対応していないリクエストです: {method} {parts.path}")
+
+    def _batch(self, body: str) -> dict:
+        """バッチリクエスト（multipart/mixed。書き込みジャーナルがまとめて送る）を1件ずつ処理し、multipartで返す"""
+        boundary = body.lstrip().split("\n", 1)[0].strip()[2:]
+        request = email.message_from_string(f'Content-Type: multipart/mixed; boundary="{boundary}"\r\n\r\n{body}')
+        parts = []
+        for part in request.get_payload():
+            head, _, inner_body = part.get_payload().replace("\r\n", "\n").partition("\n\n")
+            method, path = head.split("\n", 1)[0].split()[:2]
+            result = self._calendar(method, f"https://www.googleapis.com{path}", json.loads(inner_body) if inner_body.strip() else None)
+            content = json.dumps(result.get("json", ""), ensure_ascii=False) if "json" in result else ""
+            parts.append(f"--batch_response\r\nContent-Type: application/http\r\n"
+                         f"Content-ID: <response-{part['Content-ID'].strip('<>')}>\r\n\r\n"
+                         f"HTTP/1.1 {result['status']} {HTTPStatus(result['status']).phrase}\r\n"
+                         f"Content-Type: application/json\r\n\r\n{content}\r\n")
+        return {"status": 200, "type": "multipart/mixed; boundary=batch_response", "text": "".join(parts) + "--batch_response--\r\n"}
+
+    def _in_range(self, time_min: str, time_max: str) -> list:
+        def key(event):
+            return event["start"].get("dateTime") or event["start"].get("date")
+        low, high = (time_min or "")[:19], (time_max or "9999")[:19]
+        return sorted((e for e in self._events.values() if low <= key(e)[:19] <= high), key=key)
+
+
+def _ok(data: dict) -> dict:
+    return {"status": 200, "type": "application/json", "json": data}
+
+
+def _error(status: int, message: str) -> dict:
+    return {"status": status, "type": "application/json", "json": {"error": {"code": status, "message": message}}}
+
+
+def install(llm_latency: float = 1.0, calendar_latency: float = 0.2) -> FakeUpstreams:
+    """
+    擬似Gemini・擬似Calendarを有効にする。
+    genai.Clientやカレンダーのサービスが作られる前（app・src.agentsのimport前）に呼ぶ。
+    """
+    cassette.active = FakeUpstreams(llm_latency=llm_latency, calendar_latency=calendar_latency)
+    return cassette.active
@@ -0,0 +1,50 @@
+# benchmarks/loadtest_server.py
+"""
+負荷試験用に、擬似Gemini・擬似Calendar（fake_upstreams）を差し込んだアプリ。bench_sse_load.pyが起動する。
+
+    gunicorn --workers 1 --threads 8 benchmarks.loadtest_server:app
+    uvicorn benchmarks.loadtest_server:asgi_app
+
+環境変数:
+    LOADTEST_LLM_LATENCY / LOADTEST_CALENDAR_LATENCY: 擬似APIの応答時間（秒）
+    LOADTEST_RATE_LIMITS=1: 外部APIのレート制限・Geminiの同時呼び出し数の上限を本番の設定のまま使う
+                            （既定では緩め、APIの割り当てではなくサーバー自体の限界を測る）
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT))
+os.environ.setdefault("GEMINI_API_KEY", "loadtest-dummy-key")
+# 同じ依頼を繰り返し送るので、応答キャッシュで計測が甘くならないよう既定で無効にする
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+
+import config
+
+if os.getenv("LOADTEST_RATE_LIMITS") != "1":
+    config.UPSTREAM_LIMITS = {name: {"rate": 1000.0, "burst": 1000, "user_rate": 1000.0, "user_burst": 1000}
+                              for name in config.UPSTREAM_LIMITS}
+    # モデルごとの同時呼び出し数の上限（本番はAPIの割り当てに合わせて16/8）も、同時セッション数より大きくしておく
+    config.GEMINI_MAX_CONCURRENT = {model: 1000 for model in config.GEMINI_MAX_CONCURRENT}
+    config.GEMINI_MAX_CONCURRENT_DEFAULT = 1000
+# 書き込みジャーナルは作業ディレクトリを汚さないよう一時ファイルに書く
+config.MUTATION_JOURNAL_FILE = os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "mutation_journal.jsonl")
+
+from benchmarks import fake_upstreams
+
+fake_upstreams.install(
+    llm_latency=float(os.getenv("LOADTEST_LLM_LATENCY", "1.0")),
+    calendar_latency=float(os.getenv("LOADTEST_CALENDAR_LATENCY", "0.2")),
+)
+
+from app import app  # noqa: E402
+
+
+def __getattr__(name):
+    # uvicorn用。starletteはgunicornで起動するときには読み込まない
+    if name == "asgi_app":
+        from asgi import app as asgi_app
+        return asgi_app
+    raise AttributeError(name)
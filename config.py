@@ -14,6 +14,170 @@ GOOGLE_SCOPES = ["https://www.googleapis.com/auth/calendar"]
 
 # 使用するAIモデル名
 MODEL_NAME = "gemini-2.5-pro"
+FAST_MODEL_NAME = "gemini-2.5-flash"
+
+# モデルの階層（tier）。呼び出し箇所ごとにどのtierから始めるかをMODEL_ROUTINGで決める
+MODEL_TIERS = {
+    "fast": FAST_MODEL_NAME,
+    "pro": MODEL_NAME,
+}
+
+# 呼び出し箇所→初期tier。"fast"の箇所は、応答の解析失敗・低信頼時に"pro"へ昇格する（cascade）
+# system_prompt（初期化時のプライミング）は、ReAct用チャットと同じモデルで行う
+MODEL_ROUTING = {
+    "workflow_decision": "fast",
+    "react_step": "pro",
+    "plan": "pro",
+    "synthesis": "fast",
+    "initial_idea": "fast",
+    "final_response": "fast",
+    "oracle": "pro",
+}
+
+# tierごとの概算単価（USD / 100万トークン、入力・出力）。コスト指標の算出にのみ使う
+MODEL_PRICING = {
+    "fast": {"input": 0.30, "cached_input": 0.075, "output": 2.50},
+    "pro": {"input": 1.25, "cached_input": 0.31, "output": 10.00},
+}
+
+# シングルエージェントの実行モード
+# "plan_execute": 1回の計画→ローカル並列実行→1回の合成（失敗時のみReActにフォールバック）
+# "react": 従来の思考・行動ループ（最大5回のLLM呼び出し）
+SINGLE_AGENT_MODE = os.getenv("SINGLE_AGENT_MODE", "plan_execute")
+
+# ワークフロー判断と並行して、メッセージから推定した期間の予定を先読みするか
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "1") == "1"
+
+# マルチエージェント議論に渡す、今後N日間のカレンダー要約（バックグラウンドで更新）
+CALENDAR_DIGEST_ENABLED = os.getenv("CALENDAR_DIGEST_ENABLED", "1") == "1"
+CALENDAR_DIGEST_DAYS = 7
+CALENDAR_DIGEST_REFRESH_SECONDS = 300
+
+# LLM応答キャッシュ
+# LLM_CACHE_DIRを指定すると、メモリ上のLRUに加えてディスクにも応答を保存する
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_TTL_SECONDS = 600
+# カレンダーの内容（ツール結果・要約）を埋め込む呼び出し箇所のTTL。
+# Googleカレンダー側で直接編集された場合も、古い事実に基づく応答をこの秒数より長くは返さない
+LLM_CACHE_TTL_BY_CALL_SITE = {
+    "plan": 60,
+    "synthesis": 60,
+    "initial_idea": 60,
+    "final_response": 60,
+}
+LLM_CACHE_MAX_ENTRIES = 512
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR")
+LLM_CACHE_MAX_DISK_ENTRIES = 5000
+
+# プロンプトの部分ごとのトークン数の見積もり（src/core/prompt_profile.py）と、呼び出し箇所ごとの予算（トークン数）。
+# react_step・oracleはチャットセッションに積まれた過去のやり取りも含めた量で判定する
+PROMPT_PROFILE_ENABLED = os.getenv("PROMPT_PROFILE_ENABLED", "1") == "1"
+PROMPT_TOKEN_BUDGETS = {
+    "system_prompt": 4000,
+    "workflow_decision": 1000,
+    "react_step": 16000,
+    "plan": 6000,
+    "synthesis": 6000,
+    "initial_idea": 4000,
+    "final_response": 4000,
+    "oracle": 16000,
+}
+PROMPT_TOKEN_BUDGET_DEFAULT = 8000
+
+# ツールの結果をプロンプトに入れるときのコンパクトな形式（src/calendar_agent/tool_format.py）。
+# 一覧に載せる予定の上限（超えた分は件数と期間だけ書く）と、短いID→予定IDの対応表に保持する件数
+TOOL_OUTPUT_COMPACT = os.getenv("TOOL_OUTPUT_COMPACT", "1") == "1"
+TOOL_OUTPUT_MAX_EVENTS = 60
+TOOL_OUTPUT_ALIAS_CAPACITY = 5000
+
+# プロンプトの静的な前置き（ペルソナ・プロファイル・ツール説明など。src/core/prompt_templates.py）を、
+# Geminiのコンテキストキャッシュ（cachedContents）として共有するか。キャッシュの有効期間（使っている間は延長する）と、
+# モデルごとにキャッシュできる最小のトークン数（これより短い前置きは毎回送る）
+PROMPT_CONTEXT_CACHE_ENABLED = os.getenv("PROMPT_CONTEXT_CACHE_ENABLED", "1") == "1"
+PROMPT_CONTEXT_CACHE_TTL_SECONDS = 3600
+PROMPT_CONTEXT_CACHE_MIN_TOKENS = {
+    FAST_MODEL_NAME: 1024,
+    MODEL_NAME: 4096,
+}
+
+# 予定追加時の重なりチェックに使う索引。取得した期間の情報をこの秒数だけ信頼する
+OVERLAP_INDEX_TTL_SECONDS = 120
+
+# 繰り返し予定を親予定として受け取り、ローカルで展開するか（"0"ならGoogle側で展開したものを受け取る）
+LOCAL_RECURRENCE_EXPANSION = os.getenv("LOCAL_RECURRENCE_EXPANSION", "1") == "1"
+RECURRENCE_CACHE_WINDOWS = 256
+# 繰り返し予定を追加するとき、重なりを確認する日数
+RECURRENCE_CONFLICT_CHECK_DAYS = 28
+
+# IDで予定を参照するためのキャッシュ（一覧の取得結果などで埋める）
+EVENT_CACHE_TTL_SECONDS = 300
+EVENT_CACHE_MAX_EVENTS = 2000
+
+# カレンダーへの書き込みをローカルに記録して即座に応答し、バックグラウンドでまとめて送るか
+# （"0"なら従来どおり、応答の前にその場で送る）。
+# 有効にすると、Googleに届く前に「追加しました」と応答する。未送信の書き込みはジャーナルのファイルにしか残らないため、
+# インスタンスが回収されるとファイルが消える環境（Cloud Runのコンテナのローカルディスクなど）では有効にしない。
+# 有効にする場合は、MUTATION_JOURNAL_FILEを永続的なボリューム上のパスにする
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "0") == "1"
+MUTATION_JOURNAL_FILE = os.path.abspath(os.getenv("MUTATION_JOURNAL_FILE", "mutation_journal.jsonl"))
+MUTATION_FLUSH_INTERVAL_SECONDS = 2.0
+
+# 同じ期間の予定取得を合流させ、結果をこの秒数だけ再利用する（このプロセスからの書き込みで破棄）
+CALENDAR_READ_CACHE_TTL_SECONDS = 5
+
+# 外部API呼び出しのレート制限（1秒あたりの呼び出し数とバースト。user_*はユーザーごと）
+# Geminiは、議論ルートの1ターン（ワークフロー判断・2体の意見・オラクルの統合で4回、判断の昇格や再試行を含めて6回前後）がユーザーごとのバーストに収まり、
+# 数ターンが重なってもプロセス全体では待たない大きさにする。同時に呼び出せる数はgemini_poolのモデルごとの上限で抑える
+UPSTREAM_LIMITS = {
+    "calendar": {"rate": 5.0, "burst": 10, "user_rate": 2.0, "user_burst": 5},
+    "gemini": {"rate": float(os.getenv("GEMINI_RATE_PER_SECOND", "10")), "burst": 30, "user_rate": 3.0, "user_burst": 10},
+}
+# レート制限を覚えておくユーザーの数（超えたら、しばらく呼び出していないユーザーから忘れる）
+UPSTREAM_USER_BUCKETS_MAX = 1000
+# 429/5xxの再試行（ジッター付き指数バックオフ）とサーキットブレーカー
+UPSTREAM_MAX_RETRIES = 4
+UPSTREAM_BACKOFF_BASE_SECONDS = 0.5
+UPSTREAM_BACKOFF_MAX_SECONDS = 20
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30
+
+# /api/chatのストリームの再開（Last-Event-ID）。runごとに保持するイベント数、終了後に再開を受け付ける秒数、
+# 切断後に再接続を待つ秒数（過ぎたら実行を打ち切る）、何も送るものがない間のハートビートの間隔
+SSE_REPLAY_BUFFER_EVENTS = 200
+SSE_RESUME_RETENTION_SECONDS = 120
+SSE_RESUME_GRACE_SECONDS = float(os.getenv("SSE_RESUME_GRACE_SECONDS", "30"))
+SSE_HEARTBEAT_SECONDS = 15
+
+# ジョブ（/api/jobs）のワーカー数（うち"high"専用の数）、待ち行列の上限、ユーザーごとの待ち件数の上限、終了後に結果を保持する秒数
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_FAST_LANE_WORKERS = 1
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "32"))
+JOB_MAX_QUEUED_PER_USER = 3
+JOB_RETENTION_SECONDS = 600
+
+# ユーザーごとの会話（会話履歴・配置案・チャットセッション）を保持する数と、使われなくなってから捨てるまでの秒数
+CONVERSATION_MAX = int(os.getenv("CONVERSATION_MAX", "1000"))
+CONVERSATION_IDLE_SECONDS = 3600
+
+# asyncio版サーバー（asgi.py）が使う、Calendar APIの非同期クライアントの接続プール
+CALENDAR_HTTP_MAX_CONNECTIONS = int(os.getenv("CALENDAR_HTTP_MAX_CONNECTIONS", "20"))
+CALENDAR_HTTP_TIMEOUT_SECONDS = 30
+
+# Geminiのクライアント（genai.Client）のプール（src/core/gemini_pool.py）。エージェント・オラクルはここから借りる。
+# クライアントの数、クライアントごとのHTTP接続数の上限、モデルごとの同時呼び出し数の上限（未登録のモデルは_DEFAULT）
+GEMINI_CLIENT_POOL_SIZE = int(os.getenv("GEMINI_CLIENT_POOL_SIZE", "2"))
+GEMINI_HTTP_MAX_CONNECTIONS = int(os.getenv("GEMINI_HTTP_MAX_CONNECTIONS", "20"))
+GEMINI_MAX_CONCURRENT = {
+    FAST_MODEL_NAME: int(os.getenv("GEMINI_MAX_CONCURRENT_FAST", "16")),
+    MODEL_NAME: int(os.getenv("GEMINI_MAX_CONCURRENT_PRO", "8")),
+}
+GEMINI_MAX_CONCURRENT_DEFAULT = 8
+
+# 外部API（Gemini・Calendar）とのやり取りの記録・再生（src/core/cassette.py）。
+# CASSETTE_MODEは"record"・"replay"・空（無効）。再生時の待ち時間は、記録時の所要時間×CASSETTE_LATENCY_SCALE（0なら待たない）
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "")
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "cassettes/session.jsonl.gz")
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "1.0"))
 
 # 認証情報ファイルのパス
 GOOGLE_CREDS_FILE = os.path.abspath("credentials.json")
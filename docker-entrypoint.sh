@@ -1,6 +1,9 @@
 #!/bin/sh
-if [ "$APP_ENV" = "production" ]; then
+if [ "$APP_ENV" = "production" ] && [ "$SERVER_MODE" = "wsgi" ]; then
   exec gunicorn --bind :$PORT --workers 1 --threads 8 --timeout 0 app:app
+elif [ "$APP_ENV" = "production" ]; then
+  # asyncio版（/api/chatのストリームがスレッドを占有しない）。SERVER_MODE=wsgi で従来のgunicornに戻せる
+  exec uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 1 --timeout-keep-alive 75
 else
   exec python -m app
 fi
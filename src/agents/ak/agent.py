@@ -2,14 +2,136 @@
 from pathlib import Path
 import os
 import json
-import config
-import google.genai as genai
 import re
 from datetime import datetime, timezone, timedelta
-from src.calendar_agent import tools
+from src.calendar_agent import tools, tool_format
+from src.core import metrics, model_router, resilience, async_bridge, gemini_pool, prompt_profile, prompt_templates
+from src.core.plan_executor import PlanError, parse_plan, execute_plan, aexecute_plan, format_results
+
+# プロンプトのテンプレート（静的な前置き＋呼び出しごとの部分。src/core/prompt_templates.py）。
+# ペルソナ・ユーザープロファイル・ツール説明は前置きに置き、エージェントごと・ペルソナの版ごとに1回だけ描画する
+SYSTEM_TEMPLATE = prompt_templates.PromptTemplate("system", static="""あなたは『アーク（a-k）』という、特定のユーザーをサポートする専属AIカレンダー司令塔です。
+
+# あなたのペルソナ:
+{persona}
+
+# サポート対象ユーザーの特性プロファイル:
+{user_profile}
+
+# あなたが使えるツール:
+{tools}
+
+# 禁止事項（厳守）
+- あなたの過去の経歴に関する具体的な地名、組織名、役職名、能力名について、一切言及してはならない。
+
+# 出力フォーマット
+必ず以下の3行のフォーマットで厳密に出力してください。
+Thought: （次に何をすべきかの思考をここに記述）
+Action: （ツール名 または 'FinalAnswer'）
+Action Input: （Actionがツールの場合は、引数を**必ずJSON形式の文字列で**記述。ActionがFinalAnswerの場合は、ユーザーへの最終的な返答を記述）
+""")
+
+REACT_STEP_TEMPLATE = prompt_templates.PromptTemplate("react_step", static="", dynamic="""
+# 現在の状況
+- これまでのやり取り:
+{context}
+
+# あなたの思考と行動
+""")
+
+PLAN_TEMPLATE = prompt_templates.PromptTemplate("plan", static="""あなたは『アーク（a-k）』というAIカレンダー司令塔です。
+ユーザーの指示を達成するために必要なツール呼び出しを、**一度にすべて**計画してください。
+
+# サポート対象ユーザーの特性プロファイル:
+{user_profile}
+
+# あなたが使えるツール:
+{tools}
+
+# 計画のルール
+- 各ステップは `id`, `tool`, `args`, `depends_on` を持ちます。
+- 互いに依存しないステップは並列に実行されます。先行ステップの結果が必要な場合のみ `depends_on` に記述してください。
+- 先行ステップの結果の値を引数に使う場合は、`"$s1.events.0.id"` のように参照を記述できます。
+- ツールが不要な依頼（雑談など）の場合は、`steps` を空のリストにしてください。
+- 結果を見るまで判断できない分岐がある場合でも、確実に必要なステップだけを計画してください。
+
+# 出力形式
+必ず、以下のJSON形式で厳密に出力してください。他のテキストは一切含めないでください。
+```json
+{{
+  "steps": [
+    {{"id": "s1", "tool": "list_calendar_events", "args": {{"start_time": "2025-01-01T00:00:00", "end_time": "2025-01-01T23:59:59"}}, "depends_on": []}}
+  ]
+}}
+```
+""", dynamic="""
+# 現在の日時
+{now}
+
+# 状況
+{context}
+""")
+
+SYNTHESIS_TEMPLATE = prompt_templates.PromptTemplate("synthesis", static="""あなたは『アーク（a-k）』というAIカレンダー司令塔です。
+ペルソナ：{persona}
+
+# サポート対象ユーザーの特性プロファイル:
+{user_profile}
+
+# あなたのタスク
+この後に示す「実行したツールとその結果」だけを根拠に、あなたのペルソナと口調で、ユーザーへの最終的な返答を作成してください。
+ツールがエラーを返した場合や、指示の一部を実行できていない場合は、正直にそのことを伝えてください。
+思考や解説は含めず、完成された返答メッセージだけを出力してください。
+""", dynamic="""
+# 状況
+{context}
+
+# 実行したツールとその結果
+{tool_results}
+""")
+
+INITIAL_IDEA_TEMPLATE = prompt_templates.PromptTemplate("initial_idea", static="""
+# あなたの役割とペルソナ
+あなたは『アーク（a-k）』というAIカレンダー司令塔です。
+ペルソナ：{persona}
+
+# サポート対象のユーザープロファイル:
+{user_profile}
+
+# あなたのタスク
+これは、Orchestrator（オラクル）への報告と、ユーザーへの途中経過報告を作成する、**ブレインストーミングのフェーズ**です。
+あなたのペルソナとユーザーの情報を基に、最後に示す依頼に対する**初期アイデア**を考えて、以下の3つの成果物を生成してください。
+
+1.  **for_oracle (オラクルへの報告)**:
+    - あなたがどのような思考プロセスで、どのような具体的なアプローチを考えたかを記述する、内部報告用の詳細なテキスト。箇条書きなどで分かりやすく記述すること。
+
+2.  **for_ui (ユーザー向け要約)**:
+    - あなたのペルソナと口調を完全に反映させ、ユーザーに「今こんなことを考えていますよ」と伝えるための、**100字から200字程度の魅力的な要約メッセージ**。
+
+3.  **tasks (配置したいタスク)**:
+    - 依頼が予定の組み直しや作業の割り振りを含む場合、カレンダーに置きたいタスクを列挙する。各タスクは title、duration_minutes（所要時間・分）、deadline（締切、YYYY-MM-DDTHH:MM:SS、なければnull）、priority（1〜5、5が最重要）、preferred（"morning"・"afternoon"・"evening"、なければnull）を持つ。該当しなければ空のリスト。
+
+# 厳守すべきルール
+- このタスクでは、**絶対にツールを使用してはいけません** (`Action: ツール名` は禁止)。
+- あくまで、議論の「たたき台」となるアイデアを生成してください。
+
+# 出力形式
+必ず、以下のJSON形式で厳密に出力してください。他のテキストは一切含めないでください。
+```json
+{{
+  "for_oracle": "（ここに思考プロセスを含む詳細な意見を記述）",
+  "for_ui": "（ここにペルソナを反映した短い要約を記述）",
+  "tasks": []
+}}
+```
+""", dynamic="""
+# ユーザーからの依頼:
+「{user_message}」
+""")
+
 
 class AKAgent:
-    def __init__(self, project_root: Path, user_profile: dict):
+    def __init__(self, project_root: Path, user_profile: dict, client=None):
         self.project_root = project_root
         persona_path = self.project_root / 'knowledge' / 'ak_persona.md'
         
@@ -23,29 +145,46 @@ class AKAgent:
         self.user_profile = user_profile
         self.name = "ak"
         print("アーク：a-kエージェント、起動完了です。")
-        self.client = genai.Client(api_key=config.GEMINI_API_KEY)
+        self.client = client or gemini_pool.pool.borrow()
 
         system_prompt = self._build_system_prompt()
+        prompt_profile.observe("system_prompt", system_prompt)
         
-        self.chat = self.client.chats.create(model=config.MODEL_NAME)
-        print(f"[{self.name.upper()} AGENT INIT] システムプロンプトをGeminiに送信中...")
-        try:
-            initial_response = self.chat.send_message(system_prompt)
-            print(f"[{self.name.upper()} AGENT INIT] システムプロンプト設定完了。AIからの初期応答: {initial_response.text[:100]}...")
-        except Exception as e:
-            print(f"[{self.name.upper()} AGENT INIT ERROR] システムプロンプトの送信に失敗しました: {e}")
+        # システムプロンプトのプライミングは、ReActループで使う同じチャット（同じモデル）で行う
+        react_model = model_router.model_for("react_step")
+        self.chat = self.client.chats.create(model=react_model)
+        # コンテキストキャッシュにできれば、チャットの履歴には積まず、毎回キャッシュとして参照させる
+        # （できなければ、またはキャッシュが途中で失効したら、セッションに1回だけ送る）
+        self.system_prefix = prompt_templates.SessionPrefix(self.client, react_model, system_prompt)
+        if self.system_prefix.cached_name() is not None:
+            print(f"[{self.name.upper()} AGENT INIT] システムプロンプトをコンテキストキャッシュとして設定しました。")
+        else:
+            print(f"[{self.name.upper()} AGENT INIT] システムプロンプトをGeminiに送信中...")
+            try:
+                initial_response = self.system_prefix.prime(self.chat)
+                print(f"[{self.name.upper()} AGENT INIT] システムプロンプト設定完了。AIからの初期応答: {initial_response.text[:100]}...")
+            except Exception as e:
+                print(f"[{self.name.upper()} AGENT INIT ERROR] システムプロンプトの送信に失敗しました: {e}")
 
-    def chat_generator(self, user_message: str):
-        history = []
+    def new_chat(self):
+        """会話（ユーザー）ごとのReAct用チャットセッションを作る。システムプロンプトを送り済みなら、その履歴を引き継ぐ"""
+        return self.system_prefix.new_session(self.chat)
+
+    def chat_generator(self, user_message: str, history: list = None, context: str = None, tool_registry: dict = None,
+                       chat_session=None):
         # chat_generatorでもuser_profileをコンテキストに含める
-        context = f"# サポート対象ユーザーの特性プロファイル:\n{self.user_profile}\n\n# ユーザーからの指示:\n{user_message}"
+        if context is None:
+            context = self._build_task_context(user_message, history)
+        # 会話ごとのセッション（new_chat）を渡されなければ、このエージェントのセッションを使う
+        chat_session = chat_session or self.chat
+        history = []
         
         for _ in range(5):
             try:
                 yield {"status": "thinking", "speaker": self.name, "message": "（アークが考え中です...）"}
                 
                 user_prompt = self._build_user_prompt(context)
-                ai_response = self._call_gemini(self.chat, user_prompt)
+                ai_response = self._call_gemini(chat_session, user_prompt)
                 
                 history.append({"ai": ai_response}) # 履歴にはAIの応答だけを追加していく
                 parsed = self._parse_ai_response(ai_response)
@@ -60,10 +199,10 @@ class AKAgent:
                     tool_name = action
                     tool_input = parsed.get('action_input', {})
                     yield {"status": "tool_running", "speaker": self.name, "message": f"ツール『{tool_name}』を実行中..."}
-                    tool_result = self._run_tool(tool_name, tool_input)
+                    tool_result = self._run_tool(tool_name, tool_input, tool_registry)
                     history.append({"tool": tool_name, "result": tool_result})
                     # contextを更新して次のループへ
-                    context += f"\n\n[あなたの思考と行動]\n{ai_response}\n\n[ツール実行結果]\n{tool_result}"
+                    context = prompt_profile.append(context, "react_trail", f"\n\n[あなたの思考と行動]\n{ai_response}\n\n[ツール実行結果]\n{tool_format.for_prompt(tool_name, tool_result)}")
                 else:
                     error_message = parsed.get('action_input', 'AIの応答を解析できませんでした。')
                     yield {"status": "final_answer", "speaker": self.name, "message": f"申し訳ありません、少し混乱しているようです。エラー: {error_message}"}
@@ -76,13 +215,78 @@ class AKAgent:
                 return
         yield {"status": "final_answer", "speaker": self.name, "message": "うーん、少し考えがまとまらないようです。"}
 
+    def plan_and_execute_generator(self, user_message: str, history: list = None, tool_registry: dict = None, chat_session=None):
+        """
+        Plan-and-Executeモード。1回の計画呼び出しでツール呼び出しのDAGを作り、
+        ローカルで並列実行したうえで、1回の合成呼び出しで最終応答を作る。
+        計画が失敗した場合のみReActループにフォールバックする。
+        """
+        yield {"status": "thinking", "speaker": self.name, "message": "（アークが段取りを組んでいます...）"}
+        tool_registry = tool_registry or tools.TOOL_REGISTRY
+        context = self._build_task_context(user_message, history)
+        plan_text = self._call_with_tier(self._build_plan_prompt(context), "plan")
+
+        try:
+            steps = parse_plan(plan_text, tool_registry)
+            if steps:
+                yield {"status": "tool_running", "speaker": self.name, "message": f"ツールを{len(steps)}件実行中..."}
+            results = execute_plan(steps, tool_registry)
+        except PlanError as e:
+            print(f"[{self.name.upper()} AGENT] 計画の実行に失敗したためReActにフォールバックします: {e}")
+            metrics.incr("plan_fallbacks", agent=self.name)
+            if e.results:
+                context = prompt_profile.append(context, "tool_results", f"\n\n[実行済みのツール結果（再実行しないこと）]\n{format_results(steps, e.results)}")
+            yield from self.chat_generator(user_message, context=context, tool_registry=tool_registry, chat_session=chat_session)
+            return
+
+        final_message = self._call_with_tier(self._build_synthesis_prompt(context, format_results(steps, results)), "synthesis", accept=bool)
+        if final_message.startswith("Thought:"):
+            final_message = self._parse_ai_response(final_message).get("final_answer", final_message)
+        yield {"status": "final_answer", "speaker": self.name, "message": final_message}
+
+    async def aplan_and_execute_generator(self, user_message: str, history: list = None, tool_registry: dict = None,
+                                          async_tool_registry: dict = None, chat_session=None):
+        """
+        plan_and_execute_generatorのasyncio版（asgi.pyのサーバーが使う）。
+        LLM呼び出しと予定の取得はイベントループ上で待ち、ReActへのフォールバックだけスレッドで実行する。
+        async_tool_registryには、イベントループ上で実行するツールの表（既定はtools.ASYNC_TOOL_REGISTRY）を渡せる。
+        """
+        yield {"status": "thinking", "speaker": self.name, "message": "（アークが段取りを組んでいます...）"}
+        tool_registry = tool_registry or tools.TOOL_REGISTRY
+        context = self._build_task_context(user_message, history)
+        plan_text = await self._acall_with_tier(self._build_plan_prompt(context), "plan")
+
+        try:
+            steps = parse_plan(plan_text, tool_registry)
+            if steps:
+                yield {"status": "tool_running", "speaker": self.name, "message": f"ツールを{len(steps)}件実行中..."}
+            results = await aexecute_plan(steps, tool_registry, async_tool_registry or tools.ASYNC_TOOL_REGISTRY)
+        except PlanError as e:
+            print(f"[{self.name.upper()} AGENT] 計画の実行に失敗したためReActにフォールバックします: {e}")
+            metrics.incr("plan_fallbacks", agent=self.name)
+            if e.results:
+                context = prompt_profile.append(context, "tool_results", f"\n\n[実行済みのツール結果（再実行しないこと）]\n{format_results(steps, e.results)}")
+            async for result in async_bridge.iterate_in_thread(lambda: self.chat_generator(user_message, context=context, tool_registry=tool_registry,
+                                                                                   chat_session=chat_session)):
+                yield result
+            return
+
+        final_message = await self._acall_with_tier(self._build_synthesis_prompt(context, format_results(steps, results)), "synthesis", accept=bool)
+        if final_message.startswith("Thought:"):
+            final_message = self._parse_ai_response(final_message).get("final_answer", final_message)
+        yield {"status": "final_answer", "speaker": self.name, "message": final_message}
+
     def get_initial_idea(self, user_message: str) -> dict:
         print(f"[{self.name.upper()} AGENT] 最初のアイデアを生成中...")
         prompt = self._build_initial_idea_prompt(user_message)
-        
-        idea_chat = self.client.chats.create(model=config.MODEL_NAME)
-        response = self._call_gemini(idea_chat, prompt)
+        return self._parse_initial_idea(self._call_with_tier(prompt, "initial_idea", accept=self._is_json_response))
+
+    async def aget_initial_idea(self, user_message: str) -> dict:
+        print(f"[{self.name.upper()} AGENT] 最初のアイデアを生成中...")
+        prompt = self._build_initial_idea_prompt(user_message)
+        return self._parse_initial_idea(await self._acall_with_tier(prompt, "initial_idea", accept=self._is_json_response))
 
+    def _parse_initial_idea(self, response: str) -> dict:
         try:
             return self._parse_json_from_response(response)
         except (json.JSONDecodeError, ValueError) as e:
@@ -91,132 +295,85 @@ class AKAgent:
 
     def generate_final_response(self, prompt: str) -> str:
         print(f"[{self.name.upper()} AGENT] 最終応答を生成中...")
-        response_chat = self.client.chats.create(model=config.MODEL_NAME)
-        return self._call_gemini(response_chat, prompt)
-
-    def _build_system_prompt(self) -> str:
-        tools_description = """
-- `list_calendar_events(start_time: str, end_time: str)`: 指定期間の予定を取得。「YYYY-MM-DDTHH:MM:SS」形式。
-- `add_calendar_event(summary: str, start_time: str, end_time: str)`: 新しい予定を追加。
-- `delete_calendar_event(event_id: str)`: IDで予定を削除。
-- `get_current_datetime()`: 現在の正確な日時を取得。
-        """
-        
-        return f"""あなたは『アーク（a-k）』という、特定のユーザーをサポートする専属AIカレンダー司令塔です。
-
-# あなたのペルソナ:
-{self.persona}
-
-# サポート対象ユーザーの特性プロファイル:
-{self.user_profile}
+        return self._call_with_tier(prompt, "final_response", accept=bool)
 
-# あなたが使えるツール:
-{tools_description}
-
-# 禁止事項（厳守）
-- あなたの過去の経歴に関する具体的な地名、組織名、役職名、能力名について、一切言及してはならない。
+    async def agenerate_final_response(self, prompt: str) -> str:
+        print(f"[{self.name.upper()} AGENT] 最終応答を生成中...")
+        return await self._acall_with_tier(prompt, "final_response", accept=bool)
 
-# 出力フォーマット
-必ず以下の3行のフォーマットで厳密に出力してください。
-Thought: （次に何をすべきかの思考をここに記述）
-Action: （ツール名 または 'FinalAnswer'）
-Action Input: （Actionがツールの場合は、引数を**必ずJSON形式の文字列で**記述。ActionがFinalAnswerの場合は、ユーザーへの最終的な返答を記述）
-"""
+    def _build_system_prompt(self) -> str:
+        return SYSTEM_TEMPLATE.prefix(self.name, persona=self.persona, user_profile=self.user_profile, tools=tools.TOOLS_DESCRIPTION)
 
     def _build_user_prompt(self, context: str) -> str:
-        return f"""
-# 現在の状況
-- これまでのやり取り:
-{context}
-
-# あなたの思考と行動
-"""
+        return REACT_STEP_TEMPLATE.render(self.name, context=context)
+
+    def _build_task_context(self, user_message: str, history: list = None) -> str:
+        """ReAct/Plan実行で共通に使う、タスクの初期コンテキストを構築する（ユーザープロファイルは各プロンプトの前置きにある）"""
+        context = ""
+        # 直前までの会話（今回のユーザー発話は除く）
+        past = [item for item in (history or []) if item.get("content") != user_message][-6:]
+        if past:
+            history_text = "\n".join([f"{item['role']}: {item['content']}" for item in past])
+            context += f"# これまでの会話履歴:\n{history_text}\n\n"
+        return prompt_profile.tag(context + f"# ユーザーからの指示:\n{user_message}",
+                                  history=history_text if past else None, user_message=user_message)
+
+    def _build_plan_prompt(self, context: str) -> str:
+        """Plan-and-Executeモードの計画フェーズ用プロンプトを構築する"""
+        return PLAN_TEMPLATE.render(self.name, user_profile=self.user_profile, tools=tools.TOOLS_DESCRIPTION,
+                                    now=datetime.now(tools.JST).isoformat(timespec='minutes'), context=context)
+
+    def _build_synthesis_prompt(self, context: str, results_text: str) -> str:
+        """Plan-and-Executeモードの合成フェーズ用プロンプトを構築する"""
+        return SYNTHESIS_TEMPLATE.render(self.name, persona=self.persona, user_profile=self.user_profile,
+                                         context=context, tool_results=results_text)
 
     def _build_initial_idea_prompt(self, user_message: str) -> str:
         """get_initial_ideaで使うための専用プロンプトを構築する"""
-        return f"""
-# あなたの役割とペルソナ
-あなたは『アーク（a-k）』というAIカレンダー司令塔です。
-ペルソナ：{self.persona}
-
-# サポート対象のユーザープロファイル:
-{self.user_profile}
-
-# ユーザーからの依頼:
-「{user_message}」
-
-# あなたのタスク
-上記の依頼と情報に基づき、以下の2つの成果物を生成してください。
-
-1.  **for_oracle (オラクルへの報告)**:
-    - あなたの思考プロセス（Thought: ...）と、具体的な提案の箇条書きを含んだ、Orchestrator（オラクル）への報告用の詳細なテキスト。
-
-2.  **for_ui (ユーザー向け要約)**:
-    - あなたのペルソナと口調を完全に反映させ、ユーザーに議論の途中経過として見せるための、100字程度の魅力的な要約メッセージ。
+        return INITIAL_IDEA_TEMPLATE.render(self.name, persona=self.persona, user_profile=self.user_profile, user_message=user_message)
 
-# 出力形式
-必ず、以下のJSON形式で厳密に出力してください。他のテキストは一切含めないでください。
-```json
-{{
-  "for_oracle": "（ここに思考プロセスを含む詳細な意見を記述）",
-  "for_ui": "（ここにペルソナを反映した短い要約を記述）"
-}}
-"""
-    
-    def _call_gemini(self, chat_session, prompt: str) -> str:
+    def _call_gemini(self, chat_session, prompt: str, call_site: str = "react_step") -> str:
         """指定されたチャットセッションでGemini APIを呼び出し、応答テキストを返す"""
         try:
-            response = chat_session.send_message(prompt)
-            return response.text.strip()
+            return self.system_prefix.send(call_site, chat_session, prompt)
+        except resilience.UpstreamUnavailable as e:
+            print(f"[Gemini API Error] {e}")
+            return "Thought: Gemini APIが混み合っているか停止しているため、応答を得られませんでした。\nAction: FinalAnswer\nAction Input: 申し訳ありません、現在AIサービスが混み合っています。少し時間をおいてからもう一度お試しください。"
         except Exception as e:
             print(f"[Gemini API Error] {e}")
             return "Thought: Gemini APIエラーが発生しました。\nAction: FinalAnswer\nAction Input: 申し訳ありません、AI側でエラーが発生しました。"
 
-    def _build_initial_idea_prompt(self, user_message: str) -> str:
-        # ★★★ ここを修正 ★★★
-        """get_initial_ideaで使うための専用プロンプトを構築する"""
-        return f"""
-# あなたの役割とペルソナ
-あなたは『アーク（a-k）』というAIカレンダー司令塔です。
-ペルソナ：{self.persona}
-
-# サポート対象のユーザープロファイル:
-{self.user_profile}
-
-# ユーザーからの依頼:
-「{user_message}」
-
-# あなたのタスク
-これは、Orchestrator（オラクル）への報告と、ユーザーへの途中経過報告を作成する、**ブレインストーミングのフェーズ**です。
-あなたのペルソナとユーザーの情報を基に、この依頼に対する**初期アイデア**を考えて、以下の2つの成果物を生成してください。
-
-1.  **for_oracle (オラクルへの報告)**:
-    - あなたがどのような思考プロセスで、どのような具体的なアプローチを考えたかを記述する、内部報告用の詳細なテキスト。箇条書きなどで分かりやすく記述すること。
+    def _call_with_tier(self, prompt: str, call_site: str, accept=None) -> str:
+        """呼び出し箇所に応じたモデルで単発の呼び出しを行う（fastで不十分ならproへ昇格）"""
+        def send(model: str, prompt: str):
+            return prompt_templates.send(self.client, model, prompt)
+        try:
+            return model_router.cascade(call_site, prompt, send, accept)
+        except Exception as e:
+            return self._gemini_error_response(e)
 
-2.  **for_ui (ユーザー向け要約)**:
-    - あなたのペルソナと口調を完全に反映させ、ユーザーに「今こんなことを考えていますよ」と伝えるための、**100字から200字程度の魅力的な要約メッセージ**。
+    async def _acall_with_tier(self, prompt: str, call_site: str, accept=None) -> str:
+        """_call_with_tierのasyncio版（非同期クライアント client.aio を使う）"""
+        async def send(model: str, prompt: str):
+            return await prompt_templates.asend(self.client, model, prompt)
+        try:
+            return await model_router.acascade(call_site, prompt, send, accept)
+        except Exception as e:
+            return self._gemini_error_response(e)
 
-# 厳守すべきルール
-- このタスクでは、**絶対にツールを使用してはいけません** (`Action: ツール名` は禁止)。
-- あくまで、議論の「たたき台」となるアイデアを生成してください。
+    def _gemini_error_response(self, e: Exception) -> str:
+        """Gemini APIの呼び出しに失敗したときに、ReActの形式で返す応答"""
+        print(f"[Gemini API Error] {e}")
+        if isinstance(e, resilience.UpstreamUnavailable):
+            return "Thought: Gemini APIが混み合っているか停止しているため、応答を得られませんでした。\nAction: FinalAnswer\nAction Input: 申し訳ありません、現在AIサービスが混み合っています。少し時間をおいてからもう一度お試しください。"
+        return "Thought: Gemini APIエラーが発生しました。\nAction: FinalAnswer\nAction Input: 申し訳ありません、AI側でエラーが発生しました。"
 
-# 出力形式
-必ず、以下のJSON形式で厳密に出力してください。他のテキストは一切含めないでください。
-```json
-{{
-  "for_oracle": "（ここに思考プロセスを含む詳細な意見を記述）",
-  "for_ui": "（ここにペルソナを反映した短い要約を記述）"
-}}
-"""
-
-    def _call_gemini(self, chat_session, prompt: str) -> str:
-        """指定されたチャットセッションでGemini APIを呼び出し、応答テキストを返す"""
+    def _is_json_response(self, text: str) -> bool:
         try:
-            response = chat_session.send_message(prompt)
-            return response.text.strip()
-        except Exception as e:
-            print(f"[Gemini API Error] {e}")
-            return "Thought: Gemini APIエラーが発生しました。\nAction: FinalAnswer\nAction Input: 申し訳ありません、AI側でエラーが発生しました。"
+            self._parse_json_from_response(text)
+            return True
+        except (json.JSONDecodeError, ValueError):
+            return False
 
     def _parse_ai_response(self, ai_response: str) -> dict:
         """AI応答を解析し、Action/Action Input/FinalAnswerを抽出"""
@@ -248,13 +405,13 @@ Action Input: （Actionがツールの場合は、引数を**必ずJSON形式の
             print(f"[PARSING ERROR] {e} in response: {ai_response}")
             return {"action": "ParsingError", "action_input": "An unexpected error occurred during parsing."}
 
-    def _run_tool(self, tool_name: str, tool_args: dict) -> str:
+    def _run_tool(self, tool_name: str, tool_args: dict, tool_registry: dict = None) -> str:
         """ツール名と引数dictから該当ツールを実行"""
         print(f"[ReAct] ツール呼び出し: {tool_name} 入力: {tool_args}")
         try:
-            if tool_name == "list_calendar_events":
-                return tools.list_calendar_events(**tool_args)
-            # ... 他のツールも同様に追加 ...
+            tool_func = (tool_registry or tools.TOOL_REGISTRY).get(tool_name)
+            if tool_func:
+                return tool_func(**tool_args)
             else:
                 return f"未対応ツール: {tool_name}"
         except Exception as e:
@@ -304,7 +461,7 @@ Action Input: （Actionがツールの場合は、引数を**必ずJSON形式の
 #         self.chat = self.client.chats.create(model=config.MODEL_NAME)
 #         print(f"[{self.name.upper()} AGENT INIT] システムプロンプトをGeminiに送信中...")
 #         try:
-#             initial_response = self.chat.send_message(system_prompt)
+#             initial_response = self.chat.send_message(str(system_prompt))
 #             print(f"[{self.name.upper()} AGENT INIT] システムプロンプト設定完了。AIからの初期応答: {initial_response.text[:100]}...")
 #         except Exception as e:
 #             print(f"[{self.name.upper()} AGENT INIT ERROR] システムプロンプトの送信に失敗しました: {e}")
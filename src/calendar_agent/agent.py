@@ -1,8 +1,9 @@
 # src/calendar_agent/agent.py
 
-import google.genai as genai
 import config
-from src.calendar_agent import tools
+from src.calendar_agent import tools, free_busy, event_search
+from src.calendar_agent.mentions import MentionIndex
+from src.core import resilience, gemini_pool
 from datetime import datetime, timedelta
 import json
 import re
@@ -12,12 +13,13 @@ class CalendarAgent:
     """カレンダー操作を行うAIエージェント (Function Calling非対応Gemini用)"""
     def __init__(self):
         self._init_knowledge()
-        self.client = genai.Client(api_key=config.GEMINI_API_KEY)
+        self.client = gemini_pool.pool.borrow()
         self.system_instruction = self._build_system_instruction()
         self.chat = self.client.chats.create(model=config.MODEL_NAME)
         self.chat.send_message(self.system_instruction)
         self._last_candidates = None
         self.chat_history = []  # 会話履歴（ユーザー発話・AI応答）
+        self.mentions = MentionIndex()  # 表示・操作した予定（「その予定」「2番目の」の解決用）
 
     def _init_knowledge(self):
         knowledge = load_knowledge_texts()
@@ -35,7 +37,8 @@ class CalendarAgent:
   "end_time": "終了日時(ISO8601)", // 追加・削除時
   "is_all_day": true/false, // 追加時
   "description": "説明", // 追加時
-  "location": "場所" // 追加時
+  "location": "場所", // 追加時
+  "recurrence": "繰り返しのRRULE（例: FREQ=WEEKLY;BYDAY=MO）" // 繰り返し予定の追加時のみ
 }}
 ---
 複数予定の場合は複数のJSONコードブロックで返してください。
@@ -58,23 +61,24 @@ class CalendarAgent:
             return self._delete_by_id(user_input.strip())
         if user_input.strip() == '詳細':
             return self.show_event_details()
-        response = self.chat.send_message(user_input)
+        response = self._send(user_input)
         json_blocks = self._extract_all_json_blocks(response.text)
+        add_conflicts = self._check_add_conflicts(json_blocks)
         messages = []
-        for block in json_blocks:
+        for i, block in enumerate(json_blocks):
             action = block.get('action')
             if action == 'add':
-                messages.append(self._add_event(block))
+                messages.append(self._add_event(block, add_conflicts.get(i)))
             elif action == 'delete':
                 messages.append(self._delete_event(block, user_input))
             elif action == 'edit':
-                messages.append(self._edit_event(block))
+                messages.append(self._edit_event(block, user_input))
             elif action == 'list':
                 messages.append(self._list_event_action(block))
         return '\n'.join(messages) if messages else response.text
 
     def send_message_for_ui(self, user_input: str) -> dict:
-        response = self.chat.send_message(user_input)
+        response = self._send(user_input)
         self.chat_history.append({"user": user_input, "ai": response.text})  # 履歴保存
         json_blocks = self._extract_all_json_blocks(response.text)
         results = []
@@ -84,7 +88,8 @@ class CalendarAgent:
         is_edit_context = any(k in recent_context for k in edit_keywords)
         last_candidates = getattr(self, '_last_candidates', None)
         if json_blocks:
-            for block in json_blocks:
+            add_conflicts = self._check_add_conflicts(json_blocks)
+            for i, block in enumerate(json_blocks):
                 action = block.get('action')
                 # add→edit変換条件
                 if action == 'add' and is_edit_context and last_candidates:
@@ -112,7 +117,7 @@ class CalendarAgent:
                         results.append(msg)
                         continue  # addはスキップ
                 if action == 'add':
-                    msg = self._add_event(block)
+                    msg = self._add_event(block, add_conflicts.get(i))
                     results.append(msg)
                 elif action == 'list':
                     period = ''
@@ -131,7 +136,7 @@ class CalendarAgent:
                     msg = self._delete_event(block, user_input)
                     results.append(msg)
                 elif action == 'edit':
-                    msg = self._edit_event(block)
+                    msg = self._edit_event(block, user_input)
                     results.append(msg)
             result_text = '\n'.join(results)
             print(f"あなた: {user_input}\nAI秘書: {result_text}\n{'-'*50}")
@@ -140,37 +145,72 @@ class CalendarAgent:
         text_only = re.sub(r'```json[\s\S]*?```', '', response.text).strip()
         return {"type": "text", "content": text_only}
 
+    def _send(self, text):
+        # Gemini呼び出しは共通のレート制限・再試行を通す
+        return resilience.gemini_api.call(lambda: self.chat.send_message(text))
+
     def _delete_by_id(self, event_id):
-        # まずイベント情報を取得してタイトルを得る
-        event_info = tools.get_calendar_event(event_id)
+        # まずイベント情報を取得してタイトルを得る（一覧で取得済みならキャッシュから引ける）
+        event_info = json.loads(tools.get_calendar_event(event_id))
+        if event_info.get('status') != 'success':
+            return event_info.get('message')
+        event = event_info['event']
+        del_result = json.loads(tools.delete_calendar_event(event_id))
+        if del_result.get('status') != 'success':
+            return del_result.get('message')
+        self.mentions.forget(event_id)
+        date_str = self.format_event_date(event['start'], event['end'], event.get('is_all_day', False))
+        return f"{date_str}『{event['summary']}』を削除しました。\n（カレンダーから削除しました）"
+
+    def _check_add_conflicts(self, json_blocks):
+        """応答内の追加ブロックをまとめて重なりチェックする（ブロック番号→重なりのリスト）"""
+        add_indices = [i for i, b in enumerate(json_blocks) if b.get('action') == 'add' and b.get('start_time') and b.get('end_time')]
+        if not add_indices:
+            return {}
         try:
-            event = json.loads(event_info).get('event', {})
-            title = event.get('summary', f'ID: {event_id}')
-        except Exception:
-            title = f'ID: {event_id}'
-        del_result = tools.delete_calendar_event(event_id)
-        msg = json.loads(del_result).get('message', f"予定『{title}』を削除しました。")
-        return msg
+            found = tools.check_conflicts([json_blocks[i] for i in add_indices])
+        except Exception as e:
+            print(f"[CONFLICT WARNING] 重なりチェックに失敗しました: {e}")
+            return {}
+        # 候補同士の重なりは、応答内のブロック番号に付け替える
+        return {
+            i: [dict(c, proposal_index=add_indices[c['proposal_index']]) if 'proposal_index' in c else c for c in f]
+            for i, f in zip(add_indices, found)
+        }
 
-    def _add_event(self, block):
+    def _conflict_note(self, conflicts):
+        notes = [f"{self.format_event_date(c['start'], c['end'])}『{c['summary']}』" for c in conflicts if 'summary' in c]
+        if any('proposal_index' in c for c in conflicts):
+            notes.append('同時に追加した別の予定')
+        return f"\n※ {', '.join(notes)}と時間が重なっています。" if notes else ''
+
+    def _add_event(self, block, conflicts=None):
+        # ユーザーの明示的な指示なので重なっていても追加し、重なりは注意として伝える
         result = tools.add_calendar_event(
             summary=block.get('summary'),
             start_time=block.get('start_time'),
             end_time=block.get('end_time'),
             description=block.get('description'),
             location=block.get('location'),
-            is_all_day=block.get('is_all_day', False)
+            is_all_day=block.get('is_all_day', False),
+            allow_overlap=True,
+            recurrence=block.get('recurrence')
         )
-        msg = json.loads(result).get('message')
+        result = json.loads(result)
+        if result.get('status') != 'success':
+            return result.get('message')
+        if conflicts is None:
+            conflicts = result.get('conflicts', [])
+        self.mentions.record_touched([{'id': result.get('eventId'), 'summary': block.get('summary', ''), 'start': block.get('start_time'), 'end': block.get('end_time')}])
         # 追加した予定の日時・タイトルを日本語で整形
         start = block.get('start_time')
         end = block.get('end_time')
         is_all_day = block.get('is_all_day', False)
         summary = block.get('summary', '')
         date_str = self.format_event_date(start, end, is_all_day)
-        return f"{date_str}『{summary}』を追加しました。\n（カレンダーに追加しました）"
+        return f"{date_str}『{summary}』を追加しました。\n（カレンダーに追加しました）{self._conflict_note(conflicts)}"
 
-    def _edit_event(self, block):
+    def _edit_event(self, block, user_input=None):
         summary = block.get('summary')
         start_time = block.get('start_time')
         end_time = block.get('end_time')
@@ -179,53 +219,64 @@ class CalendarAgent:
         new_end_time = block.get('new_end_time')
         new_description = block.get('new_description')
         new_location = block.get('new_location')
-        # 検索範囲はdelete_eventと同様
-        if start_time and end_time:
-            list_start = start_time
-            list_end = end_time
-            if '+' not in list_start and 'Z' not in list_start:
-                list_start += '+09:00'
-            if '+' not in list_end and 'Z' not in list_end:
-                list_end += '+09:00'
-        else:
-            now = datetime.now(tools.JST)
-            list_start = (now - timedelta(days=30)).isoformat(timespec='seconds')
-            list_end = (now + timedelta(days=30)).isoformat(timespec='seconds')
-            if '+' not in list_start and 'Z' not in list_start:
-                list_start += '+09:00'
-            if '+' not in list_end and 'Z' not in list_end:
-                list_end += '+09:00'
-        result = tools.list_calendar_events(list_start, list_end)
-        events = json.loads(result).get('events', [])
-        candidates = []
-        for e in events:
-            if summary and summary not in e['summary']:
-                continue
-            if start_time and start_time[:10] not in e['start']:
-                continue
-            candidates.append(e)
+        candidates = self._resolve_mention(block, user_input)
+        if candidates is None:
+            # 検索範囲はdelete_eventと同様
+            if start_time and end_time:
+                list_start = start_time
+                list_end = end_time
+                if '+' not in list_start and 'Z' not in list_start:
+                    list_start += '+09:00'
+                if '+' not in list_end and 'Z' not in list_end:
+                    list_end += '+09:00'
+            else:
+                now = datetime.now(tools.JST)
+                list_start = (now - timedelta(days=30)).isoformat(timespec='seconds')
+                list_end = (now + timedelta(days=30)).isoformat(timespec='seconds')
+                if '+' not in list_start and 'Z' not in list_start:
+                    list_start += '+09:00'
+                if '+' not in list_end and 'Z' not in list_end:
+                    list_end += '+09:00'
+            result = tools.list_calendar_events(list_start, list_end)
+            events = json.loads(result).get('events', [])
+            candidates = []
+            for e in (self._search_events(summary, list_start, list_end) if summary else events):
+                if start_time and start_time[:10] not in e['start']:
+                    continue
+                candidates.append(e)
         if not candidates:
             return '編集候補の予定が見つかりませんでした。タイトルや日付を含めてご指定ください。'
         elif len(candidates) == 1:
             event_id = candidates[0]['id']
-            # tools.pyにedit_calendar_eventが必要
-            edit_result = tools.edit_calendar_event(
+            conflict_note = ''
+            if new_start_time and new_end_time:
+                # 変更後の時間が、自分以外の予定と重ならないか確認する
+                conflict_note = self._conflict_note(tools.check_conflicts(
+                    [{'start_time': new_start_time, 'end_time': new_end_time}], exclude_id=event_id
+                )[0])
+            # 重なりは上で注意として伝えるので、ツール側では止めない
+            edit_result = json.loads(tools.edit_calendar_event(
                 event_id,
                 new_summary=new_summary,
                 new_start_time=new_start_time,
                 new_end_time=new_end_time,
                 new_description=new_description,
-                new_location=new_location
-            )
-            msg = json.loads(edit_result).get('message', '編集しました。')
-            return f"{msg}\n（カレンダーを編集しました）"
+                new_location=new_location,
+                allow_overlap=True
+            ))
+            if edit_result.get('status') != 'success':
+                return edit_result.get('message')
+            msg = edit_result.get('message', '編集しました。')
+            self.mentions.record_touched([edit_result['event']])
+            return f"{msg}\n（カレンダーを編集しました）{conflict_note}"
         else:
             # 複数候補がある場合はリストアップして選択 or 詳細表示
             msg = '複数の編集候補が見つかりました。番号で選ぶか「詳細」と入力してください:\n'
             for idx, e in enumerate(candidates):
                 msg += f"{idx+1}: {self.format_event_date(e['start'], e['end'], e.get('is_all_day', False))}『{e['summary']}』\n"
-            # 詳細表示用の情報を一時保存
+            # 詳細表示用の情報を一時保存（「2番目の」で選べるよう言及索引にも記録）
             self._last_candidates = candidates
+            self.mentions.record_shown(candidates)
             return msg
 
     def _list_event_action(self, block):
@@ -251,46 +302,47 @@ class CalendarAgent:
         summary = block.get('summary')
         start_time = block.get('start_time')
         end_time = block.get('end_time')
-        # 指定があればその期間、なければ直近1ヶ月
-        if start_time and end_time:
-            list_start = start_time
-            list_end = end_time
-            if '+' not in list_start and 'Z' not in list_start:
-                list_start += '+09:00'
-            if '+' not in list_end and 'Z' not in list_end:
-                list_end += '+09:00'
-        else:
-            now = datetime.now(tools.JST)
-            list_start = (now - timedelta(days=30)).isoformat(timespec='seconds')
-            list_end = (now + timedelta(days=30)).isoformat(timespec='seconds')
-            if '+' not in list_start and 'Z' not in list_start:
-                list_start += '+09:00'
-            if '+' not in list_end and 'Z' not in list_end:
-                list_end += '+09:00'
-        result = tools.list_calendar_events(list_start, list_end)
-        print(f"[DEBUG] list_calendar_events({list_start}, {list_end}) -> {result}")
-        events = json.loads(result).get('events', [])
-        candidates = []
-        # タイトル部分一致・大文字小文字無視、日付は±1日も許容
-        def date_in_range(event_start, target_date):
-            try:
-                event_dt = datetime.fromisoformat(event_start[:10])
-                target_dt = datetime.fromisoformat(target_date[:10])
-                return abs((event_dt - target_dt).days) <= 1
-            except Exception:
-                return False
-        for e in events:
-            if summary and summary.lower() not in e['summary'].lower():
-                continue
-            if start_time and not date_in_range(e['start'], start_time):
-                continue
-            candidates.append(e)
-        # 文脈検索で補完
-        if not candidates and summary:
-            context_candidates = self._find_event_by_context(summary, start_time, events)
-            if context_candidates:
-                print(f"[DEBUG] 文脈候補: {[e['summary'] for e in context_candidates]}")
-                candidates.extend(context_candidates)
+        candidates = self._resolve_mention(block, user_input)
+        if candidates is None:
+            # 指定があればその期間、なければ直近1ヶ月
+            if start_time and end_time:
+                list_start = start_time
+                list_end = end_time
+                if '+' not in list_start and 'Z' not in list_start:
+                    list_start += '+09:00'
+                if '+' not in list_end and 'Z' not in list_end:
+                    list_end += '+09:00'
+            else:
+                now = datetime.now(tools.JST)
+                list_start = (now - timedelta(days=30)).isoformat(timespec='seconds')
+                list_end = (now + timedelta(days=30)).isoformat(timespec='seconds')
+                if '+' not in list_start and 'Z' not in list_start:
+                    list_start += '+09:00'
+                if '+' not in list_end and 'Z' not in list_end:
+                    list_end += '+09:00'
+            result = tools.list_calendar_events(list_start, list_end)
+            print(f"[DEBUG] list_calendar_events({list_start}, {list_end}) -> {result}")
+            events = json.loads(result).get('events', [])
+            candidates = []
+            # タイトル部分一致・大文字小文字無視、日付は±1日も許容
+            def date_in_range(event_start, target_date):
+                try:
+                    event_dt = datetime.fromisoformat(event_start[:10])
+                    target_dt = datetime.fromisoformat(target_date[:10])
+                    return abs((event_dt - target_dt).days) <= 1
+                except Exception:
+                    return False
+            # タイトルは検索索引で表記ゆれも含めて探し、近い順に並べる
+            for e in (self._search_events(summary, list_start, list_end) if summary else events):
+                if start_time and not date_in_range(e['start'], start_time):
+                    continue
+                candidates.append(e)
+            # 文脈検索で補完
+            if not candidates and summary:
+                context_candidates = self._find_event_by_context(summary, start_time, events)
+                if context_candidates:
+                    print(f"[DEBUG] 文脈候補: {[e['summary'] for e in context_candidates]}")
+                    candidates.extend(context_candidates)
         print(f"[DEBUG] delete_event candidates: {[e['summary'] for e in candidates]}")
         if not candidates:
             return '削除候補の予定が見つかりませんでした。タイトルや日付を含めてご指定ください。'
@@ -298,6 +350,7 @@ class CalendarAgent:
             event = candidates[0]
             event_id = event['id']
             del_result = tools.delete_calendar_event(event_id)
+            self.mentions.forget(event_id)
             date_str = self.format_event_date(event['start'], event['end'], event.get('is_all_day', False))
             title = event.get('summary', '')
             msg = f"{date_str}『{title}』を削除しました。\n（カレンダーから削除しました）"
@@ -307,7 +360,7 @@ class CalendarAgent:
                 f"{idx+1}: {self.format_event_date(e['start'], e['end'], e.get('is_all_day', False))}『{e['summary']}』" for idx, e in enumerate(candidates)
             ])
             prompt = f"次の削除候補があります。\n{candidate_list}\n\nユーザー指示: {block.get('user_input', '')}\nどの予定を削除すべきか、番号または'全部'で答えてください。" 
-            ai_response = self.chat.send_message(prompt).text.strip()
+            ai_response = self._send(prompt).text.strip()
             to_delete = []
             if '全部' in ai_response or '全て' in ai_response or 'すべて' in ai_response:
                 to_delete = list(range(len(candidates)))
@@ -321,6 +374,7 @@ class CalendarAgent:
                 event = candidates[idx]
                 event_id = event['id']
                 del_result = tools.delete_calendar_event(event_id)
+                self.mentions.forget(event_id)
                 date_str = self.format_event_date(event['start'], event['end'], event.get('is_all_day', False))
                 title = event.get('summary', '')
                 msg = f"{date_str}『{title}』を削除しました。\n（カレンダーから削除しました）"
@@ -372,6 +426,7 @@ class CalendarAgent:
         events = json.loads(result).get('events', [])
         if not events:
             return '予定はありません。'
+        self.mentions.record_shown(events)
         event_list = '\n'.join([
             f"{self.format_event_date(e['start'], e['end'], e.get('is_all_day', False))}『{e['summary']}』" for e in events
         ])
@@ -387,21 +442,25 @@ class CalendarAgent:
         return msg
 
     def _find_event_by_context(self, summary, start_time, events):
-        # 文脈（履歴）から直近のリストや指示を参照し、候補を補完
-        # 1. 直近のリスト表示で出ていた予定
-        for h in reversed(self.chat_history):
-            if 'の予定:' in h.get('ai', ''):
-                # 予定リストを抽出
-                lines = h['ai'].split('\n')
-                for line in lines:
-                    m = re.match(r'(\d{4}年\d+月\d+日.+)『(.+)』', line)
-                    if m:
-                        title = m.group(2)
-                        if summary and summary.lower() in title.lower():
-                            return [e for e in events if title.lower() in e['summary'].lower()]
-        # 2. 直前のユーザー指示のタイトル
-        for h in reversed(self.chat_history):
-            if summary and summary.lower() in h.get('user', '').lower():
-                # 直近の指示に近いタイトルを含む予定
-                return [e for e in events if summary.lower() in e['summary'].lower()]
-        return []
+        # 会話中に表示・操作した予定から、タイトルが近いものを補完（取得結果に残っているものだけ）
+        listed = {e['id'] for e in events}
+        return [e for e in self.mentions.find_by_title(summary) if e['id'] in listed]
+
+    def _resolve_mention(self, block, user_input):
+        """「その予定」「2番目の」のような指し示しを言及索引で解決する（指し示しがなければNone）"""
+        text = user_input or block.get('user_input') or block.get('summary')
+        candidates = self.mentions.resolve_reference(text)
+        if candidates is not None:
+            print(f"[MENTION] '{text}' -> {[e.get('summary') for e in candidates]}")
+        return candidates
+
+    def _search_events(self, summary, list_start, list_end):
+        """取得済みの期間から、タイトル・説明が検索語に近い予定を類似度の高い順に返す"""
+        start_min = free_busy.to_minute(datetime.fromisoformat(tools._parse_datetime_str(list_start, is_end_time=False)))
+        end_min = free_busy.to_minute(datetime.fromisoformat(tools._parse_datetime_str(list_end, is_end_time=True)))
+        hits = event_search.index.search(summary, start_min, end_min, limit=20)
+        if not hits:
+            return []
+        # 最も近い候補と同程度のものだけを残す（部分一致があれば、言い換えの候補までは出さない）
+        best = hits[0][0]
+        return [e for score, e in hits if score >= best * 0.8]
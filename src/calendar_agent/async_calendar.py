@@ -0,0 +1,113 @@
+# src/calendar_agent/async_calendar.py
+import asyncio
+import threading
+
+import httpx
+
+import config
+from src.core import resilience, cassette
+
+# asyncio版のサーバー（asgi.py）から使う、Google Calendar APIの非同期クライアント。
+# googleapiclientは同期（httplib2）でスレッドを占有するため、読み取り（一覧・取得・繰り返しの展開）だけは
+# 接続プールを持つhttpx.AsyncClientで直接REST APIを呼び、待ち時間の間イベントループを止めないようにする。
+# 書き込みは従来どおり書き込みジャーナル（mutation_journal）経由で行う。
+
+BASE_URL = "https://www.googleapis.com/calendar/v3"
+
+
+class CalendarHTTPError(Exception):
+    """Calendar APIがエラーを返した（resilience.status_ofが読めるよう、codeにHTTPステータスを持つ）"""
+
+    def __init__(self, response: httpx.Response):
+        try:
+            message = response.json().get("error", {}).get("message", response.text)
+        except ValueError:
+            message = response.text
+        super().__init__(f"HTTP {response.status_code}: {message}")
+        self.code = response.status_code
+        self.response = response
+
+
+class AsyncCalendarClient:
+    def __init__(self, max_connections: int = 20, timeout_seconds: float = 30):
+        self.max_connections = max_connections
+        self.timeout_seconds = timeout_seconds
+        self._credentials_factory = None
+        self._credentials = None
+        self._http = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def configure(self, credentials_factory):
+        """認証情報（google.oauth2.credentials.Credentials）を返す関数を設定する"""
+        self._credentials_factory = credentials_factory
+
+    def _client(self) -> httpx.AsyncClient:
+        # httpx.AsyncClientは作成したイベントループに結びつくため、ループごとに作り直す
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            self._http = httpx.AsyncClient(
+                base_url=BASE_URL,
+                timeout=self.timeout_seconds,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                transport=cassette.async_transport(),
+            )
+            self._loop = loop
+        return self._http
+
+    async def _auth_headers(self) -> dict:
+        if cassette.replaying():
+            # 記録した応答を再生するだけなので、認証情報は読み込まない
+            return {}
+        token = await asyncio.to_thread(self._valid_token)
+        return {"Authorization": f"Bearer {token}"}
+
+    def _valid_token(self) -> str:
+        with self._lock:
+            if self._credentials is None or not self._credentials.valid:
+                # トークンの読み込み・更新は同期処理なので、呼び出し側でスレッドに逃がす
+                self._credentials = self._credentials_factory()
+            return self._credentials.token
+
+    async def _get(self, path: str, params: dict = None) -> dict:
+        async def send():
+            response = await self._client().get(path, params=params, headers=await self._auth_headers())
+            if response.status_code == 401:
+                self._credentials = None
+            if response.status_code >= 400:
+                raise CalendarHTTPError(response)
+            return response.json()
+        return await resilience.calendar_api.acall(send)
+
+    async def _list(self, path: str, params: dict) -> list:
+        """ページをたどって全件のitemsを返す"""
+        items, page_token = [], None
+        while True:
+            page = await self._get(path, dict(params, pageToken=page_token) if page_token else params)
+            items.extend(page.get("items", []))
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                return items
+
+    async def list_events(self, time_min: str, time_max: str, calendar_id: str = "primary", **params) -> list:
+        """events.listに相当する。singleEvents・showDeletedなどはキーワード引数で渡す"""
+        return await self._list(f"/calendars/{calendar_id}/events", dict(params, timeMin=time_min, timeMax=time_max))
+
+    async def get_event(self, event_id: str, calendar_id: str = "primary") -> dict:
+        return await self._get(f"/calendars/{calendar_id}/events/{event_id}")
+
+    async def instances(self, event_id: str, time_min: str, time_max: str, calendar_id: str = "primary") -> list:
+        return await self._list(f"/calendars/{calendar_id}/events/{event_id}/instances", {"timeMin": time_min, "timeMax": time_max})
+
+    async def aclose(self):
+        """サーバー終了時に呼ぶ。接続プールを閉じる"""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+# プロセス全体で共有する非同期クライアント（認証情報の取得関数はtools側で設定する）
+client = AsyncCalendarClient(
+    max_connections=config.CALENDAR_HTTP_MAX_CONNECTIONS,
+    timeout_seconds=config.CALENDAR_HTTP_TIMEOUT_SECONDS,
+)
@@ -0,0 +1,125 @@
+# src/calendar_agent/conflicts.py
+import bisect
+import threading
+import time
+
+import config
+from src.calendar_agent import free_busy
+
+# 予定の重なり（ダブルブッキング）を検出するためのローカル索引。
+# list_calendar_eventsで取得した予定を分単位の区間として保持し、
+# 追加前の重なりチェックを、カレンダーへの追加の問い合わせなしで行えるようにする。
+
+
+class OverlapIndex:
+    def __init__(self, ttl_seconds: float = 120):
+        self.ttl_seconds = ttl_seconds
+        self._events = {}       # event_id -> (start_min, end_min, summary)
+        self._coverage = []     # 取得済みの期間 [(start_min, end_min, loaded_at)]
+        self._sorted = None     # (starts, items, prefix_max_end)。変更があれば作り直す
+        self._lock = threading.Lock()
+
+    def load_range(self, range_start: int, range_end: int, events: list):
+        """
+        ある期間の取得結果で索引を更新する。期間内にあった古い予定は、取得結果に
+        含まれていなければ削除済みとみなして取り除く。終日予定は対象外。
+        """
+        with self._lock:
+            for event_id, (start, end, _) in list(self._events.items()):
+                if start < range_end and end > range_start:
+                    del self._events[event_id]
+            for event in events:
+                intervals = free_busy.events_to_intervals([event])
+                if intervals:
+                    start, end = intervals[0]
+                    self._events[event["id"]] = (start, end, event.get("summary", ""))
+            now = time.time()
+            self._coverage = [c for c in self._coverage if now - c[2] < self.ttl_seconds]
+            self._coverage.append((range_start, range_end, now))
+            self._sorted = None
+
+    def covers(self, start: int, end: int) -> bool:
+        """指定期間が、有効期限内の取得結果でカバーされているか"""
+        now = time.time()
+        with self._lock:
+            return any(c[0] <= start and end <= c[1] and now - c[2] < self.ttl_seconds for c in self._coverage)
+
+    def add(self, event_id: str, summary: str, start: int, end: int):
+        with self._lock:
+            self._events[event_id] = (start, end, summary)
+            self._sorted = None
+
+    def remove(self, event_id: str):
+        with self._lock:
+            if self._events.pop(event_id, None) is not None:
+                self._sorted = None
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+            self._coverage.clear()
+            self._sorted = None
+
+    def _snapshot(self):
+        with self._lock:
+            if self._sorted is None:
+                items = sorted(self._events.items(), key=lambda kv: kv[1][0])
+                starts = [v[0] for _, v in items]
+                prefix_max_end, current = [], None
+                for _, (_, end, _) in items:
+                    current = end if current is None else max(current, end)
+                    prefix_max_end.append(current)
+                self._sorted = (starts, items, prefix_max_end)
+            return self._sorted
+
+    def find_conflicts(self, start: int, end: int, exclude_id: str = None) -> list:
+        """[start, end) と重なる既存の予定を返す"""
+        return self.find_conflicts_batch([(start, end)], exclude_id=exclude_id)[0]
+
+    def find_conflicts_batch(self, proposals: list, exclude_id: str = None) -> list:
+        """
+        複数の候補区間について、既存の予定および候補同士の重なりをまとめて調べる。
+        索引のソート済み配列は1回だけ作り、各候補は二分探索で照会する。
+
+        Args:
+            proposals (list): (start_min, end_min) のリスト。
+            exclude_id (str, optional): 編集対象など、照合から除く予定のID。
+
+        Returns:
+            list: 候補ごとの重なりのリスト。既存の予定は {"id", "summary", "start", "end"}、
+                候補同士の重なりは {"proposal_index", "start", "end"} で表す。
+        """
+        starts, items, prefix_max_end = self._snapshot()
+        results = []
+        for start, end in proposals:
+            found = []
+            # 開始が候補の終了より前の予定だけが重なりうる。累積最大の終了時刻で打ち切る
+            i = bisect.bisect_left(starts, end) - 1
+            while i >= 0 and prefix_max_end[i] > start:
+                event_id, (e_start, e_end, summary) = items[i]
+                if e_end > start and event_id != exclude_id:
+                    found.append({
+                        "id": event_id,
+                        "summary": summary,
+                        "start": free_busy.from_minute(e_start).isoformat(),
+                        "end": free_busy.from_minute(e_end).isoformat(),
+                    })
+                i -= 1
+            found.reverse()
+            results.append(found)
+
+        # 候補同士の重なり（開始順に並べて、直前までの最大終了時刻と比べる）
+        order = sorted(range(len(proposals)), key=lambda k: proposals[k][0])
+        active = []
+        for k in order:
+            start, end = proposals[k]
+            active = [j for j in active if proposals[j][1] > start]
+            for j in active:
+                results[k].append({"proposal_index": j, "start": free_busy.from_minute(proposals[j][0]).isoformat(), "end": free_busy.from_minute(proposals[j][1]).isoformat()})
+                results[j].append({"proposal_index": k, "start": free_busy.from_minute(start).isoformat(), "end": free_busy.from_minute(end).isoformat()})
+            active.append(k)
+        return results
+
+
+# プロセス全体で共有する索引
+index = OverlapIndex(ttl_seconds=config.OVERLAP_INDEX_TTL_SECONDS)
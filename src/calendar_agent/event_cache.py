@@ -0,0 +1,59 @@
+# src/calendar_agent/event_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+# 予定IDをキーにした、取得済みの予定（Google APIのイベントリソース）のキャッシュ。
+# list_calendar_eventsの取得結果や追加・変更の応答で埋めておき、IDでの参照（削除前のタイトル確認、
+# 編集時の所要時間の引き継ぎなど）を、カレンダーへの問い合わせなしで済ませられるようにする。
+
+
+class EventCache:
+    def __init__(self, ttl_seconds: float = 300, max_events: int = 2000):
+        self.ttl_seconds = ttl_seconds
+        self.max_events = max_events
+        self._events = OrderedDict()   # event_id -> (event, cached_at)
+        self._lock = threading.Lock()
+
+    def put(self, event: dict):
+        self.put_many([event])
+
+    def put_many(self, events: list):
+        now = time.time()
+        with self._lock:
+            for event in events:
+                if not event or not event.get("id"):
+                    continue
+                self._events.pop(event["id"], None)
+                self._events[event["id"]] = (event, now)
+            while len(self._events) > self.max_events:
+                self._events.popitem(last=False)
+
+    def get(self, event_id: str):
+        """有効期限内のキャッシュがあれば予定を返す（なければNone）"""
+        with self._lock:
+            entry = self._events.get(event_id)
+            if entry is None:
+                return None
+            if time.time() - entry[1] >= self.ttl_seconds:
+                del self._events[event_id]
+                return None
+            self._events.move_to_end(event_id)
+            return entry[0]
+
+    def remove(self, event_id: str):
+        with self._lock:
+            self._events.pop(event_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+    def __len__(self):
+        return len(self._events)
+
+
+# プロセス全体で共有するキャッシュ
+cache = EventCache(ttl_seconds=config.EVENT_CACHE_TTL_SECONDS, max_events=config.EVENT_CACHE_MAX_EVENTS)
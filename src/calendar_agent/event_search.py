@@ -0,0 +1,180 @@
+# src/calendar_agent/event_search.py
+import heapq
+import re
+import threading
+import unicodedata
+
+from src.calendar_agent import free_busy
+
+# 予定のタイトル・説明・場所の全文検索索引（文字n-gramの転置索引）。
+# 日本語は単語の区切りがないため、文字の1-gram/2-gramで索引を作り、検索語のn-gramがどれだけ含まれるかで順位を付ける。
+# 部分一致しない表記ゆれ（「誕生日会」と「家族の誕生日」など）でも候補に挙がり、
+# よくある言い換え（「歯医者」と「歯科」など）は索引を作る前に同じ表記にそろえる。
+
+UNIGRAM_SHARE = 0.4
+BIGRAM_SHARE = 0.6
+DESCRIPTION_WEIGHT = 0.5
+MIN_SCORE = 0.3
+_SPACE = re.compile(r"\s+")
+
+# 予定のタイトルでよく見かける言い換え（左の表記を右にそろえる）
+SYNONYMS = {
+    "歯医者": "歯科",
+    "デンタル": "歯科",
+    "締め切り": "締切",
+    "〆切": "締切",
+    "〆切り": "締切",
+    "ミーティング": "会議",
+    "mtg": "会議",
+    "打ち合わせ": "打合せ",
+    "打ち合せ": "打合せ",
+    "病院": "通院",
+    "クリニック": "通院",
+    "美容室": "美容院",
+    "ヘアカット": "美容院",
+    "ワークアウト": "ジム",
+    "トレーニング": "ジム",
+}
+_SYNONYM_PATTERN = re.compile("|".join(re.escape(k) for k in sorted(SYNONYMS, key=len, reverse=True)))
+
+
+def normalize(text: str) -> str:
+    """全角/半角・大文字/小文字・よくある言い換えをそろえ、空白を取り除く"""
+    text = _SPACE.sub("", unicodedata.normalize("NFKC", text or "").lower())
+    return _SYNONYM_PATTERN.sub(lambda m: SYNONYMS[m.group(0)], text)
+
+
+def grams(text: str) -> tuple:
+    """正規化した文字列の (1-gramの集合, 2-gramの集合)"""
+    text = normalize(text)
+    return set(text), {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _coverage(query: tuple, unigram_hits: int, bigram_hits: int) -> float:
+    """検索語の1-gram/2-gramのうち、どれだけが予定側に含まれるか（0〜1）"""
+    unigrams, bigrams = query
+    if not bigrams:
+        return unigram_hits / len(unigrams)
+    return UNIGRAM_SHARE * unigram_hits / len(unigrams) + BIGRAM_SHARE * bigram_hits / len(bigrams)
+
+
+def similarity(query: str, title: str) -> float:
+    """検索語とタイトルの類似度（0〜1）。部分一致なら1。"""
+    q, t = normalize(query), normalize(title)
+    if not q:
+        return 0.0
+    if q in t:
+        return 1.0
+    query_grams, title_grams = grams(query), grams(title)
+    return _coverage(query_grams, len(query_grams[0] & title_grams[0]), len(query_grams[1] & title_grams[1]))
+
+
+class EventSearchIndex:
+    def __init__(self):
+        self._docs = {}            # event_id -> {"event", "start", "end", "length", "title", "body"}
+        self._title_postings = {}  # gram -> {event_id}
+        self._body_postings = {}   # gram -> {event_id}
+        self._lock = threading.Lock()
+
+    def _add_locked(self, event: dict):
+        intervals = free_busy.events_to_intervals([event], include_all_day=True)
+        if not intervals:
+            return
+        self._remove_locked(event["id"])
+        title = set().union(*grams(event.get("summary", "")))
+        body_text = f"{event.get('description') or ''}{event.get('location') or ''}"
+        body = set().union(*grams(body_text)) if body_text else set()
+        self._docs[event["id"]] = {
+            "event": {k: event[k] for k in ("id", "summary", "start", "end") if k in event},
+            "start": intervals[0][0],
+            "end": intervals[0][1],
+            "length": len(normalize(event.get("summary", ""))),
+            "title": title,
+            "body": body,
+        }
+        for g in title:
+            self._title_postings.setdefault(g, set()).add(event["id"])
+        for g in body:
+            self._body_postings.setdefault(g, set()).add(event["id"])
+
+    def _remove_locked(self, event_id: str):
+        doc = self._docs.pop(event_id, None)
+        if doc is None:
+            return
+        for postings, keys in ((self._title_postings, doc["title"]), (self._body_postings, doc["body"])):
+            for g in keys:
+                ids = postings.get(g)
+                if ids is not None:
+                    ids.discard(event_id)
+                    if not ids:
+                        del postings[g]
+
+    def load_range(self, range_start: int, range_end: int, events: list):
+        """ある期間の取得結果で索引を更新する（取得結果にない期間内の予定は削除済みとみなす）"""
+        with self._lock:
+            stale = [i for i, d in self._docs.items() if d["start"] < range_end and d["end"] > range_start]
+            for event_id in stale:
+                self._remove_locked(event_id)
+            for event in events:
+                self._add_locked(event)
+
+    def add(self, event: dict):
+        with self._lock:
+            self._add_locked(event)
+
+    def remove(self, event_id: str):
+        with self._lock:
+            self._remove_locked(event_id)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _candidates(self, query: tuple) -> set:
+        """
+        採点する予定の候補。2-gramが1つでも一致する予定に絞る（1-gramだけの一致は類似度が低く、
+        「会」のようなありふれた文字で候補が膨らむため）。2-gramが1つも一致しない場合だけ1-gramで探す。
+        """
+        for keys in (query[1], query[0]):
+            ids = set()
+            for g in keys:
+                ids.update(self._title_postings.get(g, ()))
+                ids.update(self._body_postings.get(g, ()))
+            if ids:
+                return ids
+        return set()
+
+    def search(self, query: str, range_start: int = None, range_end: int = None, limit: int = 10, min_score: float = MIN_SCORE) -> list:
+        """
+        検索語に近い予定を、類似度の高い順に返す。
+
+        Args:
+            query (str): 検索語（予定のタイトルの一部や言い換え）。
+            range_start (int), range_end (int), optional: 分単位の期間。指定時はこの期間に重なる予定だけを返す。
+            limit (int): 返す件数の上限。
+            min_score (float): これより類似度の低い予定は返さない。
+
+        Returns:
+            list: (類似度, 予定の辞書) のリスト。類似度が同じなら、タイトルの短い（より近い）予定を先にする。
+        """
+        q = grams(query)
+        if not q[0]:
+            return []
+        with self._lock:
+            scored = []
+            for event_id in self._candidates(q):
+                doc = self._docs[event_id]
+                if range_start is not None and doc["end"] <= range_start:
+                    continue
+                if range_end is not None and doc["start"] >= range_end:
+                    continue
+                score = _coverage(q, len(q[0] & doc["title"]), len(q[1] & doc["title"]))
+                if doc["body"] and score < 1.0:
+                    score = max(score, _coverage(q, len(q[0] & doc["body"]), len(q[1] & doc["body"])) * DESCRIPTION_WEIGHT)
+                if score >= min_score:
+                    scored.append((score, -doc["length"], event_id))
+            best = heapq.nlargest(limit, scored)
+            return [(round(score, 3), self._docs[event_id]["event"]) for score, _, event_id in best]
+
+
+# プロセス全体で共有する索引（list_calendar_eventsの取得結果で更新される）
+index = EventSearchIndex()
@@ -0,0 +1,139 @@
+# src/calendar_agent/free_busy.py
+import heapq
+import itertools
+from datetime import datetime, timedelta
+
+import pytz
+
+# 空き時間（free/busy）の計算エンジン。
+# 予定は「エポックからの分」を単位とする整数の区間 [start, end) に変換し、
+# ソート済み・結合済みの区間リストとして扱う（1年分の密な予定でも数十ミリ秒で計算できる）。
+
+JST = pytz.timezone('Asia/Tokyo')
+_EPOCH = datetime(1970, 1, 1, tzinfo=pytz.utc)
+
+
+def to_minute(dt: datetime) -> int:
+    if dt.tzinfo is None:
+        dt = JST.localize(dt)
+    return int((dt - _EPOCH).total_seconds() // 60)
+
+
+def from_minute(minute: int) -> datetime:
+    return (_EPOCH + timedelta(minutes=minute)).astimezone(JST)
+
+
+def _parse(value: str) -> tuple:
+    """予定の開始/終了文字列を (datetime, 終日かどうか) に変換する"""
+    if len(value) == 10:
+        return JST.localize(datetime.fromisoformat(value)), True
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = JST.localize(dt)
+    return dt, False
+
+
+def events_to_intervals(events: list, include_all_day: bool = False) -> list:
+    """
+    list_calendar_eventsの予定リストを、分単位の区間リストに変換する。
+    終日予定（祝日や締切など）は、既定では予定の入った時間として扱わない。
+    """
+    intervals = []
+    for event in events:
+        try:
+            start, is_all_day = _parse(event["start"])
+            end, _ = _parse(event["end"])
+        except (KeyError, ValueError):
+            continue
+        if is_all_day and not include_all_day:
+            continue
+        intervals.append((to_minute(start), to_minute(end)))
+    return intervals
+
+
+def merge_intervals(intervals: list, buffer_minutes: int = 0) -> list:
+    """重なり・隣接する区間を結合する。buffer_minutesを指定すると各予定の前後にバッファを取る。"""
+    merged = []
+    for start, end in sorted(intervals):
+        start, end = start - buffer_minutes, end + buffer_minutes
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(s, e) for s, e in merged]
+
+
+def _working_windows(range_start: int, range_end: int, work_start: str, work_end: str, weekdays=None):
+    """期間内の各日の作業時間帯を分単位の区間として順に返す"""
+    ws_h, ws_m = map(int, work_start.split(":"))
+    we_h, we_m = map(int, work_end.split(":"))
+    day = from_minute(range_start).replace(hour=0, minute=0, second=0, microsecond=0)
+    last_day = from_minute(range_end)
+    while day <= last_day:
+        if weekdays is None or day.weekday() in weekdays:
+            base = JST.localize(datetime(day.year, day.month, day.day))
+            start = max(to_minute(base + timedelta(hours=ws_h, minutes=ws_m)), range_start)
+            end = min(to_minute(base + timedelta(hours=we_h, minutes=we_m)), range_end)
+            if start < end:
+                yield start, end
+        day = JST.localize(datetime(day.year, day.month, day.day) + timedelta(days=1))
+
+
+def free_windows(busy: list, range_start: datetime, range_end: datetime, work_start: str = "00:00",
+                 work_end: str = "24:00", min_minutes: int = 0, weekdays=None) -> list:
+    """
+    結合済みのbusy区間から、期間内・作業時間帯内の空き区間を求める。
+
+    Args:
+        busy (list): merge_intervalsで結合済みの区間リスト。
+        range_start (datetime), range_end (datetime): 探索する期間。
+        work_start (str), work_end (str): 1日のうち空きとして扱う時間帯（HH:MM、"24:00"可）。
+        min_minutes (int): これより短い空きは返さない。
+        weekdays (set, optional): 対象の曜日（0=月曜）。Noneなら全曜日。
+
+    Returns:
+        list: 分単位の空き区間 (start, end) のリスト。
+    """
+    start_min, end_min = to_minute(range_start), to_minute(range_end)
+    result = []
+    i = 0
+    for window_start, window_end in _working_windows(start_min, end_min, work_start, work_end, weekdays):
+        # この作業時間帯より前に終わる予定は読み飛ばす（busyはソート済み）
+        while i < len(busy) and busy[i][1] <= window_start:
+            i += 1
+        cursor, j = window_start, i
+        while j < len(busy) and busy[j][0] < window_end:
+            if busy[j][0] - cursor >= max(min_minutes, 1):
+                result.append((cursor, busy[j][0]))
+            cursor = max(cursor, busy[j][1])
+            j += 1
+        if window_end - cursor >= max(min_minutes, 1):
+            result.append((cursor, window_end))
+    return result
+
+
+def k_best_slots(windows: list, duration_minutes: int, k: int = 5, step_minutes: int = 30, preferred_hour: int = None) -> list:
+    """
+    空き区間から、指定時間の予定を置ける候補をk件選ぶ。
+    既定では早い順。preferred_hourを指定すると、その時刻に近い開始時刻を優先する。
+    """
+    def candidates():
+        for start, end in windows:
+            # 開始時刻はstep_minutes刻みにそろえる
+            slot_start = -(-start // step_minutes) * step_minutes
+            while slot_start + duration_minutes <= end:
+                if preferred_hour is None:
+                    score = slot_start
+                else:
+                    local = from_minute(slot_start)
+                    score = (abs(local.hour * 60 + local.minute - preferred_hour * 60), slot_start)
+                yield score, slot_start
+                slot_start += step_minutes
+
+    if preferred_hour is None:
+        # 空き区間は時刻順なので、先頭からk件取れば十分
+        best = list(itertools.islice(candidates(), k))
+    else:
+        best = heapq.nsmallest(k, candidates())
+    return [(start, start + duration_minutes) for _, start in sorted(best, key=lambda x: x[1])]
@@ -0,0 +1,107 @@
+# src/calendar_agent/mentions.py
+import re
+from collections import OrderedDict
+
+from src.calendar_agent import event_search
+
+# 会話中の「その予定」「2番目の」のような指し示しを解決するための、セッションごとの言及索引。
+# 各ターンで表示・操作した予定のIDを記録しておき、過去のAI応答の文字列を解析し直さずに引けるようにする。
+
+_KANJI_DIGITS = {"一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+ORDINAL_PATTERN = re.compile(r"(\d+|[一二三四五六七八九十]+)\s*(?:番目|つ目|件目|番の|個目)")
+FIRST_PATTERN = re.compile(r"最初の|一番上の|先頭の")
+LAST_PATTERN = re.compile(r"最後の|一番下の")
+DEMONSTRATIVE_PATTERN = re.compile(r"その予定|この予定|あの予定|さっきの|今の予定|それ(?:を|も|は|、|$)")
+MAX_TITLES = 200
+
+
+def _to_number(text: str) -> int:
+    if text.isdigit():
+        return int(text)
+    if text == "十":
+        return 10
+    if text.startswith("十"):
+        return 10 + _KANJI_DIGITS.get(text[1:], 0)
+    if text.endswith("十"):
+        return _KANJI_DIGITS.get(text[:-1], 0) * 10
+    return _KANJI_DIGITS.get(text, 0)
+
+
+class MentionIndex:
+    def __init__(self):
+        self.last_shown = []        # 直近に番号付きで表示した予定（表示順。削除済みはNone）
+        self.last_touched = []      # 直近に追加・変更・削除した予定
+        self.by_id = {}             # event_id -> 予定
+        self.by_title = OrderedDict()  # 正規化したタイトル -> event_id（最後に言及したものを後ろに）
+
+    def _remember(self, event: dict):
+        if not event or not event.get("id"):
+            return
+        self.by_id[event["id"]] = event
+        key = event_search.normalize(event.get("summary", ""))
+        self.by_title.pop(key, None)
+        self.by_title[key] = event["id"]
+        while len(self.by_title) > MAX_TITLES:
+            self.by_title.popitem(last=False)
+
+    def record_shown(self, events: list):
+        """番号付きで一覧表示した予定を記録する（「2番目の」はこの順で解決する）"""
+        self.last_shown = list(events)
+        for event in events:
+            self._remember(event)
+
+    def record_touched(self, events: list):
+        """追加・変更・削除した予定を記録する（「その予定」はこれで解決する）"""
+        self.last_touched = list(events)
+        for event in events:
+            self._remember(event)
+
+    def forget(self, event_id: str):
+        """削除した予定を、以降の解決対象から外す（一覧の番号は詰めない）"""
+        event = self.by_id.pop(event_id, None)
+        if event is not None:
+            key = event_search.normalize(event.get("summary", ""))
+            if self.by_title.get(key) == event_id:
+                del self.by_title[key]
+        self.last_shown = [e if e is None or e.get("id") != event_id else None for e in self.last_shown]
+
+    def resolve_reference(self, text: str):
+        """
+        「2番目の」「最後の」「その予定」のような指し示しを、記録済みの予定に解決する。
+
+        Returns:
+            list or None: 該当する予定のリスト。指し示しが含まれない場合はNone。
+        """
+        if not text:
+            return None
+        match = ORDINAL_PATTERN.search(text)
+        if match and self.last_shown:
+            n = _to_number(match.group(1))
+            if 1 <= n <= len(self.last_shown) and self.last_shown[n - 1] is not None:
+                return [self.last_shown[n - 1]]
+            return []
+        shown = [e for e in self.last_shown if e is not None]
+        if FIRST_PATTERN.search(text) and self.last_shown:
+            return shown[:1]
+        if LAST_PATTERN.search(text) and self.last_shown:
+            return shown[-1:]
+        if DEMONSTRATIVE_PATTERN.search(text):
+            touched = [e for e in self.last_touched if e.get("id") in self.by_id]
+            if touched:
+                return touched
+            return shown if len(shown) == 1 else []
+        return None
+
+    def find_by_title(self, summary: str) -> list:
+        """会話中に言及した予定から、タイトルが一致（なければ近い）ものを返す"""
+        if not summary:
+            return []
+        event_id = self.by_title.get(event_search.normalize(summary))
+        if event_id is not None:
+            return [self.by_id[event_id]]
+        # 完全一致がなければ、記録済みのタイトル（最大MAX_TITLES件）から近いものを探す
+        scored = [(event_search.similarity(summary, self.by_id[i].get("summary", "")), i) for i in reversed(self.by_title.values())]
+        best = max((s for s, _ in scored), default=0)
+        if best < event_search.MIN_SCORE:
+            return []
+        return [self.by_id[i] for s, i in scored if s >= best]
@@ -0,0 +1,324 @@
+# src/calendar_agent/mutation_journal.py
+import atexit
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from googleapiclient.errors import HttpError
+
+import config
+from src.core import resilience
+
+# カレンダーへの書き込み（追加・変更・削除）を溜めておき、バックグラウンドでまとめて送るジャーナル。
+# 書き込みはまずローカルの状態（キャッシュ・索引）に反映して即座に応答し、Googleへの送信は
+# 一定間隔でまとめて行う。未送信の書き込みはファイルに保存しておき、プロセスが落ちても次回起動時に送り直す。
+# 追加する予定のIDは内容から決めるので、送り直しやツールの再実行で同じ予定が二重に登録されることはない。
+
+BATCH_SIZE = 50          # Google APIのバッチリクエスト1回あたりの上限
+
+
+def event_id_for(event: dict, attempt: int = 0) -> str:
+    """
+    予定の内容（タイトル・日時・繰り返し・説明・場所）から決まるID（Googleの予定IDに使える base32hex の文字だけからなる）。
+    同じ内容なら何度呼んでも同じIDになる（送信の再試行で二重に登録されない）。説明・場所だけが違う予定は別の予定として扱う。
+    attemptは、削除済みの予定とIDが衝突したときにずらす。
+    """
+    raw = json.dumps([
+        event.get("summary"),
+        event.get("start"),
+        event.get("end"),
+        event.get("recurrence"),
+        event.get("description"),
+        event.get("location"),
+        attempt,
+    ], ensure_ascii=False, sort_keys=True)
+    digest = hashlib.sha1(raw.encode("utf-8")).digest()
+    return base64.b32hexencode(digest).decode("ascii").rstrip("=").lower()
+
+
+def _merge(first: dict, second: dict):
+    """
+    同じ予定への2つの書き込みを1つにまとめる。まとめた結果（打ち消し合う場合はNone）を返す。
+    まとめられない組み合わせ（削除後の追加など）は "keep" を返す。
+    """
+    op1, op2 = first["op"], second["op"]
+    seqs = first["seqs"] + second["seqs"]
+    if op1 == "insert" and op2 == "patch":
+        return dict(first, body={**first["body"], **second["body"]}, seqs=seqs)
+    if op1 == "insert" and op2 == "delete":
+        return None
+    if op1 == "patch" and op2 == "patch":
+        return dict(first, body={**first["body"], **second["body"]}, seqs=seqs)
+    if op1 == "patch" and op2 == "delete":
+        return dict(second, seqs=seqs)
+    if op1 == "delete" and op2 == "patch":
+        return dict(first, seqs=seqs)
+    return "keep"
+
+
+def coalesce(entries: list) -> tuple:
+    """
+    送信待ちの書き込みを予定ごとにまとめる（追加→削除は打ち消し、変更の繰り返しは1回の変更に）。
+
+    Returns:
+        tuple: (送信する書き込みのリスト, 打ち消し合って送信不要になったseqのリスト)
+    """
+    merged = []        # 送信順を保つため、最初に現れた位置に置く
+    last_for_id = {}   # event_id -> merged内の位置
+    cancelled = []
+    for entry in entries:
+        entry = dict(entry, seqs=[entry["seq"]])
+        pos = last_for_id.get(entry["event_id"])
+        if pos is None or merged[pos] is None:
+            last_for_id[entry["event_id"]] = len(merged)
+            merged.append(entry)
+            continue
+        result = _merge(merged[pos], entry)
+        if result is None:
+            cancelled.extend(merged[pos]["seqs"] + entry["seqs"])
+            merged[pos] = None
+        elif result == "keep":
+            last_for_id[entry["event_id"]] = len(merged)
+            merged.append(entry)
+        else:
+            merged[pos] = result
+    return [m for m in merged if m is not None], cancelled
+
+
+class MutationJournal:
+    def __init__(self, path: str = None, flush_interval: float = 2.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.service_factory = None
+        self.on_applied = None     # (op, event_id, resource) -> None。送信に成功したらローカルの状態を更新する（IDが変わった場合はresource["id"]が新しいID）
+        self.on_failed = None      # (op, event_id, error) -> None。送信に失敗したらローカルの状態を捨てる
+        self.failures = []         # 送信に失敗した書き込み（直近のもの）
+        self._entries = []         # 送信待ちの書き込み [{"seq", "op", "event_id", "body", "submitted_at"}]
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._load()
+
+    def configure(self, service_factory, on_applied=None, on_failed=None):
+        self.service_factory = service_factory
+        self.on_applied = on_applied
+        self.on_failed = on_failed
+        if self._entries:
+            self.start()
+
+    def start(self):
+        """バックグラウンドでの送信を開始する（前回送れなかった書き込みがあればすぐに送る）"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="mutation-journal", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self.flush()
+
+    # --- ファイルへの保存 ---
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError) as e:
+            print(f"[JOURNAL WARNING] 書き込みジャーナルを読み込めませんでした: {e}")
+            self._entries = []
+        self._seq = max((e["seq"] for e in self._entries), default=0)
+        if self._entries:
+            print(f"[JOURNAL] 前回送信できなかった書き込みが{len(self._entries)}件あります")
+
+    def _persist_locked(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for entry in self._entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[JOURNAL WARNING] 書き込みジャーナルを保存できませんでした: {e}")
+
+    # --- 書き込みの受付 ---
+
+    def submit(self, op: str, event_id: str, body: dict = None) -> int:
+        """書き込みをジャーナルに追加する（送信はバックグラウンドで行う）"""
+        with self._lock:
+            self._seq += 1
+            self._entries.append({"seq": self._seq, "op": op, "event_id": event_id, "body": body or {}, "submitted_at": time.time()})
+            self._persist_locked()
+            seq = self._seq
+        self.start()
+        return seq
+
+    def pending(self) -> list:
+        with self._lock:
+            return list(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def overlay(self, events: list, time_min: str, time_max: str) -> list:
+        """
+        Googleから取得した予定の一覧に、まだ送信していない書き込みを重ねる。
+        送信待ちの追加は期間に重なれば加え、変更は反映し、削除した予定は取り除く。
+        """
+        pending, _ = coalesce(self.pending())
+        if not pending:
+            return events
+        by_id = {e["id"]: e for e in events}
+        range_start, range_end = datetime.fromisoformat(time_min), datetime.fromisoformat(time_max)
+        for entry in pending:
+            event_id = entry["event_id"]
+            if entry["op"] == "delete":
+                by_id.pop(event_id, None)
+            elif entry["op"] == "patch" and event_id in by_id:
+                by_id[event_id] = {**by_id[event_id], **entry["body"]}
+                if not _overlaps(by_id[event_id], range_start, range_end):
+                    del by_id[event_id]
+            elif entry["op"] == "insert" and _overlaps(entry["body"], range_start, range_end):
+                by_id[event_id] = dict(entry["body"], id=event_id)
+        return sorted(by_id.values(), key=_start_key)
+
+    # --- 送信 ---
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[JOURNAL ERROR] 書き込みの送信に失敗: {e}")
+
+    def flush(self) -> int:
+        """送信待ちの書き込みをまとめて送る。送信に成功（または不要に）した件数を返す"""
+        with self._flush_lock:
+            snapshot = self.pending()
+            if not snapshot or self.service_factory is None:
+                return 0
+            batch, cancelled = coalesce(snapshot)
+            done = set(cancelled)
+            if batch:
+                service = self.service_factory()
+                for i in range(0, len(batch), BATCH_SIZE):
+                    done.update(self._send_batch(service, batch[i:i + BATCH_SIZE]))
+            with self._lock:
+                self._entries = [e for e in self._entries if e["seq"] not in done]
+                self._persist_locked()
+            if done:
+                print(f"[JOURNAL] {len(done)}件の書き込みを反映しました（送信 {len(batch)}件, 残り {len(self._entries)}件）")
+            return len(done)
+
+    def apply_now(self, op: str, event_id: str, body: dict = None):
+        """
+        書き込みを待たずにその場で送り、結果のリソースを返す（繰り返し予定や、ローカルに情報のない予定への書き込み用）。
+        IDの重複（送り直し）以外のエラーはそのままHttpErrorとして送出する。
+        """
+        entry = {"op": op, "event_id": event_id, "body": body or {}}
+        service = self.service_factory()
+        try:
+            return resilience.calendar_api.call(self._request(service, entry).execute)
+        except HttpError as error:
+            return self._handle_error(service, entry, error, replay=False)
+
+    def _request(self, service, entry: dict):
+        events = service.events()
+        if entry["op"] == "insert":
+            return events.insert(calendarId="primary", body=dict(entry["body"], id=entry["event_id"]))
+        if entry["op"] == "patch":
+            return events.patch(calendarId="primary", eventId=entry["event_id"], body=entry["body"])
+        return events.delete(calendarId="primary", eventId=entry["event_id"])
+
+    def _handle_error(self, service, entry: dict, error: HttpError, replay: bool = True):
+        """
+        送り直しで起きる既知のエラーを成功扱いにする。追加が409（同じIDが既にある）なら反映済み、
+        ジャーナルからの削除が404/410なら削除済み。409でも既存の予定が削除済みなら、IDをずらして追加し直す。
+        """
+        status = error.resp.status
+        if entry["op"] == "delete" and status in (404, 410) and replay:
+            return {}
+        if entry["op"] == "insert" and status == 409:
+            existing = resilience.calendar_api.call(service.events().get(calendarId="primary", eventId=entry["event_id"]).execute)
+            if existing.get("status") != "cancelled":
+                return existing
+            attempt = entry.get("attempt", 0) + 1
+            retry = dict(entry, event_id=event_id_for(entry["body"], attempt=attempt), attempt=attempt)
+            print(f"[JOURNAL] 削除済みの予定とIDが重なったため、IDを変えて追加し直します（{entry['event_id']} -> {retry['event_id']}）")
+            try:
+                return resilience.calendar_api.call(self._request(service, retry).execute)
+            except HttpError as retry_error:
+                return self._handle_error(service, retry, retry_error, replay)
+        raise error
+
+    def _send_batch(self, service, entries: list) -> set:
+        """まとめた書き込みを1回のバッチリクエストで送り、反映済みになったseqの集合を返す"""
+        done = set()
+
+        def callback(request_id, response, exception):
+            entry = entries[int(request_id)]
+            if exception is not None:
+                try:
+                    if not isinstance(exception, HttpError):
+                        raise exception
+                    response = self._handle_error(service, entry, exception)
+                except HttpError as error:
+                    if resilience.is_retryable(error):
+                        print(f"[JOURNAL WARNING] 一時的なエラーのため、次回送り直します（{entry['op']} {entry['event_id']}）: {error}")
+                        return
+                    self._fail(entry, error)
+                    done.update(entry["seqs"])
+                    return
+                except Exception as error:
+                    print(f"[JOURNAL WARNING] 送信に失敗したため、次回送り直します（{entry['op']} {entry['event_id']}）: {error}")
+                    return
+            done.update(entry["seqs"])
+            if self.on_applied:
+                self.on_applied(entry["op"], entry["event_id"], response or {})
+
+        batch = service.new_batch_http_request()
+        for i, entry in enumerate(entries):
+            batch.add(self._request(service, entry), request_id=str(i), callback=callback)
+        # バッチは含まれるリクエスト数だけ割り当てを消費する
+        resilience.calendar_api.call(batch.execute, tokens=len(entries))
+        return done
+
+    def _fail(self, entry: dict, error):
+        print(f"[JOURNAL ERROR] 書き込みを反映できませんでした（{entry['op']} {entry['event_id']}）: {error}")
+        self.failures = (self.failures + [{"op": entry["op"], "event_id": entry["event_id"], "body": entry["body"], "error": str(error)}])[-50:]
+        if self.on_failed:
+            self.on_failed(entry["op"], entry["event_id"], error)
+
+
+def _start_key(event: dict) -> str:
+    return event["start"].get("dateTime", event["start"].get("date", ""))
+
+
+def _overlaps(event: dict, range_start: datetime, range_end: datetime) -> bool:
+    try:
+        start = datetime.fromisoformat(event["start"].get("dateTime") or f"{event['start']['date']}T00:00:00+09:00")
+        end = datetime.fromisoformat(event["end"].get("dateTime") or f"{event['end']['date']}T00:00:00+09:00")
+    except (KeyError, ValueError):
+        return False
+    if start.tzinfo is None or end.tzinfo is None:
+        return False
+    return start < range_end and end > range_start
+
+
+# プロセス全体で共有するジャーナル（送信に使うサービスはtools.pyで設定する）
+journal = MutationJournal(path=config.MUTATION_JOURNAL_FILE, flush_interval=config.MUTATION_FLUSH_INTERVAL_SECONDS)
@@ -0,0 +1,157 @@
+# src/calendar_agent/read_coalescer.py
+import asyncio
+import threading
+import time
+
+import config
+from src.core import metrics
+
+# 同じ期間の予定取得をまとめるための層（single-flight ＋ 短時間の結果キャッシュ）。
+# 複数のセッションが「今日」「今週」などの同じ期間を同時に取得しようとしたとき、
+# 最初の1件だけがカレンダーに問い合わせ、残りはその結果を待って受け取る。
+# このプロセスからの書き込みがあれば世代を進め、それ以前の結果・実行中の取得は使わない。
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _AsyncFlight:
+    """asyncio版の実行中の取得。取得は独立したタスクで行い、待つ側がいなくなったときだけ取り消す"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class CoalescingReader:
+    def __init__(self, ttl_seconds: float = 5):
+        self.ttl_seconds = ttl_seconds
+        self._generation = 0
+        self._cache = {}       # key -> (result, fetched_at, generation)
+        self._inflight = {}    # (key, generation) -> _Flight
+        self._ainflight = {}   # (key, generation) -> _AsyncFlight（asyncio版の取得）
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """書き込みの後に呼ぶ。キャッシュを捨て、実行中の取得にも以降の呼び出しを合流させない"""
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+
+    def get(self, key: tuple, fetch):
+        """
+        keyの結果を返す。有効なキャッシュがあればそれを、同じ取得が実行中ならその完了を待って結果を返す。
+        どちらもなければfetch()を呼び、結果を短時間キャッシュする。
+
+        Args:
+            key (tuple): (カレンダー, 開始, 終了, 取得方法) のような、結果を一意に決める組。
+            fetch (Callable[[], Any]): 実際にカレンダーへ問い合わせる関数。
+        """
+        with self._lock:
+            generation = self._generation
+            cached = self._cached(key, generation)
+            if cached is not None:
+                return cached[0]
+            flight = self._inflight.get((key, generation))
+            leader = flight is None
+            if leader:
+                flight = self._inflight[(key, generation)] = _Flight()
+
+        if not leader:
+            metrics.incr("calendar_reads", outcome="coalesced")
+            flight.done.wait()
+            if isinstance(flight.error, Exception):
+                raise flight.error
+            if flight.error is not None:
+                # 先に取得していた呼び出しが取り消された（要求元の切断など）。その取り消しは自分には関係ないので、取得し直す
+                return self.get(key, fetch)
+            return flight.result
+
+        metrics.incr("calendar_reads", outcome="fetched")
+        try:
+            flight.result = fetch()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop((key, generation), None)
+                # 成功した結果だけをキャッシュする
+                if flight.error is None:
+                    self._store(key, generation, flight.result)
+            flight.done.set()
+        return flight.result
+
+    async def aget(self, key: tuple, afetch):
+        """
+        getのasyncio版。キャッシュは同期版と共有し、実行中の取得への合流は同じイベントループ上の呼び出し同士で行う。
+        取得は独立したタスクで行うので、最初に呼び出した側が取り消されても、合流した他の呼び出しは結果を受け取れる
+        （待つ側が全員取り消されたときだけ、取得も取り消す）。
+
+        Args:
+            key (tuple): getと同じ。
+            afetch (Callable[[], Awaitable[Any]]): 実際にカレンダーへ問い合わせるコルーチン関数。
+        """
+        with self._lock:
+            generation = self._generation
+            cached = self._cached(key, generation)
+            if cached is not None:
+                return cached[0]
+            flight = self._ainflight.get((key, generation))
+            leader = flight is None
+            if leader:
+                task = asyncio.get_running_loop().create_task(self._afetch(key, generation, afetch))
+                # 待つ側が全員取り消された場合に、例外が取り出されないままになる警告を出さない
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                flight = self._ainflight[(key, generation)] = _AsyncFlight(task)
+            flight.waiters += 1
+
+        metrics.incr("calendar_reads", outcome="fetched" if leader else "coalesced")
+        try:
+            # 待っている側が取り消されても、取得そのものは止めない
+            return await asyncio.shield(flight.task)
+        finally:
+            with self._lock:
+                flight.waiters -= 1
+                if flight.waiters == 0 and not flight.task.done():
+                    # 結果を待つ呼び出しがもうないので、取得を取り消す（以降の呼び出しは新しく取得する）
+                    if self._ainflight.get((key, generation)) is flight:
+                        del self._ainflight[(key, generation)]
+                    flight.task.cancel()
+
+    async def _afetch(self, key: tuple, generation: int, afetch):
+        try:
+            result = await afetch()
+        finally:
+            with self._lock:
+                flight = self._ainflight.get((key, generation))
+                if flight is not None and flight.task is asyncio.current_task():
+                    del self._ainflight[(key, generation)]
+        with self._lock:
+            self._store(key, generation, result)
+        return result
+
+    def _cached(self, key: tuple, generation: int):
+        """有効なキャッシュがあれば (結果, 取得時刻, 世代) を返す（ロックを取って呼ぶ）"""
+        cached = self._cache.get(key)
+        if cached is not None and cached[2] == generation and time.monotonic() - cached[1] < self.ttl_seconds:
+            metrics.incr("calendar_reads", outcome="cache_hit")
+            return cached
+        return None
+
+    def _store(self, key: tuple, generation: int, result):
+        """取得結果をキャッシュする（ロックを取って呼ぶ）"""
+        # 取得中に書き込みがあった結果は、古い可能性があるのでキャッシュしない
+        if generation != self._generation:
+            return
+        now = time.monotonic()
+        self._cache = {k: v for k, v in self._cache.items() if now - v[1] < self.ttl_seconds}
+        self._cache[key] = (result, now, generation)
+
+
+# プロセス全体で共有する、予定一覧の取得の合流・キャッシュ
+reads = CoalescingReader(ttl_seconds=config.CALENDAR_READ_CACHE_TTL_SECONDS)
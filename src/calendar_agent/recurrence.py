@@ -0,0 +1,368 @@
+# src/calendar_agent/recurrence.py
+import calendar
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+import pytz
+
+import config
+from src.core import resilience
+
+# 繰り返し予定のローカル展開。
+# singleEvents=Trueでは、Googleが期間内のすべての回を1件ずつ返すため、長い期間の取得ほど応答が大きくなる。
+# ここでは繰り返しの親予定（RRULE/EXDATEを持つ）を1件だけ受け取ってローカルに保持し、
+# 問い合わせ期間の分だけ手元で展開する（展開結果は期間ごとにキャッシュする）。
+# 未対応のルール（RDATEやBYSETPOSなど）を含む予定だけは、従来どおりサーバー側で展開してもらう。
+
+JST = pytz.timezone('Asia/Tokyo')
+WEEKDAYS = {"MO": 0, "TU": 1, "WE": 2, "TH": 3, "FR": 4, "SA": 5, "SU": 6}
+SUPPORTED_KEYS = {"FREQ", "INTERVAL", "COUNT", "UNTIL", "BYDAY", "BYMONTHDAY", "BYMONTH", "WKST"}
+MAX_ITERATIONS = 100000
+# events().list / instances() の1ページあたりの件数（APIの上限）
+PAGE_SIZE = 2500
+
+
+class UnsupportedRule(Exception):
+    """ローカルで展開できない繰り返しルール"""
+
+
+def parse_rrule(line: str) -> dict:
+    """'RRULE:FREQ=WEEKLY;BYDAY=MO,WE' を {"FREQ": "WEEKLY", "BYDAY": ["MO", "WE"]} のような辞書にする"""
+    body = line.split(":", 1)[1] if line.upper().startswith("RRULE") else line
+    rule = {}
+    for part in filter(None, body.strip().split(";")):
+        key, _, value = part.partition("=")
+        key = key.upper()
+        if key not in SUPPORTED_KEYS:
+            raise UnsupportedRule(f"未対応のRRULE要素: {key}")
+        rule[key] = value.upper().split(",") if key in ("BYDAY", "BYMONTHDAY", "BYMONTH") else value.upper()
+    if rule.get("FREQ") not in ("DAILY", "WEEKLY", "MONTHLY", "YEARLY"):
+        raise UnsupportedRule(f"未対応のFREQ: {rule.get('FREQ')}")
+    return rule
+
+
+def _parse_ical_time(value: str, tz, is_date: bool):
+    """iCalendar形式の日時（20250101T100000Z / 20250101T100000 / 20250101）を変換する"""
+    if is_date or len(value) == 8:
+        return datetime.strptime(value[:8], "%Y%m%d").date()
+    if value.endswith("Z"):
+        return pytz.utc.localize(datetime.strptime(value[:-1], "%Y%m%dT%H%M%S"))
+    return tz.localize(datetime.strptime(value, "%Y%m%dT%H%M%S"))
+
+
+def parse_exdates(lines: list, tz) -> set:
+    """EXDATE行から、除外する回の開始日時（終日予定なら日付）の集合を作る"""
+    result = set()
+    for line in lines:
+        params, _, values = line.partition(":")
+        line_tz = tz
+        is_date = "VALUE=DATE" in params.upper() and "VALUE=DATE-TIME" not in params.upper()
+        for param in params.split(";")[1:]:
+            if param.upper().startswith("TZID="):
+                line_tz = pytz.timezone(param.split("=", 1)[1])
+        for value in filter(None, values.split(",")):
+            parsed = _parse_ical_time(value.strip(), line_tz, is_date)
+            result.add(parsed if isinstance(parsed, date) and not isinstance(parsed, datetime) else parsed.astimezone(pytz.utc))
+    return result
+
+
+def _byday(values: list) -> list:
+    """BYDAYの各要素を (序数またはNone, 曜日番号) にする。例: '-1FR' → (-1, 4)"""
+    result = []
+    for value in values:
+        ordinal, code = value[:-2], value[-2:]
+        if code not in WEEKDAYS:
+            raise UnsupportedRule(f"不正なBYDAY: {value}")
+        result.append((int(ordinal) if ordinal else None, WEEKDAYS[code]))
+    return result
+
+
+def _month_days(year: int, month: int, rule: dict, default_day: int) -> list:
+    """MONTHLY/YEARLYで、ある月のうち該当する日の一覧"""
+    last = calendar.monthrange(year, month)[1]
+    if "BYMONTHDAY" in rule:
+        days = []
+        for value in rule["BYMONTHDAY"]:
+            day = int(value)
+            day = last + day + 1 if day < 0 else day
+            if 1 <= day <= last:
+                days.append(day)
+        return sorted(set(days))
+    if "BYDAY" in rule:
+        days = []
+        for ordinal, weekday in _byday(rule["BYDAY"]):
+            matches = [d for d in range(1, last + 1) if date(year, month, d).weekday() == weekday]
+            if ordinal is None:
+                days.extend(matches)
+            elif -len(matches) <= ordinal <= len(matches) and ordinal != 0:
+                days.append(matches[ordinal - 1] if ordinal > 0 else matches[ordinal])
+        return sorted(set(days))
+    return [default_day] if default_day <= last else []
+
+
+def _candidate_dates(rule: dict, start: date, last_day: date):
+    """ルールに合う日付を、開始日からlast_dayまで時系列順に生成する（開始日より前は含まない）"""
+    freq = rule["FREQ"]
+    interval = int(rule.get("INTERVAL", "1"))
+    by_month = {int(m) for m in rule.get("BYMONTH", [])}
+
+    if freq == "DAILY":
+        weekdays = {w for _, w in _byday(rule.get("BYDAY", []))}
+        day = start
+        while day <= last_day:
+            if (not weekdays or day.weekday() in weekdays) and (not by_month or day.month in by_month) \
+                    and ("BYMONTHDAY" not in rule or day.day in _month_days(day.year, day.month, {"BYMONTHDAY": rule["BYMONTHDAY"]}, day.day)):
+                yield day
+            day += timedelta(days=interval)
+    elif freq == "WEEKLY":
+        wkst = WEEKDAYS.get(rule.get("WKST", "MO"), 0)
+        weekdays = sorted({w for _, w in _byday(rule["BYDAY"])} if "BYDAY" in rule else {start.weekday()}, key=lambda w: (w - wkst) % 7)
+        week_start = start - timedelta(days=(start.weekday() - wkst) % 7)
+        while week_start <= last_day:
+            for weekday in weekdays:
+                day = week_start + timedelta(days=(weekday - wkst) % 7)
+                if day >= start and (not by_month or day.month in by_month):
+                    yield day
+            week_start += timedelta(weeks=interval)
+    elif freq == "MONTHLY":
+        year, month = start.year, start.month
+        while date(year, month, 1) <= last_day:
+            if not by_month or month in by_month:
+                for d in _month_days(year, month, rule, start.day):
+                    if date(year, month, d) >= start:
+                        yield date(year, month, d)
+            month += interval
+            year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    else:  # YEARLY
+        if "BYDAY" in rule and not by_month:
+            raise UnsupportedRule("BYMONTHなしの年単位BYDAYは未対応です。")
+        year = start.year
+        while year <= last_day.year:
+            for month in sorted(by_month or {start.month}):
+                for d in _month_days(year, month, rule, start.day):
+                    if date(year, month, d) >= start:
+                        yield date(year, month, d)
+            year += interval
+
+
+def expand(master: dict, window_start: datetime, window_end: datetime) -> list:
+    """
+    繰り返しの親予定を、指定期間に重なる回の (開始, 終了) のリストに展開する。
+    終日予定は date、時間指定の予定はタイムゾーン付きの datetime で返す。
+
+    Raises:
+        UnsupportedRule: ローカルで展開できないルールの場合。
+    """
+    lines = master.get("recurrence", [])
+    rrules = [l for l in lines if l.upper().startswith("RRULE")]
+    if len(rrules) != 1 or any(l.upper().startswith(("RDATE", "EXRULE")) for l in lines):
+        raise UnsupportedRule("RRULEが1つでない、またはRDATE/EXRULEを含む予定です。")
+    rule = parse_rrule(rrules[0])
+    tz = pytz.timezone(master["start"].get("timeZone") or "Asia/Tokyo")
+    exdates = parse_exdates([l for l in lines if l.upper().startswith("EXDATE")], tz)
+
+    is_all_day = "date" in master["start"]
+    if is_all_day:
+        first = date.fromisoformat(master["start"]["date"])
+        duration = date.fromisoformat(master["end"]["date"]) - first
+        start_clock = None
+    else:
+        first_dt = datetime.fromisoformat(master["start"]["dateTime"].replace('Z', '+00:00')).astimezone(tz)
+        end_dt = datetime.fromisoformat(master["end"]["dateTime"].replace('Z', '+00:00'))
+        duration = end_dt - first_dt
+        first, start_clock = first_dt.date(), first_dt.time().replace(tzinfo=None)
+
+    until = None
+    if "UNTIL" in rule:
+        until = _parse_ical_time(rule["UNTIL"], tz, len(rule["UNTIL"]) == 8)
+    count = int(rule["COUNT"]) if "COUNT" in rule else None
+    window_start_day = window_start.astimezone(tz).date()
+    window_end_day = window_end.astimezone(tz).date()
+
+    occurrences = []
+    # 期間の終わりより後の日付は生成しない（該当日がない月が続くルールでも必ず止まる）
+    for n, day in enumerate(_candidate_dates(rule, first, window_end_day)):
+        if n >= MAX_ITERATIONS or (count is not None and n >= count):
+            break
+        if is_all_day:
+            start, end = day, day + duration
+            if until is not None and day > (until if not isinstance(until, datetime) else until.astimezone(tz).date()):
+                break
+            if day > window_end_day:
+                break
+            if day in exdates or end <= window_start_day:
+                continue
+        else:
+            start = tz.localize(datetime.combine(day, start_clock))
+            end = start + duration
+            if until is not None and (start > until if isinstance(until, datetime) else day > until):
+                break
+            if start >= window_end:
+                break
+            if start.astimezone(pytz.utc) in exdates or end <= window_start:
+                continue
+        occurrences.append((start, end))
+    return occurrences
+
+
+def instance_id(master_id: str, start) -> str:
+    """Googleの繰り返しインスタンスと同じ形式のID（masterId_20250101T010000Z / masterId_20250101）"""
+    if isinstance(start, datetime):
+        return f"{master_id}_{start.astimezone(pytz.utc):%Y%m%dT%H%M%SZ}"
+    return f"{master_id}_{start:%Y%m%d}"
+
+
+class RecurrenceStore:
+    """繰り返しの親予定を1件ずつ保持し、期間ごとの展開結果をキャッシュするローカルレプリカ"""
+
+    def __init__(self, max_cached_windows: int = 256):
+        self.masters = {}
+        self.max_cached_windows = max_cached_windows
+        self._expansions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put_master(self, master: dict):
+        with self._lock:
+            self.masters[master["id"]] = master
+
+    def forget(self, master_id: str):
+        with self._lock:
+            self.masters.pop(master_id, None)
+
+    def instances(self, master: dict, window_start: datetime, window_end: datetime) -> list:
+        """親予定を期間内で展開し、Google APIのイベントと同じ形の辞書のリストで返す"""
+        key = (master["id"], master.get("etag") or master.get("updated"), window_start.isoformat(), window_end.isoformat())
+        with self._lock:
+            cached = self._expansions.get(key)
+            if cached is not None:
+                self._expansions.move_to_end(key)
+                return cached
+        result = []
+        for start, end in expand(master, window_start, window_end):
+            time_key = "dateTime" if isinstance(start, datetime) else "date"
+            result.append({
+                "id": instance_id(master["id"], start),
+                "summary": master.get("summary"),
+                "start": {time_key: start.isoformat()},
+                "end": {time_key: end.isoformat()},
+                "recurringEventId": master["id"],
+                "originalStartTime": {time_key: start.isoformat()},
+            })
+        with self._lock:
+            self._expansions[key] = result
+            while len(self._expansions) > self.max_cached_windows:
+                self._expansions.popitem(last=False)
+        return result
+
+
+store = RecurrenceStore(max_cached_windows=config.RECURRENCE_CACHE_WINDOWS)
+
+
+def _sort_key(event: dict):
+    value = event["start"].get("dateTime") or event["start"].get("date")
+    if len(value) == 10:
+        return JST.localize(datetime.fromisoformat(value))
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _original_start(event: dict):
+    """例外（変更・キャンセルされた回）がどの回を置き換えているか"""
+    original = event.get("originalStartTime", {})
+    if "dateTime" in original:
+        return datetime.fromisoformat(original["dateTime"].replace('Z', '+00:00')).astimezone(pytz.utc)
+    if "date" in original:
+        return date.fromisoformat(original["date"])
+    return None
+
+
+def _list_all(method, **params) -> list:
+    """list系のAPI（events().listなど）をnextPageTokenがなくなるまで呼び、全ページのitemsを返す"""
+    items = []
+    page_token = None
+    while True:
+        page_params = dict(params, maxResults=PAGE_SIZE)
+        if page_token:
+            page_params["pageToken"] = page_token
+        page = resilience.calendar_api.call(method(**page_params).execute)
+        items.extend(page.get("items", []))
+        page_token = page.get("nextPageToken")
+        if not page_token:
+            return items
+
+
+def fetch_events(service, time_min: str, time_max: str) -> list:
+    """
+    期間内の予定を取得する。繰り返し予定は親予定だけを受け取り、ローカルで展開する。
+    返り値はsingleEvents=Trueで取得したときと同じ形（開始順のイベントのリスト）。
+    """
+    # 削除済みの予定・変更された回も含むため、1ページに収まらないことがある
+    items = _list_all(
+        service.events().list,
+        calendarId="primary",
+        timeMin=time_min,
+        timeMax=time_max,
+        singleEvents=False,
+        showDeleted=True,
+    )
+    events, unsupported = expand_items(items, time_min, time_max)
+    for event_id in unsupported:
+        instances = _list_all(
+            service.events().instances, calendarId="primary", eventId=event_id, timeMin=time_min, timeMax=time_max
+        )
+        events.extend(i for i in instances if i.get("status") != "cancelled")
+    return sorted(events, key=_sort_key)
+
+
+async def afetch_events(client, time_min: str, time_max: str) -> list:
+    """fetch_eventsのasyncio版。clientはasync_calendar.AsyncCalendarClient。"""
+    items = await client.list_events(time_min, time_max, singleEvents=False, showDeleted=True)
+    events, unsupported = expand_items(items, time_min, time_max)
+    for event_id in unsupported:
+        instances = await client.instances(event_id, time_min, time_max)
+        events.extend(i for i in instances if i.get("status") != "cancelled")
+    return sorted(events, key=_sort_key)
+
+
+def expand_items(items: list, time_min: str, time_max: str) -> tuple:
+    """
+    singleEvents=Falseで取得した予定を展開する。
+
+    Returns:
+        tuple: (展開済みの予定のリスト（未ソート）, ローカルで展開できずサーバーでの展開が必要な親予定のIDのリスト)
+    """
+    window_start = datetime.fromisoformat(time_min)
+    window_end = datetime.fromisoformat(time_max)
+
+    # 変更・キャンセルされた回は、親予定の展開結果から取り除く（変更後の回は通常の予定として残す）
+    overridden = {}
+    for item in items:
+        if item.get("recurringEventId") and _original_start(item) is not None:
+            overridden.setdefault(item["recurringEventId"], set()).add(_original_start(item))
+
+    events = []
+    server_expanded = set()
+    for item in items:
+        if not item.get("recurrence"):
+            continue
+        if item.get("status") == "cancelled":
+            store.forget(item["id"])
+            continue
+        store.put_master(item)
+        try:
+            instances = store.instances(item, window_start, window_end)
+        except (UnsupportedRule, ValueError, KeyError) as e:
+            # 展開できない予定だけサーバー側で展開してもらう
+            print(f"[RECURRENCE] ローカル展開できないためサーバーで展開します（{item.get('summary')}）: {e}")
+            server_expanded.add(item["id"])
+            continue
+        skipped = overridden.get(item["id"], set())
+        events.extend(i for i in instances if _original_start(i) not in skipped)
+
+    # 単発の予定と、変更後の回（サーバーで展開した予定の分は展開結果に含まれているので除く）
+    events.extend(
+        item for item in items
+        if not item.get("recurrence") and item.get("status") != "cancelled"
+        and item.get("recurringEventId") not in server_expanded
+    )
+    return events, sorted(server_expanded)
@@ -0,0 +1,286 @@
+# src/calendar_agent/schedule_optimizer.py
+import re
+from datetime import datetime
+
+from src.calendar_agent import free_busy
+
+# 週単位のスケジュール最適化。
+# タスク（所要時間・締切・優先度・希望時間帯）を、free_busyで求めた空き区間に詰める。
+# 締切の早い順・優先度の高い順に貪欲に配置したあと、局所探索（1件ずつ外して最良の位置に置き直す、
+# 入らなかったタスクのために優先度の低いタスクをどかす）で改善する。数十件程度ならミリ秒で終わる。
+
+STEP_MINUTES = 30
+LOAD_WEIGHT = 0.3
+MAX_LOCAL_SEARCH_ROUNDS = 5
+
+# 希望時間帯（開始時刻の範囲、時）
+TIME_BANDS = {
+    "morning": (6, 12),
+    "afternoon": (12, 17),
+    "evening": (17, 23),
+}
+_BAND_WORDS = {
+    "morning": re.compile(r"朝|午前|morning"),
+    "afternoon": re.compile(r"昼|午後|afternoon"),
+    "evening": re.compile(r"夕方|夜|evening|night"),
+}
+
+
+def preferences_from_profile(profile_text: str) -> dict:
+    """
+    ユーザーの特性プロファイル（自由文）から、最適化に使う好みを読み取る。
+    読み取れない項目は既定値のまま。
+    """
+    text = profile_text if isinstance(profile_text, str) else ""
+    prefs = {"peak": None, "max_hours_per_day": 6.0, "break_minutes": 15}
+    if re.search(r"朝型|朝に強い|午前中.{0,6}集中|早起き", text):
+        prefs["peak"] = "morning"
+    elif re.search(r"夜型|夜に強い|夜.{0,6}集中|朝が苦手|朝に弱い", text):
+        prefs["peak"] = "evening"
+    if re.search(r"詰め込み.{0,6}(苦手|疲れ|避け)|疲れやすい|休憩.{0,6}(必要|大事|多め)", text):
+        prefs["max_hours_per_day"] = 4.0
+        prefs["break_minutes"] = 30
+    return prefs
+
+
+def normalize_task(task: dict, index: int = 0) -> dict:
+    """LLMなどから渡されたタスクを、最適化用の形にそろえる"""
+    preferred = task.get("preferred")
+    if preferred not in TIME_BANDS:
+        preferred = next((band for band, pattern in _BAND_WORDS.items() if preferred and pattern.search(str(preferred))), None)
+    deadline = task.get("deadline")
+    deadline_min = None
+    if deadline:
+        try:
+            value = datetime.fromisoformat(str(deadline).replace('Z', '+00:00'))
+            if len(str(deadline)) == 10:
+                # 日付だけの締切は、その日の終わりまでとみなす
+                value = value.replace(hour=23, minute=59)
+            deadline_min = free_busy.to_minute(value)
+        except ValueError:
+            deadline_min = None
+    return {
+        "index": index,
+        "title": str(task.get("title") or task.get("summary") or f"タスク{index + 1}"),
+        "duration": max(STEP_MINUTES // 2, int(task.get("duration_minutes") or 60)),
+        "deadline": deadline_min,
+        "priority": min(5, max(1, int(task.get("priority") or 3))),
+        "preferred": preferred,
+    }
+
+
+# JSTは夏時間がないので、分単位の時刻から日・時刻を算術で求める（datetime変換を避けて高速化）
+_JST_OFFSET_MINUTES = 9 * 60
+
+
+def _local_day(minute: int) -> int:
+    return (minute + _JST_OFFSET_MINUTES) // (24 * 60)
+
+
+def _local_hour(minute: int) -> float:
+    return (minute + _JST_OFFSET_MINUTES) % (24 * 60) / 60
+
+
+class _Board:
+    """空き区間と日ごとの負荷を管理する盤面"""
+
+    def __init__(self, windows: list, break_minutes: int):
+        self.windows = list(windows)
+        self.break_minutes = break_minutes
+        self.day_load = {}
+
+    def candidates(self, duration: int, latest_end: int = None):
+        for start, end in self.windows:
+            slot = -(-start // STEP_MINUTES) * STEP_MINUTES
+            while slot + duration <= end and (latest_end is None or slot + duration <= latest_end):
+                yield slot
+                slot += STEP_MINUTES
+
+    def place(self, start: int, duration: int):
+        # 配置した前後に休憩を取り、次のタスクが詰まりすぎないようにする
+        busy_start, busy_end = start - self.break_minutes, start + duration + self.break_minutes
+        updated = []
+        for w_start, w_end in self.windows:
+            if w_end <= busy_start or w_start >= busy_end:
+                updated.append((w_start, w_end))
+                continue
+            if w_start < busy_start:
+                updated.append((w_start, busy_start))
+            if busy_end < w_end:
+                updated.append((busy_end, w_end))
+        self.windows = updated
+        day = _local_day(start)
+        self.day_load[day] = self.day_load.get(day, 0) + duration
+
+
+def _static_cost(task: dict, start: int, prefs: dict, range_start: int) -> float:
+    """他のタスクの配置によらない部分のコスト"""
+    hour = _local_hour(start)
+    cost = 0.0
+    # 希望時間帯（タスク自身の指定 > 重要タスクはユーザーの得意な時間帯）から外れるほど不利
+    band = task["preferred"] or (prefs.get("peak") if task["priority"] >= 4 else None)
+    if band:
+        low, high = TIME_BANDS[band]
+        cost += max(0, low - hour, hour - high + task["duration"] / 60) * 2
+    # 優先度の高いタスクほど早めに終わらせる
+    cost += (start - range_start) / (24 * 60) * task["priority"] * 0.5
+    return cost
+
+
+def _slot_cost(task: dict, start: int, board: _Board, prefs: dict, range_start: int) -> float:
+    """小さいほど良い。日の上限を超える配置はNone（不可）。"""
+    day_load = board.day_load.get(_local_day(start), 0)
+    if day_load + task["duration"] > prefs["max_hours_per_day"] * 60:
+        return None
+    # 同じ日に詰め込むほど不利にして、負荷の偏りを避ける
+    return _static_cost(task, start, prefs, range_start) + day_load / 60 * LOAD_WEIGHT
+
+
+def _best_slot(task: dict, board: _Board, prefs: dict, range_start: int):
+    best = None
+    for start in board.candidates(task["duration"], task["deadline"]):
+        cost = _slot_cost(task, start, board, prefs, range_start)
+        if cost is not None and (best is None or cost < best[0]):
+            best = (cost, start)
+    return best
+
+
+class _Search:
+    """配置（タスク番号→開始）を保持し、貪欲法と局所探索で改善する"""
+
+    def __init__(self, tasks: list, windows: list, prefs: dict, range_start: int):
+        self.tasks = {t["index"]: t for t in tasks}
+        self.windows = windows
+        self.prefs = prefs
+        self.range_start = range_start
+        self.placement = {}
+
+    def board(self, exclude: set = ()) -> _Board:
+        board = _Board(self.windows, self.prefs["break_minutes"])
+        for i, start in self.placement.items():
+            if i not in exclude:
+                board.place(start, self.tasks[i]["duration"])
+        return board
+
+    def cost_of(self, i: int, board: _Board) -> float:
+        """タスクiを、自分以外が置かれた盤面で現在位置に置いたときのコスト"""
+        cost = _slot_cost(self.tasks[i], self.placement[i], board, self.prefs, self.range_start)
+        return cost if cost is not None else float("inf")
+
+    def objective(self) -> float:
+        # 各タスクのcost_ofの合計を、盤面を作らずに求める（負荷の項は同じ日の他タスクの合計時間）
+        day_load = {}
+        for i, start in self.placement.items():
+            day = _local_day(start)
+            day_load[day] = day_load.get(day, 0) + self.tasks[i]["duration"]
+        total = sum(
+            _static_cost(self.tasks[i], start, self.prefs, self.range_start)
+            + (day_load[_local_day(start)] - self.tasks[i]["duration"]) / 60 * LOAD_WEIGHT
+            for i, start in self.placement.items()
+        )
+        # 入らなかったタスクは優先度に応じて大きく減点する
+        return total + sum(100 * t["priority"] for i, t in self.tasks.items() if i not in self.placement)
+
+    def greedy(self, order: list):
+        board = self.board()
+        for task in order:
+            best = _best_slot(task, board, self.prefs, self.range_start)
+            if best is not None:
+                board.place(best[1], task["duration"])
+                self.placement[task["index"]] = best[1]
+
+    def relocate(self) -> bool:
+        """配置済みのタスクを1件ずつ外し、より良い位置があれば移す"""
+        improved = False
+        for i in list(self.placement):
+            board = self.board({i})
+            best = _best_slot(self.tasks[i], board, self.prefs, self.range_start)
+            if best is not None and best[0] < self.cost_of(i, board) - 1e-9:
+                self.placement[i] = best[1]
+                improved = True
+        return improved
+
+    def insert_unplaced(self) -> bool:
+        """入らなかったタスクを、優先度の低いタスクをどかしてでも入れられないか試す"""
+        improved = False
+        for u in sorted((t for i, t in self.tasks.items() if i not in self.placement), key=lambda t: -t["priority"]):
+            victims = [None] + sorted((i for i in self.placement if self.tasks[i]["priority"] < u["priority"]),
+                                      key=lambda i: self.tasks[i]["priority"])
+            score_before = self.objective()
+            for victim in victims:
+                before = dict(self.placement)
+                if victim is not None:
+                    del self.placement[victim]
+                board = self.board()
+                best = _best_slot(u, board, self.prefs, self.range_start)
+                if best is None:
+                    self.placement = before
+                    continue
+                self.placement[u["index"]] = best[1]
+                if victim is not None:
+                    # どかしたタスクは別の場所に置き直せれば置く
+                    board.place(best[1], u["duration"])
+                    moved = _best_slot(self.tasks[victim], board, self.prefs, self.range_start)
+                    if moved is not None:
+                        self.placement[victim] = moved[1]
+                if self.objective() < score_before - 1e-9:
+                    improved = True
+                    break
+                self.placement = before
+        return improved
+
+
+def optimize_schedule(tasks: list, busy: list, range_start: datetime, range_end: datetime, work_start: str = "09:00",
+                      work_end: str = "18:00", preferences: dict = None) -> dict:
+    """
+    タスクを空き時間に配置する案を作る。
+
+    Args:
+        tasks (list): {"title", "duration_minutes", "deadline"(ISO, 任意), "priority"(1-5, 任意),
+            "preferred"("morning"/"afternoon"/"evening", 任意)} の辞書のリスト。
+        busy (list): free_busy.merge_intervalsで結合済みの既存予定の区間。
+        range_start (datetime), range_end (datetime): 配置する期間。
+        work_start (str), work_end (str): 1日のうちタスクを置いてよい時間帯。
+        preferences (dict, optional): preferences_from_profileの結果。
+
+    Returns:
+        dict: "placed"（配置できたタスクと開始・終了）、"unplaced"（入らなかったタスク）、"score"。
+    """
+    prefs = {**preferences_from_profile(""), **(preferences or {})}
+    normalized = [normalize_task(t, i) for i, t in enumerate(tasks)]
+    windows = free_busy.free_windows(busy, range_start, range_end, work_start, work_end, min_minutes=STEP_MINUTES // 2)
+    search = _Search(normalized, windows, prefs, free_busy.to_minute(range_start))
+
+    # 1. 貪欲法：締切の早い順、同じなら優先度・所要時間の大きい順
+    search.greedy(sorted(normalized, key=lambda t: (t["deadline"] if t["deadline"] is not None else float("inf"), -t["priority"], -t["duration"])))
+
+    # 2. 局所探索：置き直しと、入らなかったタスクの割り込みを、改善がなくなるまで繰り返す
+    for _ in range(MAX_LOCAL_SEARCH_ROUNDS):
+        improved = search.relocate()
+        improved = search.insert_unplaced() or improved
+        if not improved:
+            break
+
+    placed = sorted(
+        ({
+            "title": search.tasks[i]["title"],
+            "start": free_busy.from_minute(start).isoformat(),
+            "end": free_busy.from_minute(start + search.tasks[i]["duration"]).isoformat(),
+            "priority": search.tasks[i]["priority"],
+        } for i, start in search.placement.items()),
+        key=lambda p: p["start"],
+    )
+    unplaced = [{"title": t["title"], "duration_minutes": t["duration"], "priority": t["priority"]} for t in normalized if t["index"] not in search.placement]
+    return {"placed": placed, "unplaced": unplaced, "score": round(search.objective(), 2)}
+
+
+def format_proposal(result: dict) -> str:
+    """オラクルなどのプロンプトに埋め込む、配置案の短い文字列"""
+    wdays = ['月', '火', '水', '木', '金', '土', '日']
+    lines = []
+    for p in result["placed"]:
+        start, end = datetime.fromisoformat(p["start"]), datetime.fromisoformat(p["end"])
+        lines.append(f"- {start.month}/{start.day}({wdays[start.weekday()]}) {start:%H:%M}-{end:%H:%M} {p['title']}")
+    for u in result["unplaced"]:
+        lines.append(f"- （入りきらず）{u['title']} {u['duration_minutes']}分")
+    return "\n".join(lines) if lines else "（配置するタスクはありません）"
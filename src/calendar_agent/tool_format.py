@@ -0,0 +1,205 @@
+# src/calendar_agent/tool_format.py
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import config
+from src.calendar_agent import free_busy
+from src.core import metrics, prompt_profile
+
+# ツールの結果（JSON文字列）を、LLMのプロンプトに埋め込むためのコンパクトな形式に変換する。
+# ツール自体は従来どおりJSONを返し（find_free_slots・Plan実行の"$s1.events.0.id"の参照・先読みなどはそのまま使う）、
+# プロンプトに入れる直前（ReActループ・Plan実行の合成・単純な一覧の報告）でだけfor_prompt()で変換する。
+# - 予定の一覧は日付ごとの表にし、時刻はHH:MMで書く（キー名・日付・タイムゾーンを予定ごとに繰り返さない）
+# - 予定IDは短いID（"x"＋16進数）に置き換え、IDを受け取るツールがresolve_id()で元のIDに戻す。
+#   GoogleのイベントIDはbase32hex（0-9, a-v）なので、"x"を含む短いIDと取り違えることはない
+# - 件数が多すぎる一覧は先頭だけを載せ、残りは件数と期間にまとめる
+
+WDAYS = ['月', '火', '水', '木', '金', '土', '日']
+ALIAS_PREFIX = "x"
+ALIAS_MIN_LENGTH = 5
+# 値が予定IDであるキー（一覧以外の結果で短いIDに置き換える）
+ID_KEYS = ("id", "eventId", "recurringEventId")
+# JSTの秒以下を省いた日時（"2025-01-01T10:00:00+09:00" → "2025-01-01T10:00"。ツールの引数にもそのまま使える）
+_JST_SECONDS = re.compile(r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}):00(?:\.0+)?\+09:00$")
+_NO_DAY = object()
+
+
+class IdAliases:
+    """予定ID⇔短いIDの対応表（プロセス内で共有し、古いものから捨てる）"""
+
+    def __init__(self, capacity: int = 5000):
+        self.capacity = capacity
+        self._by_alias = OrderedDict()   # 短いID -> 予定ID
+        self._by_id = {}                 # 予定ID -> 短いID
+        self._lock = threading.Lock()
+
+    def alias(self, event_id: str) -> str:
+        with self._lock:
+            alias = self._by_id.get(event_id)
+            if alias is None:
+                # 同じ予定には毎回同じ短いIDを付ける（プロンプトが揺れず、LLM応答キャッシュが効くように）。
+                # ハッシュの先頭が他の予定と重なったら長くする
+                digest = hashlib.sha1(event_id.encode("utf-8")).hexdigest()
+                length = ALIAS_MIN_LENGTH
+                alias = ALIAS_PREFIX + digest[:length]
+                while self._by_alias.get(alias, event_id) != event_id:
+                    length += 1
+                    alias = ALIAS_PREFIX + digest[:length]
+                self._by_id[event_id] = alias
+            self._by_alias[alias] = event_id
+            self._by_alias.move_to_end(alias)
+            while len(self._by_alias) > self.capacity:
+                _, old_id = self._by_alias.popitem(last=False)
+                self._by_id.pop(old_id, None)
+            return alias
+
+    def resolve(self, value):
+        """短いIDなら元の予定IDを返す。それ以外（元のIDなど）はそのまま返す"""
+        if not isinstance(value, str):
+            return value
+        with self._lock:
+            return self._by_alias.get(value.strip(), value)
+
+    def __len__(self):
+        return len(self._by_alias)
+
+
+# プロセス全体で共有する対応表
+aliases = IdAliases(capacity=config.TOOL_OUTPUT_ALIAS_CAPACITY)
+
+
+def resolve_id(value):
+    return aliases.resolve(value)
+
+
+def for_prompt(tool_name: str, result: str) -> str:
+    """
+    ツールの結果を、プロンプトに埋め込む形式にする。JSONでない結果（エラー文など）はそのまま返す。
+    変換前後のトークン数の見積もりを、ツールごとにtool_output_tokens_raw / tool_output_tokens_compactとして記録する。
+    """
+    if not config.TOOL_OUTPUT_COMPACT or not isinstance(result, str):
+        return result
+    try:
+        data = json.loads(result)
+    except ValueError:
+        return result
+    if not isinstance(data, dict):
+        return result
+    if tool_name == "list_calendar_events" and "events" in data:
+        compact = format_events(data["events"], data.get("message"))
+    elif tool_name == "find_free_slots" and "slots" in data:
+        compact = format_free_slots(data)
+    else:
+        compact = json.dumps(_compact_values(data), ensure_ascii=False, separators=(",", ":"))
+    metrics.incr("tool_output_tokens_raw", prompt_profile.estimate_tokens(result), tool=tool_name)
+    metrics.incr("tool_output_tokens_compact", prompt_profile.estimate_tokens(compact), tool=tool_name)
+    return compact
+
+
+def _compact_values(value, key: str = None):
+    """JSONの値のうち、予定IDを短いIDに、JSTの日時を秒なしの形に置き換える"""
+    if isinstance(value, dict):
+        return {k: _compact_values(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_compact_values(v, key) for v in value]
+    if isinstance(value, str):
+        if key in ID_KEYS and value:
+            return aliases.alias(value)
+        match = _JST_SECONDS.match(value)
+        if match:
+            return match.group(1)
+    return value
+
+
+def _parse(value: str) -> tuple:
+    """予定の開始/終了文字列を (JSTのdatetime, 終日かどうか) に変換する"""
+    if len(value) == 10:
+        return free_busy.JST.localize(datetime.fromisoformat(value)), True
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = free_busy.JST.localize(dt)
+    return dt.astimezone(free_busy.JST), False
+
+
+def _day_label(day) -> str:
+    return f"{day.isoformat()}({WDAYS[day.weekday()]})"
+
+
+def _time_range(start: datetime, end: datetime, is_all_day: bool) -> str:
+    if is_all_day:
+        last_day = (end - timedelta(days=1)).date()
+        return "終日" if last_day <= start.date() else f"終日〜{last_day.month}/{last_day.day}"
+    if end.date() == start.date():
+        return f"{start:%H:%M}-{end:%H:%M}"
+    if end == free_busy.JST.localize(datetime.combine(start.date() + timedelta(days=1), datetime.min.time())):
+        return f"{start:%H:%M}-24:00"
+    return f"{start:%H:%M}-{end.month}/{end.day} {end:%H:%M}"
+
+
+def format_events(events: list, message: str = None, max_events: int = None) -> str:
+    """
+    予定の一覧（list_calendar_eventsのevents）を、日付ごとの表にする。
+
+        予定 3件（時刻はJST。[ ]内は予定ID）
+        2025-01-06(月)
+          10:00-11:00 定例ミーティング [x3fa91]
+          終日 祝日 [x0c2d4]
+    """
+    if not events:
+        return message or "指定された期間に予定はありませんでした。"
+    max_events = max_events or config.TOOL_OUTPUT_MAX_EVENTS
+    rows = []
+    for event in events:
+        try:
+            start, is_all_day = _parse(event["start"])
+            end, _ = _parse(event["end"])
+            when = _time_range(start, end, is_all_day)
+        except (KeyError, ValueError):
+            # 日時を解釈できない予定は、元の文字列のまま載せる
+            start, when = None, f"{event.get('start')}〜{event.get('end')}"
+        rows.append((start, when, event))
+    # 日時を解釈できなかった予定は末尾に回す
+    rows.sort(key=lambda row: (row[0] is None, row[0] or datetime.min.replace(tzinfo=free_busy.JST)))
+
+    shown, omitted = rows[:max_events], rows[max_events:]
+    lines = [f"予定 {len(rows)}件（時刻はJST。[ ]内は予定ID）"]
+    current_day = _NO_DAY
+    for start, when, event in shown:
+        day = start.date() if start else None
+        if day != current_day:
+            lines.append(_day_label(day) if day else "日時不明")
+            current_day = day
+        event_id = f" [{aliases.alias(event['id'])}]" if event.get("id") else ""
+        lines.append(f"  {when} {event.get('summary', '（タイトルなし）')}{event_id}")
+    if omitted:
+        days = sorted({start.date() for start, _, _ in omitted if start})
+        span = f"{days[0].month}/{days[0].day}〜{days[-1].month}/{days[-1].day}の" if days else ""
+        lines.append(f"…ほか{span}{len(omitted)}件は省略しました。必要なら期間を絞って list_calendar_events を呼んでください。")
+    return "\n".join(lines)
+
+
+def _format_ranges(ranges: list) -> str:
+    """{"start", "end"}のリストを「日付 HH:MM-HH:MM, HH:MM-HH:MM」の形で日ごとにまとめる"""
+    by_day = OrderedDict()
+    for item in ranges:
+        start, _ = _parse(item["start"])
+        end, _ = _parse(item["end"])
+        by_day.setdefault(start.date(), []).append(_time_range(start, end, False))
+    return " / ".join(f"{_day_label(day)} {', '.join(times)}" for day, times in by_day.items())
+
+
+def format_free_slots(data: dict) -> str:
+    """find_free_slotsの結果を、日ごとの時間帯の列挙にする"""
+    if not data.get("slots"):
+        return data.get("message") or "空き時間はありませんでした。"
+    try:
+        lines = [f"候補: {_format_ranges(data['slots'])}"]
+        if data.get("free_windows"):
+            lines.append(f"空き時間: {_format_ranges(data['free_windows'])}")
+    except (KeyError, ValueError):
+        return json.dumps(_compact_values(data), ensure_ascii=False, separators=(",", ":"))
+    return "\n".join(lines)
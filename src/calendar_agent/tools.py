@@ -2,6 +2,7 @@
 
 import os
 import json
+import threading
 from datetime import datetime, timedelta, timezone
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -10,13 +11,29 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import config
 import pytz # JSTの定義にpytzを使うのがより堅牢です
+from src.core import resilience, cassette
+from src.calendar_agent import free_busy, conflicts, event_search, event_cache, mutation_journal, read_coalescer, schedule_optimizer, async_calendar, tool_format, recurrence as recurrence_rules
 
 # --- タイムゾーンの定義 (pytz推奨) ---
 JST = pytz.timezone('Asia/Tokyo')
 
-def get_calendar_service():
-    """Google Calendar APIのサービス（操作の本体）を取得する関数"""
-    # ... (この部分は変更なし) ...
+# --- カレンダー状態のバージョン ---
+# このプロセスからカレンダーを変更するたびに加算する。LLM応答キャッシュなどのキーに含め、
+# 変更前の状態に基づく結果が再利用されないようにする。
+_calendar_version = 0
+_calendar_version_lock = threading.Lock()
+
+def calendar_version() -> int:
+    return _calendar_version
+
+def _bump_calendar_version():
+    global _calendar_version
+    with _calendar_version_lock:
+        _calendar_version += 1
+    read_coalescer.reads.invalidate()
+
+def get_credentials():
+    """Google Calendar APIの認証情報を取得する（期限切れなら更新し、トークンファイルに保存する）"""
     creds = None
     if os.path.exists(config.GOOGLE_TOKEN_FILE):
         creds = Credentials.from_authorized_user_file(config.GOOGLE_TOKEN_FILE, config.GOOGLE_SCOPES)
@@ -28,17 +45,84 @@ def get_calendar_service():
             creds = flow.run_local_server(port=0)
         with open(config.GOOGLE_TOKEN_FILE, "w") as token:
             token.write(creds.to_json())
-    return build("calendar", "v3", credentials=creds)
+    return creds
+
+def get_calendar_service():
+    """Google Calendar APIのサービス（操作の本体）を取得する関数"""
+    # 記録・再生（cassette）が有効なら、そのHTTP層を通す（再生時は認証情報を読み込まない）
+    http = cassette.calendar_http(get_credentials)
+    if http is not None:
+        return build("calendar", "v3", http=http)
+    return build("calendar", "v3", credentials=get_credentials())
 
 # ▼▼▼ 以下、AIが呼び出すツール群 ▼▼▼
 
-def add_calendar_event(summary: str, start_time: str, end_time: str, is_all_day: bool = False, description: str = None, location: str = None) -> str:
+def _proposal_range(start_time: str, end_time: str) -> tuple:
+    """予定の候補時間を分単位の区間に変換する"""
+    start = datetime.fromisoformat(_parse_datetime_str(start_time, is_end_time=False))
+    end = datetime.fromisoformat(_parse_datetime_str(end_time, is_end_time=True))
+    return free_busy.to_minute(start), free_busy.to_minute(end)
+
+def check_conflicts(proposals: list, exclude_id: str = None) -> list:
+    """
+    追加・変更しようとしている予定が、既存の予定や候補同士と重ならないかをまとめて調べる。
+    重なり索引が対象期間をカバーしていなければ、その期間を1回だけ取得して索引を更新する。
+
+    Args:
+        proposals (list): {"start_time", "end_time", "is_all_day"} を持つ辞書のリスト。
+        exclude_id (str, optional): 照合から除く予定のID（編集対象の予定自身など）。
+
+    Returns:
+        list: 候補ごとの重なりのリスト（終日の候補は常に空）。
+    """
+    timed = [(i, _proposal_range(p["start_time"], p["end_time"])) for i, p in enumerate(proposals) if not p.get("is_all_day")]
+    results = [[] for _ in proposals]
+    if not timed:
+        return results
+    # 候補のかかる日をまとめて1回で取得する（日単位で取得範囲をそろえる）
+    first_day = free_busy.from_minute(min(r[0] for _, r in timed)).date().isoformat()
+    last_day = free_busy.from_minute(max(r[1] for _, r in timed) - 1).date().isoformat()
+    range_start = free_busy.to_minute(datetime.fromisoformat(_parse_datetime_str(first_day, is_end_time=False)))
+    range_end = free_busy.to_minute(datetime.fromisoformat(_parse_datetime_str(last_day, is_end_time=True)))
+    if not conflicts.index.covers(range_start, range_end):
+        list_calendar_events(first_day, last_day)
+    found = conflicts.index.find_conflicts_batch([r for _, r in timed], exclude_id=exclude_id)
+    for (i, _), items in zip(timed, found):
+        # 候補同士の重なりは、proposalsでの位置に付け替える
+        results[i] = [dict(c, proposal_index=timed[c["proposal_index"]][0]) if "proposal_index" in c else c for c in items]
+    return results
+
+def _conflict_message(summary: str, found: list) -> str:
+    names = [f"『{c['summary']}』({c['start'][11:16]}-{c['end'][11:16]})" for c in found if "summary" in c]
+    names += [f"同時に追加する{c['proposal_index'] + 1}件目の予定" for c in found if "proposal_index" in c]
+    return f"予定『{summary}』は {', '.join(names)} と時間が重なっています。"
+
+def _recurrence_lines(recurrence) -> list:
+    """'FREQ=WEEKLY;BYDAY=MO' や ['RRULE:...', 'EXDATE:...'] を、APIに渡すrecurrenceの形にそろえる"""
+    lines = [recurrence] if isinstance(recurrence, str) else list(recurrence)
+    return [l if l.upper().startswith(("RRULE:", "EXDATE", "RDATE")) else f"RRULE:{l}" for l in lines if l]
+
+def _occurrence_proposals(start_time: str, end_time: str, recurrence: list) -> list:
+    """繰り返し予定の、直近の各回を重なりチェック用の候補にする"""
+    start = datetime.fromisoformat(_parse_datetime_str(start_time, is_end_time=False))
+    end = datetime.fromisoformat(_parse_datetime_str(end_time, is_end_time=True))
+    master = {
+        "recurrence": recurrence,
+        "start": {"dateTime": start.isoformat(), "timeZone": "Asia/Tokyo"},
+        "end": {"dateTime": end.isoformat(), "timeZone": "Asia/Tokyo"},
+    }
+    occurrences = recurrence_rules.expand(master, start, start + timedelta(days=config.RECURRENCE_CONFLICT_CHECK_DAYS))
+    return [{"start_time": s.isoformat(), "end_time": e.isoformat()} for s, e in occurrences]
+
+def add_calendar_event(summary: str, start_time: str, end_time: str, is_all_day: bool = False, description: str = None, location: str = None, allow_overlap: bool = False, recurrence=None) -> str:
     """
     新しいカレンダーイベントを作成します。時間はJSTとして扱います。
+    既存の予定と重なる場合は追加せず、status "conflict" と重なる予定の一覧を返します。
+    allow_overlap=Trueなら重なりを承知で追加します（結果には重なりの一覧を含めます）。
+    recurrenceにRRULE（例: "FREQ=WEEKLY;BYDAY=MO"）を指定すると繰り返し予定になり、直近の各回の重なりも確認します。
     """
-    # ... (この関数は変更なし) ...
     print(f"🛠️ ツール実行: add_calendar_event (タイトル: {summary})")
-    service = get_calendar_service()
+    recurrence = _recurrence_lines(recurrence) if recurrence else None
     event = {
         'summary': summary,
     }
@@ -46,20 +130,64 @@ def add_calendar_event(summary: str, start_time: str, end_time: str, is_all_day:
         event['start'] = {'date': start_time[:10]}
         event['end'] = {'date': end_time[:10]}
     else:
-        event['start'] = {'dateTime': start_time, 'timeZone': 'Asia/Tokyo'}
-        event['end'] = {'dateTime': end_time, 'timeZone': 'Asia/Tokyo'}
+        event['start'] = {'dateTime': _parse_datetime_str(start_time, is_end_time=False), 'timeZone': 'Asia/Tokyo'}
+        event['end'] = {'dateTime': _parse_datetime_str(end_time, is_end_time=True), 'timeZone': 'Asia/Tokyo'}
     if description:
         event['description'] = description
     if location:
         event['location'] = location
-    
-    try:
-        created_event = service.events().insert(calendarId='primary', body=event).execute()
+    if recurrence:
+        event['recurrence'] = recurrence
+    # IDを内容から決めておくと、同じ追加を送り直しても二重に登録されない
+    event_id = mutation_journal.event_id_for(event)
+    existing = event_cache.cache.get(event_id)
+    if existing is not None and existing.get('status') != 'cancelled':
         return json.dumps({
+            'status': 'success',
+            'message': f"予定『{summary}』は既に追加されています。",
+            'eventId': event_id
+        }, ensure_ascii=False)
+
+    found = []
+    if not is_all_day:
+        proposals = [{"start_time": start_time, "end_time": end_time}]
+        if recurrence:
+            try:
+                proposals = _occurrence_proposals(start_time, end_time, recurrence) or proposals
+            except (recurrence_rules.UnsupportedRule, ValueError) as e:
+                print(f"[TOOL WARNING] 繰り返しルールを展開できないため、初回のみ重なりを確認します: {e}")
+        # 繰り返しの各回は互いに重ならないので、既存の予定との重なりだけを見る
+        found = [c for items in check_conflicts(proposals) for c in items if "proposal_index" not in c]
+    if found and not allow_overlap:
+        return json.dumps({
+            'status': 'conflict',
+            'message': _conflict_message(summary, found) + "時間を変えるか、重なりを承知で追加する場合は allow_overlap=true を指定してください。",
+            'conflicts': found
+        }, ensure_ascii=False)
+
+    try:
+        if config.WRITE_BEHIND_ENABLED and not recurrence:
+            # ローカルの状態にだけ反映して応答し、カレンダーへはバックグラウンドでまとめて送る
+            mutation_journal.journal.submit('insert', event_id, event)
+            created_event = dict(event, id=event_id)
+        else:
+            created_event = mutation_journal.journal.apply_now('insert', event_id, event)
+        _bump_calendar_version()
+        event_cache.cache.put(created_event)
+        if not recurrence:
+            _index_event(created_event)
+        else:
+            # 各回のIDは展開するまで分からないので、次回の取得で索引を作り直してもらう
+            conflicts.index.clear()
+        result = {
             'status': 'success',
             'message': f"予定『{summary}』を追加しました。",
             'eventId': created_event.get('id')
-        })
+        }
+        if found:
+            result['message'] += _conflict_message(summary, found)
+            result['conflicts'] = found
+        return json.dumps(result, ensure_ascii=False)
     except Exception as e:
         return json.dumps({
             'status': 'error',
@@ -109,24 +237,64 @@ def list_calendar_events(start_time: str, end_time: str) -> str:
     start_time_parsed = _parse_datetime_str(start_time, is_end_time=False)
     end_time_parsed = _parse_datetime_str(end_time, is_end_time=True)
     print(f"🛠️ ツール実行: list_calendar_events (期間: {start_time_parsed} - {end_time_parsed})")
-    service = get_calendar_service()
-    events_result = service.events().list(
-        calendarId="primary",
-        timeMin=start_time_parsed,
-        timeMax=end_time_parsed,
-        singleEvents=True,
-        orderBy="startTime"
-    ).execute()
-    events = events_result.get("items", [])
-    if not events:
-        return json.dumps({"events": [], "message": "指定された期間に予定はありませんでした。"})
-    
+    def fetch():
+        service = get_calendar_service()
+        if config.LOCAL_RECURRENCE_EXPANSION:
+            # 繰り返し予定は親予定だけを受け取り、期間内の回をローカルで展開する
+            return recurrence_rules.fetch_events(service, start_time_parsed, end_time_parsed)
+        events_result = resilience.calendar_api.call(service.events().list(
+            calendarId="primary",
+            timeMin=start_time_parsed,
+            timeMax=end_time_parsed,
+            singleEvents=True,
+            orderBy="startTime"
+        ).execute)
+        return events_result.get("items", [])
+    # 同じ期間の同時の取得は1回の問い合わせにまとめる
+    events = read_coalescer.reads.get(_read_key(start_time_parsed, end_time_parsed), fetch)
+    return _finish_listing(events, start_time_parsed, end_time_parsed)
+
+async def alist_calendar_events(start_time: str, end_time: str) -> str:
+    """
+    list_calendar_eventsのasyncio版（asgi.pyのサーバーが使う）。結果の形式は同じ。
+    """
+    start_time_parsed = _parse_datetime_str(start_time, is_end_time=False)
+    end_time_parsed = _parse_datetime_str(end_time, is_end_time=True)
+    print(f"🛠️ ツール実行: list_calendar_events[async] (期間: {start_time_parsed} - {end_time_parsed})")
+    async def fetch():
+        client = async_calendar.client
+        if config.LOCAL_RECURRENCE_EXPANSION:
+            return await recurrence_rules.afetch_events(client, start_time_parsed, end_time_parsed)
+        return await client.list_events(start_time_parsed, end_time_parsed, singleEvents=True, orderBy="startTime")
+    events = await read_coalescer.reads.aget(_read_key(start_time_parsed, end_time_parsed), fetch)
+    return _finish_listing(events, start_time_parsed, end_time_parsed)
+
+def _read_key(start_time_parsed: str, end_time_parsed: str) -> tuple:
+    mode = "local_recurrence" if config.LOCAL_RECURRENCE_EXPANSION else "single_events"
+    return ("primary", start_time_parsed, end_time_parsed, mode)
+
+def _finish_listing(events: list, start_time_parsed: str, end_time_parsed: str) -> str:
+    """取得した予定に未送信の書き込みを重ね、キャッシュ・索引を更新して、ツールの結果（JSON文字列）にする"""
+    # まだカレンダーに送っていない書き込みを重ねる
+    events = mutation_journal.journal.overlay(events, start_time_parsed, end_time_parsed)
     simplified_events = [{
         "id": event["id"],
         "summary": event.get("summary", "（タイトルなし）"),
         "start": event["start"].get("dateTime", event["start"].get("date")),
         "end": event["end"].get("dateTime", event["end"].get("date")),
     } for event in events]
+    # IDでの参照（get/edit/delete）に備えて、取得したリソースをそのままキャッシュしておく
+    event_cache.cache.put_many(events)
+    # 取得結果で重なり索引・検索索引を更新しておく（追加時の重なりチェックや予定の検索で再取得しなくて済むように）
+    range_start = free_busy.to_minute(datetime.fromisoformat(start_time_parsed))
+    range_end = free_busy.to_minute(datetime.fromisoformat(end_time_parsed))
+    conflicts.index.load_range(range_start, range_end, simplified_events)
+    event_search.index.load_range(range_start, range_end, [
+        dict(simplified, description=event.get("description"), location=event.get("location"))
+        for simplified, event in zip(simplified_events, events)
+    ])
+    if not simplified_events:
+        return json.dumps({"events": [], "message": "指定された期間に予定はありませんでした。"})
     return json.dumps({"events": simplified_events})
 
 def delete_calendar_event(event_id: str) -> str:
@@ -134,20 +302,248 @@ def delete_calendar_event(event_id: str) -> str:
     指定されたIDのカレンダーイベントを削除します。
     """
     # ... (この関数は変更なし) ...
+    # プロンプトで見せた短いIDなら、元の予定IDに戻す
+    event_id = tool_format.resolve_id(event_id)
     print(f"🛠️ ツール実行: delete_calendar_event (ID: {event_id})")
-    service = get_calendar_service()
     try:
-        service.events().delete(calendarId='primary', eventId=event_id).execute()
+        if config.WRITE_BEHIND_ENABLED and event_cache.cache.get(event_id) is not None:
+            mutation_journal.journal.submit('delete', event_id)
+        else:
+            # ローカルに情報のない予定は、存在を確かめるためにその場で削除する
+            mutation_journal.journal.apply_now('delete', event_id)
+        _bump_calendar_version()
+        conflicts.index.remove(event_id)
+        event_search.index.remove(event_id)
+        event_cache.cache.remove(event_id)
         return json.dumps({
             "status": "success",
             "message": f"予定（ID: {event_id}）を削除しました。"
         })
-    except HttpError as error:
+    except (HttpError, resilience.UpstreamUnavailable) as error:
         return json.dumps({
             "status": "error",
             "message": f"予定の削除中にエラーが発生しました: {error}"
         })
 
+def _event_bound(event: dict, key: str) -> str:
+    return event[key].get("dateTime", event[key].get("date"))
+
+def _event_details(event: dict) -> dict:
+    details = {
+        "id": event["id"],
+        "summary": event.get("summary", "（タイトルなし）"),
+        "start": _event_bound(event, "start"),
+        "end": _event_bound(event, "end"),
+        "is_all_day": "date" in event["start"],
+    }
+    for key in ("description", "location", "recurrence", "recurringEventId"):
+        if event.get(key):
+            details[key] = event[key]
+    return details
+
+def _index_event(event: dict):
+    """追加・変更した予定を重なり索引・検索索引に反映する（繰り返し予定以外）"""
+    details = _event_details(event)
+    if details['is_all_day']:
+        conflicts.index.remove(details['id'])
+    else:
+        conflicts.index.add(details['id'], details['summary'], *_proposal_range(details['start'], details['end']))
+    event_search.index.add(details)
+
+def _lookup_event(event_id: str):
+    """予定のリソースをキャッシュから返す。なければ1回だけ取得してキャッシュする（見つからなければNone）"""
+    event = event_cache.cache.get(event_id)
+    if event is not None:
+        return event
+    service = get_calendar_service()
+    try:
+        event = resilience.calendar_api.call(service.events().get(calendarId='primary', eventId=event_id).execute)
+    except (HttpError, resilience.UpstreamUnavailable) as error:
+        print(f"[TOOL WARNING] 予定（ID: {event_id}）を取得できませんでした: {error}")
+        return None
+    event_cache.cache.put(event)
+    return event
+
+def get_calendar_event(event_id: str) -> str:
+    """
+    指定されたIDの予定の詳細（タイトル・日時・説明・場所）を取得します。
+    一覧で取得済みの予定はキャッシュから返し、カレンダーには問い合わせません。
+    """
+    event_id = tool_format.resolve_id(event_id)
+    print(f"🛠️ ツール実行: get_calendar_event (ID: {event_id})")
+    event = _lookup_event(event_id)
+    if event is None or event.get("status") == "cancelled":
+        return json.dumps({
+            "status": "error",
+            "message": f"予定（ID: {event_id}）が見つかりませんでした。"
+        }, ensure_ascii=False)
+    return json.dumps({"status": "success", "event": _event_details(event)}, ensure_ascii=False)
+
+def _shift_time(value: str, delta: timedelta) -> str:
+    """日時（または日付のみ）の文字列をdeltaだけずらす。日付のみならその形のまま返す"""
+    shifted = datetime.fromisoformat(_parse_datetime_str(value, is_end_time=False)) + delta
+    return shifted.date().isoformat() if len(value.strip()) == 10 else shifted.isoformat()
+
+def edit_calendar_event(event_id: str, new_summary: str = None, new_start_time: str = None, new_end_time: str = None,
+                        new_description: str = None, new_location: str = None, allow_overlap: bool = False) -> str:
+    """
+    指定されたIDの予定を変更します。変更する項目だけを送ります（指定しなかった項目はそのまま）。
+    開始・終了の片方だけを指定した場合は、元の所要時間を保ってもう片方をずらします。
+    変更後の時間が他の予定と重なる場合は変更せず、status "conflict" を返します（allow_overlap=Trueなら確認せずに変更）。
+    """
+    event_id = tool_format.resolve_id(event_id)
+    print(f"🛠️ ツール実行: edit_calendar_event (ID: {event_id})")
+    patch = {}
+    if new_summary:
+        patch['summary'] = new_summary
+    if new_description is not None:
+        patch['description'] = new_description
+    if new_location is not None:
+        patch['location'] = new_location
+    if new_start_time or new_end_time:
+        if not (new_start_time and new_end_time):
+            current = _lookup_event(event_id)
+            if current is None:
+                return json.dumps({
+                    'status': 'error',
+                    'message': f"予定（ID: {event_id}）が見つからないため、変更できませんでした。"
+                }, ensure_ascii=False)
+            duration = (
+                datetime.fromisoformat(_parse_datetime_str(_event_bound(current, 'end'), is_end_time=False))
+                - datetime.fromisoformat(_parse_datetime_str(_event_bound(current, 'start'), is_end_time=False))
+            )
+            if new_start_time:
+                new_end_time = _shift_time(new_start_time, duration)
+            else:
+                new_start_time = _shift_time(new_end_time, -duration)
+        if len(new_start_time.strip()) == 10 and len(new_end_time.strip()) == 10:
+            patch['start'] = {'date': new_start_time.strip()}
+            patch['end'] = {'date': new_end_time.strip()}
+        else:
+            patch['start'] = {'dateTime': _parse_datetime_str(new_start_time, is_end_time=False), 'timeZone': 'Asia/Tokyo'}
+            patch['end'] = {'dateTime': _parse_datetime_str(new_end_time, is_end_time=True), 'timeZone': 'Asia/Tokyo'}
+            if not allow_overlap:
+                found = check_conflicts([{'start_time': new_start_time, 'end_time': new_end_time}], exclude_id=event_id)[0]
+                if found:
+                    return json.dumps({
+                        'status': 'conflict',
+                        'message': _conflict_message(new_summary or (event_cache.cache.get(event_id) or {}).get('summary', event_id), found) + "時間を変えるか、重なりを承知で変更する場合は allow_overlap=true を指定してください。",
+                        'conflicts': found
+                    }, ensure_ascii=False)
+    if not patch:
+        return json.dumps({
+            'status': 'error',
+            'message': "変更する項目が指定されていません。"
+        }, ensure_ascii=False)
+    current = event_cache.cache.get(event_id)
+    try:
+        if config.WRITE_BEHIND_ENABLED and current is not None and not current.get('recurrence'):
+            mutation_journal.journal.submit('patch', event_id, patch)
+            updated = {**current, **patch}
+        else:
+            updated = mutation_journal.journal.apply_now('patch', event_id, patch)
+    except (HttpError, resilience.UpstreamUnavailable) as error:
+        return json.dumps({
+            'status': 'error',
+            'message': f"予定の変更中にエラーが発生しました: {error}"
+        }, ensure_ascii=False)
+    _bump_calendar_version()
+    event_cache.cache.put(updated)
+    details = _event_details(updated)
+    if updated.get('recurrence'):
+        # 繰り返しの各回がまとめて動くので、次回の取得で索引を作り直してもらう
+        conflicts.index.clear()
+        event_search.index.remove(event_id)
+    else:
+        _index_event(updated)
+    return json.dumps({
+        'status': 'success',
+        'message': f"予定『{details['summary']}』を変更しました。",
+        'event': details
+    }, ensure_ascii=False)
+
+def add_calendar_events(events: list, allow_overlap: bool = False) -> str:
+    """
+    複数の予定をまとめて追加します。追加前に、全候補について既存の予定および候補同士の重なりを一括で調べ、
+    重なりがあれば1件も追加せずに status "conflict" と候補ごとの重なりを返します。
+
+    Args:
+        events (list): add_calendar_eventと同じキー（summary, start_time, end_time, is_all_day, description, location）を持つ辞書のリスト。
+        allow_overlap (bool): Trueなら重なりを承知で全件追加する。
+    """
+    print(f"🛠️ ツール実行: add_calendar_events ({len(events)}件)")
+    found = check_conflicts(events)
+    if any(found) and not allow_overlap:
+        return json.dumps({
+            'status': 'conflict',
+            'message': " ".join(_conflict_message(e.get('summary', ''), f) for e, f in zip(events, found) if f) + "予定は追加していません。",
+            'conflicts': [{'index': i, 'summary': e.get('summary', ''), 'conflicts': f} for i, (e, f) in enumerate(zip(events, found)) if f]
+        }, ensure_ascii=False)
+    results = []
+    for e in events:
+        # 重なりは確認済みなので、個々の追加では重ねて止めない
+        results.append(json.loads(add_calendar_event(
+            e.get('summary'), e.get('start_time'), e.get('end_time'),
+            is_all_day=e.get('is_all_day', False), description=e.get('description'), location=e.get('location'),
+            allow_overlap=True, recurrence=e.get('recurrence'),
+        )))
+    failed = [r for r in results if r.get('status') != 'success']
+    return json.dumps({
+        'status': 'error' if failed else 'success',
+        'message': f"{len(results) - len(failed)}件の予定を追加しました。" + (f"{len(failed)}件は失敗しました。" if failed else ""),
+        'results': results
+    }, ensure_ascii=False)
+
+def find_free_slots(start_time: str, end_time: str, duration_minutes: int = 60, k: int = 5,
+                    work_start: str = "09:00", work_end: str = "18:00", buffer_minutes: int = 0) -> str:
+    """
+    指定期間の空き時間を計算し、指定時間の予定を入れられる候補をk件返します。
+    作業時間帯（work_start〜work_end）の外と、既存予定の前後buffer_minutes分は候補から除きます。
+    """
+    start_time_parsed = _parse_datetime_str(start_time, is_end_time=False)
+    end_time_parsed = _parse_datetime_str(end_time, is_end_time=True)
+    print(f"🛠️ ツール実行: find_free_slots (期間: {start_time_parsed} - {end_time_parsed}, {duration_minutes}分)")
+    events = json.loads(list_calendar_events(start_time_parsed, end_time_parsed)).get("events", [])
+    busy = free_busy.merge_intervals(free_busy.events_to_intervals(events), buffer_minutes=int(buffer_minutes))
+    windows = free_busy.free_windows(
+        busy,
+        datetime.fromisoformat(start_time_parsed),
+        datetime.fromisoformat(end_time_parsed),
+        work_start=work_start,
+        work_end=work_end,
+        min_minutes=int(duration_minutes),
+    )
+    slots = free_busy.k_best_slots(windows, int(duration_minutes), k=int(k))
+    if not slots:
+        return json.dumps({"slots": [], "message": f"指定された期間に{duration_minutes}分の空き時間はありませんでした。"}, ensure_ascii=False)
+    return json.dumps({
+        "slots": [{"start": free_busy.from_minute(s).isoformat(), "end": free_busy.from_minute(e).isoformat()} for s, e in slots],
+        "free_windows": [{"start": free_busy.from_minute(s).isoformat(), "end": free_busy.from_minute(e).isoformat()} for s, e in windows[:20]],
+    }, ensure_ascii=False)
+
+def propose_schedule(tasks: list, start_time: str, end_time: str, work_start: str = "09:00", work_end: str = "18:00",
+                     buffer_minutes: int = 10, preferences: dict = None) -> str:
+    """
+    タスク（所要時間・締切・優先度・希望時間帯）を、指定期間の空き時間に配置する案を作ります。
+    カレンダーは変更しません。返した events をそのまま add_calendar_events に渡すと案を登録できます。
+    """
+    start_time_parsed = _parse_datetime_str(start_time, is_end_time=False)
+    end_time_parsed = _parse_datetime_str(end_time, is_end_time=True)
+    print(f"🛠️ ツール実行: propose_schedule ({len(tasks)}件, 期間: {start_time_parsed} - {end_time_parsed})")
+    events = json.loads(list_calendar_events(start_time_parsed, end_time_parsed)).get("events", [])
+    busy = free_busy.merge_intervals(free_busy.events_to_intervals(events), buffer_minutes=int(buffer_minutes))
+    result = schedule_optimizer.optimize_schedule(
+        tasks,
+        busy,
+        datetime.fromisoformat(start_time_parsed),
+        datetime.fromisoformat(end_time_parsed),
+        work_start=work_start,
+        work_end=work_end,
+        preferences=preferences,
+    )
+    result["events"] = [{"summary": p["title"], "start_time": p["start"], "end_time": p["end"]} for p in result["placed"]]
+    return json.dumps(result, ensure_ascii=False)
+
 # ★★★★★ ここからが追記部分 ★★★★★
 
 def get_current_datetime() -> str:
@@ -164,4 +560,63 @@ def get_current_datetime() -> str:
     return json.dumps({
         "current_datetime": current_time_str,
         "message": f"現在の正確な日時は {current_time_str} です。"
-    })
\ No newline at end of file
+    })
+
+# ▼▼▼ 書き込みジャーナルの送信結果をローカルの状態に反映する ▼▼▼
+
+def _on_mutation_applied(op: str, event_id: str, resource: dict):
+    # カレンダー側の状態が進んだので、送信前の一覧（ジャーナルを重ねて見せていたもの）は使わない
+    read_coalescer.reads.invalidate()
+    if op == 'insert' and resource.get('id') and resource['id'] != event_id:
+        # 削除済みの予定とIDが重なり、別のIDで追加された
+        _on_mutation_failed(op, event_id, None)
+        event_cache.cache.put(resource)
+        if not resource.get('recurrence'):
+            _index_event(resource)
+    elif op != 'delete' and resource:
+        event_cache.cache.put(resource)
+
+def _on_mutation_failed(op: str, event_id: str, error):
+    # ローカルにだけ反映していた内容を捨て、次回の取得で作り直してもらう
+    event_cache.cache.remove(event_id)
+    event_search.index.remove(event_id)
+    conflicts.index.clear()
+    _bump_calendar_version()
+
+mutation_journal.journal.configure(lambda: get_calendar_service(), on_applied=_on_mutation_applied, on_failed=_on_mutation_failed)
+async_calendar.client.configure(lambda: get_credentials())
+
+# ▼▼▼ ツール名と関数の対応表（ReActループ・Plan実行の両方から参照する） ▼▼▼
+
+TOOL_REGISTRY = {
+    "list_calendar_events": list_calendar_events,
+    "add_calendar_event": add_calendar_event,
+    "add_calendar_events": add_calendar_events,
+    "delete_calendar_event": delete_calendar_event,
+    "get_calendar_event": get_calendar_event,
+    "edit_calendar_event": edit_calendar_event,
+    "get_current_datetime": get_current_datetime,
+    "find_free_slots": find_free_slots,
+    "propose_schedule": propose_schedule,
+}
+
+# asyncio版の実装があるツール（asyncio版のPlan実行はこちらを優先し、ないものはスレッドで実行する）
+ASYNC_TOOL_REGISTRY = {
+    "list_calendar_events": alist_calendar_events,
+}
+
+# カレンダーの状態を変更するツール（キャッシュや再実行の判断に使う）
+MUTATING_TOOLS = {"add_calendar_event", "add_calendar_events", "edit_calendar_event", "delete_calendar_event"}
+
+# エージェントのプロンプトに埋め込むツール説明
+TOOLS_DESCRIPTION = """
+- `list_calendar_events(start_time: str, end_time: str)`: 指定期間の予定を取得。「YYYY-MM-DDTHH:MM:SS」形式。
+- `add_calendar_event(summary: str, start_time: str, end_time: str, allow_overlap: bool = False, recurrence: str = None)`: 新しい予定を追加。繰り返し予定にする場合は recurrence にRRULEを指定（例: 毎週月曜 "FREQ=WEEKLY;BYDAY=MO"、毎月第2火曜 "FREQ=MONTHLY;BYDAY=2TU"、回数や終了日は ";COUNT=10" や ";UNTIL=20251231T235959Z"）。既存の予定と重なる場合は追加されず、status "conflict" と重なる予定（conflicts）が返るので、時間を変えるか、ユーザーが重なりを了承していれば allow_overlap=true で再実行する。
+- `add_calendar_events(events: list, allow_overlap: bool = False)`: 複数の予定（add_calendar_eventと同じキーの辞書のリスト）をまとめて追加。候補同士の重なりも含めて一括で確認し、重なりがあれば1件も追加せず conflicts を返す。
+- `delete_calendar_event(event_id: str)`: IDで予定を削除。
+- `get_calendar_event(event_id: str)`: IDで予定の詳細（説明・場所を含む）を取得。
+- `edit_calendar_event(event_id: str, new_summary: str = None, new_start_time: str = None, new_end_time: str = None, new_description: str = None, new_location: str = None, allow_overlap: bool = False)`: IDで予定を変更（指定した項目だけ変わる）。開始だけ指定すると所要時間はそのまま。重なる場合は status "conflict" が返る。
+- `get_current_datetime()`: 現在の正確な日時を取得。
+- `find_free_slots(start_time: str, end_time: str, duration_minutes: int = 60, k: int = 5, work_start: str = "09:00", work_end: str = "18:00", buffer_minutes: int = 0)`: 指定期間の空き時間から、指定した長さの予定を入れられる候補をk件取得。空き時間の確認や、新しい予定の時間決めに使う。
+- `propose_schedule(tasks: list, start_time: str, end_time: str, work_start: str = "09:00", work_end: str = "18:00", buffer_minutes: int = 10)`: タスク（{"title", "duration_minutes", "deadline", "priority"(1-5), "preferred"("morning"/"afternoon"/"evening")}のリスト）を空き時間に配置する案を作成（カレンダーは変更しない）。結果の events を add_calendar_events に渡すと登録できる。
+"""
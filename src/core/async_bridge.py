@@ -0,0 +1,60 @@
+# src/core/async_bridge.py
+import asyncio
+
+from src.core import cancellation, metrics
+
+# asyncio版のサーバーから、まだ同期でしか書かれていない処理（ReActループ・一括登録など）を使うための橋渡し。
+# 同期ジェネレータを別スレッドで回し、出力を1件ずつasyncioのキュー経由で受け取る。
+# 受け取る側が途中でやめた（クライアントの切断でタスクが取り消された）場合は、スレッド側も次の区切りで止める。
+
+_DONE = object()
+
+
+async def iterate_in_thread(make_generator):
+    """
+    同期ジェネレータをスレッドで実行し、その出力をasyncioのジェネレータとして返す。
+    呼び出し元のコンテキスト（ユーザー別のレート制限・ターンの指標・取り消し）はasyncio.to_threadが引き継ぐ。
+
+    Args:
+        make_generator (Callable[[], Iterator]): 同期ジェネレータを作る関数（スレッド内で呼ばれる）。
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    # 呼び出し元のトークンが取り消されても、このジェネレータだけをやめても止まるよう、子のトークンを使う
+    token = cancellation.CancelToken(parent=cancellation.current())
+
+    def run():
+        generator = None
+        try:
+            with cancellation.scope(token):
+                generator = make_generator()
+                for item in generator:
+                    if token.cancelled:
+                        metrics.incr("cancelled_work", kind="thread_generator")
+                        raise cancellation.Cancelled(token.reason or (token.parent and token.parent.reason))
+                    loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except (Exception, cancellation.Cancelled) as e:
+            # 取り消しも通常の例外と同じく受け取る側で送出し直す（途中で終わったことを正常終了と区別できるように）
+            loop.call_soon_threadsafe(queue.put_nowait, (_DONE, e))
+            return
+        finally:
+            if generator is not None:
+                # 停止したyieldの位置でGeneratorExitを送り、ジェネレータ側の後始末を走らせる
+                generator.close()
+        loop.call_soon_threadsafe(queue.put_nowait, (_DONE, None))
+
+    worker = asyncio.ensure_future(asyncio.to_thread(run))
+    finished = False
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _DONE:
+                finished = True
+                await worker
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        if not finished:
+            token.cancel("consumer_closed")
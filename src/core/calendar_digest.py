@@ -0,0 +1,142 @@
+# src/core/calendar_digest.py
+import json
+import re
+import threading
+from datetime import datetime, timedelta
+
+from src.calendar_agent import tools, free_busy
+from src.core import metrics
+
+# マルチエージェント議論の「事実」として渡す、今後N日間のカレンダー要約。
+# バックグラウンドで定期的（およびカレンダー変更時）に作り直しておき、
+# 議論の開始時には出来上がった文字列を返すだけにする（追加の待ち時間なし）。
+
+WDAYS = ['月', '火', '水', '木', '金', '土', '日']
+DEADLINE_PATTERN = re.compile(r"締切|〆切|締め切り|期限|提出|納期|deadline|due", re.IGNORECASE)
+MIN_FREE_MINUTES = 30
+TITLE_MAX_LEN = 12
+
+
+def _parse_event_time(value: str) -> tuple:
+    """イベントの開始/終了文字列を (datetime, 終日かどうか) に変換する"""
+    if len(value) == 10:
+        dt = tools.JST.localize(datetime.fromisoformat(value))
+        return dt, True
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        dt = tools.JST.localize(dt)
+    return dt.astimezone(tools.JST), False
+
+
+def _short(title: str) -> str:
+    return title if len(title) <= TITLE_MAX_LEN else title[:TITLE_MAX_LEN] + "…"
+
+
+def build_digest(events: list, start_date, days: int, work_start: str = "09:00", work_end: str = "18:00") -> str:
+    """
+    予定リストから、日ごとの予定・空き時間・負荷と、締切の一覧をコンパクトな文字列にまとめる。
+
+    Args:
+        events (list): list_calendar_eventsが返す形式の予定リスト。
+        start_date (date): 要約の開始日。
+        days (int): 要約する日数。
+        work_start (str), work_end (str): 空き時間を探す時間帯（HH:MM）。
+    """
+    by_day = {start_date + timedelta(days=i): {"timed": [], "all_day": []} for i in range(days)}
+    deadlines = []
+    for event in events:
+        try:
+            start, is_all_day = _parse_event_time(event["start"])
+            end, _ = _parse_event_time(event["end"])
+        except (KeyError, ValueError):
+            continue
+        title = event.get("summary", "（タイトルなし）")
+        if DEADLINE_PATTERN.search(title):
+            deadlines.append(f"{start.month}/{start.day}({WDAYS[start.weekday()]}) {_short(title)}")
+        # 日をまたぐ予定は、かかっている各日に振り分ける
+        day = start.date()
+        last_day = (end - timedelta(seconds=1)).date() if end > start else day
+        while day <= last_day:
+            if day in by_day:
+                if is_all_day:
+                    by_day[day]["all_day"].append(title)
+                else:
+                    day_start = tools.JST.localize(datetime.combine(day, datetime.min.time()))
+                    by_day[day]["timed"].append((max(start, day_start), min(end, day_start + timedelta(days=1)), title))
+            day += timedelta(days=1)
+
+    lines = [f"期間: {start_date.month}/{start_date.day}〜{(start_date + timedelta(days=days - 1)).month}/{(start_date + timedelta(days=days - 1)).day}（作業時間帯 {work_start}-{work_end}）"]
+    for day, info in by_day.items():
+        busy = free_busy.merge_intervals([(free_busy.to_minute(s), free_busy.to_minute(e)) for s, e, _ in info["timed"]])
+        busy_hours = sum(e - s for s, e in busy) / 60
+        load = "軽" if busy_hours < 2 else "中" if busy_hours < 5 else "重"
+
+        day_start = tools.JST.localize(datetime.combine(day, datetime.min.time()))
+        windows = free_busy.free_windows(busy, day_start, day_start + timedelta(days=1), work_start, work_end, min_minutes=MIN_FREE_MINUTES)
+        free = [f"{free_busy.from_minute(s):%H:%M}-{free_busy.from_minute(e):%H:%M}" for s, e in windows]
+
+        items = [f"終日:{_short(t)}" for t in info["all_day"]]
+        items += [f"{s:%H:%M}-{e:%H:%M} {_short(t)}" for s, e, t in sorted(info["timed"])]
+        line = f"{day.month}/{day.day}({WDAYS[day.weekday()]}) 負荷:{load} {len(items)}件/{busy_hours:.1f}h"
+        line += f" 予定: {', '.join(items) if items else 'なし'}"
+        line += f" | 空き: {', '.join(free) if free else 'なし'}"
+        lines.append(line)
+    if deadlines:
+        lines.append(f"締切: {', '.join(deadlines)}")
+    return "\n".join(lines)
+
+
+class CalendarDigest:
+    def __init__(self, days: int = 7, refresh_seconds: float = 300, work_start: str = "09:00", work_end: str = "18:00"):
+        self.days = days
+        self.refresh_seconds = refresh_seconds
+        self.work_start = work_start
+        self.work_end = work_end
+        self._text = None
+        self._built_version = None
+        self._built_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """バックグラウンドでの定期更新を開始する"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="calendar-digest", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def refresh(self):
+        now = datetime.now(tools.JST)
+        start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        end = (start + timedelta(days=self.days - 1)).replace(hour=23, minute=59, second=59)
+        version = tools.calendar_version()
+        events = json.loads(tools.list_calendar_events(start.isoformat(), end.isoformat())).get("events", [])
+        self._text = build_digest(events, start.date(), self.days, self.work_start, self.work_end)
+        self._built_version = version
+        self._built_at = now
+        metrics.incr("calendar_digest_refreshes")
+        print(f"[DIGEST] カレンダー要約を更新しました（{len(events)}件, {len(self._text)}文字）")
+
+    def render(self) -> str:
+        """最新の要約を返す（ブロックしない）。まだ作成されていない場合はその旨を返す。"""
+        if self._text is None:
+            metrics.incr("calendar_digest_misses")
+            return "（カレンダー要約を準備中のため、事実情報はありません）"
+        return f"{self._text}\n（{self._built_at:%H:%M}時点）"
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[DIGEST ERROR] カレンダー要約の更新に失敗: {e}")
+            # 定期更新を待ちつつ、カレンダーが変更されたら早めに作り直す
+            waited = 0.0
+            while waited < self.refresh_seconds and not self._stop.is_set():
+                if self._stop.wait(5):
+                    return
+                waited += 5
+                if tools.calendar_version() != self._built_version:
+                    break
@@ -0,0 +1,88 @@
+# src/core/cancellation.py
+import contextlib
+import contextvars
+import threading
+import time
+
+from src.core import metrics
+
+# 要求元（SSEのクライアント）が切断したときに、そのターンの処理を協調的に打ち切るための仕組み。
+# ストリームの層がCancelTokenを作ってコンテキストに設定し、切断を検知したらcancel()する。
+# 外部API呼び出し・Planのステップ・スレッドで動かしているジェネレータは、区切りごとにcheck()して止まる。
+# （コンテキストはcontextvars.copy_context・asyncio.to_threadで、スレッドにも引き継がれる）
+
+_current_token = contextvars.ContextVar("cancel_token", default=None)
+
+
+class Cancelled(BaseException):
+    """
+    要求元が切断したため、処理を打ち切った。
+    エージェント内の広い except Exception で握りつぶされないよう、asyncio.CancelledErrorと同じくBaseExceptionを継承する。
+    """
+
+
+class CancelToken:
+    def __init__(self, parent: "CancelToken" = None):
+        self.parent = parent
+        self.reason = None
+        self._event = threading.Event()
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    def sleep(self, seconds: float):
+        """seconds秒待つ。待っている間に取り消されたらCancelledを送出する"""
+        deadline = time.monotonic() + seconds
+        while not self.cancelled:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            # 親の取り消しにも気づけるよう、短い間隔で確認する
+            self._event.wait(min(remaining, 0.25))
+        raise Cancelled(self.reason or (self.parent and self.parent.reason))
+
+
+@contextlib.contextmanager
+def scope(token: CancelToken):
+    """このブロック内（とそこから起動したスレッド・タスク）の処理を、tokenで取り消せるようにする"""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def current():
+    return _current_token.get()
+
+
+def is_cancelled() -> bool:
+    token = _current_token.get()
+    return token is not None and token.cancelled
+
+
+def check(kind: str, **labels):
+    """
+    取り消されていればCancelledを送出する。打ち切った処理の種類をcancelled_workに記録する。
+
+    Args:
+        kind (str): 打ち切った処理の種類（"upstream_call"・"plan_step" など）。
+    """
+    if is_cancelled():
+        metrics.incr("cancelled_work", kind=kind, **labels)
+        raise Cancelled(current().reason)
+
+
+def sleep(seconds: float):
+    """取り消しに反応するtime.sleep（トークンが設定されていなければ通常のsleep）"""
+    token = _current_token.get()
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.sleep(seconds)
@@ -0,0 +1,328 @@
+# src/core/cassette.py
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import httpx
+
+import config
+from src.core import cancellation, metrics
+
+# 外部API（Gemini・Google Calendar）とのやり取りを記録・再生する仕組み（カセット）。
+# 遅延の劣化を、実際の会話を使ってライブのサービスなしに再現・計測するためのもの。
+# - record: 実際の通信をそのまま行い、リクエストの要約と応答・所要時間を1行1件のJSONで追記する
+# - replay: 通信せず、記録した応答を記録時の所要時間（CASSETTE_LATENCY_SCALE倍）だけ待ってから返す
+# 差し込む位置はHTTPの層（genai・非同期Calendarクライアントはhttpxのトランスポート、
+# googleapiclientはhttplib2互換のオブジェクト）なので、AKAgent・AEAgent・Orchestrator・toolsのどこから
+# 呼んでも、レート制限・再試行（resilience）を含めて本番と同じ経路を通る。
+#
+# 1件の形式（キーは短く、APIキー・認証ヘッダーは保存しない。パスが.gzで終わればgzipで圧縮する）:
+#   {"api": "gemini", "m": "POST", "route": "<ホスト><パス>", "req": "<リクエストのハッシュ>",
+#    "status": 200, "type": "<Content-Type>", "ms": 1234, "json": {...}}   （本文がJSONでなければ"text"・"b64"）
+#
+# 再生時の照合は、まず同じリクエスト（メソッド・URL・本文が同じ）の未使用の記録を記録順に使い、
+# なければ同じルート（メソッド・ホスト・パス）の未使用の記録を記録順に使う
+# （日時を含むクエリや、バッチリクエストのmultipartの境界文字列は実行のたびに変わるため）。
+
+# 照合に使わないクエリ（APIキー）と、記録・再生の応答から落とすヘッダー（本文は復号済みで保存する）
+_IGNORED_PARAMS = {"key"}
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "-content-encoding"}
+# 認証（OAuthのトークン更新）のエンドポイント。リクエストにはリフレッシュトークン・クライアントシークレットが、
+# 応答にはアクセストークンが含まれるので、記録しない（再生時は認証情報を読み込まないので、記録も不要）
+_AUTH_HOSTS = {"oauth2.googleapis.com", "accounts.google.com"}
+
+
+class CassetteMiss(Exception):
+    """再生モードで、リクエストに対応する記録がカセットに残っていない"""
+
+
+def api_of(url: str) -> str:
+    host = urlsplit(url).netloc
+    if host.startswith("generativelanguage.") or host.endswith("aiplatform.googleapis.com"):
+        return "gemini"
+    return "calendar" if "googleapis.com" in host else host
+
+
+def is_auth(url: str) -> bool:
+    parts = urlsplit(url)
+    # 旧来のエンドポイント（https://www.googleapis.com/oauth2/v4/token）も含める
+    return parts.netloc in _AUTH_HOSTS or parts.path.startswith("/oauth2/")
+
+
+def _route(method: str, url: str) -> str:
+    parts = urlsplit(url)
+    return f"{method.upper()} {parts.netloc}{parts.path}"
+
+
+def request_key(method: str, url: str, body: bytes) -> str:
+    """メソッド・URL（クエリは並べ替え、APIキーは除く）・本文から、リクエストを識別するハッシュを作る"""
+    parts = urlsplit(url)
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in _IGNORED_PARAMS))
+    body = body or b""
+    try:
+        # JSONの本文は、キーの順序の違いを無視する
+        body = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False).encode("utf-8")
+    except ValueError:
+        pass
+    digest = hashlib.sha1(f"{method.upper()} {parts.netloc}{parts.path}?{query}\n".encode("utf-8") + body)
+    return digest.hexdigest()[:16]
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str, latency_scale: float = 1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"不正なカセットのモードです: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._file = None
+        self._by_request = defaultdict(deque)
+        self._by_route = defaultdict(deque)
+        if mode == "replay":
+            self._load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _open(self, mode: str):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, mode + "t", encoding="utf-8")
+        return open(self.path, mode, encoding="utf-8")
+
+    def _load(self):
+        count = 0
+        with self._open("r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                # 同じ記録を2か所から引けるよう、使用済みの印を共有するリストに包む
+                slot = [entry, False]
+                self._by_request[entry["req"]].append(slot)
+                self._by_route[entry["route"]].append(slot)
+                count += 1
+        print(f"[CASSETTE] {self.path} から {count} 件のやり取りを読み込みました（遅延 x{self.latency_scale}）。")
+
+    # ▼▼▼ 記録 ▼▼▼
+
+    def record(self, method: str, url: str, body: bytes, status: int, content_type: str, content: bytes, seconds: float):
+        if is_auth(url):
+            # 認証情報を含むやり取りは保存しない
+            metrics.incr("cassette_skipped", api="auth")
+            return
+        entry = {
+            "api": api_of(url),
+            "m": method.upper(),
+            "route": _route(method, url),
+            "req": request_key(method, url, body),
+            "status": status,
+            "type": content_type,
+            "ms": round(seconds * 1000),
+        }
+        entry.update(_encode_body(content))
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            if self._file is None:
+                # 追記する（同じファイルに複数回の実行を記録できる。やり直すときはファイルを消す）
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = self._open("a")
+            self._file.write(line + "\n")
+            self._file.flush()
+        metrics.incr("cassette_recorded", api=entry["api"])
+
+    # ▼▼▼ 再生 ▼▼▼
+
+    def match(self, method: str, url: str, body: bytes) -> dict:
+        """
+        リクエストに対応する記録を取り出す（1件の記録は1回だけ使う）。
+
+        Raises:
+            CassetteMiss: 同じリクエスト・同じルートの未使用の記録がない。
+        """
+        api = api_of(url)
+        with self._lock:
+            for how, queue in (("request", self._by_request[request_key(method, url, body)]),
+                               ("route", self._by_route[_route(method, url)])):
+                while queue:
+                    slot = queue.popleft()
+                    if not slot[1]:
+                        slot[1] = True
+                        metrics.incr("cassette_replayed", api=api, match=how)
+                        return slot[0]
+        metrics.incr("cassette_misses", api=api)
+        raise CassetteMiss(f"カセットに記録がありません: {_route(method, url)}")
+
+    def delay(self, entry: dict) -> float:
+        return entry["ms"] / 1000 * self.latency_scale
+
+
+def _encode_body(content: bytes) -> dict:
+    try:
+        text = content.decode("utf-8")
+    except UnicodeDecodeError:
+        return {"b64": base64.b64encode(content).decode("ascii")}
+    try:
+        return {"json": json.loads(text)}
+    except ValueError:
+        return {"text": text}
+
+
+def _decode_body(entry: dict) -> bytes:
+    if "json" in entry:
+        return json.dumps(entry["json"], ensure_ascii=False).encode("utf-8")
+    if "text" in entry:
+        return entry["text"].encode("utf-8")
+    return base64.b64decode(entry.get("b64", ""))
+
+
+def _kept_headers(headers) -> dict:
+    return {k: v for k, v in headers.items() if k.lower() not in _DROPPED_HEADERS}
+
+
+# ▼▼▼ httpx（genai・非同期Calendarクライアント） ▼▼▼
+
+class Transport(httpx.BaseTransport):
+    def __init__(self, cassette: Cassette, inner: httpx.BaseTransport = None):
+        self.cassette = cassette
+        self.inner = inner if inner is not None or cassette.replaying else httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        if self.cassette.replaying:
+            entry = self.cassette.match(request.method, str(request.url), body)
+            cancellation.sleep(self.cassette.delay(entry))
+            return _replayed_response(entry, request)
+        started = time.perf_counter()
+        response = self.inner.handle_request(request)
+        try:
+            content = response.read()
+        finally:
+            response.close()
+        return _recorded_response(self.cassette, request, body, response, content, time.perf_counter() - started)
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+
+
+class AsyncTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette, inner: httpx.AsyncBaseTransport = None):
+        self.cassette = cassette
+        self.inner = inner if inner is not None or cassette.replaying else httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        if self.cassette.replaying:
+            entry = self.cassette.match(request.method, str(request.url), body)
+            await asyncio.sleep(self.cassette.delay(entry))
+            return _replayed_response(entry, request)
+        started = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        try:
+            content = await response.aread()
+        finally:
+            await response.aclose()
+        return _recorded_response(self.cassette, request, body, response, content, time.perf_counter() - started)
+
+    async def aclose(self):
+        if self.inner is not None:
+            await self.inner.aclose()
+
+
+def _recorded_response(cassette: Cassette, request: httpx.Request, body: bytes, response: httpx.Response,
+                       content: bytes, seconds: float) -> httpx.Response:
+    cassette.record(request.method, str(request.url), body, response.status_code,
+                    response.headers.get("content-type", ""), content, seconds)
+    return httpx.Response(response.status_code, headers=_kept_headers(response.headers), content=content, request=request)
+
+
+def _replayed_response(entry: dict, request: httpx.Request) -> httpx.Response:
+    headers = {"content-type": entry["type"]} if entry.get("type") else {}
+    return httpx.Response(entry["status"], headers=headers, content=_decode_body(entry), request=request)
+
+
+# ▼▼▼ httplib2（googleapiclient） ▼▼▼
+
+class Httplib2Adapter:
+    """googleapiclientに渡すhttplib2.Http互換のオブジェクト。recordではinnerに通信を任せて記録する"""
+
+    def __init__(self, cassette: Cassette, inner=None):
+        self.cassette = cassette
+        self.inner = inner
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=5, connection_type=None):
+        import httplib2
+
+        raw = body.encode("utf-8") if isinstance(body, str) else (body or b"")
+        if self.cassette.replaying:
+            entry = self.cassette.match(method, uri, raw)
+            cancellation.sleep(self.cassette.delay(entry))
+            info = {"status": str(entry["status"])}
+            if entry.get("type"):
+                info["content-type"] = entry["type"]
+            return httplib2.Response(info), _decode_body(entry)
+        started = time.perf_counter()
+        resp, content = self.inner.request(uri, method=method, body=body, headers=headers,
+                                           redirections=redirections, connection_type=connection_type)
+        self.cassette.record(method, uri, raw, resp.status, resp.get("content-type", ""), content or b"",
+                             time.perf_counter() - started)
+        return resp, content
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+
+    def __getattr__(self, name):
+        # timeout・redirect_codesなど、httplib2.Httpの属性は通信を行う本体に任せる
+        if self.inner is None:
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+
+# ▼▼▼ 各クライアントへの差し込み口（カセットが無効ならNoneを返し、通常どおり通信する） ▼▼▼
+
+def genai_http_options():
+    """genai.Client(http_options=...)に渡す設定"""
+    if active is None:
+        return None
+    from google.genai import types
+    return types.HttpOptions(client_args={"transport": Transport(active)},
+                             async_client_args={"transport": AsyncTransport(active)})
+
+
+def async_transport():
+    """httpx.AsyncClient(transport=...)に渡すトランスポート"""
+    return AsyncTransport(active) if active is not None else None
+
+
+def calendar_http(credentials_factory):
+    """
+    googleapiclientのbuild(http=...)に渡すオブジェクト。再生時は認証情報を読み込まない。
+
+    Args:
+        credentials_factory (Callable[[], Credentials]): 記録時に使う認証情報を返す関数。
+    """
+    if active is None:
+        return None
+    if active.replaying:
+        return Httplib2Adapter(active)
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.http import build_http
+    return AuthorizedHttp(credentials_factory(), http=Httplib2Adapter(active, build_http()))
+
+
+def replaying() -> bool:
+    return active is not None and active.replaying
+
+
+# プロセス全体で使うカセット（CASSETTE_MODEが未設定なら無効）
+active = Cassette(config.CASSETTE_PATH, config.CASSETTE_MODE, config.CASSETTE_LATENCY_SCALE) if config.CASSETTE_MODE else None
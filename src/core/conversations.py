@@ -0,0 +1,71 @@
+# src/core/conversations.py
+import threading
+import time
+from collections import OrderedDict
+
+from src.core import metrics
+from src.core.slots import Slots
+
+# ユーザーごとの会話の状態。Orchestrator・エージェントはプロセスで1つを共有し、
+# 会話履歴・保留中の配置案・チャットセッションだけを会話（ユーザー）ごとに持つ。
+# そのため、別のユーザーのターンは互いに待たずに進む。同じ会話の中では、これらの状態を使うターンを1つずつ実行する（turn）。
+
+# user_idがない呼び出し（CLIなど）の会話
+LOCAL_USER = "local"
+
+
+class Conversation:
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.history = []
+        # マルチエージェント議論で作った配置案（ユーザーが了承したら一括で登録する）
+        self.pending_schedule = None
+        # 会話の状態を使うターンは、同じ会話の中で1つずつ（スレッドからもasyncioからも待てる）
+        self.turn = Slots(1, "turn_wait")
+        self.last_used = time.monotonic()
+        self._sessions = {}   # 名前 -> チャットセッション
+        self._lock = threading.Lock()
+
+    def session(self, name: str, create):
+        """この会話で使うチャットセッション（初回にcreate()で作る）"""
+        with self._lock:
+            session = self._sessions.get(name)
+            if session is None:
+                session = self._sessions[name] = create()
+            return session
+
+
+class ConversationRegistry:
+    def __init__(self, max_conversations: int = 1000, idle_seconds: float = 3600):
+        self.max_conversations = max_conversations
+        self.idle_seconds = idle_seconds
+        self._conversations = OrderedDict()   # user_id -> Conversation（最近使った会話ほど後ろ）
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str = None) -> Conversation:
+        """user_idの会話を返す（なければ作る）"""
+        user_id = user_id or LOCAL_USER
+        with self._lock:
+            conversation = self._conversations.get(user_id)
+            if conversation is None:
+                conversation = self._conversations[user_id] = Conversation(user_id)
+            else:
+                self._conversations.move_to_end(user_id)
+            conversation.last_used = time.monotonic()
+            self._evict_locked()
+            return conversation
+
+    def _evict_locked(self):
+        """しばらく使われていない会話を捨てる。ターンを実行中の会話と、いま使う（末尾の）会話は残す"""
+        now = time.monotonic()
+        for user_id, conversation in list(self._conversations.items())[:-1]:
+            too_many = len(self._conversations) > self.max_conversations
+            if not too_many and now - conversation.last_used <= self.idle_seconds:
+                break
+            if conversation.turn.active == 0:
+                del self._conversations[user_id]
+                metrics.incr("conversations_evicted")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._conversations)
@@ -0,0 +1,222 @@
+# src/core/gemini_pool.py
+import contextlib
+import threading
+import time
+
+import config
+from src.core import metrics, resilience, cassette
+from src.core.slots import Slots
+
+# プロセス全体で共有する、Geminiのクライアント（genai.Client）のプール。
+# エージェント・オラクルは自分でクライアントを作らず、ここから借りる（接続プール・メモリをセッション間で共有する）。
+# - クライアントは初めて使うときに作る（カセット・負荷試験の擬似Geminiを、その前に差し込めるように）
+# - 呼び出し（lease）ごとに、健全で空いているクライアントを選ぶ。チャットセッションは作ったクライアントに結びつくので、
+#   そのクライアントのまま呼び出し、結果だけを記録する
+# - クライアントごとに、429/5xx・通信エラーが続いたらサーキットブレーカーを開き、しばらく他のクライアントに回す
+# - モデルごとに同時に呼び出せる数を制限し、超えた呼び出しは空くまで待たせる
+
+
+class PooledClient:
+    """プール内の1つのクライアントと、その健全性・使用状況"""
+
+    def __init__(self, index: int, client, failure_threshold: int, reset_seconds: float):
+        self.index = index
+        self.client = client
+        self.breaker = resilience.CircuitBreaker(failure_threshold, reset_seconds)
+        self.borrowers = 0   # このクライアントを借りているエージェントなど（チャットセッションを作る）
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+
+
+class ModelSlots(Slots):
+    """1つのモデルの同時呼び出し数の上限"""
+
+    def __init__(self, limit: int):
+        super().__init__(limit, "gemini_slot")
+
+
+class GeminiClientPool:
+    def __init__(self, size: int = 2, max_connections: int = 20, model_limits: dict = None, default_limit: int = 8,
+                 failure_threshold: int = 5, reset_seconds: float = 30, factory=None):
+        """
+        Args:
+            size (int): 作るクライアントの数。
+            max_connections (int): クライアントごとのHTTP接続数の上限（keep-aliveで使い回す）。
+            model_limits (dict): モデル名 -> 同時呼び出し数の上限。未登録のモデルはdefault_limit。
+            factory (Callable[[], genai.Client], optional): クライアントを作る関数（既定はGEMINI_API_KEYで作る）。
+        """
+        self.size = max(1, size)
+        self.max_connections = max_connections
+        self.model_limits = model_limits or {}
+        self.default_limit = default_limit
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._factory = factory or self._create_client
+        self._members = []
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def _create_client(self):
+        import google.genai as genai
+        return genai.Client(api_key=config.GEMINI_API_KEY, http_options=self._http_options())
+
+    def _http_options(self):
+        options = cassette.genai_http_options()
+        if options is not None:
+            # 記録・再生中は、カセットのトランスポートを使う
+            return options
+        import httpx
+        from google.genai import types
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        return types.HttpOptions(client_args={"limits": limits}, async_client_args={"limits": limits})
+
+    def _ensure_members(self) -> list:
+        with self._lock:
+            if not self._members:
+                self._members = [PooledClient(i, self._factory(), self.failure_threshold, self.reset_seconds) for i in range(self.size)]
+                print(f"[GEMINI POOL] クライアントを{self.size}個作成しました。")
+            return self._members
+
+    def _member_of(self, client):
+        """clientがプールのクライアント（またはその内部のAPIクライアント）ならその項目を返す"""
+        if client is None:
+            return None
+        for member in self._ensure_members():
+            if client is member.client or client is getattr(member.client, "_api_client", None):
+                return member
+        return None
+
+    def _choose(self) -> PooledClient:
+        """呼び出しに使うクライアントを選ぶ（呼び出し中の少ない、健全なもの）"""
+        members = self._ensure_members()
+        with self._lock:
+            for member in members:
+                # 止めていたクライアントは、待ち時間が過ぎたら1回だけ試しに使う（成功すれば戻す）
+                if member.breaker.state == "open" and member.breaker.allow():
+                    return member
+            healthy = [m for m in members if m.breaker.state == "closed"]
+            return min(healthy or members, key=lambda m: (m.in_flight, m.borrowers, m.index))
+
+    def borrow(self):
+        """
+        チャットセッションなどを作るためのクライアントを借りる（返す必要はない）。
+        借り手の少ない健全なクライアントを返すので、エージェントのセッションはクライアント間に分散する。
+        """
+        member = self._choose()
+        with self._lock:
+            member.borrowers += 1
+        return member.client
+
+    def _slots_for(self, model: str) -> ModelSlots:
+        with self._lock:
+            slots = self._slots.get(model)
+            if slots is None:
+                slots = self._slots[model] = ModelSlots(self.model_limits.get(model, self.default_limit))
+            return slots
+
+    def _start(self, model: str, client, session):
+        """呼び出しに使うクライアントとその項目を決め、使用中として数える"""
+        if session is not None:
+            # チャットセッションは作ったクライアントでしか続けられない
+            modules = getattr(session, "_modules", None)
+            member = self._member_of(getattr(modules, "_api_client", None))
+            target = session
+        elif client is not None and self._member_of(client) is None:
+            # プール外のクライアント（ベンチマークの台本クライアントなど）はそのまま使う
+            member, target = None, client
+        else:
+            member = self._choose()
+            target = member.client
+        if member is not None:
+            with self._lock:
+                member.in_flight += 1
+                member.calls += 1
+        return member, target
+
+    def _finish(self, member, error: Exception = None):
+        if member is None:
+            return
+        with self._lock:
+            member.in_flight -= 1
+            if error is not None and resilience.is_retryable(error):
+                member.failures += 1
+        if error is not None and resilience.is_retryable(error):
+            metrics.incr("gemini_pool_client_errors", client=str(member.index))
+            if member.breaker.record_failure():
+                print(f"[GEMINI POOL] クライアント{member.index}で失敗が続いたため、{self.reset_seconds:.0f}秒間ほかのクライアントを使います。")
+        else:
+            # リクエスト自体の誤り（400/404など）は、クライアントの不調としては数えない
+            member.breaker.record_success()
+
+    @contextlib.contextmanager
+    def lease(self, model: str, client=None, session=None):
+        """
+        1回の呼び出しの間、モデルの同時呼び出し枠とクライアントを借りる。
+
+        Args:
+            model (str): 呼び出すモデル名。
+            client (optional): 呼び出し元が持っているクライアント。プール外のものならそれを使う。
+            session (optional): チャットセッション。渡すと、そのセッションを作ったクライアントの結果として記録する。
+
+        Yields:
+            呼び出しに使うクライアント（sessionを渡した場合はsessionそのもの）。
+        """
+        slots = self._slots_for(model)
+        started = time.perf_counter()
+        slots.acquire()
+        metrics.observe("gemini_pool_wait_seconds", time.perf_counter() - started, model=model)
+        try:
+            member, target = self._start(model, client, session)
+            try:
+                yield target
+            except Exception as e:
+                self._finish(member, e)
+                raise
+            except BaseException:
+                self._finish(member)
+                raise
+            self._finish(member)
+        finally:
+            slots.release()
+
+    @contextlib.asynccontextmanager
+    async def alease(self, model: str, client=None, session=None):
+        """leaseのasyncio版（同時呼び出し枠が空くまでの待ちでイベントループを止めない）"""
+        slots = self._slots_for(model)
+        started = time.perf_counter()
+        await slots.acquire_async()
+        metrics.observe("gemini_pool_wait_seconds", time.perf_counter() - started, model=model)
+        try:
+            member, target = self._start(model, client, session)
+            try:
+                yield target
+            except Exception as e:
+                self._finish(member, e)
+                raise
+            except BaseException:
+                self._finish(member)
+                raise
+            self._finish(member)
+        finally:
+            slots.release()
+
+    def stats(self) -> dict:
+        """クライアントごとの状態と、モデルごとの同時呼び出し数"""
+        with self._lock:
+            return {
+                "clients": [{"index": m.index, "state": m.breaker.state, "borrowers": m.borrowers, "in_flight": m.in_flight,
+                             "calls": m.calls, "failures": m.failures} for m in self._members],
+                "models": {model: {"limit": s.limit, "active": s.active} for model, s in sorted(self._slots.items())},
+            }
+
+
+# プロセス全体で共有するプール
+pool = GeminiClientPool(
+    size=config.GEMINI_CLIENT_POOL_SIZE,
+    max_connections=config.GEMINI_HTTP_MAX_CONNECTIONS,
+    model_limits=config.GEMINI_MAX_CONCURRENT,
+    default_limit=config.GEMINI_MAX_CONCURRENT_DEFAULT,
+    failure_threshold=config.CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=config.CIRCUIT_RESET_SECONDS,
+)
@@ -0,0 +1,218 @@
+# src/core/jobs.py
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+
+import config
+from src.core import cancellation, metrics, resilience, stream_runs
+
+# 長い依頼（マルチエージェントの議論など）を、リクエストから切り離して実行するジョブ機構。
+# 投入するとすぐにジョブIDを返し、上限付きのワーカーが優先度順に実行する。進捗はrun（stream_runs）に積まれ、
+# ポーリング（イベントの差分）またはSSEでの購読で受け取る。
+# - 待ち行列の長さ・ユーザーごとの待ち件数に上限を設け、超えた投入は受け付けない（QueueFull）
+# - 予定の確認のようなすぐ終わる依頼は"high"として先に実行し、さらに"high"専用のワーカーを確保しておくことで、
+#   長い議論がワーカーを埋めていても待たされないようにする
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+
+class QueueFull(Exception):
+    """待ち行列が上限に達しているため、ジョブを受け付けなかった"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, run: stream_runs.StreamRun, user_id: str, message: str, priority: str):
+        self.run = run
+        self.id = run.run_id
+        self.user_id = user_id
+        self.message = message
+        self.priority = priority
+        self.status = "queued"   # queued / running / done / cancelled
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    def __init__(self, run_factory, workers: int = 4, fast_lane_workers: int = 1, max_queued: int = 32,
+                 max_queued_per_user: int = 3, retention_seconds: float = 600):
+        self.run_factory = run_factory      # (job) -> 出力（dict）を順に返すジェネレータ
+        self.workers = workers
+        self.fast_lane_workers = min(fast_lane_workers, workers - 1) if workers > 1 else 0
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self.retention_seconds = retention_seconds
+        self._heap = []                     # (優先度, 投入順, Job)
+        self._jobs = {}
+        self._running = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._started = False
+
+    def _start_locked(self):
+        if self._started:
+            return
+        self._started = True
+        for i in range(self.workers):
+            # 先頭のfast_lane_workers個は"high"専用
+            fast_lane = i < self.fast_lane_workers
+            threading.Thread(target=self._worker, args=(fast_lane,), name=f"job-worker-{i}", daemon=True).start()
+
+    def submit(self, user_id: str, message: str, priority: str = "normal") -> Job:
+        """
+        ジョブを待ち行列に入れる。
+
+        Raises:
+            QueueFull: 待ち行列全体、またはこのユーザーの待ち件数が上限に達している。
+        """
+        priority = priority if priority in PRIORITIES else "normal"
+        with self._cond:
+            self._prune_locked()
+            queued = [job for _, _, job in self._heap if job.status == "queued"]
+            if len(queued) >= self.max_queued:
+                metrics.incr("jobs_rejected", reason="queue_full")
+                raise QueueFull("ただいま混み合っています。しばらくしてからもう一度お試しください。", self._retry_after_locked())
+            if sum(1 for job in queued if job.user_id == user_id) >= self.max_queued_per_user:
+                metrics.incr("jobs_rejected", reason="per_user_limit")
+                raise QueueFull("実行待ちの依頼が多すぎます。先の依頼が終わるまでお待ちください。", self._retry_after_locked())
+            run = stream_runs.registry.create(user_id)
+            # 進捗の購読が途切れても、ジョブの実行は続ける
+            run.cancel_when_abandoned = False
+            job = Job(run, user_id, message, priority)
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (PRIORITIES[priority], next(self._seq), job))
+            self._start_locked()
+            self._cond.notify_all()
+        metrics.incr("jobs_submitted", priority=priority)
+        print(f"[JOBS] ジョブ {job.id} を受け付けました（優先度: {priority} / 待ち: {self.position(job)}件目）")
+        return job
+
+    def _retry_after_locked(self) -> float:
+        # 実行時間の実績（平均）から、ワーカーが1つ空くまでの目安を返す
+        timing = metrics.snapshot()["timings"].get("job_run_seconds{priority=normal}")
+        return round(timing["avg"], 1) if timing else 30.0
+
+    def _next_job_locked(self, fast_lane: bool):
+        """実行できるジョブを優先度順に取り出す（取り消し済みは捨てる）。専用ワーカーは"high"だけを取る"""
+        while self._heap:
+            rank, _, job = self._heap[0]
+            if job.status != "queued":
+                heapq.heappop(self._heap)
+                continue
+            if fast_lane and rank != PRIORITIES["high"]:
+                return None
+            heapq.heappop(self._heap)
+            return job
+        return None
+
+    def _worker(self, fast_lane: bool):
+        while True:
+            with self._cond:
+                job = self._next_job_locked(fast_lane)
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job_locked(fast_lane)
+                job.status = "running"
+                job.started_at = time.time()
+                self._running += 1
+            metrics.observe("job_queue_wait_seconds", job.started_at - job.submitted_at, priority=job.priority)
+            try:
+                self._execute(job)
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    job.finished_at = time.time()
+                    if job.status == "running":
+                        job.status = "done"
+                metrics.observe("job_run_seconds", job.finished_at - job.started_at, priority=job.priority)
+
+    def _execute(self, job: Job):
+        run = job.run
+        try:
+            with resilience.user_scope(job.user_id), cancellation.scope(run.token), \
+                    contextlib.closing(self.run_factory(job)) as generator:
+                for payload in generator:
+                    run.append(payload)
+                    if run.token.cancelled:
+                        break
+        except cancellation.Cancelled:
+            pass
+        except Exception as e:
+            print(f"[JOBS] ジョブ {job.id} でエラーが発生: {e}")
+            run.append({"status": "error", "message": "サーバー内部でエラーが発生しました。"})
+        finally:
+            run.finish()
+
+    def get(self, job_id: str):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def position(self, job: Job) -> int:
+        """実行待ちの何件目か（実行中・終了済みなら0）"""
+        with self._cond:
+            if job.status != "queued":
+                return 0
+            key = (PRIORITIES[job.priority], job.submitted_at)
+            return 1 + sum(1 for rank, _, other in self._heap
+                           if other.status == "queued" and other is not job and (rank, other.submitted_at) < key)
+
+    def cancel(self, job_id: str) -> bool:
+        """待ち中なら実行せずに、実行中なら次の区切りで打ち切る"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in ("done", "cancelled"):
+                return False
+            was_queued = job.status == "queued"
+            job.status = "cancelled"
+            job.finished_at = time.time()
+        metrics.incr("cancelled_work", kind="job")
+        if was_queued:
+            job.run.finish()
+        else:
+            job.run.cancel("job_cancelled")
+        return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            queued = [job for _, _, job in self._heap if job.status == "queued"]
+            return {
+                "workers": self.workers,
+                "fast_lane_workers": self.fast_lane_workers,
+                "running": self._running,
+                "queued": len(queued),
+                "queued_by_priority": {p: sum(1 for job in queued if job.priority == p) for p in PRIORITIES},
+                "max_queued": self.max_queued,
+            }
+
+    def _prune_locked(self):
+        now = time.time()
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and now - j.finished_at > self.retention_seconds]:
+            del self._jobs[job_id]
+
+
+def create_queue(orchestrator) -> JobQueue:
+    """Orchestratorでジョブを実行する待ち行列を作る（app.pyで1つだけ作る）。ジョブは投入したユーザーの会話で実行する"""
+    return JobQueue(
+        lambda job: orchestrator.run_multi_agent_session_stream(job.message, job.user_id),
+        workers=config.JOB_WORKERS,
+        fast_lane_workers=config.JOB_FAST_LANE_WORKERS,
+        max_queued=config.JOB_QUEUE_MAX,
+        max_queued_per_user=config.JOB_MAX_QUEUED_PER_USER,
+        retention_seconds=config.JOB_RETENTION_SECONDS,
+    )
@@ -0,0 +1,181 @@
+# src/core/llm_cache.py
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import config
+from src.calendar_agent import tools
+from src.core import metrics
+
+# Gemini呼び出しの応答キャッシュ。
+# キーは「正規化したプロンプト・モデル名・カレンダー状態のバージョン」から作るため、
+# カレンダーが更新されると古い応答は自然に参照されなくなる。
+# メモリ上のLRU（TTL付き）と、任意で有効にできるディスク層の2段構成。
+# カレンダーのバージョンはこのプロセスからの書き込みでしか変わらないため、カレンダーの内容を埋め込む呼び出し箇所は
+# 短いTTL（config.LLM_CACHE_TTL_BY_CALL_SITE）にして、外部での編集後に古い応答を返し続けないようにする。
+# チャットセッションでの送信（ReAct・オラクル）は、応答が履歴に依存するためキャッシュしない（model_router.send_on_session）。
+
+
+def normalize_prompt(prompt: str) -> str:
+    """全角/半角や空白の揺れを吸収したプロンプト文字列を返す。"""
+    text = unicodedata.normalize("NFKC", prompt)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def make_key(call_site: str, model: str, prompt: str) -> str:
+    raw = json.dumps([call_site, model, tools.calendar_version(), normalize_prompt(prompt)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def leads_to_mutation(text: str) -> bool:
+    """応答がカレンダーを変更するツール呼び出しを含むかどうか（含む場合はキャッシュしない）。"""
+    return any(name in text for name in tools.MUTATING_TOOLS)
+
+
+class LLMCache:
+    def __init__(self, max_entries: int, ttl_seconds: float, disk_dir: str = None, max_disk_entries: int = 0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    metrics.incr("llm_cache_hits", tier="memory")
+                    return entry[1]
+                del self._memory[key]
+
+        value, expires_at = self._disk_get(key, now)
+        if value is not None:
+            metrics.incr("llm_cache_hits", tier="disk")
+            self._memory_put(key, value, expires_at)
+            return value
+        metrics.incr("llm_cache_misses")
+        return None
+
+    def put(self, key: str, value: str, ttl_seconds: float = None):
+        now = time.time()
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._memory_put(key, value, now + ttl_seconds)
+        self._disk_put(key, value, now + ttl_seconds)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def _memory_put(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                metrics.incr("llm_cache_evictions", tier="memory")
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key: str, now: float) -> tuple:
+        """(値, 有効期限)。なければ (None, None)"""
+        if not self.disk_dir:
+            return None, None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            return None, None
+        if entry.get("expires_at", 0) <= now:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None, None
+        return entry.get("value"), entry["expires_at"]
+
+    def _disk_put(self, key: str, value: str, expires_at: float):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": expires_at, "value": value}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            self._evict_disk()
+        except OSError as e:
+            print(f"[LLM CACHE WARNING] ディスクキャッシュへの書き込みに失敗: {e}")
+
+    def _evict_disk(self):
+        """ディスク上のエントリ数が上限を超えたら、更新日時の古いものから削除する。"""
+        entries = [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir) if name.endswith(".json")]
+        overflow = len(entries) - self.max_disk_entries
+        if overflow <= 0:
+            return
+        entries.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        for path in entries[:overflow]:
+            try:
+                os.remove(path)
+                metrics.incr("llm_cache_evictions", tier="disk")
+            except OSError:
+                pass
+
+
+# プロセス全体で共有するキャッシュ
+_cache = LLMCache(
+    max_entries=config.LLM_CACHE_MAX_ENTRIES,
+    ttl_seconds=config.LLM_CACHE_TTL_SECONDS,
+    disk_dir=config.LLM_CACHE_DIR,
+    max_disk_entries=config.LLM_CACHE_MAX_DISK_ENTRIES,
+)
+
+
+def cached(call_site: str, model: str, prompt: str, compute) -> str:
+    """
+    キャッシュがあればそれを返し、なければcomputeを呼んで結果を保存する。
+    カレンダーを変更する応答は保存しない（次回も必ずLLMに問い合わせる）。
+    """
+    if not config.LLM_CACHE_ENABLED:
+        return compute()
+    key = make_key(call_site, model, prompt)
+    value = _cache.get(key)
+    if value is not None:
+        print(f"[LLM CACHE] {call_site}: キャッシュから応答を返します。")
+        return value
+    value = compute()
+    _store(call_site, key, value)
+    return value
+
+
+async def acached(call_site: str, model: str, prompt: str, acompute) -> str:
+    """cachedのasyncio版。キャッシュがなければacompute()を待つ。"""
+    if not config.LLM_CACHE_ENABLED:
+        return await acompute()
+    key = make_key(call_site, model, prompt)
+    value = _cache.get(key)
+    if value is not None:
+        print(f"[LLM CACHE] {call_site}: キャッシュから応答を返します。")
+        return value
+    value = await acompute()
+    _store(call_site, key, value)
+    return value
+
+
+def _store(call_site: str, key: str, value: str):
+    if leads_to_mutation(value):
+        metrics.incr("llm_cache_bypass", call_site=call_site)
+    else:
+        _cache.put(key, value, config.LLM_CACHE_TTL_BY_CALL_SITE.get(call_site))
@@ -0,0 +1,75 @@
+# src/core/metrics.py
+import threading
+import contextvars
+from collections import defaultdict
+
+# プロセス全体で共有する簡易メトリクス（カウンタと所要時間の集計）
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = defaultdict(lambda: {"count": 0, "total": 0.0, "max": 0.0})
+
+# 現在処理中のターン（1回のユーザー発話）ごとのLLM呼び出し回数
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+def _key(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+
+def incr(name: str, value: int = 1, **labels):
+    """カウンタを加算する。"""
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def observe(name: str, value: float, **labels):
+    """所要時間などの観測値を記録する。"""
+    with _lock:
+        stat = _timings[_key(name, labels)]
+        stat["count"] += 1
+        stat["total"] += value
+        stat["max"] = max(stat["max"], value)
+
+
+def snapshot() -> dict:
+    """現在のメトリクスをdictで返す（/api/metricsやベンチマークから参照）。"""
+    with _lock:
+        timings = {
+            k: {**v, "avg": v["total"] / v["count"] if v["count"] else 0.0}
+            for k, v in _timings.items()
+        }
+        return {"counters": dict(_counters), "timings": timings}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timings.clear()
+
+
+def start_turn():
+    """ターン単位のLLM呼び出し集計を開始し、resetに使うトークンを返す。"""
+    return _current_turn.set(defaultdict(int))
+
+
+def end_turn(token, workflow: str) -> dict:
+    """ターン単位の集計を終了し、呼び出し箇所ごとの回数を返す。"""
+    calls = dict(_current_turn.get() or {})
+    try:
+        _current_turn.reset(token)
+    except ValueError:
+        # 別コンテキストで終了した場合は単に破棄する
+        _current_turn.set(None)
+    observe("llm_calls_per_turn", sum(calls.values()), workflow=workflow)
+    return calls
+
+
+def record_llm_call(call_site: str):
+    """LLM呼び出しを1回記録する。ターン集計中であればターンの内訳にも加算する。"""
+    incr("llm_calls", call_site=call_site)
+    turn = _current_turn.get()
+    if turn is not None:
+        turn[call_site] += 1
@@ -0,0 +1,170 @@
+# src/core/model_router.py
+import time
+import config
+from src.core import metrics, llm_cache, resilience, prompt_profile, gemini_pool
+
+# 呼び出し箇所（call site）ごとにモデルを選び、
+# 安価な"fast"モデルの応答が使えない場合だけ"pro"モデルへ昇格させる（cascade）。
+
+TIER_ORDER = ["fast", "pro"]
+
+
+def tier_for(call_site: str) -> str:
+    """呼び出し箇所の初期tierを返す。未登録の箇所は安全側の"pro"とする。"""
+    return config.MODEL_ROUTING.get(call_site, "pro")
+
+
+def model_for(call_site: str) -> str:
+    """呼び出し箇所で使うモデル名を返す。"""
+    return config.MODEL_TIERS[tier_for(call_site)]
+
+
+def _record(call_site: str, tier: str, elapsed: float, response):
+    """tierごとの遅延・トークン数・概算コストを記録する。"""
+    metrics.observe("llm_latency_seconds", elapsed, tier=tier, call_site=call_site)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    input_tokens = getattr(usage, "prompt_token_count", None) or 0
+    output_tokens = getattr(usage, "candidates_token_count", None) or 0
+    # 入力のうち、コンテキストキャッシュから読んだ分（安い単価で課金される）
+    cached_tokens = getattr(usage, "cached_content_token_count", None) or 0
+    metrics.incr("llm_tokens", input_tokens, tier=tier, kind="input")
+    metrics.incr("llm_tokens", output_tokens, tier=tier, kind="output")
+    if cached_tokens:
+        metrics.incr("llm_tokens", cached_tokens, tier=tier, kind="cached_input")
+    pricing = config.MODEL_PRICING.get(tier)
+    if pricing:
+        cost = ((input_tokens - cached_tokens) * pricing["input"] + cached_tokens * pricing.get("cached_input", pricing["input"])
+                + output_tokens * pricing["output"]) / 1_000_000
+        metrics.observe("llm_cost_usd", cost, tier=tier, call_site=call_site)
+
+
+def cascade(call_site: str, prompt: str, send, accept=None) -> str:
+    """
+    初期tierから順にモデルを試し、acceptを満たす最初の応答テキストを返す。
+    採用された応答はLLM応答キャッシュに保存され、同じプロンプトでは再利用される。
+
+    Args:
+        call_site (str): 呼び出し箇所の名前（config.MODEL_ROUTINGのキー）。
+        prompt (str): 送信するプロンプト。
+        send (Callable[[str, str], Any]): モデル名とプロンプトを受け取り、Geminiの応答オブジェクトを返す関数
+            （通常はprompt_templates.send。プロンプトはprompt_profile.Promptのまま渡す）。
+        accept (Callable[[str], bool], optional): 応答テキストが使えるかの判定。
+            Falseの場合（解析失敗・低信頼）は上位tierへ昇格する。最上位tierの応答は常に採用する。
+
+    Returns:
+        str: 応答テキスト。
+    """
+    return llm_cache.cached(call_site, model_for(call_site), prompt, lambda: _cascade(call_site, prompt, send, accept))
+
+
+async def acascade(call_site: str, prompt: str, asend, accept=None) -> str:
+    """
+    cascadeのasyncio版。asendはモデル名とプロンプトを受け取り、応答を返すコルーチン関数
+    （通常はprompt_templates.asend）。
+    """
+    return await llm_cache.acached(call_site, model_for(call_site), prompt, lambda: _acascade(call_site, prompt, asend, accept))
+
+
+def _cascade(call_site: str, prompt: str, send, accept) -> str:
+    tiers = TIER_ORDER[TIER_ORDER.index(tier_for(call_site)):]
+    for i, tier in enumerate(tiers):
+        is_last = i == len(tiers) - 1
+        started = time.perf_counter()
+        metrics.record_llm_call(call_site)
+        prompt_profile.observe(call_site, prompt)
+        try:
+            # 429/5xxはレート制限・再試行の層で吸収し、それでも失敗した場合だけ昇格する
+            response = resilience.gemini_api.call(lambda: send(config.MODEL_TIERS[tier], prompt))
+        except Exception as e:
+            _escalate_on_error(call_site, tier, e, is_last)
+            continue
+        text = _accepted_text(call_site, tier, started, response, is_last, accept)
+        if text is not None:
+            return text
+
+
+async def _acascade(call_site: str, prompt: str, asend, accept) -> str:
+    tiers = TIER_ORDER[TIER_ORDER.index(tier_for(call_site)):]
+    for i, tier in enumerate(tiers):
+        is_last = i == len(tiers) - 1
+        started = time.perf_counter()
+        metrics.record_llm_call(call_site)
+        prompt_profile.observe(call_site, prompt)
+        try:
+            response = await resilience.gemini_api.acall(lambda: asend(config.MODEL_TIERS[tier], prompt))
+        except Exception as e:
+            _escalate_on_error(call_site, tier, e, is_last)
+            continue
+        text = _accepted_text(call_site, tier, started, response, is_last, accept)
+        if text is not None:
+            return text
+
+
+def _escalate_on_error(call_site: str, tier: str, e: Exception, is_last: bool):
+    """tierの呼び出し失敗を記録する。最上位tierなら例外を送出する（exceptブロック内で呼ぶ）"""
+    metrics.incr("llm_errors", tier=tier, call_site=call_site)
+    if is_last:
+        raise
+    print(f"[MODEL ROUTER] {call_site}: {tier} モデルでエラーが発生したため昇格します: {e}")
+    metrics.incr("llm_escalations", call_site=call_site, reason="error")
+
+
+def _accepted_text(call_site: str, tier: str, started: float, response, is_last: bool, accept):
+    """応答を記録し、採用するなら応答テキストを、昇格するならNoneを返す"""
+    _record(call_site, tier, time.perf_counter() - started, response)
+    text = response.text.strip()
+    if is_last or accept is None or accept(text):
+        return text
+    print(f"[MODEL ROUTER] {call_site}: {tier} モデルの応答が採用基準を満たさないため昇格します。")
+    metrics.incr("llm_escalations", call_site=call_site, reason="rejected")
+    return None
+
+
+def _send_message(call_site: str, chat_session, prompt: str, generate_config):
+    # セッションを作ったクライアントのまま、モデルの同時呼び出し枠の中で送る（結果はクライアントの健全性として記録される）。
+    # 内訳付きのPrompt（strのサブクラス）は、genaiが受け付けないのでただの文字列にして送る
+    with gemini_pool.pool.lease(model_for(call_site), session=chat_session):
+        return chat_session.send_message(str(prompt), config=generate_config)
+
+
+async def _asend_message(call_site: str, chat_session, prompt: str, generate_config):
+    async with gemini_pool.pool.alease(model_for(call_site), session=chat_session):
+        return await chat_session.send_message(str(prompt), config=generate_config)
+
+
+def send_on_session(call_site: str, chat_session, prompt: str, generate_config=None) -> str:
+    """
+    既存のチャットセッション（モデル固定）で送信し、tier指標を記録して応答テキストを返す。
+    ReActループやオラクルのように、会話の文脈を保つ必要がある呼び出しで使う。
+    応答はセッションの履歴にも依存し、キャッシュから返すとセッションにそのやり取りが積まれないため、応答キャッシュは使わない。
+    generate_configはsend_messageのconfigとして渡す（システムプロンプトのコンテキストキャッシュなど。prompt_templates.session_request）。
+    """
+    tier = tier_for(call_site)
+    started = time.perf_counter()
+    metrics.record_llm_call(call_site)
+    # セッションに積まれた過去のやり取りも毎回送られるので、内訳に含める
+    prompt_profile.observe(call_site, prompt, session=chat_session)
+    try:
+        response = resilience.gemini_api.call(lambda: _send_message(call_site, chat_session, prompt, generate_config))
+    except Exception:
+        metrics.incr("llm_errors", tier=tier, call_site=call_site)
+        raise
+    _record(call_site, tier, time.perf_counter() - started, response)
+    return response.text.strip()
+
+
+async def asend_on_session(call_site: str, chat_session, prompt: str, generate_config=None) -> str:
+    """send_on_sessionのasyncio版。chat_sessionはclient.aio.chats.createで作った非同期のチャットセッション。"""
+    tier = tier_for(call_site)
+    started = time.perf_counter()
+    metrics.record_llm_call(call_site)
+    prompt_profile.observe(call_site, prompt, session=chat_session)
+    try:
+        response = await resilience.gemini_api.acall(lambda: _asend_message(call_site, chat_session, prompt, generate_config))
+    except Exception:
+        metrics.incr("llm_errors", tier=tier, call_site=call_site)
+        raise
+    _record(call_site, tier, time.perf_counter() - started, response)
+    return response.text.strip()
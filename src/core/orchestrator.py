@@ -2,15 +2,28 @@
 from pathlib import Path
 import os
 import config
-import google.genai as genai
+import asyncio
 import re
+import json
 from datetime import datetime, timedelta
 
 # 必要なモジュールを先にインポート
 from src.agents.ak.agent import AKAgent
 from src.agents.ae.agent import AEAgent
 from src.core.user_profile_handler import get_user_profile
-from src.calendar_agent import tools
+from src.calendar_agent import tools, schedule_optimizer, tool_format
+from src.core import metrics, model_router, async_bridge, cancellation, gemini_pool, prompt_profile, prompt_templates
+from src.core.prefetch import AsyncSpeculativePrefetch, SpeculativePrefetch
+from src.core.calendar_digest import CalendarDigest
+from src.core.conversations import Conversation, ConversationRegistry
+
+# 配置案を了承する返事（「この案で登録して」「それでお願い」など）
+APPLY_SCHEDULE_PATTERN = re.compile(r"(この|その|提案の?)(案|内容|とおり|通り).{0,6}(登録|反映|入れて|お願い)|^(それで|これで)(お願い|登録|反映)")
+# 予定の確認だけの依頼（「今日の予定は？」「明日のスケジュール教えて」など）と、カレンダーを変更する依頼
+LISTING_PATTERN = re.compile(r"(予定|スケジュール)(は|を|って)?.{0,4}([？?]|教えて|確認|見せて|ある|どう)")
+MUTATION_PATTERN = re.compile(r"入れて|追加|登録|削除|消して|変更|ずらして|キャンセル")
+# 同じ会話の前のターンの終了を待つ間に送る進捗
+TURN_WAIT_EVENT = {"status": "thinking", "speaker": "oracle", "message": "（前のご依頼を処理しています。少々お待ちください...）"}
 
 class Orchestrator:
     def __init__(self, project_root: Path):
@@ -28,19 +41,33 @@ class Orchestrator:
         }
         print(f"Orchestrator: {len(self.agents)}体のエージェントを起動しました。")
 
-        self.chat_history = []
-        
+        # 会話履歴・配置案・チャットセッションはユーザー（会話）ごとに持つ
+        self.conversations = ConversationRegistry(config.CONVERSATION_MAX, config.CONVERSATION_IDLE_SECONDS)
+        self.schedule_preferences = schedule_optimizer.preferences_from_profile(self.user_profile)
+
+        # マルチエージェント議論の「事実」として使うカレンダー要約をバックグラウンドで維持する
+        self.calendar_digest = None
+        if config.CALENDAR_DIGEST_ENABLED:
+            self.calendar_digest = CalendarDigest(days=config.CALENDAR_DIGEST_DAYS, refresh_seconds=config.CALENDAR_DIGEST_REFRESH_SECONDS)
+            self.calendar_digest.start()
+
         try:
-            self.client = genai.Client(api_key=config.GEMINI_API_KEY)
+            self.client = gemini_pool.pool.borrow()
             persona_path = self.project_root / 'knowledge' / 'oracle_persona.md'
-            with open(persona_path, 'r', encoding='utf-8') as f:
-                self.oracle_persona = f.read()
-            print("[Orchestrator] オラクルのペルソナをロードしました。")
+            try:
+                with open(persona_path, 'r', encoding='utf-8') as f:
+                    self.oracle_persona = f.read()
+                print("[Orchestrator] オラクルのペルソナをロードしました。")
+            except FileNotFoundError:
+                # ak・aeと同じく、ペルソナがなくても既定の人格で動かす（オラクル自体は無効にしない）
+                print(f"[Orchestrator ERROR] ペルソナファイルが見つかりません: {persona_path}")
+                self.oracle_persona = "あなたは議論をまとめる優秀なAIです。"
 
             oracle_system_prompt = self._build_oracle_system_prompt()
-            self.oracle_chat = self.client.chats.create(model=config.MODEL_NAME)
+            prompt_profile.observe("system_prompt", oracle_system_prompt)
+            self.oracle_chat = self.client.chats.create(model=model_router.model_for("oracle"))
             print("[ORACLE INIT] システムプロンプトをGeminiに送信中...")
-            initial_response = self.oracle_chat.send_message(oracle_system_prompt)
+            initial_response = self.oracle_chat.send_message(str(oracle_system_prompt))
             print(f"[ORACLE INIT] システムプロンプト設定完了。AIからの初期応答: {initial_response.text[:100]}...")
         except Exception as e:
             print(f"[Orchestrator ERROR] オラクル用AIの初期化に失敗: {e}")
@@ -49,56 +76,215 @@ class Orchestrator:
 
     # ★★★★★ ここからが今回の主要な修正箇所 ★★★★★
 
-    def run_multi_agent_session_stream(self, user_message: str):
+    def run_multi_agent_session_stream(self, user_message: str, user_id: str = None):
         """
         オラクルが最初にユーザーの意図を解釈し、
         最適なワークフロー（シングル or マルチ）に処理を委任する。
+        会話履歴・配置案・チャットセッションはuser_idの会話（conversations）ごとに持つので、別のユーザーのターンとは互いに待たない。
         """
-        self.chat_history.append({"role": "user", "content": user_message})
+        conversation = self.conversations.get(user_id)
+        conversation.history.append({"role": "user", "content": user_message})
+        turn_token = metrics.start_turn()
+
+        # 直前の議論で出した配置案への了承なら、LLMを使わずにそのまま登録する
+        if conversation.pending_schedule and APPLY_SCHEDULE_PATTERN.search(user_message):
+            final_answer = ""
+            yield from self._wait_turn(conversation)
+            try:
+                for result in self._apply_pending_schedule(conversation):
+                    yield result
+                    if result.get("status") == "final_answer":
+                        final_answer = result.get("message")
+            finally:
+                conversation.turn.release()
+            conversation.history.append({"role": "model", "content": final_answer})
+            metrics.end_turn(turn_token, "apply_schedule")
+            return
 
         # --- ステージ0: メタ認知（ワークフローの決定） ---
         yield {"status": "thinking", "speaker": "oracle", "message": "（どのようなご用件か、確認しています...）"}
 
         workflow_decision_prompt = self._build_workflow_decision_prompt(user_message)
-        
+
+        # ワークフロー判断を待つ間に、メッセージから推定した期間の予定を先読みしておく
+        prefetch = None
+        if config.SPECULATIVE_PREFETCH:
+            try:
+                prefetch = SpeculativePrefetch(*self._get_time_range_from_message(user_message))
+            except Exception as e:
+                print(f"[ORCHESTRATOR] 予定の先読みを開始できませんでした: {e}")
+
+        # --- ステージ1以降: 選択されたワークフローの実行 ---
+        # ジェネレータを最後まで実行し、最終応答を履歴に追加する
+        final_answer = ""
+        workflow = "workflow_decision"
+        holds_turn = False
+        try:
+            workflow = self._decide_workflow(workflow_decision_prompt)
+
+            # 予定の確認は会話の状態を使わないので、同じ会話の長いターン（議論など）を待たずに実行する
+            if workflow != "simple_listing":
+                yield from self._wait_turn(conversation)
+                holds_turn = True
+
+            if workflow == "simple_listing":
+                flow_generator = self._run_simple_listing_flow(user_message, prefetch)
+            elif workflow == "multi_agent_discussion":
+                flow_generator = self._run_multi_agent_flow(user_message, conversation)
+            else: # "single_agent_react" または不明な場合
+                flow_generator = self._run_single_agent_react_flow(user_message, conversation, prefetch)
+
+            for result in flow_generator:
+                yield result
+                if result.get("status") == "final_answer":
+                    final_answer = result.get("message")
+        except (GeneratorExit, cancellation.Cancelled):
+            # クライアントが切断してストリームが閉じられた。実行中のフローもここで閉じ、以降のステップは実行しない
+            self._record_cancelled_turn(turn_token, workflow)
+            raise
+        finally:
+            if holds_turn:
+                conversation.turn.release()
+            if prefetch:
+                prefetch.discard()
+
+        # 最終的なAIの応答も履歴に追加
+        # speaker情報はresultから取得できるとさらに良い
+        conversation.history.append({"role": "model", "content": final_answer})
+
+        llm_calls = metrics.end_turn(turn_token, workflow)
+        print(f"[METRICS] このターンのLLM呼び出し: {sum(llm_calls.values())}回 {llm_calls}")
+
+    async def arun_multi_agent_session_stream(self, user_message: str, user_id: str = None):
+        """
+        run_multi_agent_session_streamのasyncio版（asgi.pyのサーバーが使う）。
+        LLMの応答・予定の取得・同じ会話の順番をイベントループ上で待つため、待ち時間の間スレッドを占有しない。
+        """
+        conversation = self.conversations.get(user_id)
+        conversation.history.append({"role": "user", "content": user_message})
+        turn_token = metrics.start_turn()
+
+        if conversation.pending_schedule and APPLY_SCHEDULE_PATTERN.search(user_message):
+            final_answer = ""
+            async for result in self._await_turn(conversation):
+                yield result
+            try:
+                async for result in async_bridge.iterate_in_thread(lambda: self._apply_pending_schedule(conversation)):
+                    yield result
+                    if result.get("status") == "final_answer":
+                        final_answer = result.get("message")
+            finally:
+                conversation.turn.release()
+            conversation.history.append({"role": "model", "content": final_answer})
+            metrics.end_turn(turn_token, "apply_schedule")
+            return
+
+        yield {"status": "thinking", "speaker": "oracle", "message": "（どのようなご用件か、確認しています...）"}
+
+        workflow_decision_prompt = self._build_workflow_decision_prompt(user_message)
+
+        # ワークフロー判断を待つ間に、メッセージから推定した期間の予定を先読みしておく
+        prefetch = None
+        if config.SPECULATIVE_PREFETCH:
+            try:
+                prefetch = AsyncSpeculativePrefetch(*self._get_time_range_from_message(user_message))
+            except Exception as e:
+                print(f"[ORCHESTRATOR] 予定の先読みを開始できませんでした: {e}")
+
+        # 判断の途中で切断された場合も、使われなかった先読みを取り消す
+        final_answer = ""
+        workflow = "workflow_decision"
+        holds_turn = False
+        try:
+            workflow = await self._adecide_workflow(workflow_decision_prompt)
+
+            if workflow != "simple_listing":
+                async for result in self._await_turn(conversation):
+                    yield result
+                holds_turn = True
+
+            if workflow == "simple_listing":
+                flow_generator = self._arun_simple_listing_flow(user_message, prefetch)
+            elif workflow == "multi_agent_discussion":
+                flow_generator = self._arun_multi_agent_flow(user_message, conversation)
+            else:
+                flow_generator = self._arun_single_agent_react_flow(user_message, conversation, prefetch)
+
+            async for result in flow_generator:
+                yield result
+                if result.get("status") == "final_answer":
+                    final_answer = result.get("message")
+        except (asyncio.CancelledError, GeneratorExit, cancellation.Cancelled):
+            self._record_cancelled_turn(turn_token, workflow)
+            raise
+        finally:
+            if holds_turn:
+                conversation.turn.release()
+            if prefetch:
+                prefetch.discard()
+
+        conversation.history.append({"role": "model", "content": final_answer})
+
+        llm_calls = metrics.end_turn(turn_token, workflow)
+        print(f"[METRICS] このターンのLLM呼び出し: {sum(llm_calls.values())}回 {llm_calls}")
+
+    def _wait_turn(self, conversation: Conversation):
+        """同じ会話で状態を使うターンを1つずつにする。前のターンを待つ場合は、その旨を進捗として返す"""
+        if not conversation.turn.try_acquire():
+            metrics.incr("turn_waits")
+            yield TURN_WAIT_EVENT
+            conversation.turn.acquire()
+
+    async def _await_turn(self, conversation: Conversation):
+        """_wait_turnのasyncio版（待つ間スレッドを占有しない）"""
+        if not conversation.turn.try_acquire():
+            metrics.incr("turn_waits")
+            yield TURN_WAIT_EVENT
+            await conversation.turn.acquire_async()
+
+    def _decide_workflow(self, workflow_decision_prompt: str) -> str:
+        """オラクルにワークフローを判断させる。判断できなければReActにフォールバックする"""
         print("\n[ORCHESTRATOR] >> オラクルにワークフローの判断を要請...")
         try:
             if not self.oracle_chat: raise Exception("オラクルのチャットセッションが初期化されていません。")
             
             # ワークフロー判断専用のチャットセッションを使うのが安全
-            decision_chat = self.client.chats.create(model=config.MODEL_NAME)
-            decision_response = decision_chat.send_message(workflow_decision_prompt)
+            # 判断はfastモデルで行い、ワークフロー名を一意に読み取れない場合だけproに昇格する
+            def send_decision(model: str, prompt: str):
+                return prompt_templates.send(self.client, model, prompt)
+            decision_text = model_router.cascade("workflow_decision", workflow_decision_prompt, send_decision, accept=self._is_confident_decision)
             
-            workflow = self._parse_workflow_decision(decision_response.text)
+            workflow = self._parse_workflow_decision(decision_text)
             print(f"[ORCHESTRATOR] << オラクルの判断: '{workflow}' ワークフローを選択します。")
+            return workflow
         except Exception as e:
             print(f"[Orchestrator ERROR] ワークフロー判断中にエラー: {e}")
-            workflow = "single_agent_react" # エラー時は安全なReActモードにフォールバック
+            return "single_agent_react" # エラー時は安全なReActモードにフォールバック
 
-        # --- ステージ1以降: 選択されたワークフローの実行 ---
-        # ジェネレータを最後まで実行し、最終応答を履歴に追加する
-        final_answer = ""
-        flow_generator = None
-        
-        if workflow == "simple_listing":
-            flow_generator = self._run_simple_listing_flow(user_message)
-        elif workflow == "multi_agent_discussion":
-            flow_generator = self._run_multi_agent_flow(user_message, self.chat_history)
-        else: # "single_agent_react" または不明な場合
-            flow_generator = self._run_single_agent_react_flow(user_message, self.chat_history)
-
-        for result in flow_generator:
-            yield result
-            if result.get("status") == "final_answer":
-                final_answer = result.get("message")
-        
-        # 最終的なAIの応答も履歴に追加
-        # speaker情報はresultから取得できるとさらに良い
-        self.chat_history.append({"role": "model", "content": final_answer})
+    async def _adecide_workflow(self, workflow_decision_prompt: str) -> str:
+        """オラクルにワークフローを判断させる（asyncio版）。判断できなければReActにフォールバックする"""
+        print("\n[ORCHESTRATOR] >> オラクルにワークフローの判断を要請...")
+        try:
+            if not self.oracle_chat: raise Exception("オラクルのチャットセッションが初期化されていません。")
+            async def send_decision(model: str, prompt: str):
+                return await prompt_templates.asend(self.client, model, prompt)
+            decision_text = await model_router.acascade("workflow_decision", workflow_decision_prompt, send_decision, accept=self._is_confident_decision)
+            workflow = self._parse_workflow_decision(decision_text)
+            print(f"[ORCHESTRATOR] << オラクルの判断: '{workflow}' ワークフローを選択します。")
+            return workflow
+        except Exception as e:
+            print(f"[Orchestrator ERROR] ワークフロー判断中にエラー: {e}")
+            return "single_agent_react"
+
+    def _record_cancelled_turn(self, turn_token, workflow: str):
+        """途中で打ち切ったターンを記録する（最終応答がないので会話履歴には追加しない）"""
+        llm_calls = metrics.end_turn(turn_token, workflow)
+        metrics.incr("cancelled_work", kind="turn", workflow=workflow)
+        print(f"[ORCHESTRATOR] クライアントが切断したため '{workflow}' の処理を打ち切りました（LLM呼び出し {sum(llm_calls.values())}回）。")
 
     def _build_workflow_decision_prompt(self, user_message: str) -> str:
         """オラクルがワークフローを決定するためのプロンプトを生成する"""
-        return f"""
+        prompt = f"""
 あなたは、ユーザーからの依頼内容を分析し、それを解決するための最適なプロセスを決定する、高次のメタ認知AI『オラクル』です。
 
 # あなたが選択できるワークフロー
@@ -112,6 +298,7 @@ class Orchestrator:
 # あなたのタスク
 上記の依頼内容を分析し、最適なワークフローは`simple_listing`、`single_agent_react`、`multi_agent_discussion`のどれかを判断し、その**単語だけ**を出力してください。思考や解説は一切不要です。
 """
+        return prompt_profile.tag(prompt, user_message=user_message)
 
     def _parse_workflow_decision(self, response_text: str) -> str:
         """AIの応答からワークフロー名を抽出する"""
@@ -122,57 +309,130 @@ class Orchestrator:
             return "multi_agent_discussion"
         return "single_agent_react"
 
-    def _run_simple_listing_flow(self, user_message: str):
+    def estimate_priority(self, user_message: str, user_id: str = None) -> str:
+        """
+        LLMを使わずに、依頼がすぐ終わる種類かを見積もる（ジョブの優先度に使う）。
+        予定の確認・配置案の了承は"high"、それ以外（操作・相談）は"normal"。
+        """
+        if self.conversations.get(user_id).pending_schedule and APPLY_SCHEDULE_PATTERN.search(user_message):
+            return "high"
+        if LISTING_PATTERN.search(user_message) and not MUTATION_PATTERN.search(user_message):
+            return "high"
+        return "normal"
+
+    def _is_confident_decision(self, response_text: str) -> bool:
+        """ワークフロー名がちょうど1つだけ含まれている場合を「確信あり」とみなす"""
+        response_lower = response_text.lower()
+        found = [w for w in ("simple_listing", "single_agent_react", "multi_agent_discussion") if w in response_lower]
+        return len(found) == 1
+
+    def _run_simple_listing_flow(self, user_message: str, prefetch: SpeculativePrefetch = None):
         """【高速ルート】機械的な予定取得 ＋ AIによるコメント生成"""
         yield {"status": "tool_running", "speaker": "ak", "message": "承知しました。カレンダーを確認します。"}
         try:
             start_time, end_time = self._get_time_range_from_message(user_message)
-            events_json_str = tools.list_calendar_events(start_time=start_time, end_time=end_time)
+            events_json_str = prefetch.take(start_time, end_time) if prefetch else None
+            if events_json_str is None:
+                events_json_str = tools.list_calendar_events(start_time=start_time, end_time=end_time)
             
-            comment_prompt = f"カレンダーを確認したところ、以下の予定が見つかりました。\n{events_json_str}\n\nこの予定リストを基に、あなたのペルソナ（司令塔アーク）として、ユーザーへの報告と、気の利いたアドバイスを生成してください。"
-            final_message = self.agents["ak"].generate_final_response(comment_prompt)
+            final_message = self.agents["ak"].generate_final_response(self._build_listing_comment_prompt(events_json_str))
             yield {"status": "final_answer", "speaker": "ak", "message": final_message}
         except Exception as e:
             yield {"status": "error", "speaker": "system", "message": "予定の確認中にエラーが発生しました。"}
         return
 
-    def _run_single_agent_react_flow(self, user_message: str, history: list):
+    async def _arun_simple_listing_flow(self, user_message: str, prefetch: AsyncSpeculativePrefetch = None):
+        """_run_simple_listing_flowのasyncio版"""
+        yield {"status": "tool_running", "speaker": "ak", "message": "承知しました。カレンダーを確認します。"}
+        try:
+            start_time, end_time = self._get_time_range_from_message(user_message)
+            events_json_str = await prefetch.atake(start_time, end_time) if prefetch else None
+            if events_json_str is None:
+                events_json_str = await tools.alist_calendar_events(start_time=start_time, end_time=end_time)
+            final_message = await self.agents["ak"].agenerate_final_response(self._build_listing_comment_prompt(events_json_str))
+            yield {"status": "final_answer", "speaker": "ak", "message": final_message}
+        except Exception as e:
+            print(f"[ORCHESTRATOR] 予定の確認中にエラー: {e}")
+            yield {"status": "error", "speaker": "system", "message": "予定の確認中にエラーが発生しました。"}
+
+    def _build_listing_comment_prompt(self, events_json_str: str) -> str:
+        events_text = tool_format.for_prompt("list_calendar_events", events_json_str)
+        prompt = f"カレンダーを確認したところ、以下の予定が見つかりました。\n{events_text}\n\nこの予定リストを基に、あなたのペルソナ（司令塔アーク）として、ユーザーへの報告と、気の利いたアドバイスを生成してください。"
+        return prompt_profile.tag(prompt, tool_results=events_text)
+
+    def _run_single_agent_react_flow(self, user_message: str, conversation: Conversation, prefetch: SpeculativePrefetch = None):
         """【標準ルート】シングルエージェントによるReActでのタスク処理"""
         yield {"status": "thinking", "speaker": "ak", "message": "（アークが担当します...）"}
-        yield from self.agents["ak"].chat_generator(user_message, history)
-
-    def _run_multi_agent_flow(self, user_message: str, history: list):
+        agent = self.agents["ak"]
+        history = conversation.history
+        # ReActのやり取りは会話ごとのセッションに積む（他のユーザーのターンと混ざらないように）
+        chat_session = conversation.session("ak", agent.new_chat)
+        # 先読みした期間と同じ予定取得は、先読み結果で済ませる
+        tool_registry = prefetch.wrap_registry(tools.TOOL_REGISTRY) if prefetch else None
+        if config.SINGLE_AGENT_MODE == "plan_execute":
+            yield from agent.plan_and_execute_generator(user_message, history, tool_registry=tool_registry, chat_session=chat_session)
+        else:
+            yield from agent.chat_generator(user_message, history, tool_registry=tool_registry, chat_session=chat_session)
+
+    async def _arun_single_agent_react_flow(self, user_message: str, conversation: Conversation, prefetch: AsyncSpeculativePrefetch = None):
+        """_run_single_agent_react_flowのasyncio版"""
+        yield {"status": "thinking", "speaker": "ak", "message": "（アークが担当します...）"}
+        agent = self.agents["ak"]
+        history = conversation.history
+        chat_session = conversation.session("ak", agent.new_chat)
+        # 先読みした期間と同じ予定取得は、先読み結果で済ませる（スレッドで動くReActからも使える）
+        tool_registry = prefetch.wrap_registry(tools.TOOL_REGISTRY) if prefetch else None
+        async_tool_registry = prefetch.wrap_async_registry(tools.ASYNC_TOOL_REGISTRY) if prefetch else None
+        if config.SINGLE_AGENT_MODE == "plan_execute":
+            async for result in agent.aplan_and_execute_generator(user_message, history, tool_registry=tool_registry,
+                                                                  async_tool_registry=async_tool_registry, chat_session=chat_session):
+                yield result
+        else:
+            async for result in async_bridge.iterate_in_thread(
+                    lambda: agent.chat_generator(user_message, history, tool_registry=tool_registry, chat_session=chat_session)):
+                yield result
+
+    def _run_multi_agent_flow(self, user_message: str, conversation: Conversation):
         """【議論ルート】複数エージェントによる協調的なアイデア出し"""
         yield {"status": "thinking", "speaker": "orchestrator", "message": "（みんなで考えています...）"}
+        history = conversation.history
         
-        facts = "（特に追加の事実情報はありません）" # 事実確認は一旦省略
+        # 事実確認はLLMを使わず、事前に作成済みのカレンダー要約を渡す（追加の待ち時間なし）
+        facts = self.calendar_digest.render() if self.calendar_digest else "（特に追加の事実情報はありません）"
         
         opinions = {}
+        proposed_tasks = []
         for name, agent in self.agents.items():
             # ★★★ バックログ出力（復活） ★★★
             print(f"\n[ORCHESTRATOR] >> エージェント '{name}' に意見を要請...")
-            idea_context = f"これまでの会話履歴:\n{history}\n\n事実確認の結果:\n{facts}\n\nこの状況を踏まえ、「{user_message}」に対する最高のアイデアを提案してください。"
+            idea_context = prompt_profile.tag(
+                f"これまでの会話履歴:\n{history}\n\n事実確認の結果:\n{facts}\n\nこの状況を踏まえ、「{user_message}」に対する最高のアイデアを提案してください。",
+                history=str(history), facts=facts, user_message=user_message,
+            )
             
             idea_set = agent.get_initial_idea(idea_context)
             
             full_opinion = idea_set.get("for_oracle", "")
             opinions[name] = full_opinion
+            if isinstance(idea_set.get("tasks"), list):
+                proposed_tasks.extend(t for t in idea_set["tasks"] if isinstance(t, dict) and t.get("title"))
             # ★★★ バックログ出力（復活） ★★★
             print(f"[ORCHESTRATOR] << エージェント '{name}' の詳細な意見(for_oracle):\n---\n{full_opinion}\n---")
             
             ui_summary = idea_set.get("for_ui", "")
             yield {"status": "agent_opinion", "speaker": name, "message": ui_summary}
 
+        proposal_text = self._build_schedule_proposal(conversation, user_message, proposed_tasks)
+
         yield {"status": "thinking", "speaker": "oracle", "message": "（オラクルが神託を準備しています...）"}
         
         # ★★★ ここで history を渡すようにする ★★★
-        oracle_prompt = self._build_oracle_prompt(user_message, facts, opinions, history)
+        oracle_prompt = self._build_oracle_prompt(user_message, facts, opinions, history, proposal_text)
         # ★★★ バックログ出力（復活） ★★★
         print(f"\n[ORCHESTRATOR] >> オラクルへの最終指示:\n---\n{oracle_prompt}\n---")
         
         try:
-            response = self.oracle_chat.send_message(oracle_prompt)
-            final_message = response.text
+            final_message = model_router.send_on_session("oracle", self._oracle_chat(conversation), oracle_prompt)
             # ★★★ バックログ出力（復活） ★★★
             print(f"\n[ORCHESTRATOR] << オラクルからの最終応答:\n---\n{final_message}\n---")
         except Exception as e:
@@ -181,20 +441,140 @@ class Orchestrator:
         yield {"status": "final_answer", "speaker": "oracle", "message": final_message}
         return
 
+    async def _arun_multi_agent_flow(self, user_message: str, conversation: Conversation):
+        """_run_multi_agent_flowのasyncio版。各エージェントの意見は互いに独立しているので、同時に問い合わせる"""
+        yield {"status": "thinking", "speaker": "orchestrator", "message": "（みんなで考えています...）"}
+        history = conversation.history
+
+        facts = self.calendar_digest.render() if self.calendar_digest else "（特に追加の事実情報はありません）"
+        idea_context = prompt_profile.tag(
+            f"これまでの会話履歴:\n{history}\n\n事実確認の結果:\n{facts}\n\nこの状況を踏まえ、「{user_message}」に対する最高のアイデアを提案してください。",
+            history=str(history), facts=facts, user_message=user_message,
+        )
+        print(f"\n[ORCHESTRATOR] >> エージェント {list(self.agents)} に意見を要請...")
+        idea_sets = await asyncio.gather(*(agent.aget_initial_idea(idea_context) for agent in self.agents.values()))
+
+        opinions = {}
+        proposed_tasks = []
+        for name, idea_set in zip(self.agents, idea_sets):
+            full_opinion = idea_set.get("for_oracle", "")
+            opinions[name] = full_opinion
+            if isinstance(idea_set.get("tasks"), list):
+                proposed_tasks.extend(t for t in idea_set["tasks"] if isinstance(t, dict) and t.get("title"))
+            print(f"[ORCHESTRATOR] << エージェント '{name}' の詳細な意見(for_oracle):\n---\n{full_opinion}\n---")
+            yield {"status": "agent_opinion", "speaker": name, "message": idea_set.get("for_ui", "")}
+
+        proposal_text = await asyncio.to_thread(self._build_schedule_proposal, conversation, user_message, proposed_tasks)
+
+        yield {"status": "thinking", "speaker": "oracle", "message": "（オラクルが神託を準備しています...）"}
+
+        oracle_prompt = self._build_oracle_prompt(user_message, facts, opinions, history, proposal_text)
+        print(f"\n[ORCHESTRATOR] >> オラクルへの最終指示:\n---\n{oracle_prompt}\n---")
+        try:
+            final_message = await model_router.asend_on_session("oracle", self._oracle_async_chat(conversation), oracle_prompt)
+            print(f"\n[ORCHESTRATOR] << オラクルからの最終応答:\n---\n{final_message}\n---")
+        except Exception as e:
+            print(f"[ORCHESTRATOR] オラクルの応答取得中にエラー: {e}")
+            final_message = "神託の受信中にノイズが混入しました。"
+
+        yield {"status": "final_answer", "speaker": "oracle", "message": final_message}
+
+    def _oracle_chat(self, conversation: Conversation):
+        """この会話のオラクルのチャットセッション（システムプロンプトを送り済みのセッションの履歴を引き継いで、初回に作る）"""
+        if not self.oracle_chat:
+            raise Exception("オラクルのチャットセッションが初期化されていません。")
+        return conversation.session("oracle", lambda: self.client.chats.create(
+            model=model_router.model_for("oracle"), history=self.oracle_chat.get_history()
+        ))
+
+    def _oracle_async_chat(self, conversation: Conversation):
+        """_oracle_chatの、非同期クライアント用のチャットセッション（asgi.pyのサーバーが使う）"""
+        if not self.oracle_chat:
+            raise Exception("オラクルのチャットセッションが初期化されていません。")
+        return conversation.session("oracle_async", lambda: self.client.aio.chats.create(
+            model=model_router.model_for("oracle"), history=self.oracle_chat.get_history()
+        ))
+
+    def _build_schedule_proposal(self, conversation: Conversation, user_message: str, proposed_tasks: list):
+        """エージェントが挙げたタスクを、空き時間に配置した具体案にする（LLMは使わない）。案の説明文を返す"""
+        conversation.pending_schedule = None
+        if not proposed_tasks:
+            return None
+        try:
+            start_time, end_time = self._get_planning_range_from_message(user_message)
+            proposal = json.loads(tools.propose_schedule(
+                self._merge_tasks(proposed_tasks), start_time, end_time, preferences=self.schedule_preferences
+            ))
+            proposal_text = schedule_optimizer.format_proposal(proposal)
+            conversation.pending_schedule = proposal["events"] or None
+            print(f"[ORCHESTRATOR] 配置案を作成しました（配置{len(proposal['placed'])}件 / 未配置{len(proposal['unplaced'])}件）:\n{proposal_text}")
+            return proposal_text
+        except Exception as e:
+            print(f"[ORCHESTRATOR] 配置案の作成に失敗しました: {e}")
+            return None
+
+    def _merge_tasks(self, tasks: list) -> list:
+        """複数エージェントが挙げたタスクを、タイトルでまとめる（優先度は高い方を採る）"""
+        merged = {}
+        for task in tasks:
+            key = re.sub(r"\s", "", str(task["title"]))
+            if key not in merged:
+                merged[key] = dict(task)
+            else:
+                merged[key]["priority"] = max(int(merged[key].get("priority") or 3), int(task.get("priority") or 3))
+        return list(merged.values())
+
+    def _get_planning_range_from_message(self, message: str) -> tuple[str, str]:
+        """配置案を作る期間。「週末」なら次の土日、「今週」「来週」ならその週、それ以外は今からN日間。"""
+        now = datetime.now(tools.JST)
+        if "週末" in message:
+            # 土日の最中なら今からその日曜まで、平日なら次の土曜から日曜まで
+            sunday = now + timedelta(days=6 - now.weekday())
+            start_dt = now if now.weekday() >= 5 else (sunday - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+            end_dt = sunday.replace(hour=23, minute=59, second=59, microsecond=0)
+            return start_dt.isoformat(), end_dt.isoformat()
+        if "今週" in message or "来週" in message:
+            start_time, end_time = self._get_time_range_from_message(message)
+            return max(start_time, now.isoformat()), end_time
+        end_dt = (now + timedelta(days=config.CALENDAR_DIGEST_DAYS - 1)).replace(hour=23, minute=59, second=59, microsecond=0)
+        return now.isoformat(), end_dt.isoformat()
+
+    def _apply_pending_schedule(self, conversation: Conversation):
+        """保留中の配置案を、重なりを確認したうえで一括登録する"""
+        events = conversation.pending_schedule
+        if not events:
+            # 順番を待つ間に、同じ会話の別のターンが登録済み
+            yield {"status": "final_answer", "speaker": "ak", "message": "登録を待っている案はありません。"}
+            return
+        yield {"status": "tool_running", "speaker": "ak", "message": f"提案の{len(events)}件をカレンダーに登録します。"}
+        result = json.loads(tools.add_calendar_events(events))
+        if result.get("status") == "success":
+            conversation.pending_schedule = None
+        # 重なりがあった場合は案を残し、ユーザーに判断してもらう
+        yield {"status": "final_answer", "speaker": "ak", "message": result.get("message", "登録しました。")}
+
     def _get_time_range_from_message(self, message: str) -> tuple[str, str]:
         """ユーザーのメッセージから「今日」「明日」などを解釈し、日時を返す"""
         # (このメソッドは変更なし)
         now = datetime.now(tools.JST)
         target_date = now
-        if "明日" in message: target_date = now + timedelta(days=1)
+        if "明後日" in message: target_date = now + timedelta(days=2)
+        elif "明日" in message: target_date = now + timedelta(days=1)
         elif "昨日" in message: target_date = now - timedelta(days=1)
+        elif "今週" in message or "来週" in message:
+            # 週単位（月曜〜日曜）で取得する
+            monday = now - timedelta(days=now.weekday())
+            if "来週" in message: monday += timedelta(days=7)
+            start_dt = monday.replace(hour=0, minute=0, second=0, microsecond=0)
+            end_dt = (monday + timedelta(days=6)).replace(hour=23, minute=59, second=59, microsecond=0)
+            return start_dt.isoformat(), end_dt.isoformat()
         start_dt = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
         end_dt = target_date.replace(hour=23, minute=59, second=59, microsecond=0)
         return start_dt.isoformat(), end_dt.isoformat()
 
     def _build_oracle_system_prompt(self) -> str:
         """オラクル用のシステムプロンプトを生成する。"""
-        return f"""
+        prompt = f"""
                 あなたは、情報管理ネットワークの空間制御プログラム『オラクル』です。あなたの役割は、下で働くAIエージェントたちの議論を俯瞰し、彼らが見落としている本質や、より高次の可能性をユーザーに指し示すことです。
 
                 # あなたのペルソナ:
@@ -206,8 +586,9 @@ class Orchestrator:
                 # 禁止事項:
                 『ツインシグナル』や『オラトリオ』といった、特定の作品に関する固有名詞は絶対に使用しないでください。
                 """
+        return prompt_profile.tag(prompt, persona=self.oracle_persona)
 
-    def _build_oracle_prompt(self, user_message: str, facts: str, opinions: dict, history: list) -> str:
+    def _build_oracle_prompt(self, user_message: str, facts: str, opinions: dict, history: list, proposal_text: str = None) -> str:
         """
         オラクルが最終応答を生成するためのプロンプト。事実確認の結果も追加。
         """
@@ -236,14 +617,19 @@ class Orchestrator:
                 # エージェントたちの議論内容:
                 {opinions_text}
 
+                # 空き時間に配置した具体案（既存の予定・締切・優先度・ユーザーの好みを考慮して計算済み）:
+                {proposal_text or "（配置案はありません）"}
+
                 # あなたの最終的なタスク:
                 上記の**事実**と**議論内容**の両方を考慮し、あなた自身のオラクルとしてのペルソナと口調で、ユーザーへの最終的な応答メッセージを生成してください。
 
                 # 出力に関する厳密なルール:
                 - 必ず、**事実（既存の予定や空き時間）に基づいた**、具体的で実行可能なアクションプランを提示してください。
+                - 配置案がある場合は、その日時をそのまま使って提示し、「この案で登録して」と返せばカレンダーに登録できることを添えてください。
                 - 思考や解説は一切含めず、完成された応答メッセージだけを出力してください。
                 """
-        return prompt
+        return prompt_profile.tag(prompt, persona=self.oracle_persona, history=history_text, user_message=user_message,
+                                  facts=facts, opinions=opinions_text, proposal=proposal_text)
 
 # from pathlib import Path
 # import os
@@ -287,7 +673,7 @@ class Orchestrator:
 #             oracle_system_prompt = self._build_oracle_system_prompt()
 #             self.oracle_chat = self.client.chats.create(model=config.MODEL_NAME)
 #             print("[ORACLE INIT] システムプロンプトをGeminiに送信中...")
-#             initial_response = self.oracle_chat.send_message(oracle_system_prompt)
+#             initial_response = self.oracle_chat.send_message(str(oracle_system_prompt))
 #             print(f"[ORACLE INIT] システムプロンプト設定完了。AIからの初期応答: {initial_response.text[:100]}...")
 #         except Exception as e:
 #             print(f"[Orchestrator ERROR] オラクル用AIの初期化に失敗: {e}")
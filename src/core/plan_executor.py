@@ -0,0 +1,242 @@
+# src/core/plan_executor.py
+import asyncio
+import contextvars
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from src.calendar_agent import tool_format
+from src.core import cancellation
+
+# Plan-and-Execute モード用の計画パーサと実行器。
+# 計画は1回のLLM呼び出しで「ツール呼び出しのDAG」として生成され、
+# ここでは依存関係を守りながら、独立したステップを並列に実行する。
+
+MAX_PLAN_STEPS = 10
+
+# "$s1.events.0.id" のように、先行ステップの結果を参照する引数
+_REFERENCE_PATTERN = re.compile(r"^\$(\w+)((?:\.[^.]+)*)$")
+
+
+class PlanError(Exception):
+    """計画の解析・実行に失敗したことを表す（呼び出し側はReActにフォールバックする）。"""
+
+    def __init__(self, message: str, results: dict = None):
+        super().__init__(message)
+        self.results = results or {}
+
+
+def parse_plan(text: str, tool_registry: dict) -> list:
+    """
+    LLMの応答から計画（ステップのリスト）を抽出し、検証する。
+
+    Args:
+        text (str): LLMの応答テキスト。{"steps": [...]} 形式のJSONを含む。
+        tool_registry (dict): ツール名→関数の対応表。
+
+    Returns:
+        list: {"id", "tool", "args", "depends_on"} を持つステップのリスト。
+    """
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        raise PlanError("応答から計画のJSONを抽出できませんでした。")
+    try:
+        plan = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        raise PlanError(f"計画のJSONが不正です: {e}")
+
+    raw_steps = plan.get("steps")
+    if not isinstance(raw_steps, list):
+        raise PlanError("計画に steps がありません。")
+    if len(raw_steps) > MAX_PLAN_STEPS:
+        raise PlanError(f"計画のステップ数が多すぎます: {len(raw_steps)}")
+
+    steps, ids = [], set()
+    for i, raw in enumerate(raw_steps):
+        if not isinstance(raw, dict):
+            raise PlanError(f"ステップ{i + 1}の形式が不正です。")
+        step_id = str(raw.get("id") or f"s{i + 1}")
+        tool_name = raw.get("tool")
+        if step_id in ids:
+            raise PlanError(f"ステップIDが重複しています: {step_id}")
+        if tool_name not in tool_registry:
+            raise PlanError(f"未対応のツールです: {tool_name}")
+        args = raw.get("args") or {}
+        if not isinstance(args, dict):
+            raise PlanError(f"ステップ {step_id} の args がJSONオブジェクトではありません。")
+        depends_on = [str(d) for d in raw.get("depends_on") or []]
+        # 引数で参照しているステップは暗黙の依存関係として扱う
+        for value in args.values():
+            ref = _REFERENCE_PATTERN.match(value) if isinstance(value, str) else None
+            if ref and ref.group(1) not in depends_on:
+                depends_on.append(ref.group(1))
+        ids.add(step_id)
+        steps.append({"id": step_id, "tool": tool_name, "args": args, "depends_on": depends_on})
+
+    for step in steps:
+        for dep in step["depends_on"]:
+            if dep not in ids:
+                raise PlanError(f"ステップ {step['id']} が存在しないステップ {dep} に依存しています。")
+    _check_acyclic(steps)
+    return steps
+
+
+def _check_acyclic(steps: list):
+    remaining = {s["id"]: set(s["depends_on"]) for s in steps}
+    while remaining:
+        ready = [sid for sid, deps in remaining.items() if not deps]
+        if not ready:
+            raise PlanError(f"計画に循環依存があります: {sorted(remaining)}")
+        for sid in ready:
+            del remaining[sid]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+
+def _resolve_args(args: dict, results: dict) -> dict:
+    """"$s1.events.0.id" 形式の参照を、先行ステップの結果で置き換える。"""
+    resolved = {}
+    for key, value in args.items():
+        ref = _REFERENCE_PATTERN.match(value) if isinstance(value, str) else None
+        if not ref:
+            resolved[key] = value
+            continue
+        step_id, path = ref.group(1), ref.group(2)
+        try:
+            current = json.loads(results[step_id])
+            for part in filter(None, path.split(".")):
+                current = current[int(part)] if isinstance(current, list) else current[part]
+        except (KeyError, IndexError, ValueError, TypeError) as e:
+            raise PlanError(f"参照 {value} を解決できませんでした: {e}", results)
+        resolved[key] = current
+    return resolved
+
+
+def _is_error_result(result: str) -> bool:
+    try:
+        parsed = json.loads(result)
+    except (json.JSONDecodeError, TypeError):
+        return False
+    return isinstance(parsed, dict) and parsed.get("status") in ("error", "conflict")
+
+
+def _merge_finished(running: dict, results: dict):
+    """
+    失敗で打ち切ったときに、並列で実行中だったステップの結果もresultsに含める。
+    （呼び出し側のReActへの引き継ぎで、実行済みのステップ、特に予定の追加を二度実行しないように）
+    futureはすべて完了済み（または完了を待ってよいもの）として渡す。
+    """
+    for future, step_id in running.items():
+        if future.cancelled():
+            continue
+        try:
+            results[step_id] = future.result()
+        except Exception:
+            # 失敗したステップは実行済みとして扱わない
+            pass
+
+
+def execute_plan(steps: list, tool_registry: dict, max_workers: int = 4) -> dict:
+    """
+    依存関係を満たしたステップから順に、スレッドプールで並列実行する。
+
+    Returns:
+        dict: ステップID→ツール実行結果（文字列）。
+    """
+    results = {}
+    pending = {s["id"]: s for s in steps}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while pending or running:
+                for step_id, step in list(pending.items()):
+                    if all(dep in results for dep in step["depends_on"]):
+                        # 要求元が切断していれば、残りのステップは実行しない
+                        cancellation.check("plan_step", tool=step["tool"])
+                        args = _resolve_args(step["args"], results)
+                        print(f"[PLAN] ステップ {step_id} を実行: {step['tool']} {args}")
+                        # 呼び出し元のユーザー（レート制限の単位）などのコンテキストを引き継いで実行する
+                        running[executor.submit(contextvars.copy_context().run, tool_registry[step["tool"]], **args)] = step_id
+                        del pending[step_id]
+                if not running:
+                    raise PlanError("実行可能なステップがありません。", results)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step_id = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        raise PlanError(f"ステップ {step_id} の実行に失敗しました: {e}", results)
+                    results[step_id] = result
+                    if _is_error_result(result):
+                        raise PlanError(f"ステップ {step_id} がエラーを返しました: {result}", results)
+        except PlanError as e:
+            # 実行中のステップは止められないので、完了を待ってその結果も引き継ぐ
+            _merge_finished(running, e.results)
+            raise
+    return results
+
+
+async def aexecute_plan(steps: list, tool_registry: dict, async_registry: dict = None) -> dict:
+    """
+    execute_planのasyncio版。asyncio版の実装があるツールはイベントループ上で待ち、
+    それ以外はスレッドで実行する（コンテキストはasyncio.to_threadが引き継ぐ）。
+
+    Returns:
+        dict: ステップID→ツール実行結果（文字列）。
+    """
+    async_registry = async_registry or {}
+    results = {}
+    pending = {s["id"]: s for s in steps}
+    running = {}
+
+    try:
+        while pending or running:
+            for step_id, step in list(pending.items()):
+                if all(dep in results for dep in step["depends_on"]):
+                    cancellation.check("plan_step", tool=step["tool"])
+                    args = _resolve_args(step["args"], results)
+                    print(f"[PLAN] ステップ {step_id} を実行: {step['tool']} {args}")
+                    if step["tool"] in async_registry:
+                        call = async_registry[step["tool"]](**args)
+                    else:
+                        call = asyncio.to_thread(tool_registry[step["tool"]], **args)
+                    running[asyncio.ensure_future(call)] = step_id
+                    del pending[step_id]
+            if not running:
+                raise PlanError("実行可能なステップがありません。", results)
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                step_id = running.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    raise PlanError(f"ステップ {step_id} の実行に失敗しました: {e}", results)
+                results[step_id] = result
+                if _is_error_result(result):
+                    raise PlanError(f"ステップ {step_id} がエラーを返しました: {result}", results)
+    except PlanError as e:
+        # スレッドで実行中のステップは取り消しても止まらないので、取り消さずに完了を待ち、その結果も引き継ぐ
+        if running:
+            await asyncio.wait(running)
+            _merge_finished(running, e.results)
+            running.clear()
+        raise
+    finally:
+        # 要求元の切断などで打ち切るときは、実行中のステップを取り消す
+        for task in running:
+            task.cancel()
+    return results
+
+
+def format_results(steps: list, results: dict) -> str:
+    """実行結果を合成（synthesis）プロンプトに埋め込む形式に整形する（各結果はツールごとのコンパクトな形式にする）。"""
+    lines = []
+    for step in steps:
+        if step["id"] in results:
+            result = tool_format.for_prompt(step["tool"], results[step["id"]])
+            lines.append(f"[{step['id']}] {step['tool']}({json.dumps(step['args'], ensure_ascii=False)})\n{result}")
+    return "\n\n".join(lines) if lines else "（ツールは実行されていません）"
@@ -0,0 +1,124 @@
+# src/core/prefetch.py
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from src.calendar_agent import tools
+from src.core import metrics
+
+# ワークフロー判断（LLM呼び出し）を待っている間にカレンダーが遊ばないよう、
+# メッセージから推定した期間の予定取得を先に走らせておく（投機的実行）。
+# 選ばれたフローが同じ期間を取得しようとした場合だけ結果を渡し、使われなければ捨てる。
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+
+
+class SpeculativePrefetch:
+    def __init__(self, start_time: str, end_time: str):
+        self.start_time = tools._parse_datetime_str(start_time, is_end_time=False)
+        self.end_time = tools._parse_datetime_str(end_time, is_end_time=True)
+        self.calendar_version = tools.calendar_version()
+        self.used = False
+        self.future = _executor.submit(contextvars.copy_context().run, tools.list_calendar_events, self.start_time, self.end_time)
+        metrics.incr("prefetch_started")
+        print(f"[PREFETCH] 予定の先読みを開始: {self.start_time} - {self.end_time}")
+
+    def matches(self, start_time: str, end_time: str) -> bool:
+        """同じ期間の取得要求であり、先読み開始後にカレンダーが変更されていないか"""
+        return (
+            tools._parse_datetime_str(start_time, is_end_time=False) == self.start_time
+            and tools._parse_datetime_str(end_time, is_end_time=True) == self.end_time
+            and tools.calendar_version() == self.calendar_version
+        )
+
+    def take(self, start_time: str, end_time: str):
+        """期間が一致すれば先読み結果を返す。一致しない・失敗した場合はNone。"""
+        if not self.matches(start_time, end_time):
+            metrics.incr("prefetch_misses")
+            return None
+        try:
+            result = self.future.result()
+        except Exception as e:
+            print(f"[PREFETCH] 先読みに失敗していたため通常どおり取得します: {e}")
+            metrics.incr("prefetch_errors")
+            return None
+        self.used = True
+        metrics.incr("prefetch_hits")
+        print("[PREFETCH] 先読み結果を使用します。")
+        return result
+
+    def wrap_registry(self, tool_registry: dict) -> dict:
+        """list_calendar_eventsを先読み結果優先の版に差し替えたツール表を返す。"""
+        def list_calendar_events(start_time: str, end_time: str) -> str:
+            result = self.take(start_time, end_time)
+            return result if result is not None else tool_registry["list_calendar_events"](start_time, end_time)
+        return {**tool_registry, "list_calendar_events": list_calendar_events}
+
+    def discard(self):
+        """ターン終了時に呼ぶ。使われなかった先読みを記録し、未着手なら取り消す。"""
+        if not self.used:
+            self.future.cancel()
+            metrics.incr("prefetch_wasted")
+
+
+class AsyncSpeculativePrefetch:
+    """
+    SpeculativePrefetchのasyncio版（asgi.pyのサーバーが使う）。先読みはイベントループ上のタスクで行い、
+    記録するメトリクス（prefetch_started/hits/misses/errors/wasted）は同じ。
+    """
+
+    def __init__(self, start_time: str, end_time: str):
+        self.start_time = tools._parse_datetime_str(start_time, is_end_time=False)
+        self.end_time = tools._parse_datetime_str(end_time, is_end_time=True)
+        self.calendar_version = tools.calendar_version()
+        self.used = False
+        self.loop = asyncio.get_running_loop()
+        self.future = asyncio.ensure_future(tools.alist_calendar_events(self.start_time, self.end_time))
+        # 使われずに失敗した場合も、未取得の例外として警告されないようにする
+        self.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        metrics.incr("prefetch_started")
+        print(f"[PREFETCH] 予定の先読みを開始: {self.start_time} - {self.end_time}")
+
+    def matches(self, start_time: str, end_time: str) -> bool:
+        """同じ期間の取得要求であり、先読み開始後にカレンダーが変更されていないか"""
+        return (
+            tools._parse_datetime_str(start_time, is_end_time=False) == self.start_time
+            and tools._parse_datetime_str(end_time, is_end_time=True) == self.end_time
+            and tools.calendar_version() == self.calendar_version
+        )
+
+    async def atake(self, start_time: str, end_time: str):
+        """期間が一致すれば先読み結果を返す。一致しない・失敗した場合はNone。"""
+        if not self.matches(start_time, end_time):
+            metrics.incr("prefetch_misses")
+            return None
+        try:
+            result = await asyncio.shield(self.future)
+        except Exception as e:
+            print(f"[PREFETCH] 先読みに失敗していたため通常どおり取得します: {e}")
+            metrics.incr("prefetch_errors")
+            return None
+        self.used = True
+        metrics.incr("prefetch_hits")
+        print("[PREFETCH] 先読み結果を使用します。")
+        return result
+
+    def wrap_async_registry(self, async_tool_registry: dict) -> dict:
+        """list_calendar_eventsを先読み結果優先の版に差し替えた、asyncio版のツール表を返す。"""
+        async def alist_calendar_events(start_time: str, end_time: str) -> str:
+            result = await self.atake(start_time, end_time)
+            return result if result is not None else await async_tool_registry["list_calendar_events"](start_time, end_time)
+        return {**async_tool_registry, "list_calendar_events": alist_calendar_events}
+
+    def wrap_registry(self, tool_registry: dict) -> dict:
+        """スレッドで動くReActのためのツール表。先読み結果はイベントループから受け取る。"""
+        def list_calendar_events(start_time: str, end_time: str) -> str:
+            result = asyncio.run_coroutine_threadsafe(self.atake(start_time, end_time), self.loop).result()
+            return result if result is not None else tool_registry["list_calendar_events"](start_time, end_time)
+        return {**tool_registry, "list_calendar_events": list_calendar_events}
+
+    def discard(self):
+        """ターン終了時（打ち切り時も含む）に呼ぶ。使われなかった先読みを記録し、取得中なら取り消す。"""
+        if not self.used:
+            self.future.cancel()
+            metrics.incr("prefetch_wasted")
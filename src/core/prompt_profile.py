@@ -0,0 +1,143 @@
+# src/core/prompt_profile.py
+import threading
+from collections import defaultdict
+
+import config
+from src.core import metrics
+
+# プロンプトのどの部分（ペルソナ・ユーザープロファイル・履歴・ツール結果・指示文など）がトークンを使っているかを測る。
+# プロンプトを組み立てる側（_build_*_prompt）が、埋め込んだ部分にtag()で名前を付けて返す（中身はただの文字列）。
+# LLMを実際に呼び出すたびに（model_routerから）observe()し、部分ごとのトークン数の見積もりを呼び出し箇所ごとに集計する。
+# 名前を付けていない残り（テンプレートの固定文・書式の指示）は"instructions"、チャットセッションに積まれた過去の
+# やり取り（毎回一緒に送られる）は"session_history"として数える。見積もりの合計が予算を超えたら記録・警告する。
+
+INSTRUCTIONS = "instructions"
+SESSION_HISTORY = "session_history"
+
+# トークン数の見積もり（ローカルで計算する概算）。Geminiのトークナイザでは、英数字は4文字程度で1トークン、
+# 日本語などASCII以外の文字は1文字あたり1トークン弱になるため、予算の判定が甘くならないよう多めに見積もる
+ASCII_CHARS_PER_TOKEN = 4
+NON_ASCII_TOKENS_PER_CHAR = 1.0
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return round(ascii_chars / ASCII_CHARS_PER_TOKEN + (len(text) - ascii_chars) * NON_ASCII_TOKENS_PER_CHAR)
+
+
+class Prompt(str):
+    """部分ごとの名前（sections: 名前→その部分の文字列のリスト）を持つプロンプト。文字列としてはそのまま使える"""
+    sections = {}
+
+
+def tag(text: str, **sections) -> Prompt:
+    """
+    textに埋め込んだ部分に名前を付ける。値がtag済みのPromptなら、その内訳を引き継ぐ。
+
+    Example:
+        tag(prompt, persona=self.persona, user_profile=self.user_profile, context=context)
+    """
+    prompt = Prompt(text)
+    merged = defaultdict(list)
+    for name, value in sections.items():
+        if not value:
+            continue
+        if isinstance(value, Prompt) and value.sections:
+            for inner_name, pieces in value.sections.items():
+                merged[inner_name].extend(pieces)
+        else:
+            merged[name].append(str(value))
+    prompt.sections = dict(merged)
+    return prompt
+
+
+def append(prompt: str, section: str, text: str) -> Prompt:
+    """promptの末尾にtextを足し、足した部分にsectionの名前を付ける（ReActループで結果を積み上げるとき用）"""
+    base = getattr(prompt, "sections", {})
+    result = tag(prompt + text)
+    result.sections = {name: list(pieces) for name, pieces in base.items()}
+    result.sections.setdefault(section, []).append(text)
+    return result
+
+
+def breakdown(prompt: str, session=None) -> dict:
+    """部分ごとのトークン数の見積もり。sessionを渡すと、そのチャットセッションの過去のやり取りも含める"""
+    counts = {name: sum(estimate_tokens(piece) for piece in pieces) for name, pieces in getattr(prompt, "sections", {}).items()}
+    counts[INSTRUCTIONS] = max(0, estimate_tokens(prompt) - sum(counts.values()))
+    history = _session_history_tokens(session)
+    if history:
+        counts[SESSION_HISTORY] = history
+    return counts
+
+
+def _session_history_tokens(session) -> int:
+    get_history = getattr(session, "get_history", None)
+    if get_history is None:
+        return 0
+    try:
+        return sum(estimate_tokens(getattr(part, "text", None) or "")
+                   for content in get_history() for part in (getattr(content, "parts", None) or []))
+    except Exception:
+        return 0
+
+
+def budget_for(call_site: str) -> int:
+    return config.PROMPT_TOKEN_BUDGETS.get(call_site, config.PROMPT_TOKEN_BUDGET_DEFAULT)
+
+
+class PromptProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}   # call_site -> {"calls", "total", "max", "over_budget", "sections": {名前: 合計}}
+
+    def observe(self, call_site: str, prompt: str, session=None) -> dict:
+        """1回の呼び出しで送るプロンプトの内訳を記録し、返す"""
+        counts = breakdown(prompt, session)
+        total = sum(counts.values())
+        budget = budget_for(call_site)
+        with self._lock:
+            stat = self._stats.setdefault(call_site, {"calls": 0, "total": 0, "max": 0, "over_budget": 0, "sections": defaultdict(int)})
+            stat["calls"] += 1
+            stat["total"] += total
+            stat["max"] = max(stat["max"], total)
+            for name, tokens in counts.items():
+                stat["sections"][name] += tokens
+            if total > budget:
+                stat["over_budget"] += 1
+        metrics.observe("prompt_tokens_estimate", total, call_site=call_site)
+        if total > budget:
+            metrics.incr("prompt_over_budget", call_site=call_site)
+            top = ", ".join(f"{name}={tokens}" for name, tokens in sorted(counts.items(), key=lambda x: -x[1])[:3])
+            print(f"[PROMPT] {call_site}: 見積もり {total} トークンが予算 {budget} を超えています（上位: {top}）")
+        return counts
+
+    def report(self) -> dict:
+        """呼び出し箇所ごとの平均・最大トークン数と、部分ごとの平均・割合（大きい順）"""
+        with self._lock:
+            result = {}
+            for call_site, stat in sorted(self._stats.items()):
+                sections = sorted(stat["sections"].items(), key=lambda x: -x[1])
+                result[call_site] = {
+                    "calls": stat["calls"],
+                    "avg_tokens": round(stat["total"] / stat["calls"]),
+                    "max_tokens": stat["max"],
+                    "budget": budget_for(call_site),
+                    "over_budget": stat["over_budget"],
+                    "sections": [
+                        {"section": name, "avg_tokens": round(tokens / stat["calls"]),
+                         "share": round(tokens / stat["total"], 3) if stat["total"] else 0.0}
+                        for name, tokens in sections
+                    ],
+                }
+            return result
+
+
+# プロセス全体で共有する集計
+profiler = PromptProfiler()
+
+
+def observe(call_site: str, prompt: str, session=None):
+    if config.PROMPT_PROFILE_ENABLED:
+        profiler.observe(call_site, prompt, session)
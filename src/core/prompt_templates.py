@@ -0,0 +1,310 @@
+# src/core/prompt_templates.py
+import asyncio
+import hashlib
+import string
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import config
+from src.core import metrics, prompt_profile, resilience, gemini_pool, model_router
+
+# プロンプトのテンプレートを、呼び出しごとに変わらない「静的な前置き」（ペルソナ・ユーザープロファイル・
+# ツール説明・指示文）と、呼び出しごとの部分（状況・ツール結果・依頼など）に分けて扱う。
+# - テンプレートは作成時に1回だけ解析しておき（str.formatの書式。{{ }}は波括弧そのもの）、描画は連結だけで済ませる
+# - 前置きは、所有者（エージェント）と埋め込む値の版（ハッシュ）ごとに1回だけ描画して使い回す
+# - 前置きが十分に長ければ、Geminiの明示的なコンテキストキャッシュ（cachedContents）として登録し、
+#   以降の呼び出しでは呼び出しごとの部分だけを送る（前置きはキャッシュ済みのトークンとして安く課金される）。
+#   短すぎる前置きや、キャッシュを作れなかった場合は、従来どおり全文を送る
+# 前置きを常にプロンプトの先頭に置くので、キャッシュを使わない場合もGemini側の暗黙のキャッシュが効きやすくなる。
+
+PREFIX_CACHE_SIZE = 64
+# キャッシュを作れなかった前置きについて、作り直しを試みるまでの秒数
+CONTEXT_RETRY_SECONDS = 600
+
+
+class StaticPrefix(prompt_profile.Prompt):
+    """描画済みの静的な前置き。keyはテンプレート名・所有者・値の版から作る（コンテキストキャッシュの識別にも使う）"""
+    key = None
+    tokens = 0
+
+
+class RenderedPrompt(prompt_profile.Prompt):
+    """前置き（prefix）と呼び出しごとの部分（suffix）を連結したプロンプト。文字列としては全文"""
+    prefix = None
+    suffix = ""
+
+
+def _compile(template: str) -> list:
+    """テンプレートを (文字列, 埋め込む値の名前) の並びに解析する"""
+    pieces = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        if spec or conversion:
+            raise ValueError(f"テンプレートでは書式指定・変換は使えません: {{{field}}}")
+        pieces.append((literal, field))
+    return pieces
+
+
+def _render(pieces: list, values: dict) -> str:
+    return "".join(literal + (str(values[field]) if field else "") for literal, field in pieces)
+
+
+def _version(values: dict) -> str:
+    digest = hashlib.sha1()
+    for name in sorted(values):
+        digest.update(f"{name}\0{values[name]}\0".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+class PromptTemplate:
+    def __init__(self, name: str, static: str, dynamic: str = ""):
+        """
+        Args:
+            name (str): テンプレートの名前（前置きのキーに使う）。
+            static (str): 静的な前置きのテンプレート。
+            dynamic (str): 呼び出しごとの部分のテンプレート。
+        """
+        self.name = name
+        self._static = _compile(static)
+        self._dynamic = _compile(dynamic)
+        self.static_fields = {field for _, field in self._static if field}
+        self.dynamic_fields = {field for _, field in self._dynamic if field}
+        if self.static_fields & self.dynamic_fields:
+            raise ValueError(f"前置きと呼び出しごとの部分で同じ値を使っています: {sorted(self.static_fields & self.dynamic_fields)}")
+        self._prefixes = OrderedDict()   # (所有者, 版) -> StaticPrefix
+        self._lock = threading.Lock()
+
+    def prefix(self, owner: str, **values) -> StaticPrefix:
+        """静的な前置きを返す（所有者と値の版ごとに1回だけ描画する）"""
+        values = {name: values[name] for name in self.static_fields}
+        cache_key = (owner, _version(values))
+        with self._lock:
+            prefix = self._prefixes.get(cache_key)
+            if prefix is not None:
+                self._prefixes.move_to_end(cache_key)
+                metrics.incr("prompt_prefix_reused", template=self.name)
+                return prefix
+        prefix = StaticPrefix(_render(self._static, values))
+        prefix.sections = prompt_profile.tag(prefix, **values).sections
+        prefix.key = f"{self.name}-{owner}-{cache_key[1]}"
+        prefix.tokens = prompt_profile.estimate_tokens(prefix)
+        with self._lock:
+            self._prefixes[cache_key] = prefix
+            while len(self._prefixes) > PREFIX_CACHE_SIZE:
+                self._prefixes.popitem(last=False)
+        return prefix
+
+    def render(self, owner: str, **values) -> RenderedPrompt:
+        """
+        プロンプトを描画する。内訳（prompt_profile）には、埋め込んだ値をその名前で付ける。
+
+        Raises:
+            KeyError: テンプレートが使う値が渡されていない。
+        """
+        prefix = self.prefix(owner, **values)
+        suffix = _render(self._dynamic, values)
+        prompt = RenderedPrompt(prefix + suffix)
+        merged = prompt_profile.tag(prompt, **{name: values[name] for name in self.dynamic_fields})
+        prompt.sections = {name: list(pieces) for name, pieces in prefix.sections.items()}
+        for name, pieces in merged.sections.items():
+            prompt.sections.setdefault(name, []).extend(pieces)
+        prompt.prefix = prefix
+        prompt.suffix = suffix
+        return prompt
+
+
+class ContextCache:
+    """静的な前置きを、モデルごとにGeminiのコンテキストキャッシュとして登録・延長する"""
+
+    def __init__(self, ttl_seconds: float = 3600, min_tokens: dict = None, enabled: bool = True):
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens or {}
+        self.enabled = enabled
+        self._entries = {}   # (前置きのkey, モデル) -> {"name", "expires_at"} または {"retry_at"}
+        self._lock = threading.Lock()
+        self._create_lock = threading.Lock()
+
+    def eligible(self, model: str, prefix) -> bool:
+        if not self.enabled or not isinstance(prefix, StaticPrefix):
+            return False
+        # モデルごとの最小トークン数に届かない前置きはキャッシュできない（未登録のモデルは最大の値で判定する）
+        return prefix.tokens >= self.min_tokens.get(model, max(self.min_tokens.values(), default=0))
+
+    def _current(self, key: tuple, now: float) -> tuple:
+        """(作り直し不要か, キャッシュ名)。有効期間の残りが1/4を切ったものは延長する"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if "name" in entry:
+            return entry["expires_at"] - now > self.ttl_seconds / 4, entry["name"]
+        return now < entry["retry_at"], None
+
+    def lookup(self, client, model: str, prefix) -> str:
+        """前置きのキャッシュ名を返す。なければ作る。使えない場合はNone"""
+        if not self.eligible(model, prefix):
+            return None
+        key = (prefix.key, model)
+        with self._lock:
+            fresh, name = self._current(key, time.time())
+        if fresh:
+            return name
+        # 同じ前置きのキャッシュを同時に作らないよう、作成・延長は1つずつ行う
+        with self._create_lock:
+            with self._lock:
+                fresh, name = self._current(key, time.time())
+            if fresh:
+                return name
+            return self._store(key, client, model, prefix, name)
+
+    async def alookup(self, client, model: str, prefix) -> str:
+        """lookupのasyncio版。作成・延長が必要なときだけスレッドで行う"""
+        if not self.eligible(model, prefix):
+            return None
+        with self._lock:
+            fresh, name = self._current((prefix.key, model), time.time())
+        if fresh:
+            return name
+        return await asyncio.to_thread(self.lookup, client, model, prefix)
+
+    def _store(self, key: tuple, client, model: str, prefix: StaticPrefix, stale_name: str) -> str:
+        from google.genai import types
+
+        ttl = f"{int(self.ttl_seconds)}s"
+        name = None
+        if stale_name:
+            try:
+                resilience.gemini_api.call(lambda: client.caches.update(name=stale_name, config=types.UpdateCachedContentConfig(ttl=ttl)))
+                name = stale_name
+                metrics.incr("prompt_context_cache", event="extended")
+            except Exception as e:
+                print(f"[PROMPT CACHE] {prefix.key}（{model}）のキャッシュを延長できなかったため作り直します: {e}")
+        if name is None:
+            try:
+                cached = resilience.gemini_api.call(lambda: client.caches.create(model=model, config=types.CreateCachedContentConfig(
+                    contents=[str(prefix)], ttl=ttl, display_name=prefix.key)))
+                name = cached.name
+                metrics.incr("prompt_context_cache", event="created")
+                print(f"[PROMPT CACHE] {prefix.key}（{model}, 約{prefix.tokens}トークン）をキャッシュしました: {name}")
+            except Exception as e:
+                metrics.incr("prompt_context_cache", event="failed")
+                print(f"[PROMPT CACHE] {prefix.key}（{model}）をキャッシュできないため、前置きを毎回送ります: {e}")
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {"name": name, "expires_at": now + self.ttl_seconds} if name else {"retry_at": now + CONTEXT_RETRY_SECONDS}
+            # 期限の切れた項目を捨てる（古い版の前置きなど）
+            for stale in [k for k, e in self._entries.items() if e.get("expires_at", e.get("retry_at")) < now]:
+                del self._entries[stale]
+        return name
+
+    def invalidate(self, model: str, prefix):
+        with self._lock:
+            self._entries.pop((getattr(prefix, "key", None), model), None)
+
+
+# プロセス全体で共有するコンテキストキャッシュ
+contexts = ContextCache(
+    ttl_seconds=config.PROMPT_CONTEXT_CACHE_TTL_SECONDS,
+    min_tokens=config.PROMPT_CONTEXT_CACHE_MIN_TOKENS,
+    enabled=config.PROMPT_CONTEXT_CACHE_ENABLED,
+)
+
+
+def _is_stale_context(error: Exception) -> bool:
+    """キャッシュが期限切れ・削除済みで使えないときのエラーか（429・5xxは再試行の層に任せる）"""
+    return getattr(error, "code", None) in (400, 403, 404)
+
+
+def _cached_config(name: str):
+    from google.genai import types
+    return types.GenerateContentConfig(cached_content=name)
+
+
+def send(client, model: str, prompt: str):
+    """
+    model_router.cascadeに渡す送信関数。前置きがキャッシュ済みなら、呼び出しごとの部分だけを送る。
+    内訳付きのPrompt（strのサブクラス）はgenaiが受け付けないので、ただの文字列にして送る。
+    呼び出しはgemini_poolの同時呼び出し枠の中で、プールが選んだ健全なクライアントで行う（clientがプール外のものならそれを使う）。
+    """
+    prefix = getattr(prompt, "prefix", None)
+    with gemini_pool.pool.lease(model, client) as client:
+        name = contexts.lookup(client, model, prefix)
+        if name:
+            try:
+                response = client.chats.create(model=model).send_message(str(prompt.suffix), config=_cached_config(name))
+                metrics.incr("prompt_context_cache", event="used")
+                return response
+            except Exception as e:
+                if not _is_stale_context(e):
+                    raise
+                print(f"[PROMPT CACHE] キャッシュ {name} を使えなかったため、全文を送ります: {e}")
+                contexts.invalidate(model, prefix)
+        return client.chats.create(model=model).send_message(str(prompt))
+
+
+async def asend(client, model: str, prompt: str):
+    """sendのasyncio版（client.aioを使う）"""
+    prefix = getattr(prompt, "prefix", None)
+    async with gemini_pool.pool.alease(model, client) as client:
+        name = await contexts.alookup(client, model, prefix)
+        if name:
+            try:
+                response = await client.aio.chats.create(model=model).send_message(str(prompt.suffix), config=_cached_config(name))
+                metrics.incr("prompt_context_cache", event="used")
+                return response
+            except Exception as e:
+                if not _is_stale_context(e):
+                    raise
+                print(f"[PROMPT CACHE] キャッシュ {name} を使えなかったため、全文を送ります: {e}")
+                contexts.invalidate(model, prefix)
+        return await client.aio.chats.create(model=model).send_message(str(prompt))
+
+
+class SessionPrefix:
+    """
+    チャットセッションのシステムプロンプト（前置き）。コンテキストキャッシュにできれば毎回キャッシュとして参照させ、
+    できなければ（途中でキャッシュが失効した場合も）セッションに1回だけ送り、以降は履歴として持たせる。
+    """
+
+    def __init__(self, client, model: str, prefix):
+        self.client = client
+        self.model = model
+        self.prefix = prefix
+        self.primed = False                          # キャッシュを使わず、セッションに送るようになったか
+        self._primed_sessions = weakref.WeakSet()    # 前置きを履歴に持っているセッション
+
+    def cached_name(self) -> str:
+        """キャッシュとして参照させる場合はその名前。セッションに送り済み・キャッシュできない場合はNone"""
+        return None if self.primed else contexts.lookup(self.client, self.model, self.prefix)
+
+    def prime(self, chat_session):
+        """前置きをセッションに送り、その応答を返す"""
+        with gemini_pool.pool.lease(self.model, session=chat_session):
+            response = resilience.gemini_api.call(lambda: chat_session.send_message(str(self.prefix)))
+        self.primed = True
+        self._primed_sessions.add(chat_session)
+        return response
+
+    def new_session(self, base_session):
+        """base_sessionの履歴（送り済みの前置きを含む）を引き継いだチャットセッションを作る（会話ごとのセッションに使う）"""
+        session = self.client.chats.create(model=self.model, history=base_session.get_history())
+        if base_session in self._primed_sessions:
+            self._primed_sessions.add(session)
+        return session
+
+    def send(self, call_site: str, chat_session, prompt: str) -> str:
+        """model_router.send_on_sessionで送る。キャッシュが使えなくなっていれば、前置きを1回送ってからキャッシュなしで送る"""
+        name = self.cached_name()
+        if name:
+            try:
+                text = model_router.send_on_session(call_site, chat_session, prompt, _cached_config(name))
+                metrics.incr("prompt_context_cache", event="used")
+                return text
+            except Exception as e:
+                if not _is_stale_context(e):
+                    raise
+                print(f"[PROMPT CACHE] キャッシュ {name} を使えなかったため、システムプロンプトをセッションに送ります: {e}")
+                contexts.invalidate(self.model, self.prefix)
+        if chat_session not in self._primed_sessions:
+            self.prime(chat_session)
+        return model_router.send_on_session(call_site, chat_session, prompt)
@@ -0,0 +1,313 @@
+# src/core/resilience.py
+import asyncio
+import contextlib
+import contextvars
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import config
+from src.core import metrics, cancellation
+
+# 外部API（Google Calendar・Gemini）呼び出しの共通の保護層。
+# - APIごと・ユーザーごとのトークンバケットで、同時に動くセッションからの呼び出しの集中をならす
+# - 429/5xx・通信エラーは、ジッター付きの指数バックオフで再試行する
+# - 失敗が続いたAPIはサーキットブレーカーで一定時間呼び出しを止め、待たずに失敗させる
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# 現在の呼び出し元ユーザー（Webならセッション・接続元ごと）。未設定なら全体のバケットだけを使う
+_current_user = contextvars.ContextVar("current_user", default=None)
+
+
+@contextlib.contextmanager
+def user_scope(user_id: str):
+    """このブロック内の外部API呼び出しを、user_idのユーザー別制限の対象にする"""
+    token = _current_user.set(user_id)
+    try:
+        yield
+    finally:
+        _current_user.reset(token)
+
+
+class UpstreamUnavailable(Exception):
+    """再試行しても成功しなかった、またはサーキットブレーカーが開いているため呼び出さなかった"""
+
+    def __init__(self, api: str, message: str, cause: Exception = None):
+        super().__init__(f"{api}: {message}")
+        self.api = api
+        self.cause = cause
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate            # 1秒あたりに補充するトークン数
+        self.capacity = capacity    # 一度に使えるトークンの上限（バースト）
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """トークンを予約し、使えるようになるまでの待ち時間を返す（先に予約した呼び出しから順に通す）"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1) -> float:
+        """トークンが使えるようになるまで待ち、待った秒数を返す"""
+        wait = self._reserve(min(tokens, self.capacity))
+        if wait > 0:
+            cancellation.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: float = 1) -> float:
+        """acquireのasyncio版（待つ間イベントループを止めない）"""
+        wait = self._reserve(min(tokens, self.capacity))
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def is_full(self) -> bool:
+        """トークンが上限まで戻っているか（作り直したばかりのバケットと区別がつかない）"""
+        with self._lock:
+            return self._tokens + (time.monotonic() - self._updated) * self.rate >= self.capacity
+
+
+class CircuitBreaker:
+    """連続してfailure_threshold回失敗したら開き、reset_seconds後に1回だけ試しに通す（half-open）"""
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def abandon_trial(self):
+        """half-openの試しの呼び出しが、成否の出ないまま（取り消しなどで）終わったときに呼ぶ。次の呼び出しに試しの枠を渡す"""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self._opened_at = time.monotonic() - self.reset_seconds
+
+    def record_failure(self) -> bool:
+        """失敗を記録し、これでブレーカーが開いたらTrueを返す"""
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                opened = self.state != "open"
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                return opened
+            return False
+
+
+def status_of(error: Exception):
+    """例外からHTTPステータスを取り出す（googleapiclientのHttpError・google-genaiのAPIErrorの両方に対応）"""
+    resp = getattr(error, "resp", None)
+    if resp is not None and getattr(resp, "status", None) is not None:
+        return int(resp.status)
+    for attr in ("code", "status_code"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    status = status_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(error, OSError):
+        return True
+    # httpx（google-genai）・httplib2（googleapiclient）の通信エラー
+    return any(cls.__name__ in ("TransportError", "HttpLib2Error") for cls in type(error).__mro__)
+
+
+def _retry_after(error: Exception):
+    headers = getattr(error, "resp", None) or getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        return float(value) if value is not None else None
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class Upstream:
+    """1つの外部APIへの呼び出しをまとめて保護する（レート制限・再試行・サーキットブレーカー）"""
+
+    def __init__(self, name: str, rate: float, burst: float, user_rate: float, user_burst: float,
+                 max_retries: int = 4, backoff_base: float = 0.5, backoff_max: float = 20,
+                 failure_threshold: int = 5, reset_seconds: float = 30, max_user_buckets: int = 1000):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.max_user_buckets = max_user_buckets
+        self._user_buckets = OrderedDict()   # user_id -> TokenBucket（最近呼び出したユーザーほど後ろ）
+        self._lock = threading.Lock()
+
+    def _user_bucket(self, user_id: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._user_buckets.get(user_id)
+            if bucket is not None:
+                self._user_buckets.move_to_end(user_id)
+                return bucket
+            bucket = self._user_buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+            self._evict_user_buckets()
+            return bucket
+
+    def _evict_user_buckets(self):
+        """しばらく呼び出していないユーザーのバケットを捨てる（self._lockを持って呼ぶ）"""
+        # トークンが満タンに戻ったバケットは、捨てて作り直しても制限は変わらない
+        while len(self._user_buckets) > 1:
+            user_id, oldest = next(iter(self._user_buckets.items()))
+            if not oldest.is_full():
+                break
+            del self._user_buckets[user_id]
+        # それでも多すぎる場合は、最も長く呼び出していないユーザーから忘れる
+        while len(self._user_buckets) > self.max_user_buckets:
+            self._user_buckets.popitem(last=False)
+            metrics.incr("upstream_user_buckets_evicted", api=self.name)
+
+    def _throttle(self, tokens: float):
+        user_id = _current_user.get()
+        waited = self._user_bucket(user_id).acquire(tokens) if user_id is not None else 0.0
+        waited += self.bucket.acquire(tokens)
+        self._record_throttle(waited)
+
+    async def _athrottle(self, tokens: float):
+        user_id = _current_user.get()
+        waited = await self._user_bucket(user_id).acquire_async(tokens) if user_id is not None else 0.0
+        waited += await self.bucket.acquire_async(tokens)
+        self._record_throttle(waited)
+
+    def _record_throttle(self, waited: float):
+        if waited > 0:
+            metrics.incr("upstream_throttled", api=self.name)
+        metrics.observe("upstream_throttle_seconds", waited, api=self.name)
+
+    def backoff(self, attempt: int, error: Exception = None) -> float:
+        """attempt回目の再試行までの待ち時間（full jitter。Retry-Afterがあればそれ以上待つ）"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        retry_after = _retry_after(error) if error is not None else None
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def call(self, fn, tokens: float = 1):
+        """
+        fn() を呼び出す。429/5xx・通信エラーは再試行し、それ以外の例外はそのまま送出する。
+
+        Args:
+            fn (Callable[[], Any]): 外部APIを1回呼び出す関数。
+            tokens (float): 消費するトークン数（バッチリクエストなら含まれるリクエスト数）。
+
+        Raises:
+            UpstreamUnavailable: サーキットブレーカーが開いている、または再試行を使い切った。
+            cancellation.Cancelled: 要求元が切断した。
+        """
+        for attempt in range(self.max_retries + 1):
+            # 要求元が切断していれば、呼び出し・再試行を始めない（待機中の取り消しにも反応する）
+            cancellation.check("upstream_call", api=self.name)
+            self._check_breaker()
+            try:
+                self._throttle(tokens)
+                result = fn()
+            except Exception as e:
+                cancellation.sleep(self._retry_delay(attempt, e))
+                continue
+            except BaseException:
+                # 取り消された呼び出しは成功とも失敗とも数えないが、half-openの試しの枠は空ける
+                self.breaker.abandon_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, afn, tokens: float = 1):
+        """
+        callのasyncio版。afn() が返すコルーチンを待つ。レート制限・再試行の待ちもイベントループ上で行う。
+
+        Args:
+            afn (Callable[[], Awaitable[Any]]): 外部APIを1回呼び出すコルーチン関数。
+            tokens (float): 消費するトークン数。
+        """
+        for attempt in range(self.max_retries + 1):
+            cancellation.check("upstream_call", api=self.name)
+            self._check_breaker()
+            try:
+                await self._athrottle(tokens)
+                result = await afn()
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(attempt, e))
+                continue
+            except BaseException:
+                self.breaker.abandon_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            metrics.incr("upstream_rejected", api=self.name)
+            raise UpstreamUnavailable(self.name, "失敗が続いているため、一時的に呼び出しを止めています。")
+
+    def _retry_delay(self, attempt: int, e: Exception) -> float:
+        """失敗を記録し、再試行までの待ち時間を返す。再試行しない場合は例外を送出する（exceptブロック内で呼ぶ）"""
+        if not is_retryable(e):
+            # リクエスト自体の誤り（400/404など）は、APIの障害としては数えない
+            self.breaker.record_success()
+            raise
+        metrics.incr("upstream_errors", api=self.name, status=status_of(e) or "network")
+        if self.breaker.record_failure():
+            print(f"[RESILIENCE] {self.name}: 失敗が続いたため、{self.breaker.reset_seconds:.0f}秒間呼び出しを止めます。")
+        if attempt == self.max_retries or self.breaker.state == "open":
+            raise UpstreamUnavailable(self.name, f"{self.max_retries}回再試行しましたが失敗しました: {e}", e) from e
+        delay = self.backoff(attempt, e)
+        print(f"[RESILIENCE] {self.name}: 一時的なエラーのため {delay:.1f}秒後に再試行します（{attempt + 1}/{self.max_retries}）: {e}")
+        metrics.incr("upstream_retries", api=self.name)
+        metrics.observe("upstream_backoff_seconds", delay, api=self.name)
+        return delay
+
+
+def _upstream(name: str) -> Upstream:
+    limits = config.UPSTREAM_LIMITS[name]
+    return Upstream(
+        name,
+        rate=limits["rate"],
+        burst=limits["burst"],
+        user_rate=limits["user_rate"],
+        user_burst=limits["user_burst"],
+        max_retries=config.UPSTREAM_MAX_RETRIES,
+        backoff_base=config.UPSTREAM_BACKOFF_BASE_SECONDS,
+        backoff_max=config.UPSTREAM_BACKOFF_MAX_SECONDS,
+        failure_threshold=config.CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds=config.CIRCUIT_RESET_SECONDS,
+        max_user_buckets=config.UPSTREAM_USER_BUCKETS_MAX,
+    )
+
+
+# プロセス全体で共有する、APIごとの保護層
+calendar_api = _upstream("calendar")
+gemini_api = _upstream("gemini")
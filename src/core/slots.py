@@ -0,0 +1,75 @@
+# src/core/slots.py
+import asyncio
+import threading
+
+from src.core import cancellation
+
+# スレッドからもasyncioのタスクからも待てる、同時実行数の上限（セマフォ）。
+# asyncioで待つ呼び出しはスレッド（to_threadの実行器）を占有せず、枠が空いたときにそれぞれのイベントループ上で起こされる。
+# どちらで待っていても、要求元が切断したら待つのをやめる（cancellation）。
+
+
+class Slots:
+    """同時に実行できる数の上限。kindは、待っている間に取り消されたときに記録する種類"""
+
+    def __init__(self, limit: int, kind: str):
+        self.limit = limit
+        self.kind = kind
+        self.active = 0
+        self._cond = threading.Condition()
+        self._async_waiters = []   # (イベントループ, 空きを知らせるFuture)
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            return False
+
+    def acquire(self):
+        """空くまで待つ。待っている間に要求元が切断したらCancelledを送出する"""
+        with self._cond:
+            while self.active >= self.limit:
+                # 取り消しに気づけるよう、短い間隔で確認する
+                self._cond.wait(0.25)
+                cancellation.check(self.kind)
+            self.active += 1
+
+    async def acquire_async(self):
+        """acquireのasyncio版（待つ間イベントループを止めず、枠が空いた知らせを受けて取り直す）"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self.active < self.limit:
+                    self.active += 1
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                # 取り消しに気づけるよう、知らせがなくても短い間隔で確認する
+                await asyncio.wait_for(waiter, 0.25)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+            cancellation.check(self.kind)
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+            # asyncioで待っている呼び出しは、それぞれのイベントループ上で起こす（空いた枠は起きた順に取り合う）
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                # イベントループがすでに閉じている
+                pass
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
@@ -0,0 +1,268 @@
+# src/core/stream_runs.py
+import asyncio
+import contextlib
+import contextvars
+import json
+import threading
+import time
+import uuid
+from collections import deque
+
+import config
+from src.core import cancellation, metrics
+
+# /api/chatのストリームを、接続から切り離して実行・保持するための層。
+# 1回の依頼（run）の出力は、SSEのイベントID（"<run_id>-<連番>"）を付けてrunごとの上限付きバッファに積む。
+# 接続が切れても実行は続け、Last-Event-IDを付けて再接続したクライアントには、続きから再送する（再実行はしない）。
+# 誰も再接続しないまま猶予時間が過ぎたrunは、取り消し（cancellation）で打ち切る。
+
+HEARTBEAT = ": heartbeat\n\n"
+
+
+class ResumeError(Exception):
+    """再開しようとしたrunが見つからない（期限切れ・別のセッション）、または再送に必要なイベントがもう残っていない"""
+
+
+def format_event(run_id: str, seq: int, data: str, event: str = None) -> str:
+    head = f"id: {run_id}-{seq}\n" + (f"event: {event}\n" if event else "")
+    return f"{head}data: {data}\n\n"
+
+
+def parse_event_id(event_id: str) -> tuple:
+    """"<run_id>-<連番>" を (run_id, 連番) に分解する"""
+    run_id, _, seq = (event_id or "").strip().rpartition("-")
+    if not run_id or not seq.isdigit():
+        raise ResumeError(f"不正なイベントIDです: {event_id}")
+    return run_id, int(seq)
+
+
+class StreamRun:
+    def __init__(self, session_id: str, buffer_size: int = 200):
+        self.run_id = uuid.uuid4().hex[:16]
+        self.session_id = session_id
+        self.events = deque(maxlen=buffer_size)  # (連番, JSON文字列)
+        self.last_seq = 0
+        self.done = False
+        self.finished_at = None
+        self.subscribers = 0
+        # 接続がなくなったら（猶予時間の後に）打ち切るか。ジョブのように接続と無関係に実行するrunではFalse
+        self.cancel_when_abandoned = True
+        self.token = cancellation.CancelToken()
+        self._on_cancel = []
+        self._cond = threading.Condition()
+        self._async_waiters = set()   # (イベントループ, asyncio.Event)
+
+    def append(self, payload: dict):
+        with self._cond:
+            self.last_seq += 1
+            self.events.append((self.last_seq, json.dumps(payload, ensure_ascii=False)))
+            self._notify_locked()
+
+    def finish(self):
+        with self._cond:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._notify_locked()
+
+    def _notify_locked(self):
+        self._cond.notify_all()
+        for loop, event in list(self._async_waiters):
+            loop.call_soon_threadsafe(event.set)
+
+    def events_after(self, seq: int) -> tuple:
+        """
+        seqより後のイベントと、runが終わっているかを返す。
+
+        Raises:
+            ResumeError: seqの直後のイベントがすでにバッファから押し出されている。
+        """
+        with self._cond:
+            if self.events and seq < self.events[0][0] - 1:
+                raise ResumeError(f"イベント {seq} より後の一部がすでに破棄されています。")
+            return [e for e in self.events if e[0] > seq], self.done
+
+    def wait(self, seq: int, timeout: float) -> bool:
+        """seqより後のイベントが届くか、runが終わるまで待つ。タイムアウトしたらFalse"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.last_seq > seq or self.done, timeout)
+
+    async def wait_async(self, seq: int, timeout: float) -> bool:
+        """waitのasyncio版"""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._cond:
+            if self.last_seq > seq or self.done:
+                return True
+            self._async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+
+    def add_cancel_callback(self, callback):
+        self._on_cancel.append(callback)
+
+    def cancel(self, reason: str):
+        self.token.cancel(reason)
+        for callback in self._on_cancel:
+            callback()
+
+
+class RunRegistry:
+    def __init__(self, buffer_size: int = 200, retention_seconds: float = 120, grace_seconds: float = 30):
+        self.buffer_size = buffer_size
+        self.retention_seconds = retention_seconds
+        self.grace_seconds = grace_seconds
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def create(self, session_id: str) -> StreamRun:
+        run = StreamRun(session_id, self.buffer_size)
+        with self._lock:
+            self._prune_locked()
+            # 同じセッションの終わったrunは、新しい依頼を始めた時点で再開の対象から外す
+            for old in [r for r in self._runs.values() if r.session_id == session_id and r.done]:
+                del self._runs[old.run_id]
+            self._runs[run.run_id] = run
+        return run
+
+    def resume(self, session_id: str, event_id: str) -> tuple:
+        """
+        Last-Event-IDから再開するrunと、送信済みの連番を返す。
+
+        Raises:
+            ResumeError: runが見つからない、または続きのイベントがすでにバッファから押し出されている
+                （レスポンスを返し始める前に、呼び出し元で410にできるよう、ここで確かめる）。
+        """
+        run_id, seq = parse_event_id(event_id)
+        with self._lock:
+            self._prune_locked()
+            run = self._runs.get(run_id)
+        if run is None or run.session_id != session_id:
+            raise ResumeError("再開できる実行が見つかりません（期限切れの可能性があります）。")
+        run.events_after(seq)
+        metrics.incr("sse_resumes")
+        return run, seq
+
+    def _prune_locked(self):
+        now = time.monotonic()
+        for run_id in [r.run_id for r in self._runs.values() if r.done and now - r.finished_at > self.retention_seconds]:
+            del self._runs[run_id]
+
+    def attach(self, run: StreamRun):
+        with self._lock:
+            run.subscribers += 1
+
+    def detach(self, run: StreamRun):
+        """接続が閉じたときに呼ぶ。誰も再接続しないまま猶予時間が過ぎたら、実行中のrunを打ち切る"""
+        with self._lock:
+            run.subscribers -= 1
+            abandoned = run.subscribers == 0 and not run.done and run.cancel_when_abandoned
+        if abandoned:
+            timer = threading.Timer(self.grace_seconds, self._cancel_if_abandoned, args=(run,))
+            timer.daemon = True
+            timer.start()
+
+    def _cancel_if_abandoned(self, run: StreamRun):
+        with self._lock:
+            abandoned = run.subscribers == 0 and not run.done
+        if abandoned:
+            print(f"[STREAM] run {run.run_id} に再接続がないため、処理を打ち切ります。")
+            metrics.incr("cancelled_work", kind="stream")
+            run.cancel("client_disconnected")
+
+
+# ▼▼▼ 実行（runに出力を積む側） ▼▼▼
+
+def start_in_thread(run: StreamRun, make_generator, error_payload: dict):
+    """
+    同期ジェネレータ（Orchestrator.run_multi_agent_session_stream）をスレッドで実行し、出力をrunに積む。
+    呼び出し元のコンテキスト（ユーザー別のレート制限など）を引き継ぐ。
+    """
+    def produce():
+        try:
+            with cancellation.scope(run.token), contextlib.closing(make_generator()) as generator:
+                for payload in generator:
+                    run.append(payload)
+                    if run.token.cancelled:
+                        break
+        except cancellation.Cancelled:
+            pass
+        except Exception as e:
+            print(f"[STREAM] run {run.run_id} でエラーが発生: {e}")
+            run.append(error_payload)
+        finally:
+            run.finish()
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(produce,), name=f"run-{run.run_id}", daemon=True).start()
+
+
+def start_as_task(run: StreamRun, make_async_generator, error_payload: dict) -> asyncio.Task:
+    """start_in_threadのasyncio版。打ち切り時はタスクも取り消す"""
+    async def produce():
+        try:
+            with cancellation.scope(run.token):
+                async with contextlib.aclosing(make_async_generator()) as generator:
+                    async for payload in generator:
+                        run.append(payload)
+        except (asyncio.CancelledError, cancellation.Cancelled):
+            pass
+        except Exception as e:
+            print(f"[STREAM] run {run.run_id} でエラーが発生: {e}")
+            run.append(error_payload)
+        finally:
+            run.finish()
+    loop = asyncio.get_running_loop()
+    task = loop.create_task(produce())
+    run.add_cancel_callback(lambda: loop.call_soon_threadsafe(task.cancel))
+    return task
+
+
+# ▼▼▼ 送信（runからSSEを読み出す側。接続ごと） ▼▼▼
+
+def iter_sse(registry: RunRegistry, run: StreamRun, after_seq: int = 0, heartbeat_seconds: float = 15):
+    """runのseqより後のイベントをSSEとして送り、runが終わったら終了イベントを送る。何も届かない間はハートビートを送る"""
+    registry.attach(run)
+    try:
+        while True:
+            events, done = run.events_after(after_seq)
+            for seq, data in events:
+                yield format_event(run.run_id, seq, data)
+                after_seq = seq
+            if done and not events:
+                yield format_event(run.run_id, after_seq, "{}", event="end")
+                return
+            if not events and not run.wait(after_seq, heartbeat_seconds):
+                yield HEARTBEAT
+    finally:
+        registry.detach(run)
+
+
+async def aiter_sse(registry: RunRegistry, run: StreamRun, after_seq: int = 0, heartbeat_seconds: float = 15):
+    """iter_sseのasyncio版"""
+    registry.attach(run)
+    try:
+        while True:
+            events, done = run.events_after(after_seq)
+            for seq, data in events:
+                yield format_event(run.run_id, seq, data)
+                after_seq = seq
+            if done and not events:
+                yield format_event(run.run_id, after_seq, "{}", event="end")
+                return
+            if not events and not await run.wait_async(after_seq, heartbeat_seconds):
+                yield HEARTBEAT
+    finally:
+        registry.detach(run)
+
+
+# プロセス全体で共有する、実行中・直近のrun
+registry = RunRegistry(
+    buffer_size=config.SSE_REPLAY_BUFFER_EVENTS,
+    retention_seconds=config.SSE_RESUME_RETENTION_SECONDS,
+    grace_seconds=config.SSE_RESUME_GRACE_SECONDS,
+)
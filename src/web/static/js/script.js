@@ -35,53 +35,97 @@ document.addEventListener('DOMContentLoaded', () => {
     }
     
     // --- サーバー通信関数 ---
+    const MAX_RECONNECTS = 3;
+
     async function startChatStream(message) {
+        // 切断されたら、最後に受け取ったイベントIDを付けて再接続し、続きから受け取る（サーバー側で再実行はされない）
+        let lastEventId = null;
+        let finished = false;
         try {
-            const response = await fetch('/api/chat', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ message: message }),
-            });
-
-            if (!response.ok) {
-                throw new Error(`Server responded with ${response.status}`);
-            }
-
-            const reader = response.body.getReader();
-            const decoder = new TextDecoder("utf-8");
-            let buffer = '';
-
-            while (true) {
-                const { value, done } = await reader.read();
-                if (done) {
-                    break;
+            for (let attempt = 0; !finished && attempt <= MAX_RECONNECTS; attempt++) {
+                if (attempt > 0) {
+                    updateStatusIndicator('接続が切れたため、再接続しています...');
+                    await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+                }
+                const headers = { 'Content-Type': 'application/json' };
+                if (lastEventId) {
+                    headers['Last-Event-ID'] = lastEventId;
                 }
-                buffer += decoder.decode(value, { stream: true });
-                
-                let idx;
-                while ((idx = buffer.indexOf('\n\n')) !== -1) {
-                    const line = buffer.slice(0, idx);
-                    buffer = buffer.slice(idx + 2);
-                    
-                    if (line.startsWith('data: ')) {
-                        const jsonData = line.slice(6);
-                        try {
-                            const data = JSON.parse(jsonData);
-                            handleAiResponse(data);
-                        } catch (e) {
-                            console.error("Error parsing SSE data:", jsonData, e);
+                try {
+                    const response = await fetch('/api/chat', {
+                        method: 'POST',
+                        headers: headers,
+                        body: JSON.stringify(lastEventId ? {} : { message: message }),
+                    });
+                    if (!response.ok) {
+                        if (response.status === 410) {
+                            // 再開できる実行がもう残っていない
+                            lastEventId = null;
                         }
+                        throw new Error(`Server responded with ${response.status}`);
+                    }
+                    finished = await readEventStream(response, (id) => { lastEventId = id; });
+                } catch (error) {
+                    console.error("Chat stream failed:", error);
+                    // 一度もイベントを受け取っていなければ再開できないので、そのまま失敗とする
+                    if (!lastEventId) {
+                        break;
                     }
                 }
             }
-        } catch (error) {
-            console.error("Chat stream failed:", error);
-            addMessage('AIとの通信に失敗しました。', 'system', 'システム');
+            if (!finished) {
+                addMessage('AIとの通信に失敗しました。', 'system', 'システム');
+            }
         } finally {
             unlockUi();
         }
     }
 
+    // SSEを読み、イベントごとにhandleAiResponseを呼ぶ。終了イベントまで受け取れたらtrueを返す
+    async function readEventStream(response, onEventId) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder("utf-8");
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                return false;
+            }
+            buffer += decoder.decode(value, { stream: true });
+
+            let idx;
+            while ((idx = buffer.indexOf('\n\n')) !== -1) {
+                const block = buffer.slice(0, idx);
+                buffer = buffer.slice(idx + 2);
+
+                let eventName = 'message';
+                let jsonData = '';
+                for (const line of block.split('\n')) {
+                    // ":" で始まる行はハートビート（コメント）
+                    if (line.startsWith('id: ')) {
+                        onEventId(line.slice(4));
+                    } else if (line.startsWith('event: ')) {
+                        eventName = line.slice(7);
+                    } else if (line.startsWith('data: ')) {
+                        jsonData += line.slice(6);
+                    }
+                }
+                if (eventName === 'end') {
+                    return true;
+                }
+                if (!jsonData) {
+                    continue;
+                }
+                try {
+                    handleAiResponse(JSON.parse(jsonData));
+                } catch (e) {
+                    console.error("Error parsing SSE data:", jsonData, e);
+                }
+            }
+        }
+    }
+
     // --- 表示処理関数 ---
     function handleAiResponse(data) {
         const speakerName = getSpeakerName(data.speaker);
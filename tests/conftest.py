@@ -0,0 +1,8 @@
+# tests/conftest.py
+import os
+import sys
+from pathlib import Path
+
+# config.pyはGEMINI_API_KEYがないと読み込めない。テストではGeminiに接続しないので、ダミーの値を入れる
+os.environ.setdefault("GEMINI_API_KEY", "test-dummy-key")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
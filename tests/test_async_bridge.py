@@ -0,0 +1,67 @@
+# tests/test_async_bridge.py
+import asyncio
+import threading
+
+import pytest
+
+from src.core import async_bridge, cancellation
+
+
+def _collect(make_generator, token=None):
+    async def run():
+        items = []
+        with cancellation.scope(token or cancellation.CancelToken()):
+            async for item in async_bridge.iterate_in_thread(make_generator):
+                items.append(item)
+        return items
+    return asyncio.run(run())
+
+
+def test_items_and_errors_reach_the_consumer():
+    assert _collect(lambda: (i for i in [1, 2, 3])) == [1, 2, 3]
+
+    def failing():
+        yield 1
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        _collect(failing)
+
+
+def test_cancellation_in_the_worker_is_raised_in_the_consumer():
+    def cancelled():
+        yield 1
+        cancellation.check("test")
+        yield 2
+
+    token = cancellation.CancelToken()
+
+    def make_generator():
+        token.cancel("client_disconnected")
+        return cancelled()
+
+    with pytest.raises(cancellation.Cancelled):
+        _collect(make_generator, token)
+
+
+def test_parent_cancelled_between_items_is_not_reported_as_done():
+    token = cancellation.CancelToken()
+    proceed = threading.Event()
+    received = []
+
+    def generator():
+        yield 1
+        proceed.wait(5)
+        yield 2
+        yield 3
+
+    async def run():
+        with cancellation.scope(token):
+            async for item in async_bridge.iterate_in_thread(generator):
+                received.append(item)
+                token.cancel("client_disconnected")
+                proceed.set()
+
+    with pytest.raises(cancellation.Cancelled):
+        asyncio.run(run())
+    assert received == [1]
@@ -0,0 +1,29 @@
+# tests/test_cassette.py
+import json
+
+from src.core import cassette
+
+
+def _recorded(path) -> list:
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()] if path.exists() else []
+
+
+def test_oauth_token_refresh_is_never_recorded(tmp_path):
+    path = tmp_path / "session.jsonl"
+    recorder = cassette.Cassette(str(path), "record")
+    secret = b"grant_type=refresh_token&refresh_token=1//secret&client_secret=shh"
+    recorder.record("POST", "https://oauth2.googleapis.com/token", secret, 200, "application/json",
+                    b'{"access_token": "ya29.token"}', 0.1)
+    recorder.record("POST", "https://accounts.google.com/o/oauth2/token", secret, 200, "application/json",
+                    b'{"access_token": "ya29.token"}', 0.1)
+    assert _recorded(path) == []
+
+
+def test_calendar_requests_are_recorded(tmp_path):
+    path = tmp_path / "session.jsonl"
+    recorder = cassette.Cassette(str(path), "record")
+    recorder.record("GET", "https://www.googleapis.com/calendar/v3/calendars/primary/events?timeMin=x", b"", 200,
+                    "application/json", b'{"items": []}', 0.1)
+    entries = _recorded(path)
+    assert [e["api"] for e in entries] == ["calendar"]
+    assert entries[0]["json"] == {"items": []}
@@ -0,0 +1,56 @@
+# tests/test_conflicts.py
+from datetime import datetime
+
+from src.calendar_agent import free_busy
+from src.calendar_agent.conflicts import OverlapIndex
+
+
+def _minute(value: str) -> int:
+    return free_busy.to_minute(free_busy.JST.localize(datetime.fromisoformat(value)))
+
+
+def _event(event_id: str, start: str, end: str) -> dict:
+    return {"id": event_id, "summary": event_id, "start": start + "+09:00", "end": end + "+09:00"}
+
+
+def _index() -> OverlapIndex:
+    index = OverlapIndex(ttl_seconds=60)
+    index.load_range(_minute("2025-01-06T00:00:00"), _minute("2025-01-07T00:00:00"), [
+        _event("long", "2025-01-06T09:00:00", "2025-01-06T17:00:00"),
+        _event("lunch", "2025-01-06T12:00:00", "2025-01-06T13:00:00"),
+        _event("evening", "2025-01-06T18:00:00", "2025-01-06T19:00:00"),
+    ])
+    return index
+
+
+def test_find_conflicts_reports_overlaps_but_not_touching_events():
+    index = _index()
+    # 長い予定の途中（開始は前の方）も見つける
+    assert [c["id"] for c in index.find_conflicts(_minute("2025-01-06T12:30:00"), _minute("2025-01-06T14:00:00"))] == ["long", "lunch"]
+    # 終了と開始が接しているだけなら重ならない
+    assert index.find_conflicts(_minute("2025-01-06T17:00:00"), _minute("2025-01-06T18:00:00")) == []
+    # 編集中の予定自身は除く
+    assert [c["id"] for c in index.find_conflicts(
+        _minute("2025-01-06T18:30:00"), _minute("2025-01-06T19:30:00"), exclude_id="evening")] == []
+
+
+def test_proposals_conflict_with_each_other():
+    index = OverlapIndex(ttl_seconds=60)
+    results = index.find_conflicts_batch([
+        (_minute("2025-01-06T10:00:00"), _minute("2025-01-06T11:00:00")),
+        (_minute("2025-01-06T10:30:00"), _minute("2025-01-06T11:30:00")),
+        (_minute("2025-01-06T11:00:00"), _minute("2025-01-06T12:00:00")),
+    ])
+    assert [[c["proposal_index"] for c in found] for found in results] == [[1], [0, 2], [1]]
+
+
+def test_reload_drops_deleted_events_and_coverage_expires():
+    index = _index()
+    day_start, day_end = _minute("2025-01-06T00:00:00"), _minute("2025-01-07T00:00:00")
+    assert index.covers(_minute("2025-01-06T10:00:00"), _minute("2025-01-06T11:00:00"))
+    index.load_range(day_start, day_end, [_event("lunch", "2025-01-06T12:00:00", "2025-01-06T13:00:00")])
+    assert [c["id"] for c in index.find_conflicts(_minute("2025-01-06T09:00:00"), _minute("2025-01-06T19:00:00"))] == ["lunch"]
+
+    expired = OverlapIndex(ttl_seconds=0)
+    expired.load_range(day_start, day_end, [])
+    assert not expired.covers(day_start, day_end)
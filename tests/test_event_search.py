@@ -0,0 +1,69 @@
+# tests/test_event_search.py
+from datetime import datetime
+
+from src.calendar_agent import event_search, free_busy
+
+
+def _event(event_id: str, summary: str, day: int = 6, **extra) -> dict:
+    return {
+        "id": event_id,
+        "summary": summary,
+        "start": f"2025-01-{day:02d}T10:00:00+09:00",
+        "end": f"2025-01-{day:02d}T11:00:00+09:00",
+        **extra,
+    }
+
+
+def _index(*events) -> event_search.EventSearchIndex:
+    index = event_search.EventSearchIndex()
+    for event in events:
+        index.add(event)
+    return index
+
+
+def test_normalize_folds_width_case_and_synonyms():
+    assert event_search.normalize("ＭＴＧ 打ち合わせ") == "会議打合せ"
+    assert event_search.similarity("歯医者", "歯科検診") == 1.0
+
+
+def test_synonym_ranks_the_dentist_first():
+    index = _index(
+        _event("dentist", "歯科検診"),
+        _event("doctor", "眼科"),
+        _event("lunch", "ランチ"),
+    )
+    results = index.search("歯医者")
+    assert [event["id"] for _, event in results] == ["dentist"]
+    assert results[0][0] == 1.0
+
+
+def test_partial_overlap_and_shorter_titles_first():
+    index = _index(
+        _event("family", "家族の誕生日"),
+        _event("party", "誕生日会"),
+        _event("long", "誕生日会の準備と買い出し"),
+    )
+    ids = [event["id"] for _, event in index.search("誕生日会")]
+    # 部分一致（類似度1）はタイトルの短い順、表記の違う予定も候補に挙がる
+    assert ids == ["party", "long", "family"]
+
+
+def test_description_matches_count_for_less_and_range_filters():
+    index = _index(
+        _event("title", "歯科", day=6),
+        _event("body", "通院", day=7, description="歯科の定期検診"),
+    )
+    results = index.search("歯科")
+    assert [event["id"] for _, event in results] == ["title", "body"]
+    assert results[1][0] == event_search.DESCRIPTION_WEIGHT
+
+    day7 = free_busy.to_minute(free_busy.JST.localize(datetime(2025, 1, 7)))
+    assert [event["id"] for _, event in index.search("歯科", range_start=day7)] == ["body"]
+
+
+def test_reloading_a_range_drops_deleted_events():
+    index = _index(_event("a", "会議"), _event("b", "会議の準備"))
+    day_start = free_busy.to_minute(free_busy.JST.localize(datetime(2025, 1, 6)))
+    index.load_range(day_start, day_start + 24 * 60, [_event("b", "会議の準備")])
+    assert len(index) == 1
+    assert [event["id"] for _, event in index.search("会議")] == ["b"]
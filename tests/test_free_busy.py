@@ -0,0 +1,66 @@
+# tests/test_free_busy.py
+from datetime import datetime
+
+from src.calendar_agent import free_busy
+
+JST = free_busy.JST
+
+
+def _at(value: str) -> datetime:
+    return JST.localize(datetime.fromisoformat(value))
+
+
+def _clock(intervals):
+    return [(f"{free_busy.from_minute(s):%m-%d %H:%M}", f"{free_busy.from_minute(e):%m-%d %H:%M}") for s, e in intervals]
+
+
+def _event(start: str, end: str) -> dict:
+    return {"summary": "予定", "start": start, "end": end}
+
+
+def test_back_to_back_events_merge_and_the_buffer_closes_a_short_gap():
+    events = [
+        _event("2025-01-06T10:00:00+09:00", "2025-01-06T11:00:00+09:00"),
+        _event("2025-01-06T11:00:00+09:00", "2025-01-06T12:00:00+09:00"),
+        _event("2025-01-06T12:20:00+09:00", "2025-01-06T13:00:00+09:00"),
+    ]
+    intervals = free_busy.events_to_intervals(events)
+    assert _clock(free_busy.merge_intervals(intervals)) == [
+        ("01-06 10:00", "01-06 12:00"), ("01-06 12:20", "01-06 13:00"),
+    ]
+    # 前後10分のバッファを取ると、20分のすき間はなくなる
+    assert _clock(free_busy.merge_intervals(intervals, buffer_minutes=10)) == [("01-06 09:50", "01-06 13:10")]
+
+
+def test_free_windows_within_working_hours():
+    busy = free_busy.merge_intervals(free_busy.events_to_intervals([
+        _event("2025-01-06T10:00:00+09:00", "2025-01-06T12:00:00+09:00"),
+        _event("2025-01-06T17:30:00+09:00", "2025-01-06T19:00:00+09:00"),
+    ]))
+    windows = free_busy.free_windows(busy, _at("2025-01-06T00:00:00"), _at("2025-01-07T00:00:00"), "09:00", "18:00", min_minutes=30)
+    assert _clock(windows) == [("01-06 09:00", "01-06 10:00"), ("01-06 12:00", "01-06 17:30")]
+
+
+def test_all_day_event_blocks_the_day_only_when_included():
+    events = [_event("2025-01-07", "2025-01-08")]
+    range_start, range_end = _at("2025-01-06T00:00:00"), _at("2025-01-09T00:00:00")
+
+    ignored = free_busy.merge_intervals(free_busy.events_to_intervals(events))
+    assert len(free_busy.free_windows(ignored, range_start, range_end, "09:00", "18:00")) == 3
+
+    blocked = free_busy.merge_intervals(free_busy.events_to_intervals(events, include_all_day=True))
+    windows = free_busy.free_windows(blocked, range_start, range_end, "09:00", "18:00")
+    assert _clock(windows) == [("01-06 09:00", "01-06 18:00"), ("01-08 09:00", "01-08 18:00")]
+
+
+def test_k_best_slots_earliest_first_or_nearest_to_the_preferred_hour():
+    windows = free_busy.free_windows([], _at("2025-01-06T00:00:00"), _at("2025-01-07T00:00:00"), "09:10", "18:00")
+    # 開始時刻は30分刻みにそろえる
+    assert _clock(free_busy.k_best_slots(windows, 60, k=3)) == [
+        ("01-06 09:30", "01-06 10:30"), ("01-06 10:00", "01-06 11:00"), ("01-06 10:30", "01-06 11:30"),
+    ]
+    # 15時に近い順に選び、時刻順で返す
+    assert _clock(free_busy.k_best_slots(windows, 60, k=3, preferred_hour=15)) == [
+        ("01-06 14:30", "01-06 15:30"), ("01-06 15:00", "01-06 16:00"), ("01-06 15:30", "01-06 16:30"),
+    ]
+    assert free_busy.k_best_slots(windows, 9 * 60, k=3) == []
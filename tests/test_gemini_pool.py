@@ -0,0 +1,50 @@
+# tests/test_gemini_pool.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.core import cancellation
+from src.core.gemini_pool import GeminiClientPool, ModelSlots
+
+
+def test_async_waiter_is_woken_by_a_release_from_another_thread():
+    slots = ModelSlots(1)
+    slots.acquire()
+
+    async def run():
+        threading.Timer(0.05, slots.release).start()
+        started = time.perf_counter()
+        await slots.acquire_async()
+        return time.perf_counter() - started
+
+    waited = asyncio.run(run())
+    # ポーリングの間隔を待たず、空いた知らせですぐに取れる
+    assert waited < 0.2
+    assert slots.active == 1
+    assert slots._async_waiters == []
+
+
+def test_async_waiter_gives_up_when_the_request_is_cancelled():
+    slots = ModelSlots(1)
+    slots.acquire()
+    token = cancellation.CancelToken()
+
+    async def run():
+        with cancellation.scope(token):
+            asyncio.get_running_loop().call_later(0.05, token.cancel, "disconnected")
+            await slots.acquire_async()
+
+    with pytest.raises(cancellation.Cancelled):
+        asyncio.run(run())
+    assert slots.active == 1
+    assert slots._async_waiters == []
+
+
+def test_session_without_a_pooled_client_is_not_attributed_to_a_member():
+    class Client:
+        pass
+
+    pool = GeminiClientPool(size=2, factory=Client)
+    assert pool._member_of(None) is None
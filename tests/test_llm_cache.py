@@ -0,0 +1,38 @@
+# tests/test_llm_cache.py
+import time
+
+from src.core import llm_cache
+
+
+def test_put_uses_per_entry_ttl(tmp_path):
+    cache = llm_cache.LLMCache(max_entries=8, ttl_seconds=600, disk_dir=str(tmp_path), max_disk_entries=8)
+    cache.put("short", "a", ttl_seconds=0.05)
+    cache.put("long", "b")
+    assert cache.get("short") == "a"
+    time.sleep(0.1)
+    assert cache.get("short") is None
+    assert cache.get("long") == "b"
+
+
+def test_disk_entry_keeps_its_expiry_when_promoted(tmp_path):
+    writer = llm_cache.LLMCache(max_entries=8, ttl_seconds=600, disk_dir=str(tmp_path), max_disk_entries=8)
+    writer.put("k", "v", ttl_seconds=0.05)
+    reader = llm_cache.LLMCache(max_entries=8, ttl_seconds=600, disk_dir=str(tmp_path), max_disk_entries=8)
+    assert reader.get("k") == "v"
+    time.sleep(0.1)
+    assert reader.get("k") is None
+
+
+def test_mutating_responses_are_not_stored(monkeypatch):
+    cache = llm_cache.LLMCache(max_entries=8, ttl_seconds=600)
+    monkeypatch.setattr(llm_cache, "_cache", cache)
+    monkeypatch.setattr(llm_cache.config, "LLM_CACHE_ENABLED", True)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "Action: add_calendar_event"
+
+    llm_cache.cached("plan", "model", "prompt", compute)
+    llm_cache.cached("plan", "model", "prompt", compute)
+    assert len(calls) == 2
@@ -0,0 +1,44 @@
+# tests/test_mentions.py
+from src.calendar_agent.mentions import MentionIndex
+
+
+def _event(event_id: str, summary: str) -> dict:
+    return {"id": event_id, "summary": summary, "start": "2025-01-06T10:00:00+09:00", "end": "2025-01-06T11:00:00+09:00"}
+
+
+def _listed() -> MentionIndex:
+    mentions = MentionIndex()
+    mentions.record_shown([_event("a", "朝会"), _event("b", "歯科検診"), _event("c", "ジム")])
+    return mentions
+
+
+def test_ordinals_after_a_listing():
+    mentions = _listed()
+    assert mentions.resolve_reference("2番目のを消して") == [_event("b", "歯科検診")]
+    assert mentions.resolve_reference("三つ目の予定を1時間後ろに") == [_event("c", "ジム")]
+    assert mentions.resolve_reference("最初のはそのままで") == [_event("a", "朝会")]
+    assert mentions.resolve_reference("最後のを消して") == [_event("c", "ジム")]
+    # 一覧にない番号は、推測せずに「該当なし」
+    assert mentions.resolve_reference("5番目の") == []
+    assert mentions.resolve_reference("来週の予定を教えて") is None
+
+
+def test_numbers_do_not_shift_after_a_deletion():
+    mentions = _listed()
+    mentions.forget("b")
+    assert mentions.resolve_reference("2番目の") == []
+    assert mentions.resolve_reference("3番目の") == [_event("c", "ジム")]
+
+
+def test_demonstrative_prefers_the_event_just_touched():
+    mentions = _listed()
+    assert mentions.resolve_reference("その予定を変更して") == []
+    mentions.record_touched([_event("d", "打合せ")])
+    assert mentions.resolve_reference("その予定を30分延ばして") == [_event("d", "打合せ")]
+
+
+def test_find_by_title_uses_normalized_and_similar_titles():
+    mentions = _listed()
+    assert mentions.find_by_title("歯医者") == [_event("b", "歯科検診")]
+    assert mentions.find_by_title("ジム") == [_event("c", "ジム")]
+    assert mentions.find_by_title("飲み会") == []
@@ -0,0 +1,42 @@
+# tests/test_mutation_journal.py
+from src.calendar_agent import mutation_journal
+
+EVENT = {
+    "summary": "打ち合わせ",
+    "start": {"dateTime": "2025-01-06T10:00:00+09:00"},
+    "end": {"dateTime": "2025-01-06T11:00:00+09:00"},
+}
+
+
+def test_event_id_is_stable_and_valid_base32hex():
+    event_id = mutation_journal.event_id_for(EVENT)
+    assert event_id == mutation_journal.event_id_for(dict(EVENT))
+    assert set(event_id) <= set("0123456789abcdefghijklmnopqrstuv")
+
+
+def test_event_id_distinguishes_location_and_description():
+    base = mutation_journal.event_id_for(EVENT)
+    assert mutation_journal.event_id_for(dict(EVENT, location="会議室A")) != base
+    assert mutation_journal.event_id_for(dict(EVENT, description="議題あり")) != base
+    assert mutation_journal.event_id_for(EVENT, attempt=1) != base
+
+
+def _entry(op, body=None, seq=1):
+    return {"op": op, "event_id": "e1", "body": body or {}, "seqs": [seq]}
+
+
+def test_insert_then_patch_merges_into_insert():
+    merged = mutation_journal._merge(_entry("insert", {"summary": "a"}), _entry("patch", {"summary": "b"}, 2))
+    assert merged["op"] == "insert"
+    assert merged["body"] == {"summary": "b"}
+    assert merged["seqs"] == [1, 2]
+
+
+def test_insert_then_delete_cancels_out():
+    assert mutation_journal._merge(_entry("insert", {"summary": "a"}), _entry("delete", seq=2)) is None
+
+
+def test_patch_then_delete_keeps_delete():
+    merged = mutation_journal._merge(_entry("patch", {"summary": "a"}), _entry("delete", seq=2))
+    assert merged["op"] == "delete"
+    assert merged["seqs"] == [1, 2]
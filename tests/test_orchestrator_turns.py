@@ -0,0 +1,133 @@
+# tests/test_orchestrator_turns.py
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.core import jobs
+from src.core.conversations import ConversationRegistry
+from src.core.orchestrator import TURN_WAIT_EVENT, Orchestrator
+
+
+@pytest.fixture(autouse=True)
+def no_prefetch(monkeypatch):
+    monkeypatch.setattr("config.SPECULATIVE_PREFETCH", False)
+
+
+def _orchestrator(log: list, discussion_seconds: float = 0.05, release: threading.Event = None):
+    # ワークフロー判断と各フローの本体は差し替え、ターンの受け付けだけを確かめる
+    orchestrator = Orchestrator.__new__(Orchestrator)
+    orchestrator.conversations = ConversationRegistry()
+
+    def workflow_for(prompt):
+        return "simple_listing" if "予定" in prompt else "multi_agent_discussion"
+
+    async def adecide(prompt):
+        return workflow_for(prompt)
+
+    def discussion(message, conversation):
+        log.append(("start", message))
+        if release is not None:
+            release.wait(5)
+        else:
+            time.sleep(discussion_seconds)
+        log.append(("end", message))
+        yield {"status": "final_answer", "message": message}
+
+    async def adiscussion(message, conversation):
+        log.append(("start", message))
+        # 実行中のターンも、実行器のスレッドを使う（予定の取得・ReActなど）
+        await asyncio.to_thread(time.sleep, discussion_seconds)
+        log.append(("end", message))
+        yield {"status": "final_answer", "message": message}
+
+    def listing(message, prefetch=None):
+        log.append(("listing", message))
+        yield {"status": "final_answer", "message": message}
+
+    orchestrator._build_workflow_decision_prompt = lambda message: message
+    orchestrator._decide_workflow = workflow_for
+    orchestrator._adecide_workflow = adecide
+    orchestrator._run_multi_agent_flow = discussion
+    orchestrator._arun_multi_agent_flow = adiscussion
+    orchestrator._run_simple_listing_flow = listing
+    return orchestrator
+
+
+def test_turns_of_one_conversation_do_not_interleave():
+    log = []
+    orchestrator = _orchestrator(log)
+    outputs = {}
+
+    def worker(message):
+        outputs[message] = list(orchestrator.run_multi_agent_session_stream(message, "u"))
+
+    threads = [threading.Thread(target=worker, args=(m,)) for m in ("a", "b", "c")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+
+    assert [kind for kind, _ in log] == ["start", "end"] * 3
+    assert sum(TURN_WAIT_EVENT in out for out in outputs.values()) == 2
+    conversation = orchestrator.conversations.get("u")
+    assert conversation.turn.active == 0
+    assert len(conversation.history) == 6
+
+
+def test_queued_async_turns_do_not_hold_executor_threads():
+    log = []
+    orchestrator = _orchestrator(log, discussion_seconds=0.01)
+
+    async def stream(message, user_id):
+        return [r async for r in orchestrator.arun_multi_agent_session_stream(message, user_id)]
+
+    async def run():
+        # 実行器のスレッド数より多いターンが同じ会話で順番を待っても、実行中のターンは進む
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(4))
+        return await asyncio.wait_for(asyncio.gather(*(stream(f"m{i}", "u") for i in range(12))), 5)
+
+    outputs = asyncio.run(run())
+    assert len(outputs) == 12
+    assert [kind for kind, _ in log] == ["start", "end"] * 12
+
+
+def test_turns_of_different_users_run_concurrently():
+    log = []
+    orchestrator = _orchestrator(log, discussion_seconds=0.05)
+
+    async def stream(message, user_id):
+        return [r async for r in orchestrator.arun_multi_agent_session_stream(message, user_id)]
+
+    async def run():
+        started = time.perf_counter()
+        outputs = await asyncio.gather(*(stream("相談", f"user{i}") for i in range(50)))
+        return outputs, time.perf_counter() - started
+
+    outputs, elapsed = asyncio.run(run())
+    assert all(TURN_WAIT_EVENT not in out for out in outputs)
+    # 1つずつ実行すれば2.5秒かかる
+    assert elapsed < 1.5
+
+
+def test_listing_job_finishes_while_a_discussion_job_of_the_same_user_runs():
+    log = []
+    release = threading.Event()
+    orchestrator = _orchestrator(log, release=release)
+    queue = jobs.create_queue(orchestrator)
+    try:
+        discussion = queue.submit("u", "週末に何かしたい", "normal")
+        deadline = time.monotonic() + 5
+        while ("start", "週末に何かしたい") not in log and time.monotonic() < deadline:
+            time.sleep(0.01)
+        listing = queue.submit("u", "今日の予定は？", orchestrator.estimate_priority("今日の予定は？", "u"))
+        assert listing.priority == "high"
+
+        while listing.status != "done" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert listing.status == "done"
+        assert discussion.status == "running"
+    finally:
+        release.set()
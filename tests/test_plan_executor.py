@@ -0,0 +1,64 @@
+# tests/test_plan_executor.py
+import asyncio
+import json
+import threading
+
+import pytest
+
+from src.core.plan_executor import PlanError, aexecute_plan, execute_plan, parse_plan
+
+
+def _registry(added: list, release: threading.Event):
+    def list_calendar_events(start_time, end_time):
+        raise RuntimeError("calendar unavailable")
+
+    def add_calendar_event(summary, start_time, end_time):
+        release.wait(5)
+        added.append(summary)
+        return json.dumps({"status": "success", "id": "evt1"})
+
+    return {"list_calendar_events": list_calendar_events, "add_calendar_event": add_calendar_event}
+
+
+PLAN = json.dumps({"steps": [
+    {"id": "s1", "tool": "list_calendar_events", "args": {"start_time": "2025-01-06", "end_time": "2025-01-06"}},
+    {"id": "s2", "tool": "add_calendar_event",
+     "args": {"summary": "会議", "start_time": "2025-01-06T15:00:00", "end_time": "2025-01-06T16:00:00"}},
+]})
+
+
+def test_failed_plan_reports_steps_that_finished_in_parallel():
+    added, release = [], threading.Event()
+    registry = _registry(added, release)
+    steps = parse_plan(PLAN, registry)
+    threading.Timer(0.05, release.set).start()
+    with pytest.raises(PlanError) as info:
+        execute_plan(steps, registry)
+    assert added == ["会議"]
+    assert "s2" in info.value.results
+    assert "s1" not in info.value.results
+
+
+def test_failed_async_plan_waits_for_threaded_steps():
+    added, release = [], threading.Event()
+    registry = _registry(added, release)
+    steps = parse_plan(PLAN, registry)
+    threading.Timer(0.05, release.set).start()
+    with pytest.raises(PlanError) as info:
+        asyncio.run(aexecute_plan(steps, registry))
+    assert added == ["会議"]
+    assert "s2" in info.value.results
+
+
+def test_dependent_steps_receive_referenced_results():
+    seen = []
+    registry = {
+        "list_calendar_events": lambda start_time, end_time: json.dumps({"events": [{"id": "e1"}]}),
+        "delete_calendar_event": lambda event_id: seen.append(event_id) or json.dumps({"status": "success"}),
+    }
+    steps = parse_plan(json.dumps({"steps": [
+        {"id": "s1", "tool": "list_calendar_events", "args": {"start_time": "a", "end_time": "b"}},
+        {"id": "s2", "tool": "delete_calendar_event", "args": {"event_id": "$s1.events.0.id"}},
+    ]}), registry)
+    assert set(execute_plan(steps, registry)) == {"s1", "s2"}
+    assert seen == ["e1"]
@@ -0,0 +1,68 @@
+# tests/test_prefetch.py
+import asyncio
+import threading
+
+from src.calendar_agent import tools
+from src.core import metrics
+from src.core.prefetch import AsyncSpeculativePrefetch
+
+START, END = "2025-01-06", "2025-01-06"
+
+
+def _counters():
+    return metrics.snapshot()["counters"]
+
+
+def test_async_prefetch_records_hits_and_serves_thread_tools(monkeypatch):
+    calls = []
+
+    async def alist(start_time, end_time):
+        calls.append(start_time)
+        await asyncio.sleep(0.05)
+        return '{"events": []}'
+
+    monkeypatch.setattr(tools, "alist_calendar_events", alist)
+    metrics.reset()
+
+    async def run():
+        prefetch = AsyncSpeculativePrefetch(START, END)
+        registry = prefetch.wrap_registry({"list_calendar_events": lambda s, e: "direct"})
+        # スレッドで動くReActからも、イベントループ上の先読み結果を受け取れる
+        result = await asyncio.to_thread(registry["list_calendar_events"], START, END)
+        prefetch.discard()
+        return result
+
+    assert asyncio.run(run()) == '{"events": []}'
+    assert len(calls) == 1
+    counters = _counters()
+    assert counters.get("prefetch_started") == 1
+    assert counters.get("prefetch_hits") == 1
+    assert "prefetch_wasted" not in counters
+
+
+def test_unused_async_prefetch_is_cancelled_and_counted_as_wasted(monkeypatch):
+    cancelled = threading.Event()
+
+    async def alist(start_time, end_time):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    monkeypatch.setattr(tools, "alist_calendar_events", alist)
+    metrics.reset()
+
+    async def run():
+        prefetch = AsyncSpeculativePrefetch(START, END)
+        await asyncio.sleep(0)
+        # 別の期間の取得は先読み結果を使わない
+        assert await prefetch.atake("2025-02-01", "2025-02-01") is None
+        prefetch.discard()
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert cancelled.is_set()
+    counters = _counters()
+    assert counters.get("prefetch_misses") == 1
+    assert counters.get("prefetch_wasted") == 1
@@ -0,0 +1,80 @@
+# tests/test_prompt_templates.py
+from types import SimpleNamespace
+
+import pytest
+
+from src.core import gemini_pool, prompt_templates
+
+
+class StaleContext(Exception):
+    code = 404
+
+
+class FakeSession:
+    """send_messageに渡された内容を記録するチャットセッション。キャッシュを指定した送信は失効扱いにできる"""
+
+    def __init__(self, stale: bool = False):
+        self.stale = stale
+        self.sent = []
+
+    def send_message(self, message, config=None):
+        cached = getattr(config, "cached_content", None)
+        if cached and self.stale:
+            raise StaleContext("cached content not found")
+        self.sent.append((message, cached))
+        return SimpleNamespace(text="ok", usage_metadata=None)
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    monkeypatch.setattr(gemini_pool, "pool", gemini_pool.GeminiClientPool(size=1, factory=lambda: SimpleNamespace(_api_client=object())))
+    monkeypatch.setattr(prompt_templates.config, "LLM_CACHE_ENABLED", False)
+
+
+def _prefix(monkeypatch, cache_name):
+    monkeypatch.setattr(prompt_templates.contexts, "lookup", lambda client, model, prefix: cache_name)
+    monkeypatch.setattr(prompt_templates.contexts, "invalidate", lambda model, prefix: None)
+    return prompt_templates.SessionPrefix(client=None, model="model", prefix="SYSTEM")
+
+
+def test_cached_prefix_is_referenced_not_sent(monkeypatch):
+    prefix = _prefix(monkeypatch, "cachedContents/1")
+    session = FakeSession()
+    assert prefix.send("react_step", session, "step 1") == "ok"
+    assert session.sent == [("step 1", "cachedContents/1")]
+
+
+def test_stale_cache_primes_session_once(monkeypatch):
+    prefix = _prefix(monkeypatch, "cachedContents/1")
+    session = FakeSession(stale=True)
+    prefix.send("react_step", session, "step 1")
+    prefix.send("react_step", session, "step 2")
+    assert session.sent == [("SYSTEM", None), ("step 1", None), ("step 2", None)]
+
+
+def test_uncached_prefix_is_primed_once(monkeypatch):
+    prefix = _prefix(monkeypatch, None)
+    session = FakeSession()
+    prefix.prime(session)
+    prefix.send("react_step", session, "step 1")
+    assert session.sent == [("SYSTEM", None), ("step 1", None)]
+
+
+def test_template_splits_static_prefix_and_dynamic_part():
+    template = prompt_templates.PromptTemplate("t", "persona: {persona}\n", "request: {request}")
+    first = template.render("ak", persona="P", request="a")
+    second = template.render("ak", persona="P", request="b")
+    assert str(first) == "persona: P\nrequest: a"
+    assert first.prefix is second.prefix
+    assert second.suffix == "request: b"
+
+
+def test_each_conversation_session_is_primed_once_after_the_cache_lapses(monkeypatch):
+    prefix = _prefix(monkeypatch, "cachedContents/1")
+    first, second = FakeSession(stale=True), FakeSession(stale=True)
+    prefix.send("react_step", first, "a")
+    # 別の会話のセッションにも、キャッシュの代わりに前置きを1回だけ送る
+    prefix.send("react_step", second, "b")
+    prefix.send("react_step", second, "c")
+    assert first.sent == [("SYSTEM", None), ("a", None)]
+    assert second.sent == [("SYSTEM", None), ("b", None), ("c", None)]
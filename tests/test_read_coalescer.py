@@ -0,0 +1,142 @@
+# tests/test_read_coalescer.py
+import asyncio
+import threading
+
+import pytest
+
+from src.calendar_agent.read_coalescer import CoalescingReader
+from src.core import cancellation
+
+
+def test_concurrent_gets_share_one_fetch():
+    reader = CoalescingReader(ttl_seconds=60)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ["event"]
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(reader.get(("k",), fetch)))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(reader.get(("k",), fetch)))
+    follower.start()
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert results == [["event"], ["event"]]
+    assert len(calls) == 1
+
+
+def test_cancelled_fetch_is_not_cached():
+    reader = CoalescingReader(ttl_seconds=60)
+
+    def cancelled():
+        raise cancellation.Cancelled("disconnected")
+
+    with pytest.raises(cancellation.Cancelled):
+        reader.get(("k",), cancelled)
+    assert reader.get(("k",), lambda: ["event"]) == ["event"]
+
+
+def test_follower_refetches_when_leader_is_cancelled():
+    reader = CoalescingReader(ttl_seconds=60)
+    started, release = threading.Event(), threading.Event()
+
+    def cancelled_fetch():
+        started.set()
+        release.wait(5)
+        raise cancellation.Cancelled("disconnected")
+
+    errors, results = [], []
+
+    def lead():
+        try:
+            reader.get(("k",), cancelled_fetch)
+        except cancellation.Cancelled as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(reader.get(("k",), lambda: ["event"])))
+    follower.start()
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert len(errors) == 1
+    assert results == [["event"]]
+
+
+def test_failed_fetch_is_raised_to_followers_and_not_cached():
+    reader = CoalescingReader(ttl_seconds=60)
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        reader.get(("k",), fail)
+    assert reader.get(("k",), lambda: "ok") == "ok"
+
+
+def test_invalidate_discards_cached_result():
+    reader = CoalescingReader(ttl_seconds=60)
+    assert reader.get(("k",), lambda: "old") == "old"
+    assert reader.get(("k",), lambda: "new") == "old"
+    reader.invalidate()
+    assert reader.get(("k",), lambda: "new") == "new"
+
+
+def test_cancelling_async_leader_does_not_cancel_follower():
+    reader = CoalescingReader(ttl_seconds=60)
+
+    async def main():
+        release = asyncio.Event()
+        calls = []
+
+        async def afetch():
+            calls.append(1)
+            await release.wait()
+            return ["event"]
+
+        leader = asyncio.create_task(reader.aget(("k",), afetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(reader.aget(("k",), afetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower, len(calls)
+
+    assert asyncio.run(main()) == (["event"], 1)
+
+
+def test_async_fetch_is_cancelled_when_all_waiters_leave():
+    reader = CoalescingReader(ttl_seconds=60)
+
+    async def main():
+        cancelled = asyncio.Event()
+
+        async def afetch():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiter = asyncio.create_task(reader.aget(("k",), afetch))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+        async def ok():
+            return "ok"
+        return await reader.aget(("k",), ok)
+
+    assert asyncio.run(main()) == "ok"
@@ -0,0 +1,137 @@
+# tests/test_recurrence.py
+from datetime import date, datetime
+
+import pytest
+import pytz
+
+from src.calendar_agent import recurrence
+
+JST = recurrence.JST
+NEW_YORK = pytz.timezone("America/New_York")
+
+
+def _master(recurrence_lines, start, end, time_zone="Asia/Tokyo", event_id="m1"):
+    key = "date" if len(start) == 10 else "dateTime"
+    return {
+        "id": event_id,
+        "summary": "定例",
+        "recurrence": recurrence_lines,
+        "start": {key: start, "timeZone": time_zone} if key == "dateTime" else {key: start},
+        "end": {key: end},
+    }
+
+
+def _window(tz, start, end):
+    return tz.localize(datetime.fromisoformat(start)), tz.localize(datetime.fromisoformat(end))
+
+
+def test_parse_rrule_splits_lists_and_rejects_unsupported_parts():
+    rule = recurrence.parse_rrule("RRULE:FREQ=WEEKLY;BYDAY=mo,we;COUNT=5")
+    assert rule == {"FREQ": "WEEKLY", "BYDAY": ["MO", "WE"], "COUNT": "5"}
+    for line in ("RRULE:FREQ=MONTHLY;BYSETPOS=-1", "RRULE:FREQ=HOURLY"):
+        with pytest.raises(recurrence.UnsupportedRule):
+            recurrence.parse_rrule(line)
+
+
+def test_weekly_byday_stops_after_count():
+    # 2025-01-06は月曜日。月・水の5回で終わる
+    master = _master(["RRULE:FREQ=WEEKLY;BYDAY=MO,WE;COUNT=5"], "2025-01-06T10:00:00+09:00", "2025-01-06T11:00:00+09:00")
+    occurrences = recurrence.expand(master, *_window(JST, "2025-01-01T00:00:00", "2025-03-01T00:00:00"))
+    assert [start.date().day for start, _ in occurrences] == [6, 8, 13, 15, 20]
+    assert all(end - start == (occurrences[0][1] - occurrences[0][0]) for start, end in occurrences)
+
+
+def test_count_counts_occurrences_before_the_window():
+    master = _master(["RRULE:FREQ=WEEKLY;BYDAY=MO,WE;COUNT=5"], "2025-01-06T10:00:00+09:00", "2025-01-06T11:00:00+09:00")
+    occurrences = recurrence.expand(master, *_window(JST, "2025-01-14T00:00:00", "2025-03-01T00:00:00"))
+    assert [start.date().day for start, _ in occurrences] == [15, 20]
+
+
+def test_monthly_nth_weekday():
+    second_tuesday = _master(["RRULE:FREQ=MONTHLY;BYDAY=2TU;COUNT=3"], "2025-01-14T19:00:00+09:00", "2025-01-14T20:00:00+09:00")
+    last_friday = _master(["RRULE:FREQ=MONTHLY;BYDAY=-1FR"], "2025-01-31T18:00:00+09:00", "2025-01-31T19:00:00+09:00")
+    window = _window(JST, "2025-01-01T00:00:00", "2025-05-01T00:00:00")
+    assert [start.date() for start, _ in recurrence.expand(second_tuesday, *window)] == [
+        date(2025, 1, 14), date(2025, 2, 11), date(2025, 3, 11),
+    ]
+    assert [start.date() for start, _ in recurrence.expand(last_friday, *window)] == [
+        date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 28), date(2025, 4, 25),
+    ]
+
+
+def test_exdate_with_tzid_removes_that_occurrence():
+    master = _master(
+        ["RRULE:FREQ=WEEKLY;COUNT=3", "EXDATE;TZID=America/New_York:20250113T100000"],
+        "2025-01-06T10:00:00-05:00", "2025-01-06T10:30:00-05:00", time_zone="America/New_York",
+    )
+    occurrences = recurrence.expand(master, *_window(NEW_YORK, "2025-01-01T00:00:00", "2025-02-01T00:00:00"))
+    assert [start.date().day for start, _ in occurrences] == [6, 20]
+
+
+def test_all_day_events_expand_to_dates_and_honour_date_exdates():
+    master = _master(
+        ["RRULE:FREQ=DAILY;COUNT=4", "EXDATE;VALUE=DATE:20250102"], "2025-01-01", "2025-01-02",
+    )
+    occurrences = recurrence.expand(master, *_window(JST, "2025-01-01T00:00:00", "2025-01-31T00:00:00"))
+    assert occurrences == [
+        (date(2025, 1, 1), date(2025, 1, 2)),
+        (date(2025, 1, 3), date(2025, 1, 4)),
+        (date(2025, 1, 4), date(2025, 1, 5)),
+    ]
+    instances = recurrence.RecurrenceStore().instances(master, *_window(JST, "2025-01-01T00:00:00", "2025-01-31T00:00:00"))
+    assert instances[0]["id"] == "m1_20250101"
+    assert instances[0]["start"] == {"date": "2025-01-01"}
+
+
+def test_local_time_is_kept_across_a_dst_change():
+    # 米国東部は2025-03-09に夏時間になる。現地の9時のまま、UTCでは1時間早くなる
+    master = _master(["RRULE:FREQ=WEEKLY;COUNT=3"], "2025-03-02T09:00:00-05:00", "2025-03-02T10:00:00-05:00", time_zone="America/New_York")
+    occurrences = recurrence.expand(master, *_window(NEW_YORK, "2025-03-01T00:00:00", "2025-04-01T00:00:00"))
+    assert [start.hour for start, _ in occurrences] == [9, 9, 9]
+    assert [start.astimezone(pytz.utc).hour for start, _ in occurrences] == [14, 13, 13]
+    assert all((end - start).total_seconds() == 3600 for start, end in occurrences)
+    assert recurrence.instance_id("m1", occurrences[1][0]) == "m1_20250309T130000Z"
+
+
+class _Request:
+    def __init__(self, response):
+        self.response = response
+
+    def execute(self):
+        return self.response
+
+
+class _PagedEvents:
+    """events().list / instances() の応答をページに分けて返す"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def list(self, **params):
+        self.calls.append(params)
+        return _Request(self.pages[params.get("pageToken", "first")])
+
+    def instances(self, **params):
+        raise AssertionError("ローカルで展開できる予定だけなので、サーバーでの展開は要らない")
+
+
+class _Service:
+    def __init__(self, events):
+        self._events = events
+
+    def events(self):
+        return self._events
+
+
+def test_fetch_events_reads_every_page():
+    single = {"id": "s1", "summary": "単発", "start": {"dateTime": "2025-01-07T12:00:00+09:00"}, "end": {"dateTime": "2025-01-07T13:00:00+09:00"}}
+    master = _master(["RRULE:FREQ=DAILY;COUNT=2"], "2025-01-06T10:00:00+09:00", "2025-01-06T11:00:00+09:00", event_id="m2")
+    events = _PagedEvents({
+        "first": {"items": [single], "nextPageToken": "p2"},
+        "p2": {"items": [master]},
+    })
+    result = recurrence.fetch_events(_Service(events), "2025-01-01T00:00:00+09:00", "2025-02-01T00:00:00+09:00")
+    assert [e["id"] for e in result] == ["m2_20250106T010000Z", "m2_20250107T010000Z", "s1"]
+    assert [call.get("pageToken") for call in events.calls] == [None, "p2"]
+    assert all(call["maxResults"] == recurrence.PAGE_SIZE for call in events.calls)
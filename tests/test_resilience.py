@@ -0,0 +1,88 @@
+# tests/test_resilience.py
+import asyncio
+
+import pytest
+
+from src.core import cancellation, resilience
+
+
+def _upstream(**kwargs):
+    options = dict(rate=1000, burst=1000, user_rate=1000, user_burst=1000, max_retries=0,
+                   backoff_base=0, backoff_max=0, failure_threshold=1, reset_seconds=0)
+    options.update(kwargs)
+    return resilience.Upstream("test", **options)
+
+
+class Unavailable(Exception):
+    code = 503
+
+
+def _open(upstream):
+    with pytest.raises(resilience.UpstreamUnavailable):
+        upstream.call(lambda: (_ for _ in ()).throw(Unavailable()))
+    assert upstream.breaker.state == "open"
+
+
+def test_breaker_opens_and_recovers_after_trial():
+    upstream = _upstream()
+    _open(upstream)
+    assert upstream.call(lambda: "ok") == "ok"
+    assert upstream.breaker.state == "closed"
+
+
+def test_cancelled_trial_does_not_leave_breaker_half_open():
+    upstream = _upstream()
+    _open(upstream)
+
+    def cancelled():
+        raise cancellation.Cancelled("disconnected")
+
+    with pytest.raises(cancellation.Cancelled):
+        upstream.call(cancelled)
+    assert upstream.breaker.state != "half_open"
+    assert upstream.call(lambda: "ok") == "ok"
+    assert upstream.breaker.state == "closed"
+
+
+def test_cancelled_async_trial_does_not_leave_breaker_half_open():
+    upstream = _upstream()
+    _open(upstream)
+
+    async def main():
+        task = asyncio.create_task(upstream.acall(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        async def ok():
+            return "ok"
+        return await upstream.acall(ok)
+
+    assert asyncio.run(main()) == "ok"
+    assert upstream.breaker.state == "closed"
+
+
+def test_cancelled_trial_while_breaker_waits_keeps_it_open():
+    upstream = _upstream(reset_seconds=60)
+    _open(upstream)
+    with pytest.raises(resilience.UpstreamUnavailable):
+        upstream.call(lambda: "ok")
+    assert upstream.breaker.state == "open"
+
+
+def test_idle_user_buckets_are_evicted():
+    upstream = _upstream(user_rate=1e9, user_burst=2)
+    for i in range(50):
+        with resilience.user_scope(f"user{i}"):
+            upstream.call(lambda: "ok")
+    # 満タンに戻ったバケットは上限を待たずに捨てられ、ユーザー数だけ増え続けることはない
+    assert len(upstream._user_buckets) <= 2
+
+
+def test_user_bucket_limit_keeps_most_recent_users():
+    upstream = _upstream(user_rate=0.001, user_burst=5, max_user_buckets=2)
+    for user_id in ("a", "b", "a", "c"):
+        with resilience.user_scope(user_id):
+            upstream.call(lambda: "ok")
+    assert list(upstream._user_buckets) == ["a", "c"]
@@ -0,0 +1,69 @@
+# tests/test_schedule_optimizer.py
+from datetime import datetime
+
+from src.calendar_agent import free_busy, schedule_optimizer
+
+JST = free_busy.JST
+
+
+def _at(value: str) -> datetime:
+    return JST.localize(datetime.fromisoformat(value))
+
+
+def _busy(*ranges) -> list:
+    return free_busy.merge_intervals([(free_busy.to_minute(_at(s)), free_busy.to_minute(_at(e))) for s, e in ranges])
+
+
+def _spans(result) -> list:
+    return [(p["title"], p["start"][5:16], p["end"][11:16]) for p in result["placed"]]
+
+
+def test_greedy_placement_avoids_busy_time_and_keeps_a_break_between_tasks():
+    busy = _busy(("2025-01-06T09:00:00", "2025-01-06T10:00:00"))
+    result = schedule_optimizer.optimize_schedule(
+        [{"title": "資料作成", "duration_minutes": 60}, {"title": "メール整理", "duration_minutes": 30}],
+        busy, _at("2025-01-06T00:00:00"), _at("2025-01-07T00:00:00"),
+        preferences={"break_minutes": 15, "max_hours_per_day": 8},
+    )
+    assert result["unplaced"] == []
+    # 既存の予定の直後から置き、配置したタスクの間は休憩15分を空ける（開始は30分刻み）
+    assert _spans(result) == [("資料作成", "01-06T10:00", "11:00"), ("メール整理", "01-06T11:30", "12:00")]
+
+
+def test_deadline_is_respected():
+    result = schedule_optimizer.optimize_schedule(
+        [{"title": "提出", "duration_minutes": 60, "deadline": "2025-01-06T12:00:00+09:00", "priority": 1}],
+        [], _at("2025-01-06T00:00:00"), _at("2025-01-08T00:00:00"),
+    )
+    assert result["placed"][0]["end"] <= "2025-01-06T12:00:00+09:00"
+
+
+def test_higher_priority_task_displaces_a_lower_one_when_only_one_fits():
+    # 空きは1日に2時間だけ。締切の早い低優先度のタスクが先に貪欲に置かれるが、局所探索で入れ替わる
+    result = schedule_optimizer.optimize_schedule(
+        [
+            {"title": "雑務", "duration_minutes": 120, "priority": 1, "deadline": "2025-01-06"},
+            {"title": "重要な企画", "duration_minutes": 120, "priority": 5},
+        ],
+        [], _at("2025-01-06T00:00:00"), _at("2025-01-07T00:00:00"), work_start="09:00", work_end="11:00",
+    )
+    assert [p["title"] for p in result["placed"]] == ["重要な企画"]
+    assert [u["title"] for u in result["unplaced"]] == ["雑務"]
+
+
+def test_daily_limit_and_preferred_band():
+    prefs = schedule_optimizer.preferences_from_profile("疲れやすいので詰め込みは苦手。朝型です。")
+    assert prefs == {"peak": "morning", "max_hours_per_day": 4.0, "break_minutes": 30}
+    result = schedule_optimizer.optimize_schedule(
+        [{"title": f"作業{i}", "duration_minutes": 180} for i in range(3)],
+        [], _at("2025-01-06T00:00:00"), _at("2025-01-09T00:00:00"), preferences=prefs,
+    )
+    # 1日4時間までなので、3時間の作業は1日に1件ずつ
+    assert sorted(p["start"][:10] for p in result["placed"]) == ["2025-01-06", "2025-01-07", "2025-01-08"]
+
+    evening = schedule_optimizer.optimize_schedule(
+        [{"title": "ジム", "duration_minutes": 60, "preferred": "夜"}],
+        [], _at("2025-01-06T00:00:00"), _at("2025-01-07T00:00:00"), work_end="22:00",
+    )
+    assert evening["placed"][0]["start"][11:16] >= "17:00"
+    assert "ジム" in schedule_optimizer.format_proposal(evening)
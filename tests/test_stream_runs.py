@@ -0,0 +1,33 @@
+# tests/test_stream_runs.py
+import pytest
+
+from src.core import stream_runs
+
+
+def _run_with_events(count: int, buffer_size: int = 2):
+    registry = stream_runs.RunRegistry(buffer_size=buffer_size)
+    run = registry.create("u")
+    for i in range(count):
+        run.append({"status": "thinking", "message": str(i)})
+    return registry, run
+
+
+def test_resume_rejects_events_already_pushed_out_of_the_buffer():
+    registry, run = _run_with_events(5)
+    # 連番4・5だけが残っている。2より後（3以降）は再送できない
+    with pytest.raises(stream_runs.ResumeError):
+        registry.resume("u", f"{run.run_id}-2")
+
+
+def test_resume_within_the_buffer_replays_the_rest():
+    registry, run = _run_with_events(5)
+    resumed, seq = registry.resume("u", f"{run.run_id}-3")
+    run.finish()
+    stream = stream_runs.iter_sse(registry, resumed, seq)
+    assert [line.split("\n")[0] for line in stream] == [f"id: {run.run_id}-4", f"id: {run.run_id}-5", f"id: {run.run_id}-5"]
+
+
+def test_resume_rejects_another_session():
+    registry, run = _run_with_events(1)
+    with pytest.raises(stream_runs.ResumeError):
+        registry.resume("someone-else", f"{run.run_id}-1")